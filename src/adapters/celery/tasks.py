@@ -29,6 +29,7 @@ from src.apps.timetable.models import (
     WorkerDayCashboxDetails,
     EmploymentWorkType,
 )
+from src.apps.timetable.worker_day.prod_cal_cache import get_prod_cal_cache_stats
 from src.apps.timetable.worker_day.stat import WorkersStatsGetter
 
 
@@ -294,6 +295,8 @@ def set_prod_cal_cache(dt_from):
         ws_getter = WorkersStatsGetter(dt_from, dt_to, employee_id__in=active_employees, network=network)
         ws_getter._get_prod_cal_cached()
 
+    return get_prod_cal_cache_stats()  # попадания/промахи/инвалидации кэша для мониторинга
+
 
 @app.task
 def set_prod_cal_cache_cur_and_next_month():
@@ -1,9 +1,11 @@
 import json
-from datetime import timedelta
+from datetime import datetime, time, timedelta
 
+from django.db import connection
 from django.test import TestCase
 from django.utils import timezone
 
+from src.apps.forecast.receipt.indexes import create_receipt_info_indexes, get_networks_receipt_info_indexes
 from src.apps.forecast.receipt.tasks import (
     aggregate_timeserie_value,
     clean_timeserie_actions,
@@ -73,9 +75,9 @@ class TestAggregateTimeserie(TestsHelperMixin, TestCase):
             operation_type_name=cls.op_type_name2,
         )
         ReceiptFactory.create_batch(
-            10, shop=cls.shop, data_type='Чек', info='{"СуммаДокумента": 100, "ВидОперации": "Продажа"}')
+            10, shop=cls.shop, data_type='Чек', info={'СуммаДокумента': 100, 'ВидОперации': 'Продажа'})
         ReceiptFactory.create_batch(
-            5, shop=cls.shop, data_type='Чек', info='{"СуммаДокумента": 100, "ВидОперации": "Возврат"}'
+            5, shop=cls.shop, data_type='Чек', info={'СуммаДокумента': 100, 'ВидОперации': 'Возврат'}
         )
 
     def setUp(self):
@@ -98,6 +100,72 @@ class TestAggregateTimeserie(TestsHelperMixin, TestCase):
             operation_type=self.op_type2, type=PeriodClients.FACT_TYPE).values_list('value', flat=True))
         self.assertEqual(income_sum, 1500)
 
+    def test_aggregate_timeserie_value_by_periods(self):
+        settings_values_dict = json.loads(self.network.settings_values)
+        settings_values_dict['receive_data_info'].append({
+            'update_gap': 1,
+            'grouping_period': 'd1',
+            'aggregate': [
+                {
+                    'timeserie_code': 'buyers',
+                    'timeserie_action': 'nunique',
+                    'timeserie_value_complex': ['Покупатель', 'Касса'],
+                },
+            ],
+            'data_type': 'Покупатель',
+        })
+        self.network.settings_values = json.dumps(settings_values_dict)
+        self.network.save()
+        op_type3 = OperationType.objects.create(
+            shop=self.shop,
+            operation_type_name=OperationTypeName.objects.create(name='покупатели', code='buyers', network=self.network),
+        )
+        dt = timezone.now().date()
+        dttm = timezone.now().replace(hour=10, minute=15, second=0, microsecond=0, tzinfo=None)
+        Receipt.objects.filter(shop=self.shop, dt__gte=dt - timedelta(days=1)).delete()
+        for minutes, info in (
+                (0, {'СуммаДокумента': '10,5', 'ВидОперации': 'Продажа', 'Покупатель': '1', 'Касса': '1'}),
+                (30, {'СуммаДокумента': 20, 'ВидОперации': 'Продажа', 'Покупатель': '1', 'Касса': '2'}),
+                (60, {'СуммаДокумента': 30, 'ВидОперации': 'Продажа', 'Покупатель': '1', 'Касса': '1'}),
+                (60, {'СуммаДокумента': 40, 'ВидОперации': 'Возврат'}),
+        ):
+            for data_type in ('Чек', 'Покупатель'):
+                ReceiptFactory(
+                    shop=self.shop, data_type=data_type, info=info,
+                    dttm=dttm + timedelta(minutes=minutes),
+                )
+
+        aggregate_timeserie_value()
+
+        def _get_values(op_type):
+            return list(PeriodClients.objects.filter(
+                operation_type=op_type, type=PeriodClients.FACT_TYPE, dt_report__gte=dt - timedelta(days=1),
+            ).order_by('dttm_forecast').values_list('dttm_forecast', 'value'))
+
+        hour = dttm.replace(minute=0)
+        self.assertEqual(_get_values(self.op_type), [(hour, 2), (hour + timedelta(hours=1), 1)])
+        self.assertEqual(_get_values(self.op_type2), [(hour, 30.5), (hour + timedelta(hours=1), 30)])
+        self.assertEqual(_get_values(op_type3), [(datetime.combine(dt - timedelta(days=1), time()), 0), (datetime.combine(dt, time()), 2)])
+
+    def test_create_receipt_info_indexes(self):
+        indexes = get_networks_receipt_info_indexes()
+        self.assertEqual(list(indexes.values()), [('Чек', ('ВидОперации',))])
+        with connection.cursor() as cursor:
+            # CREATE INDEX в транзакции теста нельзя выполнить с отложенными проверками внешних ключей
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        index_names = create_receipt_info_indexes(concurrently=False)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT indexname FROM pg_indexes WHERE tablename = %s AND indexname = ANY(%s)',
+                [Receipt._meta.db_table, index_names],
+            )
+            self.assertEqual([row[0] for row in cursor.fetchall()], list(indexes))
+
+        aggregate_timeserie_value()
+        income_sum = sum(PeriodClients.objects.filter(
+            operation_type=self.op_type2, type=PeriodClients.FACT_TYPE).values_list('value', flat=True))
+        self.assertEqual(income_sum, 1000)
+
     def test_clean_timeserie_actions(self):
         ReceiptFactory.create(shop=self.shop, data_type='Другое', dttm=timezone.now() - timedelta(days=60))
         initial_receipts_count = Receipt.objects.count()
@@ -5,5 +5,11 @@ class FilesystemEngine:
     def open_file(self, filename):
         raise NotImplementedError
 
+    def open_stream(self, filename):
+        """
+        Открытие файла для последовательного чтения (без seek), по умолчанию -- как open_file
+        """
+        return self.open_file(filename)
+
     def write_file(self, filename, file_obj):
         raise NotImplementedError
@@ -1,12 +1,90 @@
 import ftplib
+import io
 import os
+import queue
 import tempfile
+import threading
 
 from django.conf import settings
 from src.apps.base.exceptions import EnvLvlViolation
 
 from .base import FilesystemEngine
 
+BLOCK_SIZE = 1024 * 1024
+STREAM_QUEUE_BLOCKS = 16
+
+
+class FtpStream(io.RawIOBase):
+    """
+    Поток чтения файла с ftp.
+
+    Файл скачивается блоками в отдельном потоке (не более STREAM_QUEUE_BLOCKS блоков впереди читателя),
+    поэтому загрузка идет параллельно с разбором, а файл целиком не пишется на диск.
+    Ошибки загрузки пробрасываются при чтении.
+    """
+
+    def __init__(self, ftp, filename, block_size=BLOCK_SIZE):
+        self.ftp = ftp
+        self.sock = ftp.transfercmd('RETR ' + filename)
+        self.block_size = block_size
+        self._blocks = queue.Queue(maxsize=STREAM_QUEUE_BLOCKS)
+        self._buffer = memoryview(b'')
+        self._error = None
+        self._eof = False
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._download, daemon=True)
+        self._thread.start()
+
+    def _put(self, block):
+        while not self._stopped.is_set():
+            try:
+                self._blocks.put(block, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _download(self):
+        try:
+            while True:
+                block = self.sock.recv(self.block_size)
+                if not block or not self._put(block):
+                    break
+        except Exception as e:
+            self._error = e
+        finally:
+            self._put(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer and not self._eof:
+            block = self._blocks.get()
+            if not block:
+                self._eof = True
+                if self._error:
+                    raise self._error
+            self._buffer = memoryview(block)
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+    def close(self):
+        if self.closed:
+            return
+        completed = self._eof and not self._error
+        self._stopped.set()
+        self.sock.close()
+        self._thread.join()
+        super().close()
+        if completed:
+            self.ftp.voidresp()
+        else:
+            # чтение прервано -- ответ сервера на прерванную передачу не ждем, соединение переоткрывается
+            self.ftp.close()
+
 
 class FtpEngine(FilesystemEngine):
     def __init__(self, host, port, username, password, **kwargs):
@@ -22,20 +100,20 @@ class FtpEngine(FilesystemEngine):
         ftp.cwd(self.base_path)
         return ftp
 
+    def _get_ftp(self):
+        if self.ftp.sock is None:
+            self.ftp = self._init_ftp()
+        return self.ftp
+
     def open_file(self, filename):
-        MEGABYTE = 1024
-        filesize = self.ftp.size(filename) / MEGABYTE
         tmp_f = tempfile.NamedTemporaryFile(mode='wb+')
-        sock = self.ftp.transfercmd('RETR ' + filename)
-        while True:
-            buff = sock.recv(MEGABYTE)
-            if not buff: 
-                break
-            tmp_f.write(buff)
-        sock.close()
+        self._get_ftp().retrbinary('RETR ' + filename, tmp_f.write, blocksize=BLOCK_SIZE)
         tmp_f.seek(0)
         return tmp_f
 
+    def open_stream(self, filename):
+        return io.BufferedReader(FtpStream(self._get_ftp(), filename), buffer_size=BLOCK_SIZE)
+
     def write_file(self, filename, file_obj):
         if not settings.ENV_LVL == settings.ENV_LVL_PROD:
             raise EnvLvlViolation()
@@ -0,0 +1,159 @@
+"""
+Буферизованная запись лога API (ApiLog) и секционирование таблицы base_apilog.
+
+Записи лога не сохраняются в БД во время запроса: они добавляются в список в Redis (push),
+задача flush_api_log раз в минуту (и при накоплении API_LOG_FLUSH_BATCH_SIZE записей)
+забирает их пачками и сохраняет через bulk_create.
+
+Таблица base_apilog секционирована по request_datetime помесячно (base_apilog_pYYYYMM),
+строки вне созданных секций попадают в base_apilog_default.
+Задача clean_api_log создает секции на следующие месяцы и удаляет секции старше срока хранения,
+поэтому удаление старого лога -- DROP TABLE секции вместо DELETE по всей таблице.
+"""
+import datetime
+import json
+import logging
+
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+from django_redis import get_redis_connection
+
+from src.apps.base.models import ApiLog
+
+api_log_logger = logging.getLogger('api_log')
+
+BUFFER_KEY = 'api_log_buffer'
+
+TABLE = 'base_apilog'
+PARTITION_NAME = TABLE + '_p{dt:%Y%m}'
+DEFAULT_PARTITION = TABLE + '_default'
+
+
+def push(log):
+    """
+    Добавление записи лога в буфер. Если Redis недоступен, запись сохраняется сразу
+    :param log: поля ApiLog (user -- объект или user_id)
+    """
+    log = dict(log)
+    user = log.pop('user', None)
+    if user is not None:
+        log['user_id'] = user.id
+    for field in ('url_kwargs', 'query_params'):
+        if field in log and not isinstance(log[field], str):
+            log[field] = str(log[field])
+    try:
+        buffer_len = get_redis_connection('default').rpush(BUFFER_KEY, json.dumps(log, cls=DjangoJSONEncoder))
+    except Exception:
+        api_log_logger.exception('ApiLog buffer is not available, saving log directly')
+        ApiLog.objects.create(**log)
+        return
+
+    if buffer_len == settings.API_LOG_FLUSH_BATCH_SIZE:
+        from src.apps.base.tasks import flush_api_log
+        flush_api_log.delay()
+
+
+def _parse_log(data):
+    log = json.loads(data)
+    for field in ('request_datetime', 'response_datetime'):
+        if log.get(field):
+            log[field] = parse_datetime(log[field])
+    return ApiLog(**log)
+
+
+def flush(batch_size=None):
+    """
+    Сохранение записей из буфера пачками
+    :return: кол-во сохраненных записей
+    """
+    batch_size = batch_size or settings.API_LOG_FLUSH_BATCH_SIZE
+    redis = get_redis_connection('default')
+    saved = 0
+    while True:
+        pipe = redis.pipeline()
+        pipe.lrange(BUFFER_KEY, 0, batch_size - 1)
+        pipe.ltrim(BUFFER_KEY, batch_size, -1)
+        items, _ = pipe.execute()
+        if not items:
+            break
+        try:
+            ApiLog.objects.bulk_create([_parse_log(item) for item in items], batch_size=batch_size)
+        except Exception:
+            # возвращаем записи в буфер, чтобы сохранить при следующем запуске
+            redis.lpush(BUFFER_KEY, *reversed(items))
+            raise
+        saved += len(items)
+        if len(items) < batch_size:
+            break
+    return saved
+
+
+def _month_start(dt):
+    return dt.replace(day=1)
+
+
+def create_partition_sql(dt):
+    """
+    :return: SQL создания секции месяца dt. Записи этого месяца из секции по умолчанию переносятся в новую секцию
+    """
+    dt_from = _month_start(dt)
+    dt_to = dt_from + relativedelta(months=1)
+    name = PARTITION_NAME.format(dt=dt_from)
+    return f'''
+CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS);
+WITH moved AS (
+    DELETE FROM {DEFAULT_PARTITION}
+    WHERE request_datetime >= '{dt_from.isoformat()}' AND request_datetime < '{dt_to.isoformat()}'
+    RETURNING *
+)
+INSERT INTO {name} SELECT * FROM moved;
+ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{dt_from.isoformat()}') TO ('{dt_to.isoformat()}');
+'''
+
+
+def get_partitions():
+    """
+    :return: {начало месяца: имя секции} для помесячных секций
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+            'WHERE i.inhparent = %s::regclass',
+            [TABLE],
+        )
+        partitions = {}
+        for name, in cursor.fetchall():
+            if name == DEFAULT_PARTITION:
+                continue
+            partitions[datetime.datetime.strptime(name[-6:], '%Y%m').date()] = name
+        return partitions
+
+
+def create_partitions(dt_from, dt_to):
+    """
+    Создание секций месяцев с dt_from по dt_to
+    """
+    partitions = get_partitions()
+    dt = _month_start(dt_from)
+    with transaction.atomic(), connection.cursor() as cursor:
+        while dt <= dt_to:
+            if dt not in partitions:
+                cursor.execute(create_partition_sql(dt))
+            dt += relativedelta(months=1)
+
+
+def drop_partitions(dttm_before):
+    """
+    Удаление секций, все записи которых раньше dttm_before
+    :return: список удаленных секций
+    """
+    dropped = []
+    with connection.cursor() as cursor:
+        for dt, name in sorted(get_partitions().items()):
+            if datetime.datetime.combine(dt + relativedelta(months=1), datetime.time()) <= dttm_before:
+                cursor.execute(f'DROP TABLE {name}')
+                dropped.append(name)
+    return dropped
@@ -0,0 +1,57 @@
+# Создано вручную 2026-10-18
+# Секционирование base_apilog по request_datetime (помесячно + секция по умолчанию).
+# Время запроса задается при создании записи, т.к. лог сохраняется из буфера позже.
+
+import django.utils.timezone
+from dateutil.relativedelta import relativedelta
+from django.db import migrations, models
+from django.utils import timezone
+
+from src.apps.base.api_log import DEFAULT_PARTITION, TABLE, create_partitions
+
+PARTITION_TABLE_SQL = f"""
+ALTER TABLE {TABLE} RENAME TO {TABLE}_old;
+CREATE TABLE {TABLE} (LIKE {TABLE}_old INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY RANGE (request_datetime);
+CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT;
+"""
+
+COPY_SQL = f"""
+INSERT INTO {TABLE} SELECT * FROM {TABLE}_old;
+DROP TABLE {TABLE}_old;
+ALTER TABLE {TABLE} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY;
+SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {TABLE};
+ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id, request_datetime);
+CREATE INDEX {TABLE}_user_id_c9f0bf2f ON {TABLE} (user_id);
+CREATE INDEX {TABLE}_view_func_http_method_c7711abd_idx ON {TABLE} (view_func, http_method);
+ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_user_id_c9f0bf2f_fk_base_user_id
+    FOREIGN KEY (user_id) REFERENCES base_user (id) DEFERRABLE INITIALLY DEFERRED;
+"""
+
+
+def partition_api_log(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(PARTITION_TABLE_SQL)
+        cursor.execute(f'SELECT MIN(request_datetime) FROM {TABLE}_old')
+        dttm_min = cursor.fetchone()[0]
+    dt_now = timezone.now().date()
+    create_partitions(min(dttm_min.date(), dt_now) if dttm_min else dt_now, dt_now + relativedelta(months=2))
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(COPY_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0198_network_set_dt_not_actual_for_vacancy_on_transfers'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='apilog',
+            name='request_datetime',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(partition_api_log, migrations.RunPython.noop),
+    ]
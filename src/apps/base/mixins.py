@@ -2,6 +2,7 @@ import json
 import logging
 import traceback
 
+from django.conf import settings
 from django.core.serializers.json import DjangoJSONEncoder
 from django.db import connection
 from django.utils import timezone
@@ -52,8 +53,7 @@ class ApiLogMixin(object):
         user = self._get_user(request)
         if user and user.network_id:
             view_func = get_view_func(request, self)
-            view_func_settings = user.network.settings_values_prop.get(
-                'api_log_settings', {}).get('log_funcs', {}).get(view_func)
+            view_func_settings = user.network.parsed_settings.api_log_funcs.get(view_func)
             if view_func_settings:
                 if self.should_log(request, response, user, view_func_settings):
                     if (connection.settings_dict.get("ATOMIC_REQUESTS") and getattr(response, "exception",
@@ -86,6 +86,10 @@ class ApiLogMixin(object):
         return response
 
     def handle_log(self):
+        if settings.API_LOG_BUFFER_ENABLED:
+            from src.apps.base import api_log
+            api_log.push(self.log)
+            return
         ApiLog.objects.create(**self.log)
 
     def _get_user(self, request):
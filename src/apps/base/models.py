@@ -2,7 +2,6 @@ import datetime, json, re
 from calendar import monthrange
 from decimal import Decimal
 
-import pandas as pd
 from celery import chain
 from dateutil.relativedelta import relativedelta
 from dateutil.parser import parse
@@ -35,11 +34,14 @@ from src.apps.base.models_abstract import (
     AbstractActiveNetworkSpecificCodeNamedModel,
 )
 from src.apps.base.models_utils import OverrideBaseManager, current_year
+from src.apps.base.network_settings import parse_network_settings
 from src.conf.djconfig import QOS_TIME_FORMAT
 from src.common.mixins.qs import AnnotateValueEqualityQSMixin
 from src.common.decorators import cached_method
 from src.common import images
 from src.apps.timetable.timesheet import min_threshold_funcs
+from src.apps.timetable.worker_day.prod_cal_cache import invalidate_prod_cal_cache
+from src.apps.timetable.worker_day.prod_cal_norm import refresh_prod_cal
 
 
 class Network(AbstractActiveModel):
@@ -346,14 +348,26 @@ class Network(AbstractActiveModel):
 
     tracker = FieldTracker(fields=('accounting_period_length', 'timesheet_min_hours_threshold'))
 
+    @property
+    def parsed_settings(self):
+        """
+        Разобранные настройки (кэшируются в процессе по тексту settings_values), только для чтения
+        """
+        return parse_network_settings(self.settings_values)
+
     @property
     def settings_values_prop(self):
-        return json.loads(self.settings_values)
+        # словарь может изменяться вызывающим кодом, поэтому кэшируется только в экземпляре до изменения settings_values
+        cached = self.__dict__.get('_settings_values_prop')
+        if cached is None or cached[0] is not self.settings_values:
+            cached = (self.settings_values, json.loads(self.settings_values))
+            self._settings_values_prop = cached
+        return cached[1]
 
     @tracker
     def save(self, *args, **kwargs):
         if self.id and self.tracker.has_changed('accounting_period_length'):
-            cache.delete_pattern("prod_cal_*_*_*")
+            invalidate_prod_cal_cache(network_id=self.id, on_commit=False)
         if self.tracker.has_changed('timesheet_min_hours_threshold'):
             self.get_timesheet_min_hours_threshold(100)
         return super().save(*args, **kwargs)
@@ -937,7 +951,8 @@ class Shop(MPTTModel, AbstractActiveNetworkSpecificCodeNamedModel):
             self._set_shop_defaults()
 
         if not is_new and self.tracker.has_changed('region_id'):
-            transaction.on_commit(lambda: cache.delete_pattern("prod_cal_*_*_*"))
+            refresh_prod_cal(shop_ids=[self.id])
+            invalidate_prod_cal_cache(network_id=self.network_id)
 
         return res
 
@@ -987,26 +1002,15 @@ class Shop(MPTTModel, AbstractActiveNetworkSpecificCodeNamedModel):
         return res or None
 
     def get_schedule(self, dt: datetime.date):
-        return self.get_period_schedule(dt_from=dt, dt_to=dt)[dt]
+        from src.apps.base.shop.schedule import ShopScheduleIndex
+        return ShopScheduleIndex([self], dt, dt).get_schedule(self.id, dt)
 
     def get_period_schedule(self, dt_from: datetime.date, dt_to: datetime.date):
-        res = {}
-
-        ss_dict = {}
-        for ss in ShopSchedule.objects.filter(shop=self, dt__gte=dt_from, dt__lte=dt_to):
-            schedule = None
-            if ss.type == ShopSchedule.WORKDAY_TYPE:
-                schedule = {
-                    'tm_open': ss.opens,
-                    'tm_close': ss.closes,
-                }
-            ss_dict[ss.dt] = schedule
-
-        for dt in pd.date_range(dt_from, dt_to):
-            dt = dt.date()
-            res[dt] = ss_dict.get(dt, self.get_standard_schedule(dt))
-
-        return res
+        """
+        Для нескольких магазинов или повторных обращений использовать ShopScheduleIndex
+        """
+        from src.apps.base.shop.schedule import ShopScheduleIndex
+        return ShopScheduleIndex([self], dt_from, dt_to).get_period_schedule(self.id, dt_from, dt_to)
 
     def get_work_schedule(self, dt_from, dt_to):
         """
@@ -1015,17 +1019,9 @@ class Shop(MPTTModel, AbstractActiveNetworkSpecificCodeNamedModel):
         :param dt_to: дата до, включительно
         :return:
         """
-        from src.common.models_converter import Converter
-        work_schedule = {}
-        for dt, schedule_dict in self.get_period_schedule(dt_from=dt_from, dt_to=dt_to).items():
-            schedule = None  # TODO: это и "нет данных" и выходной, нормально ли?
-            if schedule_dict:
-                schedule = (
-                    Converter.convert_time(schedule_dict['tm_open']),
-                    Converter.convert_time(schedule_dict['tm_close'])
-                )
-            work_schedule[Converter.convert_date(dt)] = schedule
-        return work_schedule
+        # TODO: None в расписании -- это и "нет данных" и выходной, нормально ли?
+        from src.apps.base.shop.schedule import ShopScheduleIndex
+        return ShopScheduleIndex([self], dt_from, dt_to).get_work_schedule(self.id, dt_from, dt_to)
 
     @property
     def nonstandard_schedule(self):
@@ -1303,8 +1299,17 @@ class ProductionDay(AbstractModel):
         return dict(norm_work_hours)
 
     def save(self, *args, **kwargs):
-        cache.delete_pattern("prod_cal_*_*_*")
-        return super().save(*args, **kwargs)
+        invalidate_prod_cal_cache(on_commit=False)
+        res = super().save(*args, **kwargs)
+        refresh_prod_cal(region_ids=[self.region_id], dt_from=self.dt, dt_to=self.dt)
+        return res
+
+    def delete(self, *args, **kwargs):
+        invalidate_prod_cal_cache(on_commit=False)
+        res = super().delete(*args, **kwargs)
+        # для дочерних регионов может использоваться день родительского региона
+        refresh_prod_cal(region_ids=[self.region_id], dt_from=self.dt, dt_to=self.dt)
+        return res
 
 
 class User(DjangoAbstractUser, AbstractModel):
@@ -1554,7 +1559,8 @@ class WorkerPosition(AbstractActiveNetworkSpecificCodeNamedModel):
         if is_new or force_set_defaults:
             self._set_m2m_defaults()
         if not is_new and self.tracker.has_changed('hours_in_a_week'):
-            cache.delete_pattern("prod_cal_*_*_*")
+            refresh_prod_cal(position_ids=[self.id])
+            invalidate_prod_cal_cache(network_id=self.network_id, on_commit=False)
         return res
 
     def get_department(self):
@@ -1704,7 +1710,7 @@ class Employment(AbstractActiveModel):
             res = super(Employment, self).delete(**kwargs)
             if settings.ZKTECO_INTEGRATION:
                 transaction.on_commit(lambda: export_or_delete_employment_zkteco.delay(self.id))
-            transaction.on_commit(lambda: cache.delete_pattern(f"prod_cal_*_*_{self.employee_id}"))
+            invalidate_prod_cal_cache(employee_ids=[self.employee_id])
             dt_now = timezone.now().date()
             recalc_timesheet_on_data_change({self.employee_id: [dt_now.replace(day=1) - datetime.timedelta(1), dt_now]})
             return res
@@ -1738,13 +1744,22 @@ class Employment(AbstractActiveModel):
         if (is_new or self.tracker.has_changed('dt_hired') or self.tracker.has_changed('dt_fired') or self.tracker.has_changed('shop_id')) and settings.ZKTECO_INTEGRATION:
             transaction.on_commit(lambda: export_or_delete_employment_zkteco.delay(self.id, prev_shop_id=(self.tracker.previous('shop_id') if self.tracker.has_changed('shop_id') else None)))
 
+        if (is_new
+                or self.tracker.has_changed('dt_hired')
+                or self.tracker.has_changed('dt_fired')
+                or position_has_changed
+                or self.tracker.has_changed('norm_work_hours')
+                or self.tracker.has_changed('shop_id')
+                or self.tracker.has_changed('dttm_deleted')):
+            refresh_prod_cal(employee_ids=[self.employee_id])
+
         if (is_new
                 or self.tracker.has_changed('dt_hired')
                 or self.tracker.has_changed('dt_fired')
                 or position_has_changed
                 or self.tracker.has_changed('norm_work_hours')
                 or self.tracker.has_changed('sawh_settings_id')):
-            transaction.on_commit(lambda: cache.delete_pattern(f"prod_cal_*_*_{self.employee_id}"))
+            invalidate_prod_cal_cache(employee_ids=[self.employee_id])
             if not is_new:
                 from src.apps.timetable.timesheet.tasks import recalc_timesheet_on_data_change
                 dt_now = timezone.now().date()
@@ -1892,6 +1907,7 @@ class Employment(AbstractActiveModel):
         }
 
         employees_for_clear_cache = set()
+        employees_for_refresh_prod_cal = set()
         zkteco_data = []
         created_employment: Employment
         for created_employment in created_objs:
@@ -1931,6 +1947,8 @@ class Employment(AbstractActiveModel):
 
             if dt_hired_changed or dt_fired_changed or norm_work_hours_changed or position_changed:
                 employees_for_clear_cache.add(employee_id)
+            if shop_changed:
+                employees_for_refresh_prod_cal.add(employee_id)
             
             if (dt_hired_changed or dt_fired_changed or shop_changed) and settings.ZKTECO_INTEGRATION:
                 zkteco_data.append({'id': updated_employment.id, 'prev_shop_code': before_update[i][1] if shop_changed else None})
@@ -1962,9 +1980,8 @@ class Employment(AbstractActiveModel):
                 deleted_employments=employments_for_set_worker_days_not_actual['deleted']
             )
         )
-        transaction.on_commit(
-           lambda: [cache.delete_pattern(f"prod_cal_*_*_{e_id}") for e_id in employees_for_clear_cache]
-        )
+        refresh_prod_cal(employee_ids=employees_for_clear_cache | employees_for_refresh_prod_cal)
+        invalidate_prod_cal_cache(employee_ids=employees_for_clear_cache)
         transaction.on_commit(
             lambda: [export_or_delete_employment_zkteco.delay(data['id'], prev_shop_code=data.get('prev_shop_code')) for data in zkteco_data]
         )
@@ -1991,6 +2008,7 @@ class FunctionGroup(AbstractModel):
     FUNCS_TUPLE = (
         ('AttendanceRecords', 'Отметка (attendance_records)'),
         ('AttendanceRecords_report', 'Отчет по отметкам (Получить) (attendance_records/report/)'),
+        ('AttendanceRecords_batch', 'Пакетная загрузка отметок (Создать) (attendance_records/batch/)'),
         ('AutoSettings_create_timetable', 'Составление графика (Создать) (auto_settings/create_timetable/)'),
         ('AutoSettings_set_timetable', 'Задать график (ответ от алгоритмов, Создать) (auto_settings/set_timetable/)'),
         ('AutoSettings_delete_timetable', 'Удалить график (Создать) (auto_settings/delete_timetable/)'),
@@ -2057,6 +2075,7 @@ class FunctionGroup(AbstractModel):
         ('WorkerConstraint', 'Ограничения сотрудника (worker_constraint)'),
         ('WorkerDay', 'Рабочий день (worker_day)'),
         ('WorkerDay_approve', 'Подтвердить график (Создать) (worker_day/approve/)'),
+        ('WorkerDay_post_approve_status', 'Статус пересчетов после подтверждения графика (Получить) (worker_day/post_approve_status/)'),
         ('WorkerDay_daily_stat', 'Статистика по дням (Получить) (worker_day/daily_stat/)'),
         ('WorkerDay_worker_stat', 'Статистика по работникам (Получить) (worker_day/worker_stat/)'),
         ('WorkerDay_vacancy', 'Список вакансий (Получить) (worker_day/vacancy/)'),
@@ -2086,6 +2105,7 @@ class FunctionGroup(AbstractModel):
         ('WorkerDay_recalc', 'Пересчитать часы (Создать) (worker_day/recalc/)'),
         ('WorkerDay_overtimes_undertimes_report', 'Скачать отчет о переработках/недоработках (Получить) (worker_day/overtimes_undertimes_report/)'),
         ('WorkerDay_batch_update_or_create', 'Массовое создание/обновление дней сотрудников (Создать/Обновить) (worker_day/batch_update_or_create/)'),
+        ('WorkerDay_batch_update_or_create_stream', 'Потоковое создание/обновление дней сотрудников (Создать) (worker_day/batch_update_or_create_stream/)'),
         ('WorkerDayType', 'Тип дня сотрудника (worker_day_type)'),
         ('WorkerPosition', 'Должность (worker_position)'),
         ('WorkTypeName', 'Название типа работ (work_type_name)'),
@@ -2271,7 +2291,7 @@ class ApiLog(AbstractModel):
     view_func = models.CharField(max_length=256)
     http_method = models.CharField(max_length=32)
     url_kwargs = models.TextField(blank=True)
-    request_datetime = models.DateTimeField(auto_now_add=True)
+    request_datetime = models.DateTimeField(default=timezone.now)
     query_params = models.TextField(blank=True)
     request_path = models.CharField(max_length=128)
     request_data = models.TextField(blank=True)
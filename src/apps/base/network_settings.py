@@ -0,0 +1,57 @@
+"""
+Разобранные настройки сети (Network.settings_values).
+
+settings_values хранится текстом json и раньше разбирался при каждом обращении к Network.settings_values_prop,
+в том числе внутри циклов по дням и рабочим дням. NetworkSettings разбирается один раз на процесс
+для каждой версии настроек: ключ кэша -- сам текст settings_values, поэтому после изменения и сохранения настроек
+следующее обращение получает новый объект без явной инвалидации.
+
+Объект общий для всех экземпляров Network с одинаковыми настройками, изменять values нельзя.
+"""
+import functools
+import json
+
+from django.conf import settings
+from django.utils.functional import cached_property
+
+
+class NetworkSettings:
+    def __init__(self, values):
+        self.values = values
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    @cached_property
+    def break_time_subtractor_cls(self):
+        from src.apps.timetable.break_time_subtractor import break_time_subtractor_map
+        return break_time_subtractor_map.get(self.values.get('break_time_subtractor') or 'default')
+
+    @cached_property
+    def receive_data_info(self):
+        return self.values.get('receive_data_info') or []
+
+    @cached_property
+    def receive_data_info_by_type(self):
+        return {info['data_type']: info for info in self.receive_data_info}
+
+    @cached_property
+    def api_log_settings(self):
+        return self.values.get('api_log_settings', {})
+
+    @cached_property
+    def api_log_funcs(self):
+        return self.api_log_settings.get('log_funcs', {})
+
+    @cached_property
+    def api_log_delete_gap(self):
+        return self.api_log_settings.get('delete_gap', settings.API_LOG_DELETE_GAP)
+
+
+@functools.lru_cache(maxsize=256)
+def parse_network_settings(settings_values):
+    """
+    :param settings_values: текст Network.settings_values
+    :return: NetworkSettings
+    """
+    return NetworkSettings(json.loads(settings_values))
@@ -0,0 +1,105 @@
+import datetime
+
+from src.apps.base.models import ShopSchedule
+
+
+def _to_date(dt):
+    return dt.date() if isinstance(dt, datetime.datetime) else dt
+
+
+def _date_range(dt_from, dt_to):
+    return [dt_from + datetime.timedelta(days=i) for i in range((dt_to - dt_from).days + 1)]
+
+
+class ShopScheduleIndex:
+    """
+    Расписание нескольких магазинов за период.
+
+    ShopSchedule всех магазинов за период загружается одним запросом,
+    стандартное расписание (tm_open_dict, tm_close_dict) разбирается один раз на магазин и день недели.
+    Дальше расписание на (shop_id, dt) берется из словаря без запросов.
+    Для дат вне загруженного периода расписание магазина догружается (один запрос на обращение).
+
+    Индекс не следит за изменениями ShopSchedule, поэтому живет в пределах запроса или задачи.
+    """
+
+    def __init__(self, shops, dt_from, dt_to):
+        """
+        :param shops: магазины (Shop)
+        :param dt_from: дата от, включительно
+        :param dt_to: дата до, включительно
+        """
+        self.shops = {}
+        self._periods = {}
+        self._standard_schedules = {}
+        self._schedules = {}
+        self.load(shops, dt_from, dt_to)
+
+    def load(self, shops, dt_from, dt_to):
+        """
+        Загрузка расписаний магазинов за период
+        """
+        shops = list(shops)
+        dt_from, dt_to = _to_date(dt_from), _to_date(dt_to)
+        if not shops:
+            return
+        for shop in shops:
+            self.shops[shop.id] = shop
+            if shop.id not in self._standard_schedules:
+                self._standard_schedules[shop.id] = {
+                    dt.weekday(): shop.get_standard_schedule(dt)
+                    for dt in _date_range(dt_from, dt_from + datetime.timedelta(days=6))
+                }
+            self._periods.setdefault(shop.id, []).append((dt_from, dt_to))
+
+        for ss in ShopSchedule.objects.filter(
+                shop_id__in=[shop.id for shop in shops], dt__gte=dt_from, dt__lte=dt_to):
+            schedule = None
+            if ss.type == ShopSchedule.WORKDAY_TYPE:
+                schedule = {
+                    'tm_open': ss.opens,
+                    'tm_close': ss.closes,
+                }
+            self._schedules[(ss.shop_id, ss.dt)] = schedule
+
+    def _is_loaded(self, shop_id, dt):
+        return any(dt_from <= dt <= dt_to for dt_from, dt_to in self._periods.get(shop_id, ()))
+
+    def get_schedule(self, shop_id, dt):
+        """
+        :return: {'tm_open': time, 'tm_close': time} или None (выходной или нет данных), как Shop.get_schedule
+        """
+        dt = _to_date(dt)
+        key = (shop_id, dt)
+        if key in self._schedules:
+            return self._schedules[key]
+        if not self._is_loaded(shop_id, dt):
+            self.load([self.shops[shop_id]], dt, dt)
+            if key in self._schedules:
+                return self._schedules[key]
+        return self._standard_schedules[shop_id][dt.weekday()]
+
+    def get_period_schedule(self, shop_id, dt_from, dt_to):
+        """
+        :return: {dt: расписание} за период, как Shop.get_period_schedule
+        """
+        dates = _date_range(_to_date(dt_from), _to_date(dt_to))
+        if not all(self._is_loaded(shop_id, dt) for dt in dates):
+            self.load([self.shops[shop_id]], dt_from, dt_to)
+        return {dt: self.get_schedule(shop_id, dt) for dt in dates}
+
+    def get_work_schedule(self, shop_id, dt_from, dt_to):
+        """
+        :return: {дата строкой: (время открытия, время закрытия) или None}, как Shop.get_work_schedule
+        """
+        from src.common.models_converter import Converter
+        work_schedule = {}
+        for dt, schedule_dict in self.get_period_schedule(shop_id, dt_from, dt_to).items():
+            schedule = None
+            if schedule_dict:
+                schedule = (
+                    Converter.convert_time(schedule_dict['tm_open']),
+                    Converter.convert_time(schedule_dict['tm_close'])
+                )
+            work_schedule[Converter.convert_date(dt)] = schedule
+        return work_schedule
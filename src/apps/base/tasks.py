@@ -1,17 +1,30 @@
-from django.conf import settings
+import datetime
+
+from dateutil.relativedelta import relativedelta
+from django.utils import timezone
 
 from src.adapters.celery.celery import app
+from . import api_log
 from .models import (
     Network,
     ApiLog,
 )
 
 
+@app.task
+def flush_api_log():
+    return api_log.flush()
+
+
 @app.task
 def clean_api_log():
-    for network in Network.objects.all():
-        ApiLog.clean_log(
-            network_id=network.id,
-            delete_gap=network.settings_values_prop.get(
-                'api_log_settings', {}).get('delete_gap', settings.API_LOG_DELETE_GAP),
-        )
+    dttm_now = timezone.now()
+    api_log.create_partitions(dttm_now.date(), dttm_now.date() + relativedelta(months=2))
+    delete_gaps = {network.id: network.parsed_settings.api_log_delete_gap for network in Network.objects.all()}
+    if not delete_gaps:
+        return
+    # секции старше максимального срока хранения удаляются целиком,
+    # остальные записи удаляются по сетям только из оставшихся секций (отбор по request_datetime)
+    api_log.drop_partitions(dttm_now - datetime.timedelta(days=max(delete_gaps.values())))
+    for network_id, delete_gap in delete_gaps.items():
+        ApiLog.clean_log(network_id=network_id, delete_gap=delete_gap)
@@ -1,5 +1,8 @@
 from datetime import date
 
+from django.db import connection
+from django.test import override_settings
+from django_redis import get_redis_connection
 from freezegun import freeze_time
 from rest_framework.test import APITestCase
 
@@ -10,6 +13,8 @@ from src.apps.base.models import (
     Employment,
     ApiLog,
 )
+from src.apps.base import api_log
+from src.apps.base.tasks import clean_api_log, flush_api_log
 from src.apps.base.tests.factories import (
     NetworkFactory,
     GroupFactory,
@@ -202,3 +207,50 @@ class TestApiLog(TestsHelperMixin, APITestCase):
         with freeze_time('2021-09-30'):
             ApiLog.clean_log(network_id=self.api_employee.user.network_id, delete_gap=60)
         self.assertEqual(ApiLog.objects.count(), 1)
+
+    def _put_user(self, middle_name='Иванович'):
+        return self.client.put(
+            path=self.get_url('User-detail', pk='НМ00-123456'),
+            data=self.dump_data({
+                "first_name": "Иван",
+                "last_name": "Иванов",
+                "middle_name": middle_name,
+                "username": 'НМ00-123456',
+                "by_code": True,
+            }),
+            content_type='application/json',
+        )
+
+    @override_settings(API_LOG_BUFFER_ENABLED=True)
+    def test_buffered_api_log(self):
+        get_redis_connection('default').delete(api_log.BUFFER_KEY)
+        with freeze_time('2021-06-15 10:00:00'):
+            response = self._put_user()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(ApiLog.objects.count(), 0)
+
+        self.assertEqual(flush_api_log(), 1)
+        log = ApiLog.objects.get()
+        self.assertEqual(log.user_id, self.api_employee.user_id)
+        self.assertEqual(log.request_datetime.replace(tzinfo=None).isoformat(), '2021-06-15T10:00:00')
+        self.assertEqual(log.response_status_code, 201)
+        self.assertEqual(flush_api_log(), 0)
+
+    def test_clean_api_log_drops_old_partitions(self):
+        api_log.create_partitions(date(2021, 5, 1), date(2021, 6, 1))
+        with freeze_time('2021-05-15'):
+            self._put_user()
+        with freeze_time('2021-06-15'):
+            self._put_user(middle_name='Иванович2')
+        self.assertEqual(ApiLog.objects.count(), 2)
+
+        # проверка отложенных FK до удаления секции (в тесте записи созданы в той же транзакции)
+        with connection.cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        with freeze_time('2021-09-01'):
+            clean_api_log()
+        partitions = api_log.get_partitions()
+        self.assertNotIn(date(2021, 5, 1), partitions)
+        self.assertIn(date(2021, 6, 1), partitions)
+        self.assertIn(date(2021, 11, 1), partitions)
+        self.assertEqual(ApiLog.objects.count(), 1)
@@ -0,0 +1,38 @@
+import json
+
+from django.test import TestCase
+
+from src.apps.base.models import Network
+from src.apps.timetable.break_time_subtractor import (
+    HalfNightHalfDayBreakTimeSubtractor,
+    InPriorityFromNightBreakTimeSubtractor,
+)
+
+
+class TestNetworkSettings(TestCase):
+    def setUp(self):
+        self.network = Network.objects.create(name='Сеть', code='settings_test', settings_values=json.dumps({
+            'break_time_subtractor': 'in_priority_from_night',
+            'receive_data_info': [{'data_type': 'bills', 'shop_code_field_name': 'shop'}],
+        }))
+
+    def test_parsed_settings_shared_by_settings_version(self):
+        network2 = Network.objects.get(id=self.network.id)
+        self.assertIs(self.network.parsed_settings, network2.parsed_settings)
+        self.assertIs(self.network.parsed_settings.break_time_subtractor_cls, InPriorityFromNightBreakTimeSubtractor)
+        self.assertEqual(self.network.parsed_settings.receive_data_info_by_type['bills']['shop_code_field_name'], 'shop')
+        self.assertEqual(self.network.parsed_settings.api_log_funcs, {})
+
+        self.network.set_settings_value('break_time_subtractor', None, save=True)
+        self.assertIs(self.network.parsed_settings.break_time_subtractor_cls, HalfNightHalfDayBreakTimeSubtractor)
+        network2.refresh_from_db()
+        self.assertIs(self.network.parsed_settings, network2.parsed_settings)
+
+    def test_settings_values_prop_cached_until_changed(self):
+        settings_values = self.network.settings_values_prop
+        self.assertIs(self.network.settings_values_prop, settings_values)
+
+        settings_values['show_tabel_graph'] = False
+        self.network.settings_values = json.dumps(settings_values)
+        self.assertIsNot(self.network.settings_values_prop, settings_values)
+        self.assertFalse(self.network.settings_values_prop['show_tabel_graph'])
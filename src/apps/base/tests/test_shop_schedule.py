@@ -1,9 +1,10 @@
-from datetime import timedelta, datetime
+from datetime import date, time, timedelta, datetime
 
-from django.test import override_settings
+from django.test import TestCase, override_settings
 from rest_framework.test import APITestCase
 
-from src.apps.base.models import ShopSchedule
+from src.apps.base.models import Shop, ShopSchedule
+from src.apps.base.shop.schedule import ShopScheduleIndex
 from src.apps.base.tests.factories import (
     NetworkFactory,
     ShopFactory,
@@ -15,6 +16,7 @@ from src.apps.base.tests.factories import (
 from src.apps.base.shop.tasks import fill_shop_schedule
 from src.common.mixins.tests import TestsHelperMixin
 from src.common.models_converter import Converter
+from src.common.test import create_departments_and_users
 
 
 @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
@@ -73,3 +75,55 @@ class TestShopScheduleViewSet(TestsHelperMixin, APITestCase):
         self.assertEqual(schedule.type, 'H')
         self.assertEqual(schedule.opens, None)
         self.assertEqual(schedule.closes, None)
+
+
+class TestShopScheduleIndex(TestCase):
+    USER_USERNAME = "user1"
+    USER_EMAIL = "q@q.q"
+    USER_PASSWORD = "4242"
+
+    @classmethod
+    def setUpTestData(cls):
+        create_departments_and_users(cls)
+        cls.dt = date(2021, 6, 7)  # понедельник
+        Shop.objects.filter(id=cls.shop.id).update(
+            tm_open_dict='{"all": "09:00:00"}', tm_close_dict='{"all": "21:00:00"}')
+        Shop.objects.filter(id=cls.shop2.id).update(
+            tm_open_dict='{"0": "08:00:00","1": "08:00:00","2": "08:00:00","3": "08:00:00","4": "08:00:00"}',
+            tm_close_dict='{"0": "20:00:00","1": "20:00:00","2": "20:00:00","3": "20:00:00","4": "19:00:00"}',
+        )
+        ShopSchedule.objects.filter(shop_id__in=[cls.shop.id, cls.shop2.id]).delete()
+        ShopSchedule.objects.create(
+            shop_id=cls.shop.id, dt=cls.dt + timedelta(days=1), type=ShopSchedule.HOLIDAY_TYPE)
+        ShopSchedule.objects.create(
+            shop_id=cls.shop2.id, dt=cls.dt + timedelta(days=5), type=ShopSchedule.WORKDAY_TYPE,
+            opens=time(10), closes=time(16))
+
+    def test_get_schedule(self):
+        shops = list(Shop.objects.filter(id__in=[self.shop.id, self.shop2.id]))
+        dt_to = self.dt + timedelta(days=13)
+        with self.assertNumQueries(1):
+            index = ShopScheduleIndex(shops, self.dt, dt_to)
+        with self.assertNumQueries(0):
+            self.assertEqual(index.get_schedule(self.shop.id, self.dt), {'tm_open': time(9), 'tm_close': time(21)})
+            self.assertIsNone(index.get_schedule(self.shop.id, self.dt + timedelta(days=1)))
+            self.assertEqual(
+                index.get_schedule(self.shop2.id, self.dt + timedelta(days=4)),
+                {'tm_open': time(8), 'tm_close': time(19)},
+            )
+            self.assertEqual(
+                index.get_schedule(self.shop2.id, self.dt + timedelta(days=5)),
+                {'tm_open': time(10), 'tm_close': time(16)},
+            )
+            self.assertIsNone(index.get_schedule(self.shop2.id, self.dt + timedelta(days=6)))
+            period_schedules = {shop.id: index.get_period_schedule(shop.id, self.dt, dt_to) for shop in shops}
+
+        for shop in shops:
+            self.assertEqual(period_schedules[shop.id], shop.get_period_schedule(self.dt, dt_to))
+            self.assertEqual(index.get_work_schedule(shop.id, self.dt, dt_to), shop.get_work_schedule(self.dt, dt_to))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                index.get_schedule(self.shop.id, self.dt - timedelta(days=6)),
+                {'tm_open': time(9), 'tm_close': time(21)},
+            )
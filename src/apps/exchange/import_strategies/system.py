@@ -1,11 +1,13 @@
 import datetime as dt
 import ftplib
+import io
 import json
 import typing as tp
 
 import pandas as pd
 from django.contrib.contenttypes.models import ContentType
-from django.db import transaction
+from django.db import connection, transaction
+from django.utils import timezone
 from src.apps.base.models import Shop
 from src.apps.forecast.models import Receipt
 from src.apps.integration.models import ExternalSystem, GenericExternalCode
@@ -13,6 +15,33 @@ from src.common.time import DateTimeHelper
 
 from .base import BaseImportStrategy
 
+STAGING_TABLE = 'receipt_hist_import'
+
+CREATE_STAGING_SQL = f'''
+CREATE TEMPORARY TABLE {STAGING_TABLE} (
+    line integer,
+    code varchar(256),
+    dttm timestamp,
+    shop_id integer,
+    info jsonb
+) ON COMMIT DROP
+'''
+
+STAGING_COPY_SQL = f'COPY {STAGING_TABLE} (line, code, dttm, shop_id, info) FROM STDIN WITH (FORMAT csv)'
+
+STAGING_INSERT_SQL = '''
+INSERT INTO {receipt} (code, dttm, dt, shop_id, data_type, info, version, dttm_added, dttm_modified)
+SELECT code, dttm, %(dt)s, shop_id, %(data_type)s, info, 0, %(dttm_now)s, %(dttm_now)s
+FROM {staging}
+ORDER BY line
+'''
+
+
+def _join_columns(df: pd.DataFrame, columns: tp.List[str], sep: str) -> pd.Series:
+    """glue few columns into one (NaN -> 'nan')"""
+    values = [df[col].astype(str) for col in columns]
+    return values[0].str.cat(values[1:], sep=sep)
+
 
 class BaseSystemImportStrategy(BaseImportStrategy):
     def __init__(self, settings_json, **kwargs):
@@ -204,40 +233,47 @@ class ImportHistDataStrategy(BaseSystemImportStrategy):
                            ) -> tp.Iterable[pd.DataFrame]:
         """
         encapsulate reading from file by chunks.
-        It will be replaced with the appropriate class later"""
-        with self.fs_engine.open_file(filename) as f:
+        The file is read as a stream (ftp download goes in parallel with parsing)"""
+        with self.fs_engine.open_stream(filename) as f:
             df_chunks = pd.read_csv(f, **read_csv_kwargs)
             for df in df_chunks:
                 yield df
 
+    def _stage_objects(self, cursor, df: pd.DataFrame, info_columns: tp.List[str], first_line: int) -> None:
+        """
+        COPY of the chunk objects into the staging table
+        """
+        rows = pd.DataFrame({
+            'line': range(first_line, first_line + df.shape[0]),
+            'code': df['receipt_code'].values,
+            'dttm': df['updated_dttm'].dt.strftime('%Y-%m-%d %H:%M:%S.%f').values,
+            'shop_id': df['shop_id'].astype(int).values,
+            # NaN -> null, the same as row serialization with to_json
+            'info': df[info_columns].to_json(orient='records', lines=True).split('\n')[:df.shape[0]],
+        })
+        buffer = io.StringIO()
+        rows.to_csv(buffer, header=False, index=False)
+        buffer.seek(0)
+        cursor.copy_expert(STAGING_COPY_SQL, buffer)
+
     def _insert_into_db(self,
-                        object_list_of_tuples: tp.List[tp.Dict[str, tp.Any]],
+                        cursor,
                         dtt: dt.date,
-                        shops_id: tp.Set[str],
-                        bulk_chunk_size: int) -> None:
-        db_objects = []
-        for obj in object_list_of_tuples:
-            db_objects.append(
-                Receipt(
-                    code=obj["code"],
-                    dttm=obj["dttm"],
-                    dt=dtt,
-                    shop_id=obj["shop_id"],
-                    data_type=self.data_type,
-                    info=obj["info"],
-                )
-            )
-        with transaction.atomic():
-            Receipt.objects.filter(dt=dtt,
-                                   data_type=self.data_type,
-                                   shop_id__in=shops_id).delete()
-
-            Receipt.objects.bulk_create(db_objects, batch_size=bulk_chunk_size)
-
-    def _get_dttm(self, 
-                  row: pd.Series, 
-                  dtt: dt.date
-                  ) -> tp.Tuple[tp.Optional[dt.datetime], tp.Optional[Exception]]:
+                        shops_id: tp.Set[int]) -> None:
+        Receipt.objects.filter(dt=dtt,
+                               data_type=self.data_type,
+                               shop_id__in=shops_id).delete()
+        dttm_now = timezone.now()
+        cursor.execute(STAGING_INSERT_SQL.format(staging=STAGING_TABLE, receipt=Receipt._meta.db_table), {
+            'dt': dtt,
+            'data_type': self.data_type,
+            'dttm_now': dttm_now,
+        })
+
+    def _get_dttms(self,
+                   df: pd.DataFrame,
+                   dtt: dt.date
+                   ) -> tp.Tuple[pd.Series, pd.Series]:
         """
         we should check a type and a correct form of our date.
         If all is good and data_type is from 'pobeda' then we check
@@ -246,61 +282,58 @@ class ImportHistDataStrategy(BaseSystemImportStrategy):
             (because it's very weird to get the date like that in file
             with the current date)
         2. change the current date to another: get a date from filename
+
+        Returns datetimes (NaT for invalid values) and error messages (None for valid values)
         """
-        try:
-            dttm = dt.datetime.strptime(
-                row[self.dt_or_dttm_column_name],
-                self.dt_or_dttm_format,
+        values = df[self.dt_or_dttm_column_name]
+        dttms = pd.to_datetime(values, format=self.dt_or_dttm_format, errors='coerce')
+        errors = pd.Series(None, index=df.index, dtype=object)
+        errors[values.isna()] = 'TypeError: strptime() argument 1 must be str, not float'
+        invalid = dttms.isna() & values.notna()
+        if invalid.any():
+            errors[invalid] = (
+                'ValueError: time data ' + values[invalid].map(repr)
+                + f' does not match format {self.dt_or_dttm_format!r}'
             )
-            if self.fix_date:
-                # https://mindandmachine.myjetbrains.com/youtrack/issue/RND-572
-                # use a date from a filename pattern
-                if abs((dtt - dttm.date()).days) > 7:
-                    raise TypeError("Days range between dt and dttm is greater"
-                                    f" than 1 week: {dtt} and {dttm.date()}")
-                else:
-                    dttm = dt.datetime(
-                        dtt.year,
-                        dtt.month,
-                        dtt.day,
-                        # https://mindandmachine.myjetbrains.com/youtrack/issue/RND-612/
-                        min(dttm.hour, 20),
-                        dttm.minute,
-                        dttm.second
-                    )
-            return dttm, None
-        except TypeError as e:
-            return None, e
+        if self.fix_date:
+            # https://mindandmachine.myjetbrains.com/youtrack/issue/RND-572
+            # use a date from a filename pattern
+            file_dt = pd.Timestamp(dtt)
+            out_of_range = (dttms.dt.normalize() - file_dt).dt.days.abs() > 7
+            if out_of_range.any():
+                errors[out_of_range] = (
+                    'TypeError: Days range between dt and dttm is greater'
+                    f' than 1 week: {dtt} and ' + dttms[out_of_range].dt.strftime('%Y-%m-%d')
+                )
+            dttms = (
+                file_dt
+                # https://mindandmachine.myjetbrains.com/youtrack/issue/RND-612/
+                + pd.to_timedelta(dttms.dt.hour.clip(upper=20), unit='h')
+                + pd.to_timedelta(dttms.dt.minute, unit='m')
+                + pd.to_timedelta(dttms.dt.second, unit='s')
+            )
+            dttms[out_of_range] = pd.NaT
+        return dttms, errors
 
-    def _get_receipt_code(self, obj):
+    def _get_receipt_codes(self, df: pd.DataFrame) -> pd.Series:
         if self.receipt_code_columns:
-            receipt_code = "".join(obj[self.receipt_code_columns].values)
-        else:
-            receipt_code = hash(tuple(obj))
-        return receipt_code
-
-    @staticmethod
-    def _create_object(
-            row: pd.Series,
-            all_columns: tp.List[str],
-            unused_columns: tp.List[str]) -> tp.Dict[str, tp.Any]:
-        return {
-            "code": row['receipt_code'],
-            "dttm": row["updated_dttm"],
-            "shop_id": row["shop_id"],
-            "info": row[list(set(all_columns) - set(unused_columns))].to_json(),
-        }
+            return _join_columns(df, self.receipt_code_columns, sep='')
+        # hash of all the columns (with the row number in the file)
+        return pd.util.hash_pandas_object(df, index=False).astype(str)
 
     def load_file(self,
                   dtt: dt.date,
                   filename: str,
                   chunksize: int = 10000,
                   bulk_chunk_size: int = 10000) -> tp.Set[str]:
-
+        """
+        Chunks of the file are processed column-wise and loaded with COPY into a staging table,
+        after all the chunks the receipts of the file date and shops are replaced in one transaction.
+        bulk_chunk_size is left for compatibility (the rows are copied by chunks of the file)
+        """
         load_errors = set()
         shops_id = set()
-        objects = []
-        objects_unique_ids = [] # use it if a self.use_total_discounted_price is True
+        objects_unique_ids = set()  # use it if a self.use_total_discounted_price is True
 
         read_csv_kwargs = {
             "dtype": str,
@@ -313,79 +346,55 @@ class ImportHistDataStrategy(BaseSystemImportStrategy):
             read_csv_kwargs['names'] = self.columns
 
         unused_cols = ["index", "shop_id", "updated_dttm", "dttm_error"]
-
-        def get_key(values): # glue few columns into one
-            return "_".join(map(str, values))
+        shop_ids_by_num = self.cached_data['generic_shop_ids']
 
         try:
-            for ix, df in enumerate(self._get_csv_generator(filename, read_csv_kwargs)):                
-                df["index"] = df.index.values
-
-                if self.use_total_discounted_price:
-                    df = df.drop_duplicates(subset=self.remove_duplicates_columns, keep='first')
-
-                    df = (
-                        df[
-                            ~(
-                                df[self.remove_duplicates_columns]
-                                .apply(get_key, axis=1)
-                                .isin(objects_unique_ids)
-                            )
-                        ]
-                        .reset_index(drop=True)
-                    )
-                    objects_unique_ids += (
-                        df[self.remove_duplicates_columns]
-                        .apply(get_key,axis=1)
-                        .unique()
-                        .tolist()
-                    )
-
-                    if not df.shape[0]:
-                        continue
-
-                # Hash generation is different in each python
-                # launch! Can only compare in receipts imported
-                # from the same task
-
-                df["receipt_code"] = df.apply(self._get_receipt_code, axis=1)
-                df['shop_id'] = (df[self.shop_num_column_name]
-                                    .apply(self.get_shop_id_by_shop_num))
-                df["updated_dttm"] = (
-                    df.apply(lambda obj: self._get_dttm(obj, dtt)[0], axis=1))
-                df["dttm_error"] = (
-                    df.apply(lambda obj: self._get_dttm(obj, dtt)[1], axis=1))
-
-                # update containers with main info
-
-                shops_id |= set(df.loc[~df['shop_id'].isna(), "shop_id"])
-
-                df_for_objects = df[(~df["shop_id"].isna()) & (~df["updated_dttm"].isna())]
-
-                if df_for_objects.shape[0]:
-                    objects += (df_for_objects.apply(
-                        lambda row: self._create_object(row, df.columns, unused_cols),
-                        axis=1).values.tolist())
-
-                # update sets with errors
-                df_shop_load_error = df.loc[df["shop_id"].isna(), self.shop_num_column_name]
-
-                if df_shop_load_error.shape[0]:
-                    load_errors |= set(
-                        df_shop_load_error.apply(
-                            lambda x: f"can't map shop_id for shop_num='{x}'"))
-
-                df_dttm_error = df.loc[df["updated_dttm"].isna(), ["dttm_error", "index"]]
-                if df_dttm_error.shape[0]:
-                    load_errors |= set(
-                        df_dttm_error
-                        .apply(
-                            lambda row: f"{row['dttm_error'].__class__.__name__}: "
-                                        f"{str(row['dttm_error'])}: {filename}: "
-                                        f"row: {row['index']}",
-                            axis=1))
-
-            self._insert_into_db(objects, dtt, shops_id, bulk_chunk_size)
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(CREATE_STAGING_SQL)
+                staged = 0
+                for ix, df in enumerate(self._get_csv_generator(filename, read_csv_kwargs)):
+                    df["index"] = df.index.values
+
+                    if self.use_total_discounted_price:
+                        df = df.drop_duplicates(subset=self.remove_duplicates_columns, keep='first')
+                        keys = _join_columns(df, self.remove_duplicates_columns, sep='_')
+                        is_new = ~keys.isin(objects_unique_ids)
+                        objects_unique_ids.update(keys[is_new])
+                        df = df[is_new.values].reset_index(drop=True)
+
+                        if not df.shape[0]:
+                            continue
+
+                    df["receipt_code"] = self._get_receipt_codes(df)
+                    df['shop_id'] = df[self.shop_num_column_name].map(shop_ids_by_num)
+                    df["updated_dttm"], df["dttm_error"] = self._get_dttms(df, dtt)
+
+                    # update containers with main info
+
+                    has_shop = df['shop_id'].notna()
+                    shops_id |= set(df.loc[has_shop, "shop_id"].astype(int))
+
+                    df_for_objects = df[has_shop & df["updated_dttm"].notna()]
+
+                    if df_for_objects.shape[0]:
+                        info_columns = [col for col in df.columns if col not in unused_cols]
+                        self._stage_objects(cursor, df_for_objects, info_columns, staged)
+                        staged += df_for_objects.shape[0]
+
+                    # update sets with errors
+                    load_errors |= {
+                        f"can't map shop_id for shop_num='{x}'"
+                        for x in df.loc[~has_shop, self.shop_num_column_name].unique()
+                    }
+
+                    df_dttm_error = df.loc[df["updated_dttm"].isna(), ["dttm_error", "index"]]
+                    load_errors |= {
+                        f"{error}: {filename}: row: {index}"
+                        for error, index in zip(df_dttm_error["dttm_error"], df_dttm_error["index"])
+                    }
+
+                self._insert_into_db(cursor, dtt, shops_id)
+                cursor.execute(f'DROP TABLE {STAGING_TABLE}')
 
         except (FileNotFoundError, PermissionError, *ftplib.all_errors) as e:
             load_errors.add(f'{e.__class__.__name__}: {str(e)}: {filename}')
@@ -0,0 +1,106 @@
+"""
+Безопасное вычисление формул отношений типов операций (OperationTypeRelation.formula).
+
+Формула -- выражение от значения зависимого типа операций `a` (например 'a * 2 + a' или 'a - 1 if a > 1 else 0').
+Выражение разбирается через ast и проверяется (только арифметика, сравнения и условные выражения,
+как и при сохранении отношения), затем вычисляется один раз над всем массивом значений numpy.
+"""
+import ast
+import functools
+import operator
+
+import numpy as np
+
+FORMULA_ARG = 'a'
+
+BIN_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Pow: operator.pow,
+}
+UNARY_OPERATORS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+COMPARE_OPERATORS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+
+
+def _check_node(node):
+    if isinstance(node, ast.Constant):
+        if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+            raise ValueError(f'unsupported constant {node.value!r}')
+    elif isinstance(node, ast.Name):
+        if node.id != FORMULA_ARG:
+            raise ValueError(f'unknown name {node.id}')
+    elif isinstance(node, ast.BinOp):
+        if type(node.op) not in BIN_OPERATORS:
+            raise ValueError(f'unsupported operator {type(node.op).__name__}')
+        _check_node(node.left)
+        _check_node(node.right)
+    elif isinstance(node, ast.UnaryOp):
+        if type(node.op) not in UNARY_OPERATORS:
+            raise ValueError(f'unsupported operator {type(node.op).__name__}')
+        _check_node(node.operand)
+    elif isinstance(node, ast.Compare):
+        if any(type(op) not in COMPARE_OPERATORS for op in node.ops):
+            raise ValueError('unsupported comparison')
+        for child in [node.left] + node.comparators:
+            _check_node(child)
+    elif isinstance(node, ast.IfExp):
+        for child in (node.test, node.body, node.orelse):
+            _check_node(child)
+    else:
+        raise ValueError(f'unsupported expression {type(node).__name__}')
+
+
+def _eval_node(node, values):
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.Name):
+        return values
+    if isinstance(node, ast.BinOp):
+        return BIN_OPERATORS[type(node.op)](_eval_node(node.left, values), _eval_node(node.right, values))
+    if isinstance(node, ast.UnaryOp):
+        return UNARY_OPERATORS[type(node.op)](_eval_node(node.operand, values))
+    if isinstance(node, ast.Compare):
+        result = True
+        left = _eval_node(node.left, values)
+        for op, comparator in zip(node.ops, node.comparators):
+            right = _eval_node(comparator, values)
+            result = np.logical_and(result, COMPARE_OPERATORS[type(op)](left, right))
+            left = right
+        return result
+    return np.where(_eval_node(node.test, values), _eval_node(node.body, values), _eval_node(node.orelse, values))
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_formula(formula):
+    """
+    :param formula: строка с формулой
+    :return: функция от массива значений, возвращающая массив результатов
+        (деление на 0 и другие недопустимые операции дают 0)
+    :raises ValueError: формула некорректна
+    """
+    try:
+        expression = ast.parse((formula or '').strip(), mode='eval').body
+    except SyntaxError as e:
+        raise ValueError(f'invalid syntax: {e.msg}')
+    _check_node(expression)
+
+    def _formula(values):
+        values = np.asarray(values, dtype=float)
+        with np.errstate(all='ignore'):
+            result = np.broadcast_to(_eval_node(expression, values), np.shape(values)).astype(float)
+        return np.nan_to_num(result, nan=0.0, posinf=0.0, neginf=0.0)
+
+    return _formula
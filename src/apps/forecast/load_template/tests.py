@@ -15,7 +15,8 @@ from src.apps.forecast.models import (
     OperationTypeRelation,
     PeriodClients,
 )
-from src.apps.forecast.load_template.utils import prepare_load_template_request
+from src.apps.forecast.load_template.formula import compile_formula
+from src.apps.forecast.load_template.utils import calculate_shop_load, prepare_load_template_request
 from src.apps.timetable.models import WorkTypeName, WorkType
 
 
@@ -400,6 +401,78 @@ class TestLoadTemplate(APITestCase, TestsHelperMixin):
         self.assertEqual(load_template, data)
     
 
+    def test_calculate_shop_load(self):
+        self.operation_type_name1.do_forecast = OperationTypeName.FORECAST_FORMULA
+        self.operation_type_name1.save()
+        self.operation_type_name3.do_forecast = OperationTypeName.FORECAST
+        self.operation_type_name3.save()
+        operation_type_template6 = OperationTypeTemplate.objects.create(
+            load_template=self.load_template,
+            operation_type_name=self.operation_type_name6,
+        )
+        OperationTypeRelation.objects.create(
+            base=self.operation_type_template1,
+            depended=operation_type_template6,
+            formula='a * 2',
+        )
+        OperationTypeRelation.objects.create(
+            base=self.operation_type_template1,
+            depended=self.operation_type_template2,
+            formula='a + 1',
+        )
+        OperationTypeRelation.objects.create(
+            base=operation_type_template6,
+            depended=self.operation_type_template2,
+            formula='a - 1 if a < 10 else 0',
+        )
+        with self.settings(CELERY_TASK_ALWAYS_EAGER=True):
+            self.client.post(f'{self.url}apply/', {'id': self.load_template.id, 'shop_id': self.shop.id}, format='json')
+        self.shop.refresh_from_db()
+        operation_types = {o.operation_type_name_id: o for o in OperationType.objects.filter(shop=self.shop)}
+        operation_types[self.operation_type_name2.id].status = OperationType.READY
+        operation_types[self.operation_type_name2.id].save()
+        dt_from = datetime.now().date()
+        for hour, value in ((10, 3), (11, 20)):
+            PeriodClients.objects.create(
+                operation_type=operation_types[self.operation_type_name2.id],
+                dttm_forecast=datetime.combine(dt_from, time(hour)),
+                dt_report=dt_from,
+                value=value,
+                type=PeriodClients.LONG_FORECASE_TYPE,
+            )
+
+        res = calculate_shop_load(self.shop, self.load_template, dt_from, dt_from + timedelta(days=1))
+        self.assertFalse(res['error'])
+        values = dict(PeriodClients.objects.filter(
+            operation_type=operation_types[self.operation_type_name1.id],
+            type=PeriodClients.LONG_FORECASE_TYPE,
+        ).values_list('dttm_forecast', 'value'))
+        self.assertEqual(len(values), 48)
+        self.assertEqual(values[datetime.combine(dt_from, time(10))], 2 * 2 + 4)
+        self.assertEqual(values[datetime.combine(dt_from, time(11))], 0 * 2 + 21)
+        self.assertEqual(values[datetime.combine(dt_from, time(12))], -1 * 2 + 1)
+        self.assertEqual(
+            set(OperationType.objects.filter(
+                id__in=[operation_types[self.operation_type_name1.id].id, operation_types[self.operation_type_name6.id].id],
+            ).values_list('status', flat=True)),
+            {OperationType.READY},
+        )
+
+        OperationTypeRelation.objects.filter(base=self.operation_type_template1, depended=operation_type_template6).update(
+            formula='__import__("os").system("true")')
+        res = calculate_shop_load(self.shop, self.load_template, dt_from, dt_from + timedelta(days=1))
+        self.assertEqual(res['code'], 'error_in_formula_rel')
+
+    def test_compile_formula(self):
+        values = [0.0, 1.0, 4.0]
+        self.assertEqual(list(compile_formula('a * 2 + a')(values)), [0.0, 3.0, 12.0])
+        self.assertEqual(list(compile_formula('1 / a if a > 1 else -a')(values)), [0.0, -1.0, 0.25])
+        self.assertEqual(list(compile_formula('a / (a - 1)')(values)), [0.0, 0.0, 4 / 3])
+        self.assertEqual(list(compile_formula('5')(values)), [5.0, 5.0, 5.0])
+        for formula in ('b + 1', 'a.real', 'open("f")', '[a]', 'a +', 'lambda a: a'):
+            with self.assertRaises(ValueError):
+                compile_formula(formula)
+
     def test_delete(self):
         response = self.client.delete(f'{self.url}{self.load_template.id}/')
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
@@ -1,4 +1,5 @@
 import datetime
+import graphlib
 import json
 
 # from src.main.demand.utils import create_predbills_request_function
@@ -6,7 +7,7 @@ import numpy as np
 import pandas as pd
 from dateutil.relativedelta import relativedelta
 from django.db import transaction
-from django.db.models import Case, F, Max, Min, TimeField, When
+from django.db.models import Case, F, Max, Min, Q, TimeField, When
 from django.db.models.functions import Greatest, Least
 from django.utils import timezone
 from django.utils.translation import gettext as _
@@ -15,6 +16,7 @@ from rest_framework.response import Response
 from src.apps.base.models import Shop, ShopSchedule
 from src.interfaces.api.serializers.shop import ShopSerializer
 from src.conf.djconfig import HOST
+from src.apps.forecast.load_template.formula import compile_formula
 from src.apps.forecast.models import (
     LoadTemplate,
     OperationType,
@@ -24,16 +26,18 @@ from src.apps.forecast.models import (
     PeriodClients,
 )
 from src.apps.timetable.models import WorkType
+from src.apps.timetable.work_type.efficiency_cache import invalidate_shop_efficiency_cache
 from src.common.download import xlsx_method
 
 
 ########################## Вспомогательные функции ##########################
-def create_operation_type_relations_dict(load_template_id, reverse=False):
+def create_operation_type_relations_dict(load_template_id, reverse=False, types=None):
     '''
     Создаёт словарь зависимых операций.
     reverse: показывает какая операция будет ключем:
     False - базовая операция
     True - операция от которой есть зависимость
+    types: типы отношений (по умолчанию все)
     '''
     key_field = 'base_id'
     type_of_relation = 'depended_id'
@@ -41,6 +45,8 @@ def create_operation_type_relations_dict(load_template_id, reverse=False):
         key_field = 'depended_id'
         type_of_relation = 'base_id'
     operation_type_relations = OperationTypeRelation.objects.filter(base__load_template_id=load_template_id)
+    if types:
+        operation_type_relations = operation_type_relations.filter(type__in=types)
     result_dict = {}
 
     for operation_type_relation in operation_type_relations:
@@ -82,124 +88,171 @@ def prepare_answer(error, code="", result=None, params={}):
 
 ##############################################################################
 
-def apply_formula(operation_type, operation_type_template, operation_type_relations, shop, dt_from, dt_to, tm_from=None, tm_to=None):
+def _get_window(tm_from, tm_to):
+    return (
+        tm_from.hour * 3600 + tm_from.minute * 60 + tm_from.second,
+        tm_to.hour * 3600 + tm_to.minute * 60 + tm_to.second,
+    )
+
+
+def apply_formulas(shop, operation_type_templates, dt_from, dt_to, tm_from=None, tm_to=None):
     '''
-    Применяет формулу для типа операций.
+    Применяет формулы для типов операций магазина.
     Логика частично взята из функции расчета эффективности.
     params:
-        operation_type: тип операции для которой делаем расчёт
-        operation_type_template: шаблон операции, из которой был создан данный тип опирации
-        operation_type_relations: словарь с отношениями типов операций, создается при помощи
-            функции create_operation_type_relations_dict
-        operation_types_dict: словарь с типами операций в данном магазине, где ключ это id OperationTypeName
+        shop: магазин
+        operation_type_templates: шаблоны конечных типов операций, для которых делаем расчёт
         dt_from: дата с которой применяем
         dt_to: дата до которой применяем
-        tm_from: время с которого применяем
-        tm_to: время до которого применяем
+        tm_from: время с которого применяем (для конечных типов операций, по умолчанию из шаблона)
+        tm_to: время до которого применяем (для конечных типов операций, по умолчанию из шаблона)
 
     перед вызовом данной функции необходимо вызвать функцию check_forecasts
 
-    подсчёт ведётся рекурсивно, начиная от конечного типа операций (к которому привязан тип работ)
-    пока не будут посчитаны все зависимые операции, результат записан не будет
-    порядок расчета зависимых операций не имеет значения, так как невозможны циклические отношения
+    граф отношений шаблона нагрузки обходится от конечных типов операций, зависимые типы операций
+    в статусе "Обновлён" тоже пересчитываются. Каждая формула вычисляется один раз над всем периодом
+    в порядке топологической сортировки графа (циклические отношения невозможны),
+    значения остальных зависимых типов операций загружаются одним запросом.
+    Результат записывается, только если все формулы посчитаны без ошибок.
     '''
     MINUTES_IN_DAY = 24 * 60
-    # shop = operation_type.shop
     period_lengths_minutes = shop.forecast_step_minutes.hour * 60 + shop.forecast_step_minutes.minute
     period_in_day = MINUTES_IN_DAY // period_lengths_minutes
-    tm_from = tm_from if tm_from else operation_type_template.tm_from if operation_type_template.tm_from else datetime.time(0)
-    tm_to = tm_to if tm_to else operation_type_template.tm_to if operation_type_template.tm_to else datetime.time(23, 59)
-    def dttm2index(dt_init, dttm):
-        days = (dttm.date() - dt_init).days
-        return days * period_in_day + (dttm.hour * 60 + dttm.minute) // period_lengths_minutes
-
-    def fill_array(array, db_list):
-        for model in db_list:
-            index = dttm2index(dt_from, model.dttm_forecast)
-            array[index] = model.value
-    
-    def count_res(op_type, template_relation):
-        temp_values = np.zeros(((dt_to - dt_from).days + 1)  * period_in_day)
-        fill_array(temp_values, PeriodClients.objects.filter(
-            operation_type=op_type,
-            dttm_forecast__date__gte=dt_from,
-            dttm_forecast__date__lte=dt_to,
-            dttm_forecast__time__gte=tm_from,
-            dttm_forecast__time__lte=tm_to,
-            type=PeriodClients.LONG_FORECASE_TYPE,
-        ).order_by('dttm_forecast'))
-        formula = eval(template_relation.get('formula'))
-        try:
-            return prepare_answer(False, result=np.array(list(map(formula, temp_values))))
-        except (NameError, ValueError) as e:
-            return prepare_answer(True, code="error_in_formula_rel", params={
-                    'formula': template_relation.get('formula'),
-                    'base': operation_type.operation_type_name.name,
-                    'depended': template_relation.get("depended").operation_type_name.name,
-                    'error': e,
-                })
-    
-    related_templates = operation_type_relations.get(operation_type_template.id, None)
-    
-    if not related_templates:
-        return prepare_answer(True, code="no_relations", params={'operation_type': operation_type})
-    result = np.zeros(((dt_to - dt_from).days + 1)  * period_in_day)
-    for template_relation in related_templates:
-        op_type = OperationType.objects.filter(shop=shop, operation_type_name_id=template_relation.get('depended').operation_type_name_id).first()
-        #operation_types_dict.get(template_relation.get('depended').operation_type_name_id)
-        if not op_type:
+    days_count = (dt_to - dt_from).days + 1
+    periods_seconds = np.tile(np.arange(period_in_day) * period_lengths_minutes * 60, days_count)
+
+    relations = {}
+    for relation in OperationTypeRelation.objects.filter(
+            base__load_template_id=shop.load_template_id,
+            type=OperationTypeRelation.TYPE_FORMULA,
+        ):
+        relations.setdefault(relation.base_id, []).append(relation)
+    templates = {
+        template.id: template
+        for template in OperationTypeTemplate.objects.select_related(
+            'operation_type_name',
+        ).filter(load_template_id=shop.load_template_id)
+    }
+    operation_types = {
+        operation_type.operation_type_name_id: operation_type
+        for operation_type in OperationType.objects.select_related('operation_type_name').filter(
+            shop=shop,
+            operation_type_name_id__in=[template.operation_type_name_id for template in templates.values()],
+        )
+    }
+
+    # шаблоны, которые нужно посчитать, и их зависимости, которые тоже считаются
+    windows = {}
+    graph = {}
+    templates_to_calc = [(template.id, (tm_from, tm_to)) for template in operation_type_templates]
+    while templates_to_calc:
+        template_id, (_tm_from, _tm_to) = templates_to_calc.pop()
+        if template_id in graph:
+            continue
+        template = templates[template_id]
+        operation_type = operation_types.get(template.operation_type_name_id)
+        if not operation_type:
             return prepare_answer(True, code="load_template_not_applied", params={"shop": shop})
-        if op_type.status == OperationType.UPDATED:
-            res = apply_formula(
-                op_type, 
-                template_relation.get('depended'), 
-                operation_type_relations,
-                shop,
-                dt_from, 
-                dt_to,
-            )
-            if res['error']:
-                return res     
-        res = count_res(op_type, template_relation)
-        if res['error']:
-            return res
-        else:
-            result += res['result']        
-    
-    PeriodClients.objects.filter(
-        operation_type=operation_type,
+        if not relations.get(template_id):
+            return prepare_answer(True, code="no_relations", params={'operation_type': operation_type})
+        windows[template_id] = _get_window(
+            _tm_from or template.tm_from or datetime.time(0),
+            _tm_to or template.tm_to or datetime.time(23, 59),
+        )
+        graph[template_id] = set()
+        for relation in relations[template_id]:
+            depended_operation_type = operation_types.get(templates[relation.depended_id].operation_type_name_id)
+            if not depended_operation_type:
+                return prepare_answer(True, code="load_template_not_applied", params={"shop": shop})
+            if depended_operation_type.status == OperationType.UPDATED:
+                graph[template_id].add(relation.depended_id)
+                templates_to_calc.append((relation.depended_id, (None, None)))
+
+    # значения остальных зависимых типов операций: строка массива на тип операций
+    input_operation_type_ids = {
+        operation_types[templates[relation.depended_id].operation_type_name_id].id
+        for template_id in graph
+        for relation in relations[template_id]
+        if relation.depended_id not in graph
+    }
+    input_indexes = {operation_type_id: i for i, operation_type_id in enumerate(input_operation_type_ids)}
+    input_values = np.zeros((len(input_indexes), days_count * period_in_day))
+    period_clients = list(PeriodClients.objects.filter(
+        operation_type_id__in=input_operation_type_ids,
         dttm_forecast__date__gte=dt_from,
         dttm_forecast__date__lte=dt_to,
-        dttm_forecast__time__gte=tm_from,
-        dttm_forecast__time__lte=tm_to,
         type=PeriodClients.LONG_FORECASE_TYPE,
-    ).delete()
-    values_list = []
-
-    for day in range((dt_to - dt_from).days + 1):
-        for period in range(MINUTES_IN_DAY // period_lengths_minutes):
+    ).order_by('dttm_forecast').values_list('operation_type_id', 'dttm_forecast', 'value'))
+    if period_clients:
+        operation_type_ids, dttms, values = zip(*period_clients)
+        dttms = np.array(dttms, dtype='datetime64[m]')
+        days = (dttms.astype('datetime64[D]') - np.datetime64(dt_from, 'D')).astype(int)
+        minutes = (dttms - dttms.astype('datetime64[D]')).astype(int)
+        input_values[
+            [input_indexes[operation_type_id] for operation_type_id in operation_type_ids],
+            days * period_in_day + minutes // period_lengths_minutes,
+        ] = values
+
+    results = {}
+    for template_id in graphlib.TopologicalSorter(graph).static_order():
+        window_from, window_to = windows[template_id]
+        window = (periods_seconds >= window_from) & (periods_seconds <= window_to)
+        result = np.zeros(days_count * period_in_day)
+        for relation in relations[template_id]:
+            if relation.depended_id in results:
+                depended_values = results[relation.depended_id]
+            else:
+                depended_operation_type = operation_types[templates[relation.depended_id].operation_type_name_id]
+                depended_values = input_values[input_indexes[depended_operation_type.id]]
+            try:
+                formula = compile_formula(relation.formula)
+            except ValueError as e:
+                return prepare_answer(True, code="error_in_formula_rel", params={
+                    'formula': relation.formula,
+                    'base': templates[template_id].operation_type_name.name,
+                    'depended': templates[relation.depended_id].operation_type_name.name,
+                    'error': e,
+                })
+            result += formula(np.where(window, depended_values, 0))
+        results[template_id] = np.where(window, result, 0)
+
+    period_clients = []
+    delete_q = Q()
+    for template_id, result in results.items():
+        operation_type = operation_types[templates[template_id].operation_type_name_id]
+        window_from, window_to = windows[template_id]
+        delete_q |= Q(
+            operation_type=operation_type,
+            dttm_forecast__time__gte=datetime.time(window_from // 3600, window_from // 60 % 60, window_from % 60),
+            dttm_forecast__time__lte=datetime.time(window_to // 3600, window_to // 60 % 60, window_to % 60),
+        )
+        for index in np.flatnonzero((periods_seconds >= window_from) & (periods_seconds <= window_to)):
             dttm = datetime.datetime.combine(
-                dt_from + datetime.timedelta(days=day), 
-                datetime.time(
-                    hour=period * period_lengths_minutes // 60,
-                    minute=period * period_lengths_minutes % 60
-                )
-            )
-            if dttm.time() > tm_to or dttm.time() < tm_from:
-                continue
-            values_list.append(
+                dt_from + datetime.timedelta(days=int(index) // period_in_day),
+                datetime.time(),
+            ) + datetime.timedelta(seconds=int(periods_seconds[index]))
+            period_clients.append(
                 PeriodClients(
                     dttm_forecast=dttm,
                     dt_report=dttm.date(),
-                    operation_type=operation_type, 
-                    value=result[dttm2index(dt_from, dttm)],
+                    operation_type=operation_type,
+                    value=result[index],
                     type=PeriodClients.LONG_FORECASE_TYPE,
                 )
             )
 
-    PeriodClients.objects.bulk_create(values_list)
-    operation_type.status = OperationType.READY
-    operation_type.save()
+    with transaction.atomic():
+        PeriodClients.objects.filter(
+            delete_q,
+            dttm_forecast__date__gte=dt_from,
+            dttm_forecast__date__lte=dt_to,
+            type=PeriodClients.LONG_FORECASE_TYPE,
+        ).delete()
+        PeriodClients.objects.bulk_create(period_clients, batch_size=1000)
+        OperationType.objects.filter(
+            id__in=[operation_types[templates[template_id].operation_type_name_id].id for template_id in results],
+        ).update(status=OperationType.READY)
+    invalidate_shop_efficiency_cache(shop_id=shop.id, dt_from=dt_from, dt_to=dt_to)
 
     return prepare_answer(False)
 
@@ -308,37 +361,12 @@ def calculate_shop_load(shop, load_template, dt_from, dt_to, lang='ru'):
     res = check_forecasts(shop)
     if res['error']:
         return res
-    # Словарь с конечными типами операций которые расчитываются по формуле
-    operation_types_dict = {
-        op.operation_type_name_id: op
-        for op in OperationType.objects.filter(
-            shop=shop, 
-            operation_type_name__do_forecast=OperationTypeName.FORECAST_FORMULA,
-            work_type__isnull=False,
-        )
-    }
-    operation_type_relations = create_operation_type_relations_dict(shop.load_template_id)
+    # Конечные типы операций которые расчитываются по формуле
     operation_type_templates = load_template.operation_type_templates.filter(
         operation_type_name__do_forecast=OperationTypeName.FORECAST_FORMULA,
-        work_type_name_id__isnull=False,
+        operation_type_name__work_type_name_id__isnull=False,
     )
-
-    for operation_type_template in operation_type_templates:
-        operation_type = operation_types_dict.get(operation_type_template.operation_type_name_id)
-        if not operation_type:
-            return prepare_answer(True, code="load_template_not_applied", params={'shop':shop})
-        
-        res = apply_formula(
-            operation_type, 
-            operation_type_template, 
-            operation_type_relations, 
-            shop,
-            dt_from, 
-            dt_to, 
-        )
-        if res['error']:
-            return res
-    return prepare_answer(False)
+    return apply_formulas(shop, operation_type_templates, dt_from, dt_to)
 
 
 '''
@@ -349,48 +377,39 @@ def apply_reverse_formula(operation_type, dt_from, dt_to, tm_from=None, tm_to=No
     res = check_forecasts(operation_type.shop)
     if res['error']:
         return res
-    operation_type_relations = create_operation_type_relations_dict(load_template_id, reverse=True)
-    operation_types = {
-        x.operation_type_name_id:x
-        for x in OperationType.objects.filter(shop_id=operation_type.shop_id)
-    }
+    operation_type_relations = create_operation_type_relations_dict(
+        load_template_id, reverse=True, types=[OperationTypeRelation.TYPE_FORMULA])
     operation_type_template = OperationTypeTemplate.objects.get(
         load_template_id=load_template_id,
         operation_type_name_id=operation_type.operation_type_name_id
     )
-    operation_types = set(search_related_operation_types(operation_type, operation_type_relations, operation_type_template, operation_types))
-    operation_type_relations = create_operation_type_relations_dict(load_template_id)
-    for operation_type in operation_types:
-        res = apply_formula(
-            operation_type[0], 
-            operation_type[1], 
-            operation_type_relations, 
-            operation_type.shop, 
-            dt_from, 
-            dt_to, 
-            tm_from=tm_from, 
-            tm_to=tm_to,
-        )
-        if res['error']:
-            return res
-    return prepare_answer(False)
-
+    # пересчитываются конечные типы операций, зависящие от измененного (сам он не пересчитывается)
+    template_ids = search_related_operation_types(operation_type_template.id, operation_type_relations)
+    template_ids.discard(operation_type_template.id)
+    if not template_ids:
+        return prepare_answer(False)
+    return apply_formulas(
+        operation_type.shop,
+        OperationTypeTemplate.objects.filter(id__in=template_ids),
+        dt_from,
+        dt_to,
+        tm_from=tm_from,
+        tm_to=tm_to,
+    )
 
-def search_related_operation_types(operation_type, operation_type_relations, operation_type_template, operation_types=None):
 
-    related_templates = operation_type_relations.get(operation_type_template.id)
-    result = []
-    if not related_templates:
-        return result + [(operation_type, operation_type_template), ]
-    else:
-        for template in related_templates:
-            result += search_related_operation_types(
-                operation_types.get(template.get('base').operation_type_name_id),
-                operation_type_relations, 
-                template.get('base'), 
-                operation_types,
-            )
-        return result
+def search_related_operation_types(operation_type_template_id, operation_type_relations, result=None):
+    '''
+    Ищет конечные шаблоны типов операций, которые зависят от данного.
+    operation_type_relations: словарь, созданный create_operation_type_relations_dict с reverse=True
+    '''
+    result = set() if result is None else result
+    related_template_ids = operation_type_relations.get(operation_type_template_id)
+    if not related_template_ids:
+        result.add(operation_type_template_id)
+    for template_id in related_template_ids or []:
+        search_related_operation_types(template_id, operation_type_relations, result)
+    return result
 
 
 def prepare_load_template_request(
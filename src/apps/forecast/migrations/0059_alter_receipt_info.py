@@ -0,0 +1,19 @@
+# Generated by Django 4.1.7 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forecast', '0058_auto_20221219_1232'),
+    ]
+
+    operations = [
+        # существующие данные переводятся в jsonb через USING "info"::jsonb
+        migrations.AlterField(
+            model_name='receipt',
+            name='info',
+            field=models.JSONField(),
+        ),
+    ]
@@ -357,14 +357,33 @@ class OperationTypeRelation(AbstractModel):
 
 
 class PeriodClientsManager(models.Manager):
-    def shop_times_filter(self, shop, *args, weekday=False, dt_from=None, dt_to=None, **kwargs):
+    @staticmethod
+    def get_shop_times(shop_ids, dt_from=None, dt_to=None):
+        """
+        Минимальное время открытия и максимальное время закрытия по расписанию магазинов
+        :return: {shop_id: {'open': time, 'close': time}}
+        """
+        if not dt_from:
+            dt_from = date.today().replace(day=1)
+        if not dt_to:
+            dt_to = dt_from + relativedelta(day=31)
+        return {
+            shop_times.pop('shop_id'): shop_times
+            for shop_times in ShopSchedule.objects.filter(
+                shop_id__in=shop_ids,
+                dt__gte=dt_from,
+                dt__lte=dt_to,
+                type=ShopSchedule.WORKDAY_TYPE,
+            ).values('shop_id').annotate(
+                open=Min('opens'),
+                close=Max('closes'),
+            ).order_by()
+        }
+
+    def shop_times_q(self, shop, weekday=False, dt_from=None, dt_to=None, shop_times=None):
         '''
-        param:
-        shop - Shop object
-        dt_from - date object
-        dt_to - date object
-        weekday - bool - смотреть по дням недели
-        https://docs.djangoproject.com/en/3.0/ref/models/querysets/#week-day
+        Q-фильтр dttm_forecast по времени работы магазина (см. shop_times_filter)
+        shop_times - dict - заранее посчитанные open/close из get_shop_times (чтобы не делать запрос на каждый магазин)
         '''
         if weekday and not shop.open_times.get('all', False):
             filt = models.Q()
@@ -378,29 +397,28 @@ class PeriodClientsManager(models.Manager):
                     filt |= (models.Q(dttm_forecast__week_day=week_day) & (models.Q(dttm_forecast__time__gte=tm_start) & models.Q(dttm_forecast__time__lt=tm_end)))
                 elif tm_start > tm_end:
                     filt |= (models.Q(dttm_forecast__week_day=week_day) & (models.Q(dttm_forecast__time__gte=tm_start) | models.Q(dttm_forecast__time__lt=tm_end)))
-            return self.filter(filt, *args, **kwargs)
-        else:
-            if not dt_from:
-                dt_from = date.today().replace(day=1)
-            if not dt_to:
-                dt_to = dt_from + relativedelta(day=31)
-            shop_times = ShopSchedule.objects.filter(
-                shop_id=shop.id,
-                dt__gte=dt_from,
-                dt__lte=dt_to,
-                type=ShopSchedule.WORKDAY_TYPE,
-            ).aggregate(
-                open=Min('opens'),
-                close=Max('closes'),
-            )
-            max_shop_time = time(23, 59) if time(0,0) == shop_times['close'] else shop_times['close']
-            min_shop_time = shop_times['open']
-            time_filter = {}
-            if max_shop_time != min_shop_time:
-                time_filter['dttm_forecast__time__gte'] = min_shop_time if min_shop_time < max_shop_time else max_shop_time
-                time_filter['dttm_forecast__time__lt'] = max_shop_time if min_shop_time < max_shop_time else min_shop_time
-            kwargs.update(time_filter)
-        return self.filter(*args, **kwargs)
+            return filt
+
+        if shop_times is None:
+            shop_times = self.get_shop_times([shop.id], dt_from=dt_from, dt_to=dt_to).get(shop.id, {})
+        max_shop_time = time(23, 59) if time(0,0) == shop_times.get('close') else shop_times.get('close')
+        min_shop_time = shop_times.get('open')
+        time_filter = {}
+        if max_shop_time != min_shop_time:
+            time_filter['dttm_forecast__time__gte'] = min_shop_time if min_shop_time < max_shop_time else max_shop_time
+            time_filter['dttm_forecast__time__lt'] = max_shop_time if min_shop_time < max_shop_time else min_shop_time
+        return models.Q(**time_filter)
+
+    def shop_times_filter(self, shop, *args, weekday=False, dt_from=None, dt_to=None, **kwargs):
+        '''
+        param:
+        shop - Shop object
+        dt_from - date object
+        dt_to - date object
+        weekday - bool - смотреть по дням недели
+        https://docs.djangoproject.com/en/3.0/ref/models/querysets/#week-day
+        '''
+        return self.filter(self.shop_times_q(shop, weekday=weekday, dt_from=dt_from, dt_to=dt_to), *args, **kwargs)
 
 
 class PeriodClients(AbstractModel):
@@ -451,6 +469,6 @@ class Receipt(AbstractModel):
     dt = models.DateField(verbose_name='Дата события')
     dttm_added = models.DateTimeField(auto_now_add=True)
     shop = models.ForeignKey(Shop, on_delete=models.PROTECT, blank=True, null=True)
-    info = models.TextField()
+    info = models.JSONField()
     data_type = models.CharField(max_length=128, verbose_name='Тип данных', null=True, blank=True)
     version = models.IntegerField(verbose_name='Версия объекта', default=0)
@@ -13,6 +13,7 @@ from rest_framework.serializers import ValidationError
 from src.apps.base.models import Shop
 from src.apps.forecast.models import OperationType, PeriodClients
 from src.common.download import xlsx_method
+from src.apps.timetable.work_type.efficiency_cache import invalidate_shop_efficiency_cache
 from src.common.models_converter import Converter
 
 logger = logging.getLogger('upload_demand')
@@ -130,6 +131,8 @@ def upload_demand_util_v2(new_workload, shop: Shop, type=PeriodClients.LONG_FORE
             type=type,
         ).delete()
         PeriodClients.objects.bulk_create(period_clients)
+        if period_clients:
+            invalidate_shop_efficiency_cache(shop_id=shop.id, dt_from=dttm_min.date(), dt_to=dttm_max.date())
     return list(errors)
 
 
@@ -154,6 +157,7 @@ def upload_demand_util_v3(operation_type_name, demand_file, index_col=None, type
             min_dttm = min(data[DTTM_COL])
             max_dttm = max(data[DTTM_COL])
             PeriodClients.objects.filter(operation_type=operation_types[s.id], dttm_forecast__gte=min_dttm, dttm_forecast__lte=max_dttm, type=type).delete()
+            invalidate_shop_efficiency_cache(shop_id=s.id, dt_from=min_dttm.date(), dt_to=max_dttm.date())
             creates.append(
                 (
                     s.code, 
@@ -367,4 +371,5 @@ def create_demand(data):
                 )
             )
         PeriodClients.objects.bulk_create(models_list)
+        invalidate_shop_efficiency_cache(shop_id=shop.id, dt_from=dt_from, dt_to=dt_to)
     return True
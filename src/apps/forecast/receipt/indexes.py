@@ -0,0 +1,63 @@
+"""
+Индексы по полям Receipt.info, выбранные по настройкам receive_data_info сетей.
+
+Набор полей в info зависит от сети и типа данных, поэтому индексы не создаются миграцией:
+для каждого типа данных и набора ключей timeserie_filters создается частичный индекс
+(shop_id, dt, (info -> 'ключ'), ...) WHERE data_type = 'тип', который используется фильтрами агрегации.
+"""
+import hashlib
+import json
+
+from django.db import connection
+
+from src.apps.base.models import Network
+from src.apps.forecast.models import Receipt
+
+INDEX_NAME = 'forecast_receipt_info_{hash}'
+
+
+def get_receipt_info_indexes(receive_data_info):
+    """
+    Индексы для настроек receive_data_info
+    :return: {index_name: (data_type, filter_keys)}
+    """
+    indexes = {}
+    for timeserie in receive_data_info:
+        data_type = timeserie.get('data_type')
+        for aggregate in timeserie.get('aggregate', []):
+            filter_keys = tuple(sorted(aggregate.get('timeserie_filters') or {}))
+            if not filter_keys:
+                continue
+            index_hash = hashlib.md5(json.dumps([data_type, filter_keys]).encode()).hexdigest()[:16]
+            indexes[INDEX_NAME.format(hash=index_hash)] = (data_type, filter_keys)
+    return indexes
+
+
+def get_networks_receipt_info_indexes():
+    indexes = {}
+    for settings_values in Network.objects.values_list('settings_values', flat=True):
+        receive_data_info = json.loads(settings_values or '{}').get('receive_data_info') or []
+        indexes.update(get_receipt_info_indexes(receive_data_info))
+    return indexes
+
+
+def create_receipt_info_indexes(indexes=None, concurrently=True):
+    """
+    Создает отсутствующие индексы (по умолчанию для настроек всех сетей)
+    :param concurrently: CREATE INDEX CONCURRENTLY (без блокировки записи, нельзя выполнять в транзакции)
+    :return: список имен индексов
+    """
+    if indexes is None:
+        indexes = get_networks_receipt_info_indexes()
+    quote_name = connection.ops.quote_name
+    table = quote_name(Receipt._meta.db_table)
+    with connection.cursor() as cursor:
+        for index_name, (data_type, filter_keys) in indexes.items():
+            key_expressions = ', '.join('(info -> %s)' for _ in filter_keys)
+            data_type_condition = 'data_type IS NULL' if data_type is None else 'data_type = %s'
+            cursor.execute(
+                f'CREATE INDEX {"CONCURRENTLY " if concurrently else ""}IF NOT EXISTS {quote_name(index_name)} '
+                f'ON {table} (shop_id, dt, {key_expressions}) WHERE {data_type_condition}',
+                list(filter_keys) + ([] if data_type is None else [data_type]),
+            )
+    return list(indexes)
@@ -0,0 +1,194 @@
+"""
+Потоковая загрузка событийных данных (Receipt) большими пачками.
+
+Строки NDJSON/CSV разбираются по одной и порциями загружаются через COPY во временную таблицу,
+затем одним запросом сливаются с forecast_receipt:
+существующие записи (по code) обновляются, если их версия меньше переданной, новые -- вставляются.
+Уникального индекса по code нет (системный импорт может создавать одинаковые коды),
+поэтому вместо INSERT ... ON CONFLICT используется UPDATE ... FROM + INSERT ... WHERE NOT EXISTS
+под блокировкой таблицы на время слияния.
+"""
+import codecs
+import csv
+import io
+import json
+
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from src.apps.base.models import Shop
+from src.apps.forecast.models import Receipt
+from src.common.decorators import require_lock
+from src.common.drf.parsers import NDJSON_FORMAT
+
+CSV_FORMAT = 'csv'
+MAX_ERRORS = 100
+
+STAGING_TABLE = 'receipt_ingestion'
+
+CREATE_STAGING_SQL = f'''
+CREATE TEMPORARY TABLE {STAGING_TABLE} (
+    line integer,
+    code varchar(256),
+    shop_code varchar(256),
+    dttm timestamp,
+    info jsonb
+) ON COMMIT DROP
+'''
+
+COPY_SQL = f'COPY {STAGING_TABLE} (line, code, shop_code, dttm, info) FROM STDIN WITH (FORMAT csv)'
+
+MERGE_SQL = '''
+WITH batch AS (
+    SELECT DISTINCT ON (s.code) s.code, sh.id AS shop_id, s.dttm, s.info
+    FROM {staging} s
+    INNER JOIN {shop} sh ON sh.code = s.shop_code AND sh.network_id = %(network_id)s
+    ORDER BY s.code, s.line DESC
+), updated AS (
+    UPDATE {receipt} r
+    SET shop_id = b.shop_id, dttm = b.dttm, dt = b.dttm::date, info = b.info,
+        data_type = %(data_type)s, version = %(version)s, dttm_modified = %(dttm_now)s
+    FROM batch b
+    WHERE r.code = b.code AND r.version < %(version)s
+    RETURNING r.code
+), inserted AS (
+    INSERT INTO {receipt} (code, shop_id, dttm, dt, info, data_type, version, dttm_added, dttm_modified)
+    SELECT b.code, b.shop_id, b.dttm, b.dttm::date, b.info, %(data_type)s, %(version)s, %(dttm_now)s, %(dttm_now)s
+    FROM batch b
+    WHERE NOT EXISTS (SELECT 1 FROM {receipt} r WHERE r.code = b.code)
+    RETURNING 1
+)
+SELECT
+    (SELECT COUNT(DISTINCT code) FROM updated),
+    (SELECT COUNT(*) FROM inserted)
+'''
+
+UNKNOWN_SHOPS_SQL = '''
+SELECT s.line, s.shop_code
+FROM {staging} s
+WHERE NOT EXISTS (SELECT 1 FROM {shop} sh WHERE sh.code = s.shop_code AND sh.network_id = %(network_id)s)
+ORDER BY s.line
+'''
+
+
+def _iter_records(lines, data_format):
+    """
+    :param lines: итератор строк тела запроса (bytes)
+    :return: итератор (номер строки, запись, ошибка)
+    """
+    text_lines = codecs.iterdecode(lines, 'utf-8-sig')
+    if data_format == CSV_FORMAT:
+        reader = csv.DictReader(text_lines)
+        for record in reader:
+            yield reader.line_num, record, None
+        return
+
+    for line_num, line in enumerate(text_lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_num, json.loads(line), None
+        except ValueError as e:
+            yield line_num, None, f'invalid json: {e}'
+
+
+def _get_row(record, receive_data_info):
+    """
+    :return: (code, shop_code, dttm, info) для COPY
+    """
+    if not isinstance(record, dict):
+        raise ValueError('record should be an object')
+    shop_code = record.get(receive_data_info['shop_code_field_name'])
+    code = record.get(receive_data_info['receipt_code_field_name'])
+    dttm = record.get(receive_data_info['dttm_field_name'])
+    if not shop_code or not code or not dttm:
+        raise ValueError('shop code, receipt code and datetime fields are required')
+    shop_code = str(shop_code).strip()
+    record[receive_data_info['shop_code_field_name']] = shop_code
+    dttm = parse_datetime(str(dttm))
+    if dttm is None:
+        raise ValueError('invalid datetime')
+    return code, shop_code, dttm.replace(tzinfo=None).isoformat(), json.dumps(record, ensure_ascii=False)
+
+
+def _copy_rows(cursor, rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(COPY_SQL, buffer)
+
+
+@require_lock(Receipt, 'SHARE ROW EXCLUSIVE')
+def _merge(cursor, params):
+    # блокировка исключает параллельную вставку одинаковых кодов, чтение таблицы не блокируется
+    cursor.execute(MERGE_SQL.format(
+        staging=STAGING_TABLE,
+        shop=Shop._meta.db_table,
+        receipt=Receipt._meta.db_table,
+    ), params)
+    return cursor.fetchone()
+
+
+def ingest_receipts(lines, data_format, data_type, receive_data_info, network_id, version=0, chunk_size=10000):
+    """
+    Загрузка событийных данных из потока строк
+    :param lines: итератор строк (bytes) в формате NDJSON (объект в строке) или CSV с заголовком
+    :param data_format: ndjson или csv
+    :param receive_data_info: настройки обработки данных типа data_type из network.settings_values
+    :param version: версия данных, существующие записи с версией меньше обновляются, остальные пропускаются
+    :return: словарь с количеством созданных, обновленных, пропущенных и отклоненных записей
+        и ошибками по строкам (не более MAX_ERRORS)
+    """
+    result = {
+        'created': 0,
+        'updated': 0,
+        'skipped': 0,
+        'rejected': 0,
+        'errors': [],
+    }
+
+    def _add_error(line_num, error):
+        result['rejected'] += 1
+        if len(result['errors']) < MAX_ERRORS:
+            result['errors'].append({'line': line_num, 'error': error})
+
+    staged = 0
+    unknown_shops = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(CREATE_STAGING_SQL)
+        rows = []
+        for line_num, record, error in _iter_records(lines, data_format):
+            if error is None:
+                try:
+                    rows.append((line_num,) + _get_row(record, receive_data_info))
+                except ValueError as e:
+                    error = str(e)
+            if error is not None:
+                _add_error(line_num, error)
+            if len(rows) >= chunk_size:
+                _copy_rows(cursor, rows)
+                staged += len(rows)
+                rows = []
+        if rows:
+            _copy_rows(cursor, rows)
+            staged += len(rows)
+
+        if staged:
+            params = {
+                'network_id': network_id,
+                'data_type': data_type,
+                'version': version,
+                'dttm_now': timezone.now(),
+            }
+            cursor.execute(UNKNOWN_SHOPS_SQL.format(staging=STAGING_TABLE, shop=Shop._meta.db_table), params)
+            for line_num, shop_code in cursor:
+                unknown_shops += 1
+                _add_error(line_num, f'There is no department with this identifier: {shop_code}.')
+            result['updated'], result['created'] = _merge(cursor, params)
+        cursor.execute(f'DROP TABLE {STAGING_TABLE}')
+
+    # повторы кода в пачке и записи с не меньшей версией
+    result['skipped'] = staged - unknown_shops - result['updated'] - result['created']
+    return result
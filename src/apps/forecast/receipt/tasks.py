@@ -1,20 +1,24 @@
 import json
-import pandas as pd
-from datetime import datetime, date, timedelta
+from datetime import datetime, date, time, timedelta
 from typing import Optional, Union, List
 import logging
 
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, DateTimeField, FloatField, Func, Q, Sum, TextField, Value
+from django.db.models.fields.json import KeyTextTransform, KeyTransform
+from django.db.models.functions import Cast, Coalesce, Replace, Trunc
 
 from src.adapters.celery.celery import app
 from src.apps.base.models import Network
 from src.apps.forecast.models import OperationTypeName, OperationType, Receipt, PeriodClients
+from src.apps.timetable.work_type.efficiency_cache import invalidate_shop_efficiency_cache
 
 receipt_logger = logging.getLogger('forecast_receipts')
 
 
 '''
-Исходные данные хранятся в виде json в базе данных. как именно агреггировать network.settings_values['receive_data_info']
+Исходные данные хранятся в виде jsonb в базе данных (Receipt.info). как именно агреггировать network.settings_values['receive_data_info']
 представлен в виде списка, каждый элемент состоит из:
 
 {
@@ -67,8 +71,7 @@ def aggregate_timeserie_value(
             )
 
     for network in Network.objects.all():
-        network.settings_values = json.loads(network.settings_values)
-        receive_data_info = network.settings_values.get('receive_data_info', '')
+        receive_data_info = network.parsed_settings.receive_data_info
 
         if receive_data_info:
             if data_types_to_process is not None:
@@ -78,16 +81,23 @@ def aggregate_timeserie_value(
                 ]
             for timeserie in receive_data_info:
                 grouping_period = timeserie.get('grouping_period', 'h1')
+                if grouping_period not in ('h1', 'd1'):
+                    # todo: добавить варианты, когда группируем не по часам.
+                    raise NotImplementedError(f'grouping {grouping_period}, timeserie {timeserie}, network {network}')
                 update_gap = update_tail if update_tail is not None else timeserie.get('update_gap', 3)
                 data_type = timeserie.get('data_type')
+
+                # типы операций всех агрегатов по магазинам: {shop_id: [(aggregate, operation_type), ...]}
+                shops_aggregates = {}
                 for aggregate in timeserie['aggregate']:
-                    aggr_filters = aggregate.get('timeserie_filters')
                     timeserie_action = aggregate.get('timeserie_action', 'sum')
 
                     # check all needed
                     if not (aggregate.get('timeserie_code') and (
                             aggregate.get('timeserie_value') or aggregate.get('timeserie_value_complex'))):
                         raise Exception(f"no needed values in timeserie: {timeserie}. Network: {network}")
+                    if timeserie_action not in ('sum', 'count', 'nunique'):
+                        raise NotImplementedError(f'timeserie_action {timeserie_action}, timeserie {timeserie}, network {network}')
 
                     receipt_logger.info(
                         'start aggregation {nw} for time series {ts}'.format(
@@ -99,88 +109,114 @@ def aggregate_timeserie_value(
                         code=aggregate['timeserie_code'],
                     )
 
-                    # по выборке всех типов очень много может быть, поэтому цикл по магазинам:
                     operations_type = OperationType.objects.filter(
                         shop__network=network,
                         operation_type_name=operation_type_name,
                     ).exclude(
                         dttm_deleted__lte=dttm_now,
                         shop__dttm_deleted__lte=dttm_now,
-                    ).select_related('shop')
-
+                    )
                     for operation_type in operations_type:
-                        for _dt in (dt - timedelta(days=i) for i in range(update_gap+1)):
-                            # Большое кол-во чеков занимают слишком много ОЗУ, обрабатываем по одному дню
-                            items_list = []
-                            items = Receipt.objects.filter(
-                                shop=operation_type.shop, dt=_dt, data_type=data_type)
-                            for item in items:
-                                item.info = json.loads(item.info)
-
-                                # Пропускаем записи, которые не удовл. значениям в фильтре
-                                if aggr_filters and not all(item.info.get(k) == v for k, v in aggr_filters.items()):
-                                    continue
-
-                                value = 0
-                                if 'timeserie_value' in aggregate:
-                                    value = item.info.get(aggregate['timeserie_value'], 0)  # fixme: то ли ошибку лучше кидать, то ли пропускать (0 ставить)
-                                    if isinstance(value, str):
-                                        value = value.replace(',', '.')
-                                    value = float(value)
-                                elif 'timeserie_value_complex' in aggregate:
-                                    value = '_'.join(item.info.get(field_name) for field_name in aggregate['timeserie_value_complex'])
-                                items_list.append({
-                                    'dttm': item.dttm,
-                                    'value': value,
-                                })
-
-                            item_df = pd.DataFrame(items_list, columns=['dttm', 'value'])
-
-                            if grouping_period == 'h1':
-                                # todo: вообще в item_df могут быть значения за какие-то периоды, но не за все. Когда нет, то по хорошему
-                                # надо ставить 0. Ноооо, скорей всего в этом случае (когда событий мало) нулевые периоды плохо будут
-                                # влиять на модель прогноза (если нет события, то риск ошибиться большой).
-
-                                item_df['dttm'] = item_df['dttm'].apply(lambda x: x.replace(minute=0, second=0, microsecond=0))
-                            elif grouping_period == 'd1':
-                                item_df['dttm'] = item_df['dttm'].apply(lambda x: x.replace(hour=0, minute=0, second=0, microsecond=0))
-                                item_df = pd.merge(
-                                    pd.DataFrame([_dt], columns=['dttm']).astype('datetime64[ns]'),
-                                    item_df,
-                                    on='dttm',
-                                    how='left',
-                                )
-                                item_df = item_df.fillna(0)  # пропущенные дни вставляем (в какие то дни что то могут не делать)
-                            else:
-                                # todo: добавить варианты, когда группируем не по часам.
-                                raise NotImplementedError(f'grouping {grouping_period}, timeserie {timeserie}, network {network}')
-
-                            periods_data = item_df.groupby('dttm')['value']
-                            if timeserie_action == 'sum':
-                                periods_data = periods_data.sum()
-                            elif timeserie_action == 'count':
-                                periods_data = periods_data.count()
-                            elif timeserie_action == 'nunique':
-                                periods_data = periods_data.nunique()
-                            else:
-                                raise NotImplementedError(f'timeserie_action {timeserie_action}, timeserie {timeserie}, network {network}')
-
-                            periods_data = periods_data.reset_index()
-                            PeriodClients.objects.filter(
+                        shops_aggregates.setdefault(operation_type.shop_id, []).append((aggregate, operation_type))
+
+                # по выборке всех типов очень много может быть, поэтому цикл по магазинам,
+                # агрегация чеков за все дни обновления выполняется в бд
+                dt_from = dt - timedelta(days=update_gap)
+                for shop_id, shop_aggregates in shops_aggregates.items():
+                    period_clients = []
+                    for aggregate, operation_type in shop_aggregates:
+                        period_clients.extend(
+                            PeriodClients(
                                 operation_type=operation_type,
+                                dttm_forecast=dttm,
                                 dt_report=_dt,
+                                value=value,
                                 type=PeriodClients.FACT_TYPE,
-                            ).delete()
+                            ) for _dt, dttm, value in _aggregate_receipts(
+                                shop_id, dt_from, dt, data_type, aggregate, grouping_period)
+                        )
+
+                    with transaction.atomic():
+                        PeriodClients.objects.filter(
+                            operation_type__in=[operation_type for _, operation_type in shop_aggregates],
+                            dt_report__gte=dt_from,
+                            dt_report__lte=dt,
+                            type=PeriodClients.FACT_TYPE,
+                        ).delete()
+                        PeriodClients.objects.bulk_create(period_clients, batch_size=1000)
+                    invalidate_shop_efficiency_cache(shop_id=shop_id, dt_from=dt_from, dt_to=dt)
+
+
+def _filter_receipts(receipts, aggr_filters):
+    """
+    Фильтр по значениям полей info: сравнение json значений (info -> 'ключ') = 'значение'::jsonb,
+    для None -- ключа нет или значение null.
+    Выражения совпадают с индексами из src.apps.forecast.receipt.indexes
+    """
+    for i, (key, value) in enumerate((aggr_filters or {}).items()):
+        alias = f'info_filter_{i}'
+        receipts = receipts.alias(**{alias: KeyTransform(key, 'info')})
+        if value is None:
+            receipts = receipts.filter(Q(**{f'{alias}__isnull': True}) | Q(**{alias: None}))
+        else:
+            receipts = receipts.filter(**{alias: value})
+    return receipts
+
+
+def _get_receipts_value(aggregate):
+    if 'timeserie_value' in aggregate:
+        return Coalesce(
+            Cast(
+                Replace(KeyTextTransform(aggregate['timeserie_value'], 'info'), Value(','), Value('.')),
+                FloatField(),
+            ),
+            Value(0.0),  # fixme: то ли ошибку лучше кидать, то ли пропускать (0 ставить)
+        )
+
+    # если какого-то из полей нет, значение null и не учитывается
+    return Func(
+        *(KeyTextTransform(field_name, 'info') for field_name in aggregate['timeserie_value_complex']),
+        template='(%(expressions)s)',
+        arg_joiner=" || '_' || ",
+        output_field=TextField(),
+    )
+
+
+def _aggregate_receipts(shop_id, dt_from, dt_to, data_type, aggregate, grouping_period):
+    """
+    Агрегация чеков магазина за дни с dt_from по dt_to по периодам grouping_period
+    :return: список (dt, dttm периода, значение)
+    """
+    timeserie_action = aggregate.get('timeserie_action', 'sum')
+    receipts = _filter_receipts(
+        Receipt.objects.filter(shop_id=shop_id, dt__gte=dt_from, dt__lte=dt_to, data_type=data_type),
+        aggregate.get('timeserie_filters'),
+    ).annotate(
+        receipt_value=_get_receipts_value(aggregate),
+    )
+    if timeserie_action == 'sum':
+        aggregation = Sum('receipt_value')
+    elif timeserie_action == 'count':
+        aggregation = Count('receipt_value')
+    else:
+        aggregation = Count('receipt_value', distinct=True)
+
+    if grouping_period == 'h1':
+        # todo: вообще в периодах могут быть значения за какие-то периоды, но не за все. Когда нет, то по хорошему
+        # надо ставить 0. Ноооо, скорей всего в этом случае (когда событий мало) нулевые периоды плохо будут
+        # влиять на модель прогноза (если нет события, то риск ошибиться большой).
+        return list(receipts.annotate(
+            period_dttm=Trunc('dttm', 'hour', output_field=DateTimeField()),
+        ).values('dt', 'period_dttm').annotate(
+            value=aggregation,
+        ).values_list('dt', 'period_dttm', 'value'))
 
-                            PeriodClients.objects.bulk_create([
-                                PeriodClients(
-                                    operation_type=operation_type,
-                                    dttm_forecast=period['dttm'],
-                                    dt_report=_dt,
-                                    value=period['value'],
-                                    type=PeriodClients.FACT_TYPE,
-                                ) for _, period in periods_data.iterrows()
-                            ])
+    days_values = dict(receipts.values('dt').annotate(value=aggregation).values_list('dt', 'value'))
+    # пропущенные дни вставляем (в какие то дни что то могут не делать)
+    return [
+        (_dt, datetime.combine(_dt, time()), days_values.get(_dt) or 0)
+        for _dt in (dt_from + timedelta(days=i) for i in range((dt_to - dt_from).days + 1))
+    ]
 
 
 @app.task
@@ -195,8 +231,7 @@ def clean_timeserie_actions(
     if isinstance(dttm_for_delete, str):
         dttm_for_delete = datetime.strptime(dttm_for_delete, settings.QOS_DATETIME_FORMAT)
     for network in Network.objects.all():
-        network.settings_values = json.loads(network.settings_values)
-        receive_data_info = network.settings_values.get('receive_data_info', '')
+        receive_data_info = network.parsed_settings.receive_data_info
 
         if receive_data_info:
             if data_types_to_process is not None:
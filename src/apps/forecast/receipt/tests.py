@@ -91,7 +91,7 @@ class TestReceiptCreateAndUpdate(TestsHelperMixin, APITestCase):
     def test_update_receipt(self):
         receipt = ReceiptFactory(
             shop=self.shop,
-            info=self.dump_data({}),
+            info={},
             data_type='Чек',
         )
         resp = self.client.put(
@@ -103,7 +103,7 @@ class TestReceiptCreateAndUpdate(TestsHelperMixin, APITestCase):
     def test_update_receipt_when_shop_with_spaces(self):
         receipt = ReceiptFactory(
             shop=self.shop,
-            info=self.dump_data({}),
+            info={},
             data_type='Чек',
         )
         data = self._get_data()
@@ -146,7 +146,7 @@ class TestReceiptCreateAndUpdate(TestsHelperMixin, APITestCase):
         self.assertEqual(resp.status_code, 201)
         receipt = Receipt.objects.filter(code=data['Ссылка']).first()
         self.assertIsNotNone(receipt)
-        receipt_data = json.loads(receipt.info)
+        receipt_data = receipt.info
         self.assertEqual(receipt_data['СуммаДокумента'], 1000)
 
         data['СуммаДокумента'] = 2000
@@ -158,7 +158,7 @@ class TestReceiptCreateAndUpdate(TestsHelperMixin, APITestCase):
         self.assertEqual(resp.status_code, 200)
         receipt = Receipt.objects.filter(code=data['Ссылка']).first()
         self.assertIsNotNone(receipt)
-        receipt_data = json.loads(receipt.info)
+        receipt_data = receipt.info
         self.assertEqual(receipt_data['СуммаДокумента'], 2000)
 
         data['СуммаДокумента'] = 1500
@@ -170,5 +170,68 @@ class TestReceiptCreateAndUpdate(TestsHelperMixin, APITestCase):
         self.assertEqual(resp.status_code, 412)
         receipt = Receipt.objects.filter(code=data['Ссылка']).first()
         self.assertIsNotNone(receipt)
-        receipt_data = json.loads(receipt.info)
+        receipt_data = receipt.info
         self.assertEqual(receipt_data['СуммаДокумента'], 2000)
+
+    def _post_bulk(self, body, content_type='application/x-ndjson', **params):
+        params.setdefault('data_type', 'Чек')
+        return self.client.generic(
+            'POST',
+            self.get_url('Receipt-bulk') + '?' + '&'.join(f'{k}={v}' for k, v in params.items()),
+            data=body.encode(),
+            content_type=content_type,
+        )
+
+    def test_bulk_ndjson(self):
+        data1 = self._get_data()
+        data2 = dict(self._get_data(), **{'Ссылка': 'code2', 'СуммаДокумента': '100'})
+        data2_last = dict(data2, **{'СуммаДокумента': '200', 'КодМагазина': f' {self.shop.code} '})
+        data_unknown_shop = dict(self._get_data(), **{'Ссылка': 'code3', 'КодМагазина': 'unknown'})
+        body = '\n'.join([
+            self.dump_data(data1),
+            self.dump_data(data2),
+            '{not json',
+            self.dump_data(data_unknown_shop),
+            self.dump_data(data2_last),
+            '',
+        ])
+        resp = self._post_bulk(body)
+        self.assertEqual(resp.status_code, 200)
+        result = resp.json()
+        self.assertEqual(
+            {k: result[k] for k in ('created', 'updated', 'skipped', 'rejected')},
+            {'created': 2, 'updated': 0, 'skipped': 1, 'rejected': 2},
+        )
+        self.assertEqual([e['line'] for e in result['errors']], [3, 4])
+        receipt = Receipt.objects.get(code='code2')
+        self.assertEqual(receipt.info['СуммаДокумента'], '200')
+        self.assertEqual(receipt.info['КодМагазина'], self.shop.code)
+        self.assertEqual(receipt.shop_id, self.shop.id)
+        self.assertEqual(receipt.data_type, 'Чек')
+        self.assertEqual(str(receipt.dt), '2020-07-24')
+
+        data2_last['СуммаДокумента'] = '300'
+        resp = self._post_bulk('\n'.join([self.dump_data(data1), self.dump_data(data2_last)]), version=1)
+        self.assertEqual(resp.json()['updated'], 2)
+        self.assertEqual(Receipt.objects.get(code='code2').info['СуммаДокумента'], '300')
+        self.assertEqual(Receipt.objects.get(code='code2').version, 1)
+
+        data2_last['СуммаДокумента'] = '400'
+        resp = self._post_bulk(self.dump_data(data2_last), version=1)
+        self.assertEqual(resp.json()['skipped'], 1)
+        self.assertEqual(Receipt.objects.get(code='code2').info['СуммаДокумента'], '300')
+        self.assertEqual(Receipt.objects.count(), 2)
+
+    def test_bulk_csv(self):
+        body = '\n'.join([
+            'Ссылка,Дата,КодМагазина,СуммаДокумента',
+            f'code1,2020-07-24T11:06:32,{self.shop.code},"10,5"',
+            f'code2,2020-07-24T12:06:32,{self.shop.code},20',
+            f'code3,invalid,{self.shop.code},30',
+        ])
+        resp = self._post_bulk(body, content_type='text/csv')
+        self.assertEqual(resp.status_code, 200)
+        result = resp.json()
+        self.assertEqual((result['created'], result['rejected']), (2, 1))
+        self.assertEqual(result['errors'], [{'line': 4, 'error': 'invalid datetime'}])
+        self.assertEqual(Receipt.objects.get(code='code1').info['СуммаДокумента'], '10,5')
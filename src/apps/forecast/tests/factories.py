@@ -1,4 +1,3 @@
-import json
 import random
 
 import factory
@@ -10,7 +9,7 @@ class ReceiptFactory(factory.django.DjangoModelFactory):
     code = factory.Faker('uuid4')
     dttm = factory.Faker('date_time_between', start_date='-1m', end_date='-1d')
     dt = factory.LazyAttribute(lambda o: o.dttm.date())
-    info = factory.Sequence(lambda n: json.dumps({'СуммаДокумента': random.randint(1, 100)}))
+    info = factory.Sequence(lambda n: {'СуммаДокумента': random.randint(1, 100)})
 
     class Meta:
         model = Receipt
@@ -0,0 +1,152 @@
+import logging
+from datetime import datetime, timedelta
+
+from django.db import transaction
+
+from src.apps.base.models import Employment
+from src.apps.integration.models import ShopExternalCode, UserExternalCode
+from src.apps.timetable.models import AttendanceRecords, WorkerDay
+from src.apps.timetable.worker_day.utils.utils import create_fact_from_attendance_records
+
+logger = logging.getLogger('zkteco')
+
+
+class ZKTecoAttendanceImport:
+    """
+    Загрузка событий терминалов ZKTeco в отметки (AttendanceRecords).
+
+    Коды сотрудников, коды зон, активные трудоустройства и плановые дни загружаются одним запросом на все события,
+    магазин отметки определяется в памяти, уже загруженные отметки отбрасываются по одному запросу.
+    Новые отметки создаются через bulk_create, после чего факт пересчитывается
+    по всем отметкам затронутых дней сотрудников (create_fact_from_attendance_records),
+    вместо сохранения каждой отметки отдельно.
+    """
+
+    def __init__(self, ext_system):
+        self.ext_system = ext_system
+        self.user_ids_by_code = dict(
+            UserExternalCode.objects.filter(
+                external_system=ext_system,
+            ).values_list('code', 'user_id')
+        )
+        # порядок как у ShopExternalCode.objects.filter(...).first()
+        self.shop_ids_by_area = {}
+        for area_code, shop_id in ShopExternalCode.objects.filter(
+                attendance_area__external_system=ext_system,
+        ).order_by('id').values_list('attendance_area__code', 'shop_id'):
+            self.shop_ids_by_area.setdefault(area_code, []).append(shop_id)
+        self.employments = {}
+        self.plan_shop_ids = {}
+
+    def _parse_events(self, events):
+        parsed = []
+        for event in events:
+            user_id = self.user_ids_by_code.get(str(event['pin']))
+            if not user_id:
+                logger.info(f"User for event {event} does not exist")
+                continue
+            dttm = datetime.strptime(event['eventTime'], "%Y-%m-%d %H:%M:%S")
+            parsed.append((user_id, dttm, event))
+        return parsed
+
+    def _load_user_data(self, user_ids, dt_from, dt_to):
+        employments = Employment.objects.get_active(
+            None,
+            dt_from, dt_to,
+            employee__user_id__in=user_ids,
+            position__isnull=False,
+        ).values_list('employee__user_id', 'employee_id', 'shop_id', 'dt_hired', 'dt_fired').order_by('id')
+        for user_id, employee_id, shop_id, dt_hired, dt_fired in employments:
+            self.employments.setdefault(user_id, []).append((employee_id, shop_id, dt_hired, dt_fired))
+
+        plan_wdays = WorkerDay.objects.filter(
+            employee__user_id__in=user_ids,
+            dt__gte=dt_from,
+            dt__lte=dt_to,
+            is_fact=False,
+            is_approved=True,
+            type__is_dayoff=False,
+        ).values_list('employee__user_id', 'dt', 'shop_id')
+        for user_id, dt, shop_id in plan_wdays:
+            self.plan_shop_ids.setdefault((user_id, dt), set()).add(shop_id)
+
+    def _get_active_employments(self, user_id, dt):
+        return [
+            (employee_id, shop_id) for employee_id, shop_id, dt_hired, dt_fired in self.employments.get(user_id, [])
+            if (dt_hired is None or dt_hired <= dt) and (dt_fired is None or dt_fired >= dt)
+        ]
+
+    def _get_shop_id(self, user_id, dttm, area_code):
+        area_shop_ids = self.shop_ids_by_area.get(area_code, [])
+        plan_shop_ids = self.plan_shop_ids.get((user_id, dttm.date()), set())
+        for shop_id in area_shop_ids:
+            if shop_id in plan_shop_ids:
+                return shop_id
+
+        active_shop_ids = {shop_id for _employee_id, shop_id in self._get_active_employments(user_id, dttm.date())}
+        for shop_id in area_shop_ids:
+            if shop_id in active_shop_ids:
+                return shop_id
+        return area_shop_ids[0] if area_shop_ids else None
+
+    def _get_employee_ids(self, user_id, dt, shop_id):
+        """
+        :return: сотрудники пользователя с активным трудоустройством на дату, первый -- трудоустроенный в магазин отметки
+        """
+        active_employments = self._get_active_employments(user_id, dt)
+        return sorted(
+            dict.fromkeys(employee_id for employee_id, _shop_id in active_employments),
+            key=lambda employee_id: (employee_id, shop_id) not in active_employments,
+        )
+
+    def run(self, events):
+        """
+        :param events: события ZKTeco (pin, eventTime, accZone)
+        :return: кол-во созданных отметок
+        """
+        events = self._parse_events(events)
+        if not events:
+            return 0
+        user_ids = {user_id for user_id, _dttm, _event in events}
+        dt_from = min(dttm for _user_id, dttm, _event in events).date()
+        dt_to = max(dttm for _user_id, dttm, _event in events).date()
+        self._load_user_data(user_ids, dt_from, dt_to)
+
+        existing_records = set(AttendanceRecords.objects.filter(
+            user_id__in=user_ids,
+            dt__gte=dt_from - timedelta(days=1),
+            dt__lte=dt_to + timedelta(days=1),
+        ).values_list('user_id', 'shop_id', 'dttm'))
+
+        records = []
+        employee_days = {}
+        for user_id, dttm, event in sorted(events, key=lambda e: (e[0], e[1])):
+            shop_id = self._get_shop_id(user_id, dttm, event['accZone'])
+            if not shop_id:
+                logger.info(f"Shop for event {event} does not exist")
+                continue
+            if (user_id, shop_id, dttm) in existing_records:  # если отметка уже внесена игнорируем
+                continue
+            employee_ids = self._get_employee_ids(user_id, dttm.date(), shop_id)
+            if not employee_ids:
+                logger.info(f"Active employment for event {event} does not exist")
+                continue
+            existing_records.add((user_id, shop_id, dttm))
+            records.append(AttendanceRecords(
+                user_id=user_id,
+                employee_id=employee_ids[0],
+                dt=dttm.date(),
+                dttm=dttm,
+                shop_id=shop_id,
+                # тип отметки и сотрудник определяются при пересчете факта
+                type=AttendanceRecords.TYPE_NO_TYPE,
+                terminal=True,
+            ))
+            for employee_id in employee_ids:
+                employee_days.setdefault(employee_id, set()).add(dttm.date())
+
+        if records:
+            with transaction.atomic():
+                AttendanceRecords.objects.bulk_create(records, batch_size=1000)
+                create_fact_from_attendance_records(employee_days_list=employee_days.items())
+        return len(records)
@@ -1,5 +1,5 @@
 import os, logging
-from datetime import datetime, timedelta, date
+from datetime import datetime, timedelta
 
 import requests
 from django.db.models.expressions import Exists, OuterRef
@@ -14,7 +14,8 @@ from src.apps.base.models import (
     Shop,
     User,
 )
-from src.apps.timetable.models import AttendanceRecords, WorkerDay
+from src.apps.timetable.models import AttendanceRecords
+from src.apps.integration.attendance_import import ZKTecoAttendanceImport
 from src.apps.integration.models import (
     AttendanceArea,
     ExternalSystem,
@@ -45,85 +46,17 @@ def import_urv_zkteco():
     dt_from=max_date.strftime("%Y-%m-%d 00:00:00")
     dt_to=(max_date + timedelta(31)).strftime("%Y-%m-%d 00:00:00") # в zkteco обязательна дата окончания
 
+    events = []
     page = 0
-    users = {}
-
-    wds = WorkerDay.objects.filter(
-        employee__user__in=users.keys(),
-        dt__gte=max_date - timedelta(1),
-        dt__lte=date.today() + timedelta(1),
-        is_fact=False,
-        is_approved=True,
-        type__is_dayoff=False,
-    ).select_related('employee', 'shop')
-
-    worker_days = {}
-    for wd in wds:
-        worker_days.setdefault(wd.employee.user_id, {})[wd.dt] = wd
-
     while True:
         page += 1
-        events = zkteco.get_events(page=page, dt_from=dt_from, dt_to=dt_to)
-        if not events['data']:
+        page_events = zkteco.get_events(page=page, dt_from=dt_from, dt_to=dt_to)
+        if not page_events['data']:
             break
+        events.extend(page_events['data'])
 
-        for event in events['data']:
-            try:
-                user_token = UserExternalCode.objects.get(
-                    code=event['pin'],
-                    external_system=ext_system)
-            except UserExternalCode.DoesNotExist:
-                logger.info(f"User for event {event} does not exist")
-                continue
-            user_id = user_token.user_id
-            dttm = datetime.strptime(event['eventTime'], "%Y-%m-%d %H:%M:%S")
-            wd = worker_days.get(user_id, {}).get(dttm.date)
-            if wd and ShopExternalCode.objects.filter(shop_id=wd.shop_id, attendance_area__code=event['accZone'], attendance_area__external_system=ext_system).exists():
-                shop = wd.shop
-            else:
-                shop_ids = Employment.objects.get_active(
-                    None,
-                    dttm, dttm,
-                    employee__user_id=user_id,
-                    position__isnull=False,
-                ).values_list('shop_id', flat=True)
-                shop_token = ShopExternalCode.objects.filter(
-                    attendance_area__code=event['accZone'],
-                    attendance_area__external_system=ext_system,
-                    shop_id__in=shop_ids,
-                ).first() or ShopExternalCode.objects.filter(
-                    attendance_area__code=event['accZone'],
-                    attendance_area__external_system=ext_system,
-                ).first()
-                if shop_token:
-                    shop = shop_token.shop
-                else:
-                    logger.info(f"Shop for event {event} does not exist")
-                    continue
-
-            users.setdefault(user_id, []).append((dttm, shop))
-
-    attrs = AttendanceRecords.objects.filter(
-        user_id__in=users.keys(),
-        dt__gte=max_date - timedelta(1),
-        dt__lte=date.today(),
-    )
-    attendance_records = {}
-    for attr in attrs:
-        attendance_records.setdefault(attr.user_id, {}).setdefault(attr.shop_id, {})[attr.dttm] = attr
-
-    for user_id, dttms in users.items():
-        dttms = sorted(dttms, key=lambda x: x[0])
-        for dttm, shop in dttms:
-            record = attendance_records.get(user_id, {}).get(shop.id, {}).get(dttm)
-            if record: # если отметка уже внесена игнорируем
-                continue
-            AttendanceRecords.objects.create(
-                user_id=user_id,
-                dttm=dttm,
-                shop=shop,
-                terminal=True,
-            )
+    created = ZKTecoAttendanceImport(ext_system).run(events)
+    logger.info(f'Imported {created} attendance records from {len(events)} events')
 
 
 @app.task()
@@ -170,7 +170,7 @@ class TestIntegration(TestsHelperMixin, APITestCase):
             attendance_area=self.att_area,
             shop=self.shop,
         )
-        with patch('src.apps.integration.zkteco.requests', new_callable=TestRequestMock) as mock_request:
+        with patch('src.adapters.zkteco.zkteco.requests', new_callable=TestRequestMock) as mock_request:
             export_workers_zkteco()
         self.assertEqual(UserExternalCode.objects.count(), 5)
 
@@ -180,7 +180,7 @@ class TestIntegration(TestsHelperMixin, APITestCase):
             attendance_area=self.att_area,
             shop=self.shop,
         )
-        with patch('src.apps.integration.zkteco.requests', new_callable=TestRequestMock) as mock_request:
+        with patch('src.adapters.zkteco.zkteco.requests', new_callable=TestRequestMock) as mock_request:
             export_workers_zkteco()
             self.employment2.dt_fired = date.today() - timedelta(days=2)
             self.employment2.save()
@@ -196,7 +196,7 @@ class TestIntegration(TestsHelperMixin, APITestCase):
             attendance_area=self.att_area,
             shop=self.shop2,
         )
-        with patch('src.apps.integration.zkteco.requests', new_callable=TestRequestMock) as mock_request:
+        with patch('src.adapters.zkteco.zkteco.requests', new_callable=TestRequestMock) as mock_request:
             export_workers_zkteco()
             self.assertEqual(UserExternalCode.objects.count(), 5)
             self.employment2.dt_fired = date.today() - timedelta(days=2)
@@ -218,7 +218,7 @@ class TestIntegration(TestsHelperMixin, APITestCase):
             attendance_area=self.att_area2,
             shop=self.shop2,
         )
-        with patch('src.apps.integration.zkteco.requests', new_callable=TestRequestMock) as mock_request:
+        with patch('src.adapters.zkteco.zkteco.requests', new_callable=TestRequestMock) as mock_request:
             export_workers_zkteco()
             self.assertEqual(UserExternalCode.objects.count(), 5)
             self.employment2.dt_fired = date.today() - timedelta(days=2)
@@ -262,7 +262,7 @@ class TestIntegration(TestsHelperMixin, APITestCase):
             dttm_work_end=datetime.combine(date.today() - timedelta(1), time(20)),
             is_approved=True,
         )
-        with patch('src.apps.integration.zkteco.requests', new_callable=TestRequestMock) as mock_request:
+        with patch('src.adapters.zkteco.zkteco.requests', new_callable=TestRequestMock) as mock_request:
             import_urv_zkteco()
 
         self.assertEqual(WorkerDay.objects.filter(is_approved=True).count(), 3)
@@ -341,7 +341,7 @@ class TestIntegration(TestsHelperMixin, APITestCase):
                     ],
                 }
         }
-        with patch('src.apps.integration.zkteco.requests', new_callable=TestRequestMock) as mock_request:
+        with patch('src.adapters.zkteco.zkteco.requests', new_callable=TestRequestMock) as mock_request:
             import_urv_zkteco()
 
         self.assertEqual(WorkerDay.objects.filter(is_approved=True).count(), 3)
@@ -363,7 +363,7 @@ class TestIntegration(TestsHelperMixin, APITestCase):
             code='1',
         )
 
-        with patch('src.apps.integration.zkteco.requests', new_callable=TestRequestMock) as mock_request:
+        with patch('src.adapters.zkteco.zkteco.requests', new_callable=TestRequestMock) as mock_request:
             import_urv_zkteco()
 
         self.assertEqual(WorkerDay.objects.filter(is_approved=True).count(), 1)
@@ -442,7 +442,7 @@ class TestIntegration(TestsHelperMixin, APITestCase):
                     ],
                 }
         }
-        with patch('src.apps.integration.zkteco.requests', new_callable=TestRequestMock) as mock_request:
+        with patch('src.adapters.zkteco.zkteco.requests', new_callable=TestRequestMock) as mock_request:
             import_urv_zkteco()
 
         self.assertEqual(WorkerDay.objects.filter(is_approved=True).count(), 1)
@@ -561,7 +561,7 @@ class TestIntegration(TestsHelperMixin, APITestCase):
                     ],
                 }
         }
-        with patch('src.apps.integration.zkteco.requests', new_callable=TestRequestMock) as mock_request:
+        with patch('src.adapters.zkteco.zkteco.requests', new_callable=TestRequestMock) as mock_request:
             import_urv_zkteco()
 
         self.assertEqual(WorkerDay.objects.filter(is_approved=True).count(), 4)
@@ -682,7 +682,7 @@ class TestIntegration(TestsHelperMixin, APITestCase):
                     ],
                 }
         }
-        with patch('src.apps.integration.zkteco.requests', new_callable=TestRequestMock) as mock_request:
+        with patch('src.adapters.zkteco.zkteco.requests', new_callable=TestRequestMock) as mock_request:
             import_urv_zkteco()
 
         self.assertEqual(WorkerDay.objects.filter(is_approved=True).count(), 4)
@@ -802,7 +802,7 @@ class TestIntegration(TestsHelperMixin, APITestCase):
                     ],
                 }
         }
-        with patch('src.apps.integration.zkteco.requests', new_callable=TestRequestMock) as mock_request:
+        with patch('src.adapters.zkteco.zkteco.requests', new_callable=TestRequestMock) as mock_request:
             import_urv_zkteco()
 
         self.assertEqual(WorkerDay.objects.filter(is_approved=True).count(), 4)
@@ -922,7 +922,7 @@ class TestIntegration(TestsHelperMixin, APITestCase):
                     ],
                 }
         }
-        with patch('src.apps.integration.zkteco.requests', new_callable=TestRequestMock) as mock_request:
+        with patch('src.adapters.zkteco.zkteco.requests', new_callable=TestRequestMock) as mock_request:
             import_urv_zkteco()
 
         self.assertEqual(WorkerDay.objects.filter(is_approved=True).count(), 4)
@@ -996,7 +996,7 @@ class TestIntegration(TestsHelperMixin, APITestCase):
                     ],
                 },
         }
-        with patch('src.apps.integration.zkteco.requests', new_callable=TestRequestMock) as mock_request:
+        with patch('src.adapters.zkteco.zkteco.requests', new_callable=TestRequestMock) as mock_request:
             import_urv_zkteco()
 
         self.assertEqual(WorkerDay.objects.filter(is_approved=True).count(), 2)
@@ -1156,7 +1156,7 @@ class TestIntegration(TestsHelperMixin, APITestCase):
             dttm_work_end=datetime.combine(date.today(), time(18)),
             is_approved=True,
         )
-        with patch('src.apps.integration.zkteco.requests', new_callable=TestRequestMock) as mock_request:
+        with patch('src.adapters.zkteco.zkteco.requests', new_callable=TestRequestMock) as mock_request:
             import_urv_zkteco()
 
         self.assertEqual(WorkerDay.objects.filter(is_approved=True).count(), 6)
@@ -1172,6 +1172,43 @@ class TestIntegration(TestsHelperMixin, APITestCase):
         self.assertEqual(employee3_worker_day.dttm_work_start, dttm_employee3_coming)
         self.assertEqual(employee3_worker_day.dttm_work_end, dttm_employee3_leaving)
 
+    def test_import_urv_shop_from_plan_and_no_duplicates(self):
+        ShopExternalCode.objects.create(
+            attendance_area=self.att_area,
+            shop=self.shop,
+        )
+        ShopExternalCode.objects.create(
+            attendance_area=self.att_area,
+            shop=self.root_shop,
+        )
+        UserExternalCode.objects.create(
+            external_system=self.ext_system,
+            user_id=self.employment2.employee.user_id,
+            code='1',
+        )
+        WorkerDay.objects.create(
+            shop_id=self.root_shop.id,
+            employee_id=self.employment2.employee_id,
+            employment=self.employment2,
+            type_id=WorkerDay.TYPE_WORKDAY,
+            dt=date.today(),
+            dttm_work_start=datetime.combine(date.today(), time(10)),
+            dttm_work_end=datetime.combine(date.today(), time(20)),
+            is_approved=True,
+        )
+        TestRequestMock.responses["/transaction/listAttTransaction"] = default_transaction_response
+        with patch('src.adapters.zkteco.zkteco.requests', new_callable=TestRequestMock) as mock_request:
+            import_urv_zkteco()
+            # повторная загрузка тех же событий не создает отметки
+            import_urv_zkteco()
+
+        self.assertEqual(AttendanceRecords.objects.count(), 3)
+        self.assertEqual(set(AttendanceRecords.objects.values_list('shop_id', flat=True)), {self.root_shop.id})
+        fact_approved = WorkerDay.objects.get(is_fact=True, is_approved=True, dt=date.today())
+        self.assertEqual(fact_approved.shop_id, self.root_shop.id)
+        self.assertEqual(fact_approved.dttm_work_start, dttm_first)
+        self.assertEqual(fact_approved.dttm_work_end, dttm_third)
+
     def test_export_workers_m2m(self):
         self.att_area2, _ = AttendanceArea.objects.update_or_create(
             code='2',
@@ -1188,7 +1225,7 @@ class TestIntegration(TestsHelperMixin, APITestCase):
             attendance_area=self.att_area2,
             shop=self.shop,
         )
-        with patch('src.apps.integration.zkteco.requests', new_callable=TestRequestMock) as mock_request:
+        with patch('src.adapters.zkteco.zkteco.requests', new_callable=TestRequestMock) as mock_request:
             export_workers_zkteco()
         self.assertEqual(UserExternalCode.objects.count(), 5)
 
@@ -1198,7 +1235,7 @@ class TestIntegration(TestsHelperMixin, APITestCase):
             shop=self.shop,
         )
         with patch.object(transaction, 'on_commit', lambda t: t()):
-            with patch('src.apps.integration.zkteco.requests', spec=TestRequestMock) as mock_request:
+            with patch('src.adapters.zkteco.zkteco.requests', spec=TestRequestMock) as mock_request:
                 mock_request.json.return_value = {"code": 0}
                 mock_request.request.return_value = mock_request
                 Employment.objects.create(
@@ -1245,7 +1282,7 @@ class TestIntegration(TestsHelperMixin, APITestCase):
             code=settings.ZKTECO_USER_ID_SHIFT + self.user1.id,
         )   
         with patch.object(transaction, 'on_commit', lambda t: t()):
-            with patch('src.apps.integration.zkteco.requests', spec=TestRequestMock) as mock_request:
+            with patch('src.adapters.zkteco.zkteco.requests', spec=TestRequestMock) as mock_request:
                 mock_request.json.return_value = {"code": 0}
                 mock_request.request.return_value = mock_request
                 self.employment1.dt_fired = date(2019, 1, 1)
@@ -1281,7 +1318,7 @@ class TestIntegration(TestsHelperMixin, APITestCase):
             code=settings.ZKTECO_USER_ID_SHIFT + self.user1.id,
         )   
         with patch.object(transaction, 'on_commit', lambda t: t()):
-            with patch('src.apps.integration.zkteco.requests', spec=TestRequestMock) as mock_request:
+            with patch('src.adapters.zkteco.zkteco.requests', spec=TestRequestMock) as mock_request:
                 mock_request.json.return_value = {"code": 0}
                 mock_request.request.return_value = mock_request
                 self.employment1.dt_fired = date(2019, 1, 1)
@@ -1312,7 +1349,7 @@ class TestIntegration(TestsHelperMixin, APITestCase):
             code=settings.ZKTECO_USER_ID_SHIFT + self.user1.id,
         )   
         with patch.object(transaction, 'on_commit', lambda t: t()):
-            with patch('src.apps.integration.zkteco.requests', spec=TestRequestMock) as mock_request:
+            with patch('src.adapters.zkteco.zkteco.requests', spec=TestRequestMock) as mock_request:
                 mock_request.json.return_value = {"code": 0}
                 mock_request.request.return_value = mock_request
                 self.employment1.delete()
@@ -1353,7 +1390,7 @@ class TestIntegration(TestsHelperMixin, APITestCase):
             code=settings.ZKTECO_USER_ID_SHIFT + self.user1.id,
         )   
         with patch.object(transaction, 'on_commit', lambda t: t()):
-            with patch('src.apps.integration.zkteco.requests', spec=TestRequestMock) as mock_request:
+            with patch('src.adapters.zkteco.zkteco.requests', spec=TestRequestMock) as mock_request:
                 mock_request.json.return_value = {"code": 0}
                 mock_request.request.return_value = mock_request
                 
@@ -1424,7 +1461,7 @@ class TestIntegration(TestsHelperMixin, APITestCase):
         )
         dt = date.today()
         with patch.object(transaction, 'on_commit', lambda t: t()):
-            with patch('src.apps.integration.zkteco.requests', spec=TestRequestMock) as mock_request:
+            with patch('src.adapters.zkteco.zkteco.requests', spec=TestRequestMock) as mock_request:
                 mock_request.json.return_value = {"code": 0}
                 mock_request.request.return_value = mock_request
 
@@ -1529,7 +1566,7 @@ class TestIntegration(TestsHelperMixin, APITestCase):
             shop=self.root_shop,
         )
         with patch.object(transaction, 'on_commit', lambda t: t()):
-            with patch('src.apps.integration.zkteco.requests', spec=TestRequestMock) as mock_request:
+            with patch('src.adapters.zkteco.zkteco.requests', spec=TestRequestMock) as mock_request:
                 mock_request.json.return_value = {"code": 0}
                 mock_request.request.return_value = mock_request
                 Employment.objects.create(
@@ -1580,7 +1617,7 @@ class TestIntegration(TestsHelperMixin, APITestCase):
         )
         dt = date.today()
         with patch.object(transaction, 'on_commit', lambda t: t()):
-            with patch('src.apps.integration.zkteco.requests', spec=TestRequestMock) as mock_request:
+            with patch('src.adapters.zkteco.zkteco.requests', spec=TestRequestMock) as mock_request:
                 mock_request.json.return_value = {"code": 0}
                 mock_request.request.return_value = mock_request
 
@@ -1664,7 +1701,7 @@ class TestIntegration(TestsHelperMixin, APITestCase):
         self.employment1.dt_fired = date(2019, 1, 1)
         self.employment1.save()
         with patch.object(transaction, 'on_commit', lambda t: t()):
-            with patch('src.apps.integration.zkteco.requests', spec=TestRequestMock) as mock_request:
+            with patch('src.adapters.zkteco.zkteco.requests', spec=TestRequestMock) as mock_request:
                 mock_request.json.return_value = {"code": 0}
                 mock_request.request.return_value = mock_request
                 self.employment1.dt_hired = date(2018, 11, 1)
@@ -1719,7 +1756,7 @@ class TestIntegration(TestsHelperMixin, APITestCase):
         WorkTypeFactory(shop=self.shop, work_type_name=work_type_name)
         work_type = WorkTypeFactory(shop=self.shop2, work_type_name=work_type_name)
 
-        with patch('src.apps.integration.zkteco.requests', new_callable=TestRequestMock):
+        with patch('src.adapters.zkteco.zkteco.requests', new_callable=TestRequestMock):
             import_urv_zkteco()
         self.assertEqual(AttendanceRecords.objects.count(), 1)
         self.assertEqual(AttendanceRecords.objects.first().shop_id, self.shop.id)
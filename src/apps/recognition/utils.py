@@ -1,4 +1,3 @@
-import json
 import logging
 
 from django.db.models import Subquery, Q, OuterRef
@@ -37,8 +36,8 @@ def get_worker_days_with_no_ticks(dttm: datetime):
 
     for shop in Shop.objects.select_related('network').all():
         dttm_to = dttm + timedelta(hours=shop.get_tz_offset())
-        dttm_from_comming = dttm_to - timedelta(seconds=json.loads(shop.network.settings_values).get('delta_for_comming_in_secs', 300))
-        dttm_from_leaving = dttm_to - timedelta(seconds=json.loads(shop.network.settings_values).get('delta_for_leaving_in_secs', 300))
+        dttm_from_comming = dttm_to - timedelta(seconds=shop.network.parsed_settings.get('delta_for_comming_in_secs', 300))
+        dttm_from_leaving = dttm_to - timedelta(seconds=shop.network.parsed_settings.get('delta_for_leaving_in_secs', 300))
         not_coming_records_list = list(
             pfh_qs.filter(
                 dttm_work_start_plan__gte=dttm_from_comming,
@@ -0,0 +1,117 @@
+import logging
+
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from src.apps.base.models import Shop, User
+from src.apps.timetable.models import AttendanceRecords, WorkerDay
+
+logger = logging.getLogger('attendance_records')
+
+
+class AttendanceRecordsBatch:
+    """
+    Отложенные действия пакетной обработки отметок.
+
+    При сохранении каждой отметки (AttendanceRecords.save) подтвержденный факт обновляется сразу,
+    а неподтвержденный факт пересоздается и ставится пересчет табеля.
+    В пакете неподтвержденный факт пересоздается один раз на день сотрудника по итоговому подтвержденному факту,
+    а пересчет табеля ставится одной задачей на месяц сотрудника.
+    """
+
+    def __init__(self):
+        self.facts = {}  # id подтвержденного факта -> последняя отметка, изменившая его
+        self.timesheet_days = {}  # employee_id -> даты
+
+    def add_fact(self, record, fact_approved):
+        self.facts.pop(fact_approved.id, None)
+        self.facts[fact_approved.id] = record
+
+    def add_timesheet_day(self, employee_id, dt):
+        self.timesheet_days.setdefault(employee_id, set()).add(dt)
+
+    def flush(self):
+        """
+        Выполнение отложенных действий, вызывается внутри транзакции пакета
+        """
+        from src.apps.timetable.timesheet.tasks import recalc_timesheet_on_data_change
+
+        facts_approved = WorkerDay.objects.in_bulk(list(self.facts))
+        last_facts = {}
+        for fact_id, record in self.facts.items():
+            # факт мог быть удален более поздней отметкой (например, при объединении связанных смен)
+            fact_approved = facts_approved.get(fact_id)
+            if fact_approved:
+                key = (fact_approved.employee_id, fact_approved.dt)
+                last_facts.pop(key, None)
+                last_facts[key] = (record, fact_approved)
+        for record, fact_approved in last_facts.values():
+            record._copy_fact_approved_to_not_approved(fact_approved)
+
+        if self.timesheet_days:
+            recalc_timesheet_on_data_change(self.timesheet_days)
+        self.facts = {}
+        self.timesheet_days = {}
+
+
+class AttendanceRecordsBatchService:
+    """
+    Пакетная обработка отметок.
+
+    Отметки обрабатываются в порядке (пользователь, время) так же, как при последовательном сохранении,
+    в одной транзакции. Пользователи и магазины загружаются одним запросом на пакет,
+    неподтвержденные факты и пересчет табеля выполняются один раз на день / месяц сотрудника (AttendanceRecordsBatch).
+    """
+
+    def __init__(self, recalc_fact_from_att_records=False, skip_errors=False):
+        """
+        :param recalc_fact_from_att_records: пересчет факта по уже внесенным отметкам
+        :param skip_errors: отметки, которые не удалось сохранить (нет трудоустройства и т.п.), пропускаются,
+            иначе ошибка прерывает весь пакет
+        """
+        self.recalc_fact_from_att_records = recalc_fact_from_att_records
+        self.skip_errors = skip_errors
+        self.errors = []
+
+    @staticmethod
+    def _set_related(records):
+        users = User.objects.select_related('network').in_bulk(
+            {r.user_id for r in records if not AttendanceRecords.user.is_cached(r)})
+        shops = Shop.objects.select_related('network').in_bulk(
+            {r.shop_id for r in records if not AttendanceRecords.shop.is_cached(r)})
+        for record in records:
+            if record.user_id in users:
+                record.user = users[record.user_id]
+            if record.shop_id in shops:
+                record.shop = shops[record.shop_id]
+
+    def _save(self, record, batch):
+        if not self.skip_errors:
+            record.save(recalc_fact_from_att_records=self.recalc_fact_from_att_records, batch=batch)
+            return True
+        try:
+            with transaction.atomic():
+                record.save(recalc_fact_from_att_records=self.recalc_fact_from_att_records, batch=batch)
+        except ValidationError as e:
+            logger.info(f'Отметка {record} не сохранена: {e}')
+            self.errors.append((record, e))
+            return False
+        return True
+
+    def run(self, records):
+        """
+        :param records: отметки (AttendanceRecords), новые или уже сохраненные
+        :return: сохраненные отметки
+        """
+        records = sorted(records, key=lambda r: (r.user_id, r.dttm))
+        if not records:
+            return []
+        self._set_related(records)
+        batch = AttendanceRecordsBatch()
+        saved = []
+        with transaction.atomic():
+            for record in records:
+                if self._save(record, batch):
+                    saved.append(record)
+            batch.flush()
+        return saved
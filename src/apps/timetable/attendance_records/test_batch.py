@@ -0,0 +1,98 @@
+from datetime import date, datetime, time, timedelta
+from unittest import mock
+
+from django.db import transaction
+from rest_framework.test import APITestCase
+
+from src.apps.base.models import User
+from src.apps.timetable.attendance_records.batch import AttendanceRecordsBatchService
+from src.apps.timetable.models import AttendanceRecords, WorkerDay
+from src.common.mixins.tests import TestsHelperMixin
+from src.common.test import create_departments_and_users
+
+
+class TestAttendanceRecordsBatch(TestsHelperMixin, APITestCase):
+    USER_USERNAME = "user1"
+    USER_EMAIL = "q@q.q"
+    USER_PASSWORD = "4242"
+
+    @classmethod
+    def setUpTestData(cls):
+        create_departments_and_users(cls)
+        cls.dt = date(2021, 6, 1)
+        for dt in (cls.dt, cls.dt + timedelta(days=1)):
+            WorkerDay.objects.create(
+                employee=cls.employee2, employment=cls.employment2, shop=cls.shop, dt=dt,
+                type_id=WorkerDay.TYPE_WORKDAY, is_fact=False, is_approved=True,
+                dttm_work_start=datetime.combine(dt, time(10)), dttm_work_end=datetime.combine(dt, time(20)),
+            )
+
+    def setUp(self):
+        self.client.force_authenticate(user=self.user1)
+
+    def _get_ticks(self):
+        next_dt = self.dt + timedelta(days=1)
+        return [
+            AttendanceRecords(user=self.user2, shop=self.shop, dttm=datetime.combine(self.dt, time(9, 50))),
+            AttendanceRecords(user=self.user2, shop=self.shop, dttm=datetime.combine(self.dt, time(20, 5))),
+            AttendanceRecords(user=self.user2, shop=self.shop, dttm=datetime.combine(next_dt, time(9, 55))),
+            AttendanceRecords(user=self.user3, shop=self.shop, dttm=datetime.combine(self.dt, time(8))),
+            AttendanceRecords(user=self.user3, shop=self.shop, dttm=datetime.combine(self.dt, time(17))),
+            AttendanceRecords(user=self.user3, shop=self.shop, dttm=datetime.combine(self.dt, time(17, 30))),
+        ]
+
+    @staticmethod
+    def _get_facts():
+        return sorted(WorkerDay.objects.filter(is_fact=True).values_list(
+            'employee_id', 'dt', 'is_approved', 'shop_id', 'type_id', 'dttm_work_start', 'dttm_work_end',
+            'closest_plan_approved_id', 'is_vacancy', 'source', 'work_hours',
+        ))
+
+    def _save_ticks(self, save_func):
+        with mock.patch('src.apps.timetable.timesheet.tasks.calc_timesheets.apply_async') as calc_timesheets:
+            with transaction.atomic():
+                with self.captureOnCommitCallbacks(execute=True):
+                    save_func(self._get_ticks())
+                facts = self._get_facts()
+                records = sorted(AttendanceRecords.objects.values_list('user_id', 'employee_id', 'dt', 'type', 'dttm'))
+                transaction.set_rollback(True)
+        return facts, records, calc_timesheets
+
+    def test_batch_same_as_sequential(self):
+        def save_sequential(ticks):
+            for record in ticks:
+                record.save()
+
+        facts, records, calc_timesheets = self._save_ticks(save_sequential)
+        batch_facts, batch_records, batch_calc_timesheets = self._save_ticks(
+            lambda ticks: AttendanceRecordsBatchService().run(ticks))
+
+        self.assertEqual(len(facts), 6)
+        self.assertEqual(batch_facts, facts)
+        self.assertEqual(batch_records, records)
+        # пересчет табеля -- одна задача на месяц сотрудника
+        self.assertEqual(batch_calc_timesheets.call_count, 2)
+        self.assertGreater(calc_timesheets.call_count, batch_calc_timesheets.call_count)
+
+    def test_batch_api(self):
+        user_without_employment = User.objects.create(username='no_empl', network=self.network)
+        response = self.client.post(
+            self.get_url('AttendanceRecords-batch'),
+            {
+                'data': [
+                    {'user_id': self.user2.id, 'shop_id': self.shop.id, 'dttm': datetime.combine(self.dt, time(9, 50))},
+                    {'user_id': user_without_employment.id, 'shop_id': self.shop.id,
+                     'dttm': datetime.combine(self.dt, time(9, 50))},
+                    {'user_id': self.user2.id, 'shop_id': self.shop.id, 'dttm': datetime.combine(self.dt, time(20)),
+                     'type': AttendanceRecords.TYPE_LEAVING},
+                ],
+            },
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['created'], 2)
+        self.assertEqual([e['index'] for e in response.json()['errors']], [1])
+        self.assertTrue(WorkerDay.objects.filter(
+            employee=self.employee2, dt=self.dt, is_fact=True, is_approved=False,
+            dttm_work_start=datetime.combine(self.dt, time(9, 50)), dttm_work_end=datetime.combine(self.dt, time(20)),
+        ).exists())
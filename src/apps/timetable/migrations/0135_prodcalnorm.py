@@ -0,0 +1,85 @@
+# Generated by Django 4.1.7 on 2026-10-18 00:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from src.apps.timetable.worker_day.prod_cal_norm import VIEW_SQL, refresh_prod_cal
+
+# представление prod_cal до материализации (0120_manual_20220829)
+OLD_VIEW_SQL = """
+CREATE OR REPLACE VIEW prod_cal AS
+ SELECT pd.id,
+    pd.dt,
+    employee.user_id,
+    employment.id AS employment_id,
+    u.username,
+    employment.shop_id,
+    s.code,
+    pd.region_id,
+    sum(
+        CASE
+            WHEN pd.type::text = 'W'::text THEN 8::double precision * COALESCE(wp.hours_in_a_week::integer, 40)::double precision / 40::double precision * employment.norm_work_hours / 100::double precision
+            WHEN pd.type::text = 'S'::text THEN 8::double precision * COALESCE(wp.hours_in_a_week::integer, 40)::double precision / 40::double precision * employment.norm_work_hours / 100::double precision - 1::double precision
+            ELSE 0::double precision
+        END) AS norm_hours,
+    employment.employee_id
+   FROM base_employment employment
+     JOIN base_shop s ON employment.shop_id = s.id
+     JOIN base_region r ON s.region_id = r.id
+     JOIN base_productionday pd ON (pd.dt >= employment.dt_hired OR employment.dt_hired IS NULL) AND (pd.dt <= employment.dt_fired OR employment.dt_fired IS NULL) AND (pd.region_id = r.id OR pd.region_id = r.parent_id) AND pd.id = (( SELECT pd2.id
+           FROM base_productionday pd2
+          WHERE (pd2.dt >= employment.dt_hired OR employment.dt_hired IS NULL) AND (pd2.dt <= employment.dt_fired OR employment.dt_fired IS NULL) AND (pd2.region_id = r.id OR pd2.region_id = r.parent_id) AND pd2.dt = pd.dt
+          ORDER BY (pd2.region_id = r.id) DESC, (pd2.region_id = r.parent_id) DESC
+         LIMIT 1))
+     JOIN base_employee employee ON employment.employee_id = employee.id
+     JOIN base_user u ON employee.user_id = u.id
+     LEFT JOIN base_workerposition wp ON employment.position_id = wp.id AND pd.dt >= '2020-01-01'::date
+  WHERE employment.dttm_deleted IS NULL
+  GROUP BY pd.id, pd.dt, employee.user_id, employment.id, u.username, employment.shop_id, s.code, pd.region_id;
+"""
+
+
+def fill_prod_cal_norm(apps, schema_editor):
+    refresh_prod_cal()
+    schema_editor.execute(VIEW_SQL)
+
+
+def restore_prod_cal_view(apps, schema_editor):
+    schema_editor.execute(OLD_VIEW_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0198_network_set_dt_not_actual_for_vacancy_on_transfers'),
+        ('timetable', '0134_worktypename_availability_on_external_exchange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProdCalNorm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dt', models.DateField()),
+                ('norm_hours', models.FloatField()),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='base.employee')),
+                ('employment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='base.employment')),
+                ('production_day', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='base.productionday')),
+                ('region', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='base.region')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='base.shop')),
+            ],
+            options={
+                'verbose_name': 'Норма часов производственного календаря',
+                'verbose_name_plural': 'Нормы часов производственного календаря',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='prodcalnorm',
+            index=models.Index(fields=['employee', 'dt'], name='timetable_p_employe_9423b0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prodcalnorm',
+            index=models.Index(fields=['shop', 'dt'], name='timetable_p_shop_id_fe20c9_idx'),
+        ),
+        migrations.RunPython(fill_prod_cal_norm, restore_prod_cal_view),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.1.7 on 2026-10-18 04:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0202_workerday_post_approve_status_func'),
+        ('timetable', '0136_manual_plan_and_fact_hours'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostApproveJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=128)),
+                ('kind', models.CharField(choices=[('employee_month', 'Сотрудник за месяц'), ('shop_work_type_month', 'Тип работ магазина за месяц')], max_length=32)),
+                ('dt', models.DateField(help_text='Первый день месяца')),
+                ('actions', models.JSONField(default=dict, help_text='Действия и даты, по которым их нужно выполнить')),
+                ('approve_ids', models.JSONField(default=list, help_text='Идентификаторы подтверждений, создавших задание')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает выполнения'), ('running', 'Выполняется'), ('done', 'Выполнено'), ('failed', 'Ошибка')], default='pending', max_length=16)),
+                ('error', models.TextField(blank=True, default='')),
+                ('dttm_added', models.DateTimeField(auto_now_add=True)),
+                ('dttm_started', models.DateTimeField(blank=True, null=True)),
+                ('dttm_finished', models.DateTimeField(blank=True, null=True)),
+                ('employee', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='base.employee')),
+                ('shop', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='base.shop')),
+                ('work_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='timetable.worktype')),
+            ],
+            options={
+                'verbose_name': 'Действие после подтверждения графика',
+                'verbose_name_plural': 'Действия после подтверждения графика',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='postapprovejob',
+            index=models.Index(fields=['status', 'id'], name='timetable_p_status_79934d_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='postapprovejob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'pending')), fields=('key',), name='unique_pending_post_approve_job_key'),
+        ),
+    ]
@@ -2,6 +2,7 @@ import datetime
 import inspect
 import json
 import logging
+from copy import deepcopy
 from decimal import Decimal
 
 import pandas as pd
@@ -10,7 +11,6 @@ from django.conf import settings
 from django.contrib.auth.models import (
     UserManager
 )
-from django.core.cache import cache
 from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.db import transaction
@@ -47,6 +47,7 @@ from src.apps.timetable.exceptions import (
     DtMaxHoursRestrictionViolated,
     SawhSettingsIsNotSetRestrictionViolated,
 )
+from src.apps.timetable.worker_day.prod_cal_cache import invalidate_prod_cal_cache
 from src.common.commons import obj_deep_get
 from src.common.mixins.qs import AnnotateValueEqualityQSMixin
 
@@ -545,7 +546,7 @@ class WorkerDayType(AbstractModel):
     @tracker
     def save(self, *args, **kwargs):
         if self.code and self.tracker.has_changed('is_reduce_norm'):
-            cache.delete_pattern("prod_cal_*_*_*")
+            invalidate_prod_cal_cache(on_commit=False)
         return super().save(*args, **kwargs)
 
 
@@ -909,10 +910,6 @@ class WorkerDay(AbstractModel):
     def is_open_vacancy(self) -> bool:
         return bool(self.is_vacancy and not self.employee_id)
 
-    @classmethod
-    def _get_batch_create_extra_kwargs(cls):
-        return {'need_count_wh': True}
-
     @classmethod
     def _get_rel_objs_mapping(cls):
         # TODO: добавить условие, только при выполнении которого, действия над связанными объектами выполняются, например
@@ -1155,9 +1152,10 @@ class WorkerDay(AbstractModel):
             if prev_type != new_type or new_type in reduce_norm_types:
                 grouped_by_employee.setdefault(obj.employee_id, []).extend([new_type, prev_type])
 
-        for employee_id, types in grouped_by_employee.items():
-            if set(types).intersection(reduce_norm_types):
-                transaction.on_commit(lambda empl_id=employee_id: cache.delete_pattern(f"prod_cal_*_*_{empl_id}"))
+        invalidate_prod_cal_cache(employee_ids=[
+            employee_id for employee_id, types in grouped_by_employee.items()
+            if set(types).intersection(reduce_norm_types)
+        ])
 
     @classmethod
     def _check_create_single_obj_perm(cls, user, obj_data, check_active_empl=True, **extra_kwargs):
@@ -1216,9 +1214,9 @@ class WorkerDay(AbstractModel):
             cls.check_only_one_wday_on_date(employee_days_q=kwargs.get('employee_days_q'), exc_cls=ValidationError)
 
     @classmethod
-    def _batch_update_extra_handler(cls, obj):
-        obj.dttm_work_start_tabel, obj.dttm_work_end_tabel, obj.work_hours = obj._calc_wh()
-        obj.work_hours = obj._round_wh()
+    def _batch_objs_extra_handler(cls, objs_to_create, objs_to_update):
+        from src.apps.timetable.worker_day.services.work_hours import WorkHoursCalculator
+        WorkHoursCalculator(objs_to_create + objs_to_update).run()
         return {
             'dttm_work_start_tabel',
             'dttm_work_end_tabel',
@@ -1321,10 +1319,10 @@ class WorkerDay(AbstractModel):
             night_seconds = round_wh_alg_func(night_seconds / 3600) * 3600
 
         total_seconds = (work_seconds + break_time_seconds)
-        break_time_subtractor_alias = None
         if network:
-            break_time_subtractor_alias = network.settings_values_prop.get('break_time_subtractor')
-        break_time_subtractor_cls = break_time_subtractor_map.get(break_time_subtractor_alias or 'default')
+            break_time_subtractor_cls = network.parsed_settings.break_time_subtractor_cls
+        else:
+            break_time_subtractor_cls = break_time_subtractor_map['default']
         break_time_subtractor = break_time_subtractor_cls(break_time_seconds, total_seconds, night_seconds)
         work_hours_day, work_hours_night = break_time_subtractor.calc()
         work_hours = work_hours_day + work_hours_night
@@ -1352,7 +1350,11 @@ class WorkerDay(AbstractModel):
                 break_time = self._calc_break(breaks, plan_approved.dttm_work_start, plan_approved.dttm_work_end)
         return break_time
 
-    def _calc_wh(self):
+    def _calc_wh(self, calc_cache=None):
+        """
+        :param calc_cache: предзагруженные данные для пакетного расчета (WorkHoursCalculator),
+            если не передан -- данные запрашиваются для каждого дня
+        """
         from src.common.models_converter import Converter
         self.dt = Converter.parse_date(self.dt) if isinstance(self.dt, str) else self.dt
         breaks = self._get_breaks() if self.type.subtract_breaks else None
@@ -1360,7 +1362,10 @@ class WorkerDay(AbstractModel):
             dttm_work_start = _dttm_work_start = self.dttm_work_start
             dttm_work_end = _dttm_work_end = self.dttm_work_end
             if self.shop_id and self.shop.network.crop_work_hours_by_shop_schedule:
-                shop_schedule = self.shop.get_schedule(dt=self.dt)
+                if calc_cache:
+                    shop_schedule = calc_cache.get_shop_schedule(self.shop_id, self.dt)
+                else:
+                    shop_schedule = self.shop.get_schedule(dt=self.dt)
                 if shop_schedule is None:
                     return dttm_work_start, dttm_work_end, datetime.timedelta(0)
 
@@ -1442,13 +1447,16 @@ class WorkerDay(AbstractModel):
                     self.work_hours is None
                 )
             ):
-                from src.apps.timetable.worker_day.stat import WorkersStatsGetter
-                employee_stats = WorkersStatsGetter(
-                    employee_id=self.employee_id,
-                    dt_from=self.dt,
-                    dt_to=self.dt,
-                    shop_id=self.employment.shop_id,
-                ).run()
+                if calc_cache:
+                    employee_stats = calc_cache.get_employee_stats(self.employee_id, self.employment.shop_id, self.dt)
+                else:
+                    from src.apps.timetable.worker_day.stat import WorkersStatsGetter
+                    employee_stats = WorkersStatsGetter(
+                        employee_id=self.employee_id,
+                        dt_from=self.dt,
+                        dt_to=self.dt,
+                        shop_id=self.employment.shop_id,
+                    ).run()
                 work_hours = employee_stats.get(
                     self.employee_id, {}
                 ).get(
@@ -1461,13 +1469,16 @@ class WorkerDay(AbstractModel):
                     self.dt.month, 0
                 )
             elif self.type.get_work_hours_method == WorkerDayType.GET_WORK_HOURS_METHOD_TYPE_NORM_HOURS:
-                prod_cal = ProdCal.objects.filter(
-                    employee_id=self.employee_id,
-                    dt=self.dt,
-                    shop_id=self.employment.shop_id,
-                ).first()
-                if prod_cal:
-                    work_hours = prod_cal.norm_hours
+                if calc_cache:
+                    work_hours = calc_cache.get_norm_hours(self.employee_id, self.dt, self.employment.shop_id)
+                else:
+                    prod_cal = ProdCal.objects.filter(
+                        employee_id=self.employee_id,
+                        dt=self.dt,
+                        shop_id=self.employment.shop_id,
+                    ).first()
+                    if prod_cal:
+                        work_hours = prod_cal.norm_hours
 
             elif self.type.get_work_hours_method in [
                 WorkerDayType.GET_WORK_HOURS_METHOD_TYPE_MANUAL,
@@ -1674,13 +1685,13 @@ class WorkerDay(AbstractModel):
                 },
             ))
         if self.type.is_reduce_norm or (not is_new and self.tracker.has_changed('type') and WorkerDayType.objects.get(pk=self.tracker.previous('type')).is_reduce_norm):
-            transaction.on_commit(lambda: cache.delete_pattern(f"prod_cal_*_*_{self.employee_id}"))
+            invalidate_prod_cal_cache(employee_ids=[self.employee_id])
 
         return res
 
     def delete(self, *args, **kwargs):
         if self.type.is_reduce_norm:
-            transaction.on_commit(lambda: cache.delete_pattern(f"prod_cal_*_*_{self.employee_id}"))
+            invalidate_prod_cal_cache(employee_ids=[self.employee_id])
         return super().delete(*args, **kwargs)
 
     @classmethod
@@ -2489,6 +2500,13 @@ class AttendanceRecords(AbstractModel):
             return
 
     def _create_or_update_not_approved_fact(self, fact_approved):
+        if self._batch is not None:
+            # при пакетной обработке неподтвержденный факт создается один раз на день сотрудника
+            self._batch.add_fact(self, fact_approved)
+            return
+        self._copy_fact_approved_to_not_approved(fact_approved)
+
+    def _copy_fact_approved_to_not_approved(self, fact_approved):
         # TODO: попробовать найти вариант без удаления workerday?
         WorkerDay.objects.filter(
             Q(last_edited_by__isnull=True) | Q(type_id=WorkerDay.TYPE_EMPTY),
@@ -2690,13 +2708,22 @@ class AttendanceRecords(AbstractModel):
 
     def _recalc_timesheet(self, recalc_fact_from_att_records=False):
         if not recalc_fact_from_att_records and self.fact_wd and self.fact_wd.dttm_work_start and self.fact_wd.dttm_work_end:
+            if self._batch is not None:
+                self._batch.add_timesheet_day(self.fact_wd.employee_id, self.fact_wd.dt)
+                return
             from src.apps.timetable.timesheet.tasks import recalc_timesheet_on_data_change
             transaction.on_commit(lambda: recalc_timesheet_on_data_change({self.fact_wd.employee_id: [self.fact_wd.dt, self.fact_wd.dt]}))
 
-    def save(self, *args, recalc_fact_from_att_records=False, **kwargs):
+    _batch = None
+
+    def save(self, *args, recalc_fact_from_att_records=False, batch=None, **kwargs):
         """
         Создание WorkerDay при занесении отметок.
+
+        :param batch: AttendanceRecordsBatch -- при пакетной обработке отметок
+            неподтвержденный факт и пересчет табеля откладываются до batch.flush()
         """
+        self._batch = batch
         # рефакторинг
         employee_id, active_user_empl, dt, record_type, closest_plan_approved = self.get_day_data(
             self.dttm, self.user, self.shop, self.type)
@@ -3148,6 +3175,108 @@ class ProdCal(models.Model):
         db_table = 'prod_cal'
 
 
+class ProdCalNorm(models.Model):
+    """
+    Норма часов сотрудника по трудоустройству на день производственного календаря.
+    Данные для представления prod_cal (ProdCal), обновляются в worker_day.prod_cal_norm.refresh_prod_cal
+    """
+    production_day = models.ForeignKey('base.ProductionDay', on_delete=models.CASCADE)
+    dt = models.DateField()
+    employment = models.ForeignKey('base.Employment', on_delete=models.CASCADE)
+    employee = models.ForeignKey('base.Employee', on_delete=models.CASCADE)
+    shop = models.ForeignKey('base.Shop', on_delete=models.CASCADE)
+    region = models.ForeignKey('base.Region', on_delete=models.CASCADE)
+    norm_hours = models.FloatField()
+
+    class Meta:
+        verbose_name = 'Норма часов производственного календаря'
+        verbose_name_plural = 'Нормы часов производственного календаря'
+        indexes = [
+            models.Index(fields=['employee', 'dt']),
+            models.Index(fields=['shop', 'dt']),
+        ]
+
+
+class PostApproveJob(models.Model):
+    """
+    Отложенное действие после подтверждения графика (пересчеты), см. worker_day.services.post_approve.
+    Ожидающие выполнения задания с одинаковым ключом объединяются
+    """
+    KIND_EMPLOYEE_MONTH = 'employee_month'
+    KIND_SHOP_WORK_TYPE_MONTH = 'shop_work_type_month'
+
+    KIND_CHOICES = [
+        (KIND_EMPLOYEE_MONTH, 'Сотрудник за месяц'),
+        (KIND_SHOP_WORK_TYPE_MONTH, 'Тип работ магазина за месяц'),
+    ]
+
+    ACTION_RECALC_WORK_HOURS = 'recalc_work_hours'
+    ACTION_RECALC_FACT_FROM_RECORDS = 'recalc_fact_from_records'
+    ACTION_RECALC_TIMESHEET = 'recalc_timesheet'
+    ACTION_CREATE_AND_CANCEL_VACANCIES = 'create_and_cancel_vacancies'
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Ожидает выполнения'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_DONE, 'Выполнено'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
+    key = models.CharField(max_length=128)
+    kind = models.CharField(max_length=32, choices=KIND_CHOICES)
+    dt = models.DateField(help_text='Первый день месяца')
+    employee = models.ForeignKey('base.Employee', null=True, blank=True, on_delete=models.CASCADE)
+    shop = models.ForeignKey('base.Shop', null=True, blank=True, on_delete=models.CASCADE)
+    work_type = models.ForeignKey('timetable.WorkType', null=True, blank=True, on_delete=models.CASCADE)
+    actions = models.JSONField(default=dict, help_text='Действия и даты, по которым их нужно выполнить')
+    approve_ids = models.JSONField(default=list, help_text='Идентификаторы подтверждений, создавших задание')
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    error = models.TextField(blank=True, default='')
+    dttm_added = models.DateTimeField(auto_now_add=True)
+    dttm_started = models.DateTimeField(null=True, blank=True)
+    dttm_finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Действие после подтверждения графика'
+        verbose_name_plural = 'Действия после подтверждения графика'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['key'],
+                condition=Q(status='pending'),
+                name='unique_pending_post_approve_job_key',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'id']),
+        ]
+
+    def __str__(self):
+        return f'{self.key} ({self.status})'
+
+    @classmethod
+    def get_key(cls, kind, dt, employee_id=None, shop_id=None, work_type_id=None):
+        return f'{kind}:{employee_id or ""}:{shop_id or ""}:{work_type_id or ""}:{dt:%Y-%m}'
+
+    def add_dates(self, action, dates):
+        self.actions[action] = sorted(set(self.actions.get(action, [])) | {str(dt) for dt in dates})
+
+    def merge(self, other):
+        """
+        Объединение с заданием с тем же ключом
+        :return: изменилось ли задание
+        """
+        actions, approve_ids = deepcopy(self.actions), list(self.approve_ids)
+        for action, dates in other.actions.items():
+            self.add_dates(action, dates)
+        self.approve_ids.extend(approve_id for approve_id in other.approve_ids if approve_id not in self.approve_ids)
+        return (actions, approve_ids) != (self.actions, self.approve_ids)
+
+
 class ScheduleDeviations(PlanAndFactHoursAbstract):
     class Meta:
         managed = False
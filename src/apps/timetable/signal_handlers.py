@@ -1,13 +1,16 @@
 import inspect
 import logging
 
-from django.db.models.signals import post_save, pre_delete
+from django.db.models.signals import post_save, pre_delete, post_delete
 from django.dispatch import receiver
+from django.utils.dateparse import parse_datetime
 
+from src.apps.forecast.models import PeriodClients
 from src.apps.timetable.models import (
     WorkerDayPermission,
     WorkerDayType, WorkerDay,
 )
+from src.apps.timetable.work_type.efficiency_cache import invalidate_shop_efficiency_cache
 
 
 logger = logging.getLogger('attendance_records')
@@ -63,4 +66,19 @@ def log_worker_day_deletion(sender, instance, **kwargs):
         traces_str = ' '.join(traces)
         logger.info(
             f'Удаляем подтвержденный факт для {instance.employee.user.last_name} {instance.employee.user.first_name} '
-            f'за {instance.dt} время начала {instance.dttm_work_start} время конца {instance.dttm_work_end} {traces_str}')
\ No newline at end of file
+            f'за {instance.dt} время начала {instance.dttm_work_start} время конца {instance.dttm_work_end} {traces_str}')
+
+
+@receiver(post_save, sender=WorkerDay)
+@receiver(post_delete, sender=WorkerDay)
+def invalidate_worker_day_efficiency_cache(sender, instance, **kwargs):
+    invalidate_shop_efficiency_cache(shop_id=instance.shop_id, dt_from=instance.dt)
+
+
+@receiver(post_save, sender=PeriodClients)
+def invalidate_period_clients_efficiency_cache(sender, instance, **kwargs):
+    # массовые изменения и удаления нагрузки инвалидируют кэш явно (без поштучных сигналов)
+    dttm_forecast = instance.dttm_forecast
+    if isinstance(dttm_forecast, str):
+        dttm_forecast = parse_datetime(dttm_forecast)
+    invalidate_shop_efficiency_cache(shop_id=instance.operation_type.shop_id, dt_from=dttm_forecast.date())
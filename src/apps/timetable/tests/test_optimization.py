@@ -1,12 +1,25 @@
+import json
+import time as time_module
+from types import SimpleNamespace
 from datetime import date, time, datetime, timedelta
-from django.conf import settings
+from decimal import Decimal
 
+import numpy as np
+from django.conf import settings
+from django.db.models import Prefetch
+from django.test import SimpleTestCase
 from rest_framework.test import APITestCase
+from src.apps.base.models import Network
 from src.apps.timetable.models import (
     WorkerDay,
+    WorkerDayCashboxDetails,
+    WorkType,
+    WorkTypeName,
 )
+from src.apps.timetable.work_type.utils import fill_intervals, fill_points
 from src.apps.timetable.worker_day.services.approve import WorkerDayApproveService
 from src.common.mixins.tests import TestsHelperMixin
+from src.interfaces.api.serializers.worker_day import WorkerDayListSerializer
 
 
 # Code and performance optimization tests
@@ -26,7 +39,7 @@ class TestWorkerDayApproveOptimization(TestsHelperMixin, APITestCase):
         Correct `QUERY_COUNT` as needed when you change approve logic.
         For checking specific parts of the code use decorator at `src.common.decorators.print_queries`.
         """
-        QUERY_COUNT = 38
+        QUERY_COUNT = 39
         WORKERDAYS_COUNT = 20
         for dt in (self.today + timedelta(i) for i in range(WORKERDAYS_COUNT)):
             WorkerDay.objects.create(
@@ -56,3 +69,202 @@ class TestWorkerDayApproveOptimization(TestsHelperMixin, APITestCase):
             count = WorkerDayApproveService(**kwargs).approve()
             self.assertEqual(count, WORKERDAYS_COUNT)
         self.assertEqual(WorkerDay.objects.filter(is_approved=True).count(), WORKERDAYS_COUNT)
+
+    def test_approve_fetches_only_changed_days(self):
+        """Unchanged days are compared by values, full objects are fetched only for changed employee-dt"""
+        WORKERDAYS_COUNT = 20
+        for dt in (self.today + timedelta(i) for i in range(WORKERDAYS_COUNT)):
+            for is_approved in (True, False):
+                WorkerDay.objects.create(
+                    dt=dt,
+                    employment=self.employment2,
+                    employee=self.employee2,
+                    shop=self.shop,
+                    type_id=WorkerDay.TYPE_WORKDAY,
+                    dttm_work_start=datetime.combine(dt, time(9)),
+                    dttm_work_end=datetime.combine(dt, time(18)),
+                    is_fact=False,
+                    is_approved=is_approved,
+                )
+        changed_dt = self.today + timedelta(5)
+        changed_wd = WorkerDay.objects.get(dt=changed_dt, is_approved=False)
+        changed_wd.dttm_work_end = datetime.combine(changed_dt, time(20))
+        changed_wd.save()
+        service = WorkerDayApproveService(
+            is_fact=False,
+            dt_from=self.today,
+            dt_to=self.today + timedelta(WORKERDAYS_COUNT - 1),
+            user=self.user1,
+            shop_id=self.shop.id,
+            wd_types=[WorkerDay.TYPE_WORKDAY],
+        )
+        self.assertEqual(service.approve(), 1)
+        self.assertEqual([wd.dt for wd in service.to_approve_wdays], [changed_dt])
+        self.assertEqual([wd.dt for wd in service.to_delete_wdays], [changed_dt])
+        self.assertEqual(service.changes_dict, {self.employee2.id: {changed_dt}})
+        self.assertEqual(WorkerDay.objects.get(dt=changed_dt, is_approved=True).dttm_work_end.time(), time(20))
+        self.assertEqual(WorkerDay.objects.filter(is_approved=True).count(), WORKERDAYS_COUNT)
+        self.assertEqual(WorkerDay.objects.filter(is_approved=False).count(), WORKERDAYS_COUNT)
+
+        # nothing changed
+        self.assertEqual(WorkerDayApproveService(
+            is_fact=False,
+            dt_from=self.today,
+            dt_to=self.today + timedelta(WORKERDAYS_COUNT - 1),
+            user=self.user1,
+            shop_id=self.shop.id,
+            wd_types=[WorkerDay.TYPE_WORKDAY],
+        ).approve(), 0)
+
+
+class TestWorkerDayListValues(TestsHelperMixin, APITestCase):
+    """Values-based WorkerDay list matches WorkerDayListSerializer output"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_departments_and_users()
+        cls.dt = date.today()
+        cls.work_type = WorkType.objects.create(
+            shop=cls.shop, work_type_name=WorkTypeName.objects.create(name='Кассир', network=cls.network))
+        cls.outsource_network = Network.objects.create(name='Outsource')
+        for days in range(3):
+            dt = cls.dt + timedelta(days)
+            plan = WorkerDay.objects.create(
+                dt=dt, employee=cls.employee2, employment=cls.employment2, shop=cls.shop,
+                type_id=WorkerDay.TYPE_WORKDAY, is_fact=False, is_approved=True,
+                dttm_work_start=datetime.combine(dt, time(16)),
+                dttm_work_end=datetime.combine(dt + timedelta(1), time(3)),
+                last_edited_by=cls.user1, cost_per_hour=Decimal('120.50'),
+            )
+            WorkerDayCashboxDetails.objects.create(worker_day=plan, work_type=cls.work_type)
+            WorkerDay.objects.create(
+                dt=dt, employee=cls.employee2, employment=cls.employment2, shop=cls.shop,
+                type_id=WorkerDay.TYPE_WORKDAY, is_fact=True, is_approved=True,
+                dttm_work_start=datetime.combine(dt, time(16, 40)),
+                dttm_work_end=datetime.combine(dt + timedelta(1), time(3, 20)),
+                closest_plan_approved=plan,
+            )
+        WorkerDay.objects.create(
+            dt=cls.dt, employee=cls.employee3, employment=cls.employment3, shop=cls.shop,
+            type_id=WorkerDay.TYPE_VACATION, is_fact=False, is_approved=True,
+        )
+        vacancy = WorkerDay.objects.create(
+            dt=cls.dt, shop=cls.shop, type_id=WorkerDay.TYPE_WORKDAY, is_fact=False, is_approved=True,
+            is_vacancy=True, is_outsource=True,
+            dttm_work_start=datetime.combine(cls.dt, time(8)),
+            dttm_work_end=datetime.combine(cls.dt, time(20)),
+        )
+        vacancy.outsources.add(cls.outsource_network)
+        WorkerDayCashboxDetails.objects.create(worker_day=vacancy, work_type=cls.work_type, work_part=0.5)
+
+    def setUp(self):
+        self.client.force_authenticate(user=self.user1)
+
+    def _get_expected(self, hours_details=False):
+        data = []
+        for wd in WorkerDay.objects.filter(canceled=False).prefetch_related(
+                Prefetch('worker_day_details', to_attr='worker_day_details_list'),
+                Prefetch('outsources', to_attr='outsources_list'),
+        ).select_related('last_edited_by').order_by('id'):
+            wd_dict = WorkerDayListSerializer(wd, context={
+                'extra_fields': ['shop__name'], 'view': SimpleNamespace(action='list')}).data
+            if hours_details:
+                work_hours, work_hours_day, work_hours_night = wd.calc_day_and_night_work_hours()
+                wd_dict['work_hours'] = work_hours
+                wd_dict['work_hours_details'] = {'D': work_hours_day, 'N': work_hours_night}
+            data.append(wd_dict)
+        return json.loads(json.dumps(data))
+
+    def _get_list(self, **params):
+        response = self.client.get(self.get_url('WorkerDay-list'), data={
+            'dt__gte': self.dt,
+            'dt__lte': self.dt + timedelta(2),
+            'extra_fields': 'shop__name',
+            **params,
+        })
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def _assert_same_rows(self, data, expected):
+        data = sorted(data, key=lambda wd: wd['id'])
+        self.assertEqual(len(data), 8)
+        self.assertEqual([list(wd) for wd in data], [list(wd) for wd in expected])
+        self.assertEqual(data, expected)
+
+    def test_list_matches_serializer(self):
+        self._assert_same_rows(self._get_list().json(), self._get_expected())
+
+    def test_list_hours_details_matches_model_calc(self):
+        data = self._get_list(hours_details=True).json()
+        self._assert_same_rows(data, self._get_expected(hours_details=True))
+        self.assertTrue(all(wd['work_hours_details']['N'] > 0 for wd in data if wd['employee_id'] == self.employee2.id))
+
+    def test_list_stream(self):
+        expected = self._get_expected()
+        response = self._get_list(stream='json')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self._assert_same_rows(json.loads(b''.join(response.streaming_content)), expected)
+
+        response = self._get_list(stream='ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self._assert_same_rows(
+            [json.loads(line) for line in b''.join(response.streaming_content).splitlines()], expected)
+
+
+class TestShopEfficiencyFillBenchmark(SimpleTestCase):
+    """
+    Benchmark of vectorized interval/point filling (`ShopEfficiencyGetter`)
+    against the previous per-row path (python loop with fancy-index `+=`).
+    300 employees, 31 days, 30 minutes periods.
+    """
+    EMPLOYEES = 300
+    DAYS = 31
+    PERIODS_IN_DAY = 48
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        rows_count = self.EMPLOYEES * self.DAYS
+        self.array_size = self.DAYS * self.PERIODS_IN_DAY
+        days = np.repeat(np.arange(self.DAYS), self.EMPLOYEES)
+        self.starts = days * self.PERIODS_IN_DAY + rng.integers(12, 30, rows_count)
+        self.ends = self.starts + rng.integers(8, 26, rows_count)  # night shifts can go beyond the last period
+        self.days = days
+        self.work_hours = rng.integers(4, 13, rows_count) + rng.choice([0, 0.25, 0.5], rows_count)
+
+    @staticmethod
+    def _fill_array_per_row(array, rows, get_indexes, get_value):
+        arr_sz = array.size
+        for row in rows:
+            indexes = [ind for ind in get_indexes(row) if ind < arr_sz]
+            array[indexes] += get_value(row)
+
+    @staticmethod
+    def _timeit(func):
+        start = time_module.perf_counter()
+        func()
+        return time_module.perf_counter() - start
+
+    def _compare_intervals(self, weights):
+        per_row_array = np.zeros(self.array_size)
+        vectorized_array = np.zeros(self.array_size)
+        rows = list(zip(self.starts.tolist(), self.ends.tolist(), weights.tolist()))
+        per_row_time = self._timeit(lambda: self._fill_array_per_row(
+            per_row_array, rows, lambda x: list(range(x[0], x[1])), lambda x: x[2]))
+        vectorized_time = self._timeit(lambda: fill_intervals(vectorized_array, self.starts, self.ends, weights))
+        np.testing.assert_array_equal(vectorized_array, per_row_array)
+        self.assertLess(vectorized_time, per_row_time)
+
+    def test_fill_intervals_integer_weights(self):
+        self._compare_intervals(np.ones(self.starts.size))
+
+    def test_fill_intervals_fractional_weights(self):
+        self._compare_intervals(np.random.default_rng(7).choice([1.0, 0.5, 1 / 3], self.starts.size))
+
+    def test_fill_points(self):
+        per_row_array = np.zeros(self.array_size)
+        vectorized_array = np.zeros(self.array_size)
+        rows = list(zip(self.days.tolist(), self.work_hours.tolist()))
+        per_row_time = self._timeit(lambda: self._fill_array_per_row(
+            per_row_array, rows, lambda x: [x[0]], lambda x: x[1]))
+        vectorized_time = self._timeit(lambda: fill_points(vectorized_array, self.days, self.work_hours))
+        np.testing.assert_array_equal(vectorized_array, per_row_array)
+        self.assertLess(vectorized_time, per_row_time)
@@ -144,7 +144,7 @@ class TimesheetCalculatorService:
 
     def _add_plan(self, plan_wd, dt, fact_timesheet_dict, empl_dt_key):
         day_in_past = dt < self.dt_now
-        if self.employee.user.network.settings_values_prop.get('timesheet_only_day_in_past', False) and not day_in_past:
+        if self.employee.user.network.parsed_settings.get('timesheet_only_day_in_past', False) and not day_in_past:
             return
         work_type_name = self._get_work_type_name(worker_day=plan_wd)
         is_absent = day_in_past and not plan_wd.type.is_dayoff
@@ -190,7 +190,7 @@ class TimesheetCalculatorService:
             if not active_employment:
                 continue
             day_in_past = worker_day.dt < self.dt_now
-            if self.employee.user.network.settings_values_prop.get('timesheet_only_day_in_past', False) and not day_in_past:
+            if self.employee.user.network.parsed_settings.get('timesheet_only_day_in_past', False) and not day_in_past:
                 continue
             # TODO: нужна поддержка нескольких типов работ?
             work_type_name = self._get_work_type_name(worker_day=worker_day)
@@ -252,7 +252,7 @@ class TimesheetCalculatorService:
             if not active_employment:
                 continue
             day_in_past = dt < self.dt_now
-            if self.employee.user.network.settings_values_prop.get(
+            if self.employee.user.network.parsed_settings.get(
                     'timesheet_only_day_in_past', False) and not day_in_past:
                 continue
             empl_dt_key = self._get_empl_key(self.employee.id, dt)
@@ -369,7 +369,7 @@ class BaseTimesheetDivider:
     def _init_main_and_additional_timesheets(self):
         for dt in pd.date_range(self.fiscal_timesheet.dt_from, self.fiscal_timesheet.dt_to).date:
             day_in_past = dt < self.dt_now
-            if self.fiscal_timesheet.employee.user.network.settings_values_prop.get(
+            if self.fiscal_timesheet.employee.user.network.parsed_settings.get(
                     'timesheet_only_day_in_past', False) and not day_in_past:
                 continue
             fact_timesheet_items = list(filter(
@@ -395,7 +395,7 @@ class BaseTimesheetDivider:
     def _fill_empty_dates_as_holidays_in_main_timesheet(self):
         for dt in pd.date_range(self.fiscal_timesheet.dt_from, self.fiscal_timesheet.dt_to).date:
             day_in_past = dt < self.dt_now
-            if self.fiscal_timesheet.employee.user.network.settings_values_prop.get(
+            if self.fiscal_timesheet.employee.user.network.parsed_settings.get(
                     'timesheet_only_day_in_past', False) and not day_in_past:
                 continue
             active_employment = self.fiscal_timesheet._get_active_employment(dt)
@@ -423,7 +423,7 @@ class BasePobedaTimesheetDivider(BaseTimesheetDivider):
                         main_timesheet_item.work_type_name.id != active_employment.main_work_type_name_id
                     position_differs = main_timesheet_item.position != active_employment.position
                     shop_differs = main_timesheet_item.shop != active_employment.shop
-                    move_cond = (self.fiscal_timesheet.employee.user.network.settings_values_prop.get(
+                    move_cond = (self.fiscal_timesheet.employee.user.network.parsed_settings.get(
                         'move_to_add_timesheet_if_work_type_name_differs') and work_type_name_differs) \
                                 or position_differs \
                                 or shop_differs
@@ -624,7 +624,7 @@ class ShiftScheduleDivider(BaseTimesheetDivider):
     def _divide_by_shift_schedule(self):
         for dt in pd.date_range(self.fiscal_timesheet.dt_from, self.fiscal_timesheet.dt_to).date:
             day_in_past = dt < self.dt_now
-            if self.fiscal_timesheet.employee.user.network.settings_values_prop.get(
+            if self.fiscal_timesheet.employee.user.network.parsed_settings.get(
                     'timesheet_only_day_in_past', False) and not day_in_past:
                 continue
             fact_timesheet_items = list(filter(
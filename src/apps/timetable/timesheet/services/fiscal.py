@@ -11,7 +11,33 @@ from src.apps.timetable.models import (
     TimesheetItem as TimesheetItemModel,
     EmploymentWorkType,
 )
-from src.common.decorators import require_lock
+from src.common.decorators import require_advisory_lock
+
+# поля записи табеля, которые сравниваются при сохранении (кроме сотрудника, типа табеля и даты)
+TIMESHEET_ITEM_DIFF_FIELDS = [
+    'shop_id',
+    'position_id',
+    'work_type_name_id',
+    'day_type_id',
+    'dttm_work_start',
+    'dttm_work_end',
+    'day_hours',
+    'night_hours',
+    'source',
+]
+HOURS_PRECISION = Decimal('0.01')
+
+
+def _get_item_values(item):
+    values = []
+    for field in TIMESHEET_ITEM_DIFF_FIELDS:
+        value = getattr(item, field)
+        if field in ('day_hours', 'night_hours'):
+            value = Decimal(value or 0).quantize(HOURS_PRECISION)
+        elif field == 'source':
+            value = value or ''
+        values.append(value)
+    return tuple(values)
 
 
 class TimesheetItem:
@@ -212,7 +238,10 @@ class Timesheet:
                 self.add(dt, items)
         return subtracted_items
 
-    def save(self):
+    def get_timesheet_items(self):
+        """
+        :return: несохраненные записи табеля (TimesheetItemModel)
+        """
         timesheet_items = []
         for dt, items in self._timesheet_items.items():
             for i in items:
@@ -232,7 +261,7 @@ class Timesheet:
                         source=i.source or '',
                     )
                 )
-        return TimesheetItemModel.objects.bulk_create(timesheet_items)
+        return timesheet_items
 
 
 class FiscalTimesheet:
@@ -292,13 +321,57 @@ class FiscalTimesheet:
                 ))
 
     @transaction.atomic
-    @require_lock(TimesheetItemModel, 'EXCLUSIVE')
+    @require_advisory_lock('timesheet', lambda self: self.employee.id)
     def save(self):
-        TimesheetItemModel.objects.filter(
-            employee=self.employee,
-            dt__gte=self.dt_from,
-            dt__lte=self.dt_to,
-        ).delete()
-        self.fact_timesheet.save()
-        self.main_timesheet.save()
-        self.additional_timesheet.save()
+        """
+        Сохранение табеля сотрудника за период.
+        Записи сравниваются с сохраненными, в БД пишутся только изменения:
+        совпадающие записи остаются, отличающиеся обновляются, лишние удаляются, недостающие создаются.
+        Блокируются только записи сотрудника (advisory lock), расчеты разных сотрудников и чтение не блокируются.
+        :return: (кол-во созданных, кол-во обновленных, кол-во удаленных записей)
+        """
+        stored_items = {}
+        for stored_item in TimesheetItemModel.objects.filter(
+                employee=self.employee,
+                dt__gte=self.dt_from,
+                dt__lte=self.dt_to,
+        ).order_by('id'):
+            stored_items.setdefault((stored_item.timesheet_type, stored_item.dt), []).append(stored_item)
+
+        items_to_create = []
+        items_to_update = []
+        for timesheet in (self.fact_timesheet, self.main_timesheet, self.additional_timesheet):
+            new_items = {}
+            for item in timesheet.get_timesheet_items():
+                new_items.setdefault((item.timesheet_type, item.dt), []).append(item)
+            for key, items in new_items.items():
+                stored = stored_items.pop(key, [])
+                stored_values = [_get_item_values(stored_item) for stored_item in stored]
+                changed_items = []
+                for item in items:
+                    values = _get_item_values(item)
+                    if values in stored_values:
+                        # запись не изменилась
+                        stored.pop(stored_values.index(values))
+                        stored_values.remove(values)
+                    else:
+                        changed_items.append(item)
+                for item in changed_items:
+                    if stored:
+                        stored_item = stored.pop(0)
+                        for field in TIMESHEET_ITEM_DIFF_FIELDS:
+                            setattr(stored_item, field, getattr(item, field))
+                        items_to_update.append(stored_item)
+                    else:
+                        items_to_create.append(item)
+                if stored:
+                    stored_items[key] = stored
+
+        ids_to_delete = [stored_item.id for stored in stored_items.values() for stored_item in stored]
+        if ids_to_delete:
+            TimesheetItemModel.objects.filter(id__in=ids_to_delete).delete()
+        if items_to_update:
+            TimesheetItemModel.objects.bulk_update(items_to_update, TIMESHEET_ITEM_DIFF_FIELDS, batch_size=1000)
+        if items_to_create:
+            TimesheetItemModel.objects.bulk_create(items_to_create, batch_size=1000)
+        return len(items_to_create), len(items_to_update), len(ids_to_delete)
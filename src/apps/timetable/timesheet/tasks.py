@@ -1,7 +1,9 @@
 import logging
 from datetime import date
 
+from celery import chord
 from celery_singleton import Singleton
+from django.conf import settings
 from django.db import transaction
 
 from src.apps.base.models import Employee, Employment
@@ -15,8 +17,38 @@ from ..worker_day.stat import get_month_range
 logger = logging.getLogger('calc_timesheets')
 
 
-@app.task(base=Singleton)
-def calc_timesheets(employee_id__in: list = None, dt_from=None, dt_to=None, reraise_exc=False, cleanup=True):
+def _calc_employees_timesheets(employees, dt_from, dt_to, calc_periods, reraise_exc=False, progress_callback=None):
+    """
+    Расчет табеля сотрудников
+    :param progress_callback: функция (кол-во обработанных сотрудников, кол-во ошибок), вызывается после каждого сотрудника
+    :return: (кол-во обработанных сотрудников, кол-во ошибок)
+    """
+    wd_types_dict = WorkerDayType.get_wd_types_dict()
+    work_type_names_dict = WorkTypeName.get_work_type_names_dict()
+    processed = errors = 0
+    for employee in employees:
+        try:
+            TimesheetCalculatorService(
+                employee=employee, dt_from=dt_from, dt_to=dt_to, wd_types_dict=wd_types_dict,
+                work_type_names_dict=work_type_names_dict, calc_periods=calc_periods).calc()
+        except Exception as e:
+            logger.exception(e)
+            if reraise_exc:
+                raise e
+            errors += 1
+        processed += 1
+        if progress_callback:
+            progress_callback(processed, errors)
+    return processed, errors
+
+
+def _cleanup(calc_periods):
+    res = delete_hanging_timesheet_items(calc_periods)
+    if res[0]:
+        logger.info(f'deleted {res[0]} hanging TimesheetItems')
+
+
+def _parse_dates(dt_from, dt_to):
     assert (dt_from and dt_to) or (dt_from is None and dt_to is None)
     if dt_from and dt_to:
         if isinstance(dt_from, str):
@@ -24,6 +56,22 @@ def calc_timesheets(employee_id__in: list = None, dt_from=None, dt_to=None, rera
         if isinstance(dt_to, str):
             dt_to = Converter.parse_date(dt_to)
         assert dt_from.month == dt_to.month
+    return dt_from, dt_to
+
+
+def _parse_calc_periods(calc_periods):
+    return [(Converter.parse_date(period_start), Converter.parse_date(period_end)) for period_start, period_end in calc_periods]
+
+
+@app.task(base=Singleton)
+def calc_timesheets(employee_id__in: list = None, dt_from=None, dt_to=None, reraise_exc=False, cleanup=True, chunk_size=None):
+    """
+    Расчет табеля сотрудников
+    :param chunk_size: если сотрудников больше, расчет разбивается на задачи calc_timesheets_chunk по chunk_size
+        сотрудников, которые выполняются параллельно (celery chord), очистка выполняется после всех задач.
+        По умолчанию settings.CALC_TIMESHEETS_CHUNK_SIZE, 0 -- расчет в этой задаче
+    """
+    dt_from, dt_to = _parse_dates(dt_from, dt_to)
     logger.info('start calc_timesheets')
 
     calc_periods = _get_calc_periods(dt_from=dt_from, dt_to=dt_to)
@@ -41,26 +89,77 @@ def calc_timesheets(employee_id__in: list = None, dt_from=None, dt_to=None, rera
     #     dt_hired=Min('employments__dt_hired'),
     #     dt_fired=Max('employments__dt_fired'),
     # )
-    wd_types_dict = WorkerDayType.get_wd_types_dict()
-    work_type_names_dict = WorkTypeName.get_work_type_names_dict()
-    for employee in qs:
-        try:
-            TimesheetCalculatorService(
-                employee=employee, dt_from=dt_from, dt_to=dt_to, wd_types_dict=wd_types_dict,
-                work_type_names_dict=work_type_names_dict, calc_periods=calc_periods).calc()
-        except Exception as e:
-            logger.exception(e)
-            if reraise_exc:
-                raise e
-    
+    chunk_size = settings.CALC_TIMESHEETS_CHUNK_SIZE if chunk_size is None else chunk_size
+    if chunk_size:
+        employee_ids = sorted(qs.values_list('id', flat=True))
+        if len(employee_ids) > chunk_size:
+            chunks = [employee_ids[i:i + chunk_size] for i in range(0, len(employee_ids), chunk_size)]
+            task_kwargs = dict(
+                dt_from=Converter.convert_date(dt_from),
+                dt_to=Converter.convert_date(dt_to),
+                calc_periods=[
+                    (Converter.convert_date(period_start), Converter.convert_date(period_end))
+                    for period_start, period_end in calc_periods
+                ],
+            )
+            chord(
+                calc_timesheets_chunk.si(
+                    employee_id__in=chunk, chunk_num=chunk_num, chunks_count=len(chunks),
+                    reraise_exc=reraise_exc, **task_kwargs,
+                )
+                for chunk_num, chunk in enumerate(chunks, start=1)
+            )(calc_timesheets_finish.s(cleanup=cleanup, **task_kwargs))
+            logger.info(f'calc_timesheets: started {len(chunks)} chunks for {len(employee_ids)} employees')
+            return
+
+    _calc_employees_timesheets(qs, dt_from, dt_to, calc_periods, reraise_exc=reraise_exc)
+
     if cleanup:
-        res = delete_hanging_timesheet_items(calc_periods)
-        if res[0]:
-            logger.info(f'deleted {res[0]} hanging TimesheetItems')
-    
+        _cleanup(calc_periods)
+
     logger.info('finish calc_timesheets')
 
 
+@app.task(bind=True)
+def calc_timesheets_chunk(self, employee_id__in: list, dt_from=None, dt_to=None, calc_periods=None,
+                          chunk_num=1, chunks_count=1, reraise_exc=False):
+    """
+    Расчет табеля части сотрудников для calc_timesheets.
+    Прогресс доступен в состоянии задачи (PROGRESS, meta: chunk, chunks, processed, total, errors).
+    """
+    dt_from, dt_to = _parse_dates(dt_from, dt_to)
+    calc_periods = _parse_calc_periods(calc_periods)
+    total = len(employee_id__in)
+    logger.info(f'start calc_timesheets chunk {chunk_num}/{chunks_count}: {total} employees')
+
+    def _report_progress(processed, errors):
+        if not self.request.called_directly and not self.request.is_eager:
+            self.update_state(state='PROGRESS', meta={
+                'chunk': chunk_num, 'chunks': chunks_count, 'processed': processed, 'total': total, 'errors': errors,
+            })
+
+    processed, errors = _calc_employees_timesheets(
+        Employee.objects.filter(id__in=employee_id__in).select_related('user__network'),
+        dt_from, dt_to, calc_periods, reraise_exc=reraise_exc, progress_callback=_report_progress,
+    )
+    logger.info(f'finish calc_timesheets chunk {chunk_num}/{chunks_count}: {processed} employees, {errors} errors')
+    return {'chunk': chunk_num, 'processed': processed, 'errors': errors}
+
+
+@app.task
+def calc_timesheets_finish(chunks_results, dt_from=None, dt_to=None, calc_periods=None, cleanup=True):
+    """
+    Завершение calc_timesheets после расчета всех частей: очистка и итоговая статистика
+    """
+    if cleanup:
+        _cleanup(_parse_calc_periods(calc_periods))
+    logger.info('finish calc_timesheets: {processed} employees, {errors} errors in {chunks} chunks'.format(
+        processed=sum(r['processed'] for r in chunks_results),
+        errors=sum(r['errors'] for r in chunks_results),
+        chunks=len(chunks_results),
+    ))
+
+
 def recalc_timesheet_on_data_change(groupped_data: dict[int, tuple[date]]):
     # recalculate timesheet for period when employees' workdays changed
     for employee_id, dates in groupped_data.items():
@@ -2,6 +2,7 @@ from datetime import date, datetime, time, timedelta
 
 from django.db.models import Sum
 from django.test import TestCase, override_settings
+from freezegun import freeze_time
 
 from src.apps.base.models import Employment, WorkerPosition
 from src.apps.base.tests import (
@@ -16,6 +17,7 @@ from src.apps.base.tests import (
 )
 from src.apps.timetable.models import WorkerDay, TimesheetItem, WorkTypeName, WorkType, WorkerDayType
 from src.apps.timetable.tests.factories import WorkerDayFactory
+from src.apps.timetable.timesheet.tasks import calc_timesheets
 from ._base import TestTimesheetMixin
 
 
@@ -371,3 +373,41 @@ class TestTimesheetCalc(TestTimesheetMixin, TestCase):
         )
         self._calc_timesheets(dttm_now=dt)
         self.assertEqual(count_before, TimesheetItem.objects.count())
+
+    def test_recalc_timesheets_saves_only_changes(self):
+        self._calc_timesheets()
+        items_before = {i.id: i for i in TimesheetItem.objects.all()}
+        self._calc_timesheets()
+        self.assertEqual(set(TimesheetItem.objects.values_list('id', flat=True)), set(items_before))
+
+        dt = date(2021, 6, 7)
+        wd = WorkerDay.objects.get(employee=self.employee_worker, dt=dt, is_fact=True)
+        wd.dttm_work_end = datetime.combine(dt, time(18))
+        wd.save()
+        self._calc_timesheets()
+        items_after = {i.id: i for i in TimesheetItem.objects.all()}
+        self.assertEqual(set(items_after), set(items_before))
+        changed_items = [
+            i for i in items_after.values()
+            if i.day_hours + i.night_hours != items_before[i.id].day_hours + items_before[i.id].night_hours
+        ]
+        self.assertEqual(len(changed_items), 1)
+        self.assertEqual(changed_items[0].dt, dt)
+
+    @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+    def test_calc_timesheets_in_chunks(self):
+        employee2 = EmployeeFactory(user=UserFactory(network=self.network), tabel_code='employee2')
+        EmploymentFactory(employee=employee2, shop=self.shop, position=self.position_worker)
+        fired_employment = EmploymentFactory(dt_hired=date(2020, 1, 1), dt_fired=date(2020, 2, 1))
+        TimesheetItem.objects.create(
+            timesheet_type=TimesheetItem.TIMESHEET_TYPE_FACT,
+            employee=fired_employment.employee,
+            dt=date(2021, 6, 7),
+            day_type_id=WorkerDay.TYPE_WORKDAY,
+        )
+        with freeze_time(datetime(2021, 6, 7, 10, 10, 10)):
+            calc_timesheets(
+                employee_id__in=[self.employee_worker.id, employee2.id], reraise_exc=True, chunk_size=1)
+        self.assertEqual(TimesheetItem.objects.filter(employee=self.employee_worker).count(), 30)
+        self.assertTrue(TimesheetItem.objects.filter(employee=employee2).exists())
+        self.assertFalse(TimesheetItem.objects.filter(employee=fired_employment.employee).exists())
@@ -27,6 +27,7 @@ import json, logging
 # TODO разобраться с Event
 from datetime import timedelta, datetime, time
 
+import numpy as np
 import pandas
 from dateutil.relativedelta import relativedelta
 from django.conf import settings
@@ -59,7 +60,7 @@ from src.apps.timetable.models import (
     VacancyBlackList,
 )
 from src.apps.timetable.timesheet.tasks import recalc_timesheet_on_data_change
-from src.apps.timetable.work_type.utils import ShopEfficiencyGetter
+from src.apps.timetable.work_type.utils import ShopEfficiencyGetter, BatchShopEfficiencyGetter
 
 logger = logging.getLogger('vacancy')
 
@@ -1111,7 +1112,7 @@ def workers_exchange():
     # }
 
     shop_list = Shop.objects.select_related('exchange_settings').all()
-    df_shop_stat = pandas.DataFrame()
+    shops_dates = {}
 
     for shop in shop_list:
         exchange_settings = shop.get_exchange_settings()
@@ -1119,36 +1120,20 @@ def workers_exchange():
             continue
         from_dt = (now().replace(minute=0, second=0, microsecond=0) + exchange_settings.automatic_worker_select_timegap).date()
         to_dt = from_dt + exchange_settings.automatic_worker_select_timegap_to
-        params = {
-            'from_dt': from_dt,
-            'to_dt': to_dt,
-        }
-        for work_type in shop.work_types.all():
-            params['work_type_ids'] = [work_type.id]
-
-            shop_stat = ShopEfficiencyGetter(
-                shop.id,
-                consider_vacancies=False,
-                **params,
-            ).get()
-
-            df_stat=pandas.DataFrame(shop_stat['tt_periods']['real_cashiers']).rename({'amount':'real_cashiers'}, axis=1)
-            df_stat['predict_cashier_needs'] = pandas.DataFrame(shop_stat['tt_periods']['predict_cashier_needs']).amount
-            df_stat['lack'] = df_stat.predict_cashier_needs - df_stat.real_cashiers
-            df_stat['dttm'] = pandas.to_datetime(df_stat.dttm, format=QOS_DATETIME_FORMAT)
-            # df_stat['shop_id'] = shop.id
-            df_stat['work_type_id'] = work_type.id
-            df_shop_stat = pandas.concat([df_shop_stat, df_stat])
-
-    if not len(df_shop_stat):
+        shops_dates[shop.id] = (from_dt, to_dt)
+
+    if not shops_dates:
+        return
+
+    shops_stat = BatchShopEfficiencyGetter(shops_dates, consider_vacancies=False).get()
+    if not shops_stat.positions:
         return
 
-    df_shop_stat.set_index([# df_shop_stat.shop_id,
-                            df_shop_stat.work_type_id, df_shop_stat.dttm], inplace=True)
     for shop in shop_list:
-        exchange_settings = shop.get_exchange_settings()
-        if not exchange_settings or not exchange_settings.automatic_exchange:
+        if shop.id not in shops_dates:
             continue
+        exchange_settings = shop.get_exchange_settings()
+        from_dt, to_dt = shops_dates[shop.id]
         exchange_shops = list(shop.exchange_shops.all())
         exclude_positions = exchange_settings.exclude_positions.all()
         
@@ -1164,7 +1149,7 @@ def workers_exchange():
             ).order_by('dt')
 
             for vacancy in vacancies:
-                vacancy_lack = _lack_calc( df_shop_stat, work_type.id, vacancy.dttm_work_start, vacancy.dttm_work_end)
+                vacancy_lack = _lack_calc(shops_stat, work_type.id, vacancy.dttm_work_start, vacancy.dttm_work_end)
                 logger.info('lack: {}; vacancy: {}; work_type: {}'.format(vacancy_lack, vacancy, work_type))
                 # dttm_from_workers = vacancy.dttm_work_start - timedelta(hours=4)
                 if vacancy_lack > 0:
@@ -1188,7 +1173,7 @@ def workers_exchange():
                     worker_lack = None
                     candidate_to_change = None
                     for worker_day in worker_days:
-                        lack = _lack_calc(df_shop_stat, worker_day.work_type_id, worker_day.worker_day.dttm_work_start, worker_day.worker_day.dttm_work_end )
+                        lack = _lack_calc(shops_stat, worker_day.work_type_id, worker_day.worker_day.dttm_work_start, worker_day.worker_day.dttm_work_end )
                         if worker_lack is None or lack < worker_lack:
                             worker_lack = lack
                             candidate_to_change = worker_day
@@ -1237,18 +1222,22 @@ def workers_exchange():
                             )
                             msg.send()
 
-                        _lack_add(df_shop_stat, work_type.id, vacancy.dttm_work_start, vacancy.dttm_work_end, -1 )
+                        _lack_add(shops_stat, work_type.id, vacancy.dttm_work_start, vacancy.dttm_work_end, -1 )
                         for work_type_id, lack in candidate_details.items():
-                            _lack_add(df_shop_stat, work_type_id, candidate_worker_day.dttm_work_start, candidate_worker_day.dttm_work_end, lack )
+                            _lack_add(shops_stat, work_type_id, candidate_worker_day.dttm_work_start, candidate_worker_day.dttm_work_end, lack )
 
 
-def _lack_add(df, work_type_id, dttm_from, dttm_to, add):
-    cond = (df.work_type_id == work_type_id) & (df['dttm'] >= dttm_from) & (df['dttm'] < dttm_to)
-    df.loc[cond, 'lack'] += add
+def _lack_add(shops_stat, work_type_id, dttm_from, dttm_to, add):
+    periods_slice = shops_stat.get_periods_slice(work_type_id, dttm_from, dttm_to)
+    if periods_slice is not None:
+        shops_stat.lack_array[periods_slice] += add
 
 
-def _lack_calc(df, work_type_id, dttm_from, dttm_to):
-    cond = (df.work_type_id == work_type_id) & (df['dttm'] >= dttm_from) & (df['dttm'] < dttm_to)
-    return df.loc[cond, 'lack'].apply(
-        lambda x: x if 1.0 > x > -1.0 else 1 if x >= 1 else -1
-    ).mean()
+def _lack_calc(shops_stat, work_type_id, dttm_from, dttm_to):
+    periods_slice = shops_stat.get_periods_slice(work_type_id, dttm_from, dttm_to)
+    if periods_slice is None:
+        return np.nan
+    lack = shops_stat.lack_array[periods_slice]
+    if not lack.size:
+        return np.nan
+    return np.clip(lack, -1, 1).mean()
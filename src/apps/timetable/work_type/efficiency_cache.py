@@ -0,0 +1,98 @@
+"""
+Кэш массивов эффективности магазина по дням.
+
+Для каждого дня хранится вклад рабочих дней и прогноза этого дня в массивы ShopEfficiencyGetter
+(смена, начатая в этот день, может заходить на следующий день).
+Инвалидация -- смена поколения (shop_id, dt): ключи старого поколения больше не читаются и истекают по TTL,
+поэтому не нужно искать и удалять ключи по шаблону.
+
+Модуль не импортирует модели, чтобы его можно было использовать в моделях и обработчиках сигналов.
+"""
+import datetime
+import hashlib
+import uuid
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+GENERATION_KEY = 'shop_efficiency_gen_{shop_id}_{dt}'
+DAY_KEY = 'shop_efficiency_{shop_id}_{params}_{dt}_{generation}'
+
+
+def _get_timeout():
+    return settings.CACHE_TTL.get('shop_efficiency', 3600)
+
+
+def get_params_hash(*params):
+    """
+    Хэш параметров расчета, от которых зависят массивы (типы работ, тип графика, шаг периода и т.д.)
+    """
+    return hashlib.md5(repr(params).encode()).hexdigest()
+
+
+def get_generations(shop_id, dts):
+    """
+    Текущие поколения дней магазина
+    :return: {dt: generation}
+    """
+    keys = {dt: GENERATION_KEY.format(shop_id=shop_id, dt=dt) for dt in dts}
+    generations = cache.get_many(keys.values())
+    return {dt: generations.get(key, '0') for dt, key in keys.items()}
+
+
+def get_days_arrays(shop_id, params_hash, generations):
+    """
+    Закэшированные массивы дней
+    :param generations: {dt: generation} из get_generations
+    :return: {dt: np.ndarray} только для найденных дней
+    """
+    keys = {
+        dt: DAY_KEY.format(shop_id=shop_id, params=params_hash, dt=dt, generation=generation)
+        for dt, generation in generations.items()
+    }
+    values = cache.get_many(keys.values())
+    return {dt: np.frombuffer(values[key]) for dt, key in keys.items() if key in values}
+
+
+def set_days_arrays(shop_id, params_hash, generations, days_arrays):
+    """
+    Сохраняет массивы дней в поколениях, прочитанных до расчета
+    (если день успел инвалидироваться во время расчета, значение просто не будет прочитано).
+    """
+    cache.set_many({
+        DAY_KEY.format(shop_id=shop_id, params=params_hash, dt=dt, generation=generations[dt]): array.tobytes()
+        for dt, array in days_arrays.items()
+    }, timeout=_get_timeout())
+
+
+def _bump_generations(shop_dts):
+    # ключ поколения живет дольше значений, чтобы после его истечения не осталось значений со старым поколением
+    cache.set_many({
+        GENERATION_KEY.format(shop_id=shop_id, dt=dt): uuid.uuid4().hex
+        for shop_id, dts in shop_dts.items()
+        for dt in dts
+    }, timeout=_get_timeout() * 2)
+
+
+def invalidate_shop_efficiency_cache(shop_id=None, dt_from=None, dt_to=None, shop_dts=None):
+    """
+    Инвалидация дней магазина (или нескольких магазинов через shop_dts={shop_id: [dt, ...]}).
+    Смена ночью влияет на эффективность следующего дня, но хранится во вкладе дня начала,
+    поэтому инвалидируются только дни изменений.
+    Поколение меняется сразу и еще раз после коммита транзакции,
+    чтобы значения, посчитанные по незакоммиченным данным, не использовались.
+    """
+    shop_dts = {shop_id: set(dts) for shop_id, dts in (shop_dts or {}).items()}
+    if shop_id and dt_from:
+        dt_to = dt_to or dt_from
+        shop_dts.setdefault(shop_id, set()).update(
+            dt_from + datetime.timedelta(days=i) for i in range((dt_to - dt_from).days + 1)
+        )
+    shop_dts = {shop_id: dts for shop_id, dts in shop_dts.items() if shop_id and dts}
+    if not shop_dts:
+        return
+
+    _bump_generations(shop_dts)
+    transaction.on_commit(lambda: _bump_generations(shop_dts))
@@ -2,6 +2,7 @@ from datetime import datetime, timedelta, time, date
 from decimal import Decimal
 from unittest.case import skip
 
+import numpy as np
 from dateutil.relativedelta import relativedelta
 from rest_framework import status
 from rest_framework.test import APITestCase
@@ -14,6 +15,7 @@ from src.apps.timetable.models import (
     WorkerDay,
     WorkerDayCashboxDetails,
 )
+from src.apps.timetable.work_type.utils import ShopEfficiencyGetter, BatchShopEfficiencyGetter
 from src.common.mixins.tests import TestsHelperMixin
 from src.common.models_converter import Converter
 from src.common.test import create_departments_and_users
@@ -475,6 +477,132 @@ class TestWorkType(APITestCase, TestsHelperMixin):
         self.assertEqual(resp_data['indicators']['covering'], 9.8)
         self.assertEqual(resp_data['indicators']['deadtime'], 15.4)
 
+    def test_batch_efficiency(self):
+        dt_now = date(2021, 6, 1)
+        self.shop2.forecast_step_minutes = time(minute=30)
+        self.shop2.save()
+        for work_type, value in ((self.work_type1, 2), (self.work_type2, 1)):
+            for i in range(3):
+                dt = dt_now + timedelta(days=i)
+                for j in range(8, 22):
+                    PeriodClients.objects.create(
+                        value=value,
+                        operation_type=work_type.operation_type,
+                        dttm_forecast=datetime.combine(dt, time(j)),
+                        dt_report=dt,
+                    )
+        for work_type, employee, employment, dt, dttm_work_start, dttm_work_end, work_part in (
+                (self.work_type1, self.employee2, self.employment2, dt_now,
+                 datetime.combine(dt_now, time(9)), datetime.combine(dt_now, time(18)), 1.0),
+                (self.work_type1, self.employee3, self.employment3, dt_now + timedelta(days=1),
+                 datetime.combine(dt_now + timedelta(days=1), time(20)),
+                 datetime.combine(dt_now + timedelta(days=2), time(2)), 0.5),
+                (self.work_type2, self.employee8, self.employment8, dt_now,
+                 datetime.combine(dt_now, time(9, 30)), datetime.combine(dt_now, time(18)), 1.0),
+                (self.work_type2, self.employee8, self.employment8, dt_now + timedelta(days=1),
+                 datetime.combine(dt_now + timedelta(days=1), time(9, 30)),
+                 datetime.combine(dt_now + timedelta(days=1), time(18)), 1.0),
+        ):
+            wd = WorkerDay.objects.create(
+                dttm_work_start=dttm_work_start,
+                dttm_work_end=dttm_work_end,
+                type_id=WorkerDay.TYPE_WORKDAY,
+                dt=dt,
+                shop=work_type.shop,
+                employee=employee,
+                employment=employment,
+                is_approved=True,
+                is_fact=False,
+            )
+            WorkerDayCashboxDetails.objects.create(worker_day=wd, work_type=work_type, work_part=work_part)
+
+        shops_dates = {
+            self.shop.id: (dt_now, dt_now + timedelta(days=1)),
+            self.shop2.id: (dt_now + timedelta(days=1), dt_now + timedelta(days=2)),
+        }
+        shops_stat = BatchShopEfficiencyGetter(shops_dates).get()
+        self.assertNotIn(self.work_type4.id, shops_stat.positions)
+        for work_type in (self.work_type1, self.work_type2, self.work_type3):
+            dt_from, dt_to = shops_dates[work_type.shop_id]
+            shop_stat = ShopEfficiencyGetter(work_type.shop_id, dt_from, dt_to, work_type_ids=[work_type.id]).get()
+            row = shops_stat.positions[work_type.id]
+            periods = len(shop_stat['tt_periods']['real_cashiers'])
+            self.assertEqual(
+                shops_stat.wdays_array[row, :periods].tolist(),
+                [period['amount'] for period in shop_stat['tt_periods']['real_cashiers']],
+            )
+            self.assertEqual(
+                shops_stat.predict_needs_array[row, :periods].tolist(),
+                [period['amount'] for period in shop_stat['tt_periods']['predict_cashier_needs']],
+            )
+            self.assertTrue(np.isnan(shops_stat.lack_array[row, periods:]).all())
+
+        self.assertEqual(
+            shops_stat.get_periods_slice(
+                self.work_type2.id,
+                datetime.combine(dt_now + timedelta(days=1), time(9, 15)),
+                datetime.combine(dt_now + timedelta(days=1), time(10)),
+            ),
+            (shops_stat.positions[self.work_type2.id], slice(19, 20)),
+        )
+
+    def test_efficiency_cache(self):
+        dt_now = date(2021, 6, 1)
+        for i in range(3):
+            dt = dt_now + timedelta(days=i)
+            for j in range(8, 22):
+                PeriodClients.objects.create(
+                    value=2,
+                    operation_type=self.work_type1.operation_type,
+                    dttm_forecast=datetime.combine(dt, time(j)),
+                    dt_report=dt,
+                )
+        wdays = []
+        for employee, employment, dt, dttm_work_start, dttm_work_end in (
+                (self.employee2, self.employment2, dt_now,
+                 datetime.combine(dt_now, time(9)), datetime.combine(dt_now, time(18))),
+                (self.employee3, self.employment3, dt_now,
+                 datetime.combine(dt_now, time(20)), datetime.combine(dt_now + timedelta(days=1), time(10))),
+                (self.employee3, self.employment3, dt_now + timedelta(days=2),
+                 datetime.combine(dt_now + timedelta(days=2), time(12)),
+                 datetime.combine(dt_now + timedelta(days=2), time(21))),
+        ):
+            wd = WorkerDay.objects.create(
+                dttm_work_start=dttm_work_start,
+                dttm_work_end=dttm_work_end,
+                type_id=WorkerDay.TYPE_WORKDAY,
+                dt=dt,
+                shop=self.shop,
+                employee=employee,
+                employment=employment,
+                is_approved=True,
+                is_fact=False,
+            )
+            WorkerDayCashboxDetails.objects.create(worker_day=wd, work_type=self.work_type1)
+            wdays.append(wd)
+
+        def _get_efficiency(use_cache):
+            return ShopEfficiencyGetter(
+                self.shop.id, dt_now, dt_now + timedelta(days=2), use_cache=use_cache).get()
+
+        self.assertEqual(_get_efficiency(True), _get_efficiency(False))
+        self.assertEqual(_get_efficiency(True), _get_efficiency(False))
+
+        # изменение без сигналов не видно, пока день не инвалидирован
+        WorkerDay.objects.filter(id=wdays[2].id).update(
+            dttm_work_end=datetime.combine(dt_now + timedelta(days=2), time(15)))
+        self.assertNotEqual(_get_efficiency(True), _get_efficiency(False))
+
+        wdays[2].refresh_from_db()
+        wdays[2].save()
+        self.assertEqual(_get_efficiency(True), _get_efficiency(False))
+
+        # ночная смена первого дня учитывается в покрытии второго дня
+        wdays[1].delete()
+        expected = _get_efficiency(False)
+        self.assertEqual(_get_efficiency(True), expected)
+        self.assertEqual(expected['day_stats']['graph_hours'][Converter.convert_date(dt_now + timedelta(days=1))], 0)
+
     def test_set_preliminary_cost_per_hour(self):
         response = self.client.put(
             f'{self.url}{self.work_type1.id}/',
@@ -18,11 +18,93 @@ from src.apps.timetable.models import (
     WorkerDay,
     WorkType,
 )
+from src.apps.timetable.work_type import efficiency_cache
 from src.common.models_converter import Converter
 
 MINUTES_IN_DAY = 24 * 60
 
 
+def fill_points(array, indexes, values):
+    """
+    Прибавляет values к array по индексам indexes (повторяющиеся индексы суммируются).
+    Индексы, выходящие за границы массива, отбрасываются.
+    """
+    mask = (indexes >= 0) & (indexes < array.size)
+    np.add.at(array, indexes[mask], values[mask])
+
+
+def fill_intervals(array, starts, ends, weights):
+    """
+    Прибавляет weights[i] ко всем периодам [starts[i], ends[i]) массива array.
+    Интервалы обрезаются по границам массива
+    (смена с 10 вечера до 8 утра следующего дня может выходить за последний период).
+    """
+    starts = np.clip(starts, 0, array.size)
+    ends = np.clip(ends, 0, array.size)
+    mask = starts < ends
+    starts, ends, weights = starts[mask], ends[mask], weights[mask]
+    if not starts.size:
+        return
+
+    if np.all(np.mod(weights, 1) == 0):
+        # целые веса суммируются точно в любом порядке -- считаем через разностный массив и кумулятивную сумму
+        diff = np.zeros(array.size + 1)
+        np.add.at(diff, starts, weights)
+        np.add.at(diff, ends, -weights)
+        array += np.cumsum(diff[:-1])
+    else:
+        # дробные веса раскладываем по периодам в порядке строк,
+        # чтобы порядок суммирования (и результат) совпадал с построчным заполнением
+        lengths = ends - starts
+        indexes = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        np.add.at(array, indexes, np.repeat(weights, lengths))
+
+
+def get_efficiency_wdays_qs(dt_from, dt_to, work_type_ids, graph_type='plan_approved', consider_vacancies=False,
+                            only_open_vacancies=False, consider_canceled=False):
+    """
+    Рабочие дни, покрывающие потребность по типам работ work_type_ids (с аннотацией work_part).
+    """
+    base_wd_q = Q(
+        Q(employment__dt_fired__gte=dt_from) &
+        Q(dt__lte=F('employment__dt_fired')) |
+        Q(employment__dt_fired__isnull=True),
+        Q(employment__dt_hired__lte=dt_to) &
+        Q(dt__gte=F('employment__dt_hired')) |
+        Q(employment__dt_hired__isnull=True),
+        dt__gte=dt_from,
+        dt__lte=dt_to,
+    )
+    if not consider_vacancies:
+        base_wd_q &= Q(employee__isnull=False)
+
+    if only_open_vacancies:
+        base_wd_q &= Q(employee__isnull=True)
+
+    if not consider_canceled:
+        base_wd_q &= Q(canceled=False)
+
+    qs = WorkerDay.objects.filter(base_wd_q)
+
+    if graph_type == 'plan_edit':
+        qs = qs.get_plan_not_approved()
+    elif graph_type == 'fact_approved':
+        qs = qs.get_fact_approved()
+    elif graph_type == 'fact_edit':
+        qs = qs.get_fact_not_approved()
+    else:
+        qs = qs.get_plan_approved()
+
+    qs = qs.filter(
+        type__is_work_hours=True,
+        worker_day_details__work_type_id__in=work_type_ids,
+    ).exclude(
+        Q(dttm_work_start__isnull=True) | Q(dttm_work_end__isnull=True),
+    ).annotate(work_part=F('worker_day_details__work_part')).distinct()
+
+    return qs
+
+
 class ShopEfficiencyGetterError(ValidationError):
     pass
 
@@ -30,7 +112,7 @@ class ShopEfficiencyGetterError(ValidationError):
 class ShopEfficiencyGetter:
     def __init__(self, shop_id, from_dt, to_dt, graph_type='plan_approved', work_type_ids: list = None,
                  consider_vacancies=False, efficiency=True, indicators=False, consider_canceled=False,
-                 add_schedule_tabs_day_stats=False, **kwargs):
+                 add_schedule_tabs_day_stats=False, use_cache=False, **kwargs):
         self.shop_id = shop_id
         self.dt_from = from_dt
         self.dt_to = to_dt + datetime.timedelta(days=1)  # To include last day in "x < to_dt" conds
@@ -42,36 +124,26 @@ class ShopEfficiencyGetter:
         self.add_schedule_tabs_day_stats = add_schedule_tabs_day_stats
         self.efficiency = efficiency
         self.indicators = indicators
-        self.lambda_index_periodclients = lambda x: [self._dttm2index(self.dt_from, x.dttm_forecast)]
-        self.lambda_add_periodclients = lambda x: x.need_workers
-        self.lambda_index_wdays = lambda x: list(range(
-            self._dttm2index(self.dt_from, x.dttm_work_start),
-            self._dttm2index(self.dt_from, x.dttm_work_end),
-        ))
-        self.lambda_add_wdays = lambda x: x.work_part
-        self.lambda_index_work_hours = lambda x: [self._dt2index(self.dt_from, x.dt)]
-        self.lambda_add_work_hours = lambda x: (x.work_hours.total_seconds()) / 3600
-        self.lambda_index_work_days = lambda x: [self._dt2index(self.dt_from, x.dt)]
-        self.lambda_add_work_days = lambda x: 1
-        self.lambda_index_income = lambda x: [self._dt2index(self.dt_from, x.dttm_forecast.date())]
-        self.lambda_add_income = lambda x: x.value
+        # брать массивы по дням из кэша (efficiency_cache), считать только отсутствующие дни
+        self.use_cache = use_cache
         self.kwargs = kwargs
         self.response = {}
 
-    def _dttm2index(self, dt_init, dttm):
-        days = (dttm.date() - dt_init).days
-        return days * self.periods_in_day + (dttm.hour * 60 + dttm.minute) // self.period_length_in_minutes
-
-    def _dt2index(self, dt_init, dt):
-        days = (dt - dt_init).days
-        return days
-
-    def _fill_array(self, array, db_list, lambda_get_indexes, lambda_add):
-        arr_sz = array.size
-        for db_model in db_list:
-            # период может быть до 12 ночи, а смена с 10 до 8 утра следующего дня и поэтому выходим за границы
-            indexes = [ind for ind in lambda_get_indexes(db_model) if ind < arr_sz]
-            array[indexes] += lambda_add(db_model)
+    def _dttms2indexes(self, dttms, dt_from=None):
+        """
+        Индексы периодов (от начала dt_from) для последовательности datetime
+        """
+        dt_from = dt_from or self.dt_from
+        minutes = (np.asarray(dttms, dtype='datetime64[s]') - np.datetime64(dt_from, 's')).astype(np.int64) // 60
+        return (minutes // MINUTES_IN_DAY) * self.periods_in_day + \
+            (minutes % MINUTES_IN_DAY) // self.period_length_in_minutes
+
+    def _dts2indexes(self, dts, dt_from=None):
+        """
+        Индексы дней (от dt_from) для последовательности date (или datetime, время отбрасывается)
+        """
+        return (np.asarray(dts, dtype='datetime64[s]').astype('datetime64[D]') -
+                np.datetime64(dt_from or self.dt_from, 'D')).astype(np.int64)
 
     @cached_property
     def shop(self):
@@ -111,152 +183,214 @@ class ShopEfficiencyGetter:
 
         self.work_types = {wt.id: wt for wt in work_types}
 
-    def _get_predict_needs_qs(self):
-        return PeriodClients.objects.shop_times_filter(self.shop, weekday=True).annotate(
+    @cached_property
+    def shop_times_q(self):
+        return PeriodClients.objects.shop_times_q(self.shop, weekday=True)
+
+    def _get_predict_needs_qs(self, dt_from=None, dt_to=None):
+        return PeriodClients.objects.filter(self.shop_times_q).annotate(
             need_workers=F('value'),
         ).select_related('operation_type').filter(
-            dttm_forecast__gte=self.dt_from,
-            dttm_forecast__lte=self.dt_to,
+            dttm_forecast__gte=dt_from or self.dt_from,
+            dttm_forecast__lte=dt_to or self.dt_to,
             operation_type__work_type_id__in=self.work_types.keys(),
             operation_type__dttm_deleted__isnull=True,
         )
 
+    def _annotate_selected_department(self, qs):
+        return qs.annotate(has_active_selected_shop_employment_on_selected_period=Exists(Employment.objects.get_active(
+            employee_id=OuterRef('employee_id'),
+            dt_from=self.dt_from,
+            dt_to=self.dt_to,
+            shop_id=self.shop_id,
+        )))
+
     def _get_wdays_qs(self, consider_vacancies=False, only_open_vacancies=False, other_departments=False,
                       selected_department=False):
-        base_wd_q = Q(
-            Q(employment__dt_fired__gte=self.dt_from) &
-            Q(dt__lte=F('employment__dt_fired')) |
-            Q(employment__dt_fired__isnull=True),
-            Q(employment__dt_hired__lte=self.dt_to) &
-            Q(dt__gte=F('employment__dt_hired')) |
-            Q(employment__dt_hired__isnull=True),
-            dt__gte=self.dt_from,
-            dt__lte=self.dt_to,
+        qs = get_efficiency_wdays_qs(
+            self.dt_from, self.dt_to, self.work_types.keys(), graph_type=self.graph_type,
+            consider_vacancies=consider_vacancies, only_open_vacancies=only_open_vacancies,
+            consider_canceled=self.consider_canceled,
         )
-        if not consider_vacancies:
-            base_wd_q &= Q(employee__isnull=False)
-
-        if only_open_vacancies:
-            base_wd_q &= Q(employee__isnull=True)
-
-        if not self.consider_canceled:
-            base_wd_q &= Q(canceled=False)
-
-        qs = WorkerDay.objects.filter(base_wd_q)
 
         if other_departments or selected_department:
-            qs = qs.annotate(has_active_selected_shop_employment_on_selected_period=Exists(Employment.objects.get_active(
-                employee_id=OuterRef('employee_id'),
-                dt_from=self.dt_from,
-                dt_to=self.dt_to,
-                shop_id=self.shop_id,
-            )))
+            qs = self._annotate_selected_department(qs)
             if other_departments:
                 qs = qs.filter(has_active_selected_shop_employment_on_selected_period=False)
             if selected_department:
                 qs = qs.filter(has_active_selected_shop_employment_on_selected_period=True)
 
-        if self.graph_type == 'plan_edit':
-            qs = qs.get_plan_not_approved()
-        elif self.graph_type == 'fact_approved':
-            qs = qs.get_fact_approved()
-        elif self.graph_type == 'fact_edit':
-            qs = qs.get_fact_not_approved()
-        else:
-            qs = qs.get_plan_approved()
-
-        qs = qs.filter(
-            type__is_work_hours=True,
-            worker_day_details__work_type_id__in=self.work_types.keys(),
-        ).exclude(
-            Q(dttm_work_start__isnull=True) | Q(dttm_work_end__isnull=True),
-        ).annotate(work_part=F('worker_day_details__work_part')).distinct()
-
         return qs
 
-    def _get_income_qs(self):
-        income_code = self.shop.network.settings_values_prop.get('income_code', None)
-        if not income_code:
+    @cached_property
+    def income_code(self):
+        return self.shop.network.settings_values_prop.get('income_code', None)
+
+    def _get_income_qs(self, dt_from=None, dt_to=None):
+        if not self.income_code:
             PeriodClients.objects.none()
 
         return PeriodClients.objects.filter(
             type=PeriodClients.FACT_TYPE,
             operation_type__shop=self.shop,
-            operation_type__operation_type_name__code=income_code,
-            dttm_forecast__gte=self.dt_from,
-            dttm_forecast__lte=self.dt_to,
+            operation_type__operation_type_name__code=self.income_code,
+            dttm_forecast__gte=dt_from or self.dt_from,
+            dttm_forecast__lte=dt_to or self.dt_to,
             operation_type__dttm_deleted__isnull=True,
         )
 
-    def _init_arrays(self):
-        consider_vacancy_map_wdays = {
-            True: list(self._get_wdays_qs(consider_vacancies=True)),
-            False: list(self._get_wdays_qs(consider_vacancies=False)),
+    def _get_wdays_columns(self):
+        """
+        Рабочие дни (вместе с вакансиями) одним запросом в виде колонок numpy.
+        Выборки без вакансий, только по вакансиям и по отделам получаются из нее масками.
+        """
+        fields = ['id', 'dt', 'dttm_work_start', 'dttm_work_end', 'work_hours', 'work_part', 'employee_id']
+        qs = self._get_wdays_qs(consider_vacancies=True)
+        if self.add_schedule_tabs_day_stats:
+            qs = self._annotate_selected_department(qs)
+            fields.append('has_active_selected_shop_employment_on_selected_period')
+        rows = list(qs.values_list(*fields))
+        columns = list(zip(*rows)) if rows else [()] * len(fields)
+
+        wdays = {
+            'start': self._dttms2indexes(columns[2]),
+            'end': self._dttms2indexes(columns[3]),
+            'day': self._dts2indexes(columns[1]),
+            'work_hours': np.asarray(columns[4], dtype='timedelta64[us]').astype(np.int64) / 10 ** 6 / 3600,
+            'work_part': np.asarray(columns[5], dtype=float),
+            'is_vacancy': np.array([employee_id is None for employee_id in columns[6]], dtype=bool),
         }
-        self.predict_needs_array = np.zeros(len(self.dttms))
-        self._fill_array(
-            self.predict_needs_array,
-            list(self._get_predict_needs_qs().filter(type=PeriodClients.LONG_FORECASE_TYPE)),
-            self.lambda_index_periodclients,
-            self.lambda_add_periodclients,
-        )
-        self.wdays_array = np.zeros(len(self.dttms))
-        self._fill_array(
-            self.wdays_array,
-            consider_vacancy_map_wdays.get(self.consider_vacancies),
-            self.lambda_index_wdays,
-            self.lambda_add_wdays,
-        )
-        self.wdays_with_open_vacancies_array = np.zeros(len(self.dttms))
-        self._fill_array(
-            self.wdays_with_open_vacancies_array,
-            consider_vacancy_map_wdays.get(True),
-            self.lambda_index_wdays,
-            self.lambda_add_wdays,
-        )
-        self.work_hours_array = np.zeros(len(self.dttms))
-        self._fill_array(
-            self.work_hours_array,
-            consider_vacancy_map_wdays.get(False),
-            self.lambda_index_work_hours,
-            self.lambda_add_work_hours,
+        if self.add_schedule_tabs_day_stats:
+            wdays['selected_department'] = np.asarray(columns[7], dtype=bool)
+        return wdays
+
+    def _get_points_columns(self, qs, value_field, by_day=False, dt_from=None):
+        rows = list(qs.values_list('dttm_forecast', value_field))
+        dttms, values = zip(*rows) if rows else ((), ())
+        indexes = self._dts2indexes(dttms, dt_from=dt_from) if by_day else self._dttms2indexes(dttms, dt_from=dt_from)
+        return indexes, np.asarray(values, dtype=float)
+
+    def _calc_days_arrays(self, dts):
+        """
+        Вклад данных каждого дня из dts в массивы одним расчетом по диапазону дней:
+        прогноз дня (periods_in_day), покрытие и покрытие с открытыми вакансиями от смен, начатых в этот день
+        (2 * periods_in_day -- ночная смена заходит на следующий день), часы, рабочие дни и выручка дня.
+        :return: {dt: np.ndarray}
+        """
+        dt_from, dt_to = min(dts), max(dts)
+        days = (dt_to - dt_from).days + 1
+        periods_in_day = self.periods_in_day
+
+        rows = list(get_efficiency_wdays_qs(
+            dt_from, dt_to, self.work_types.keys(), graph_type=self.graph_type,
+            consider_vacancies=True, consider_canceled=self.consider_canceled,
+        ).values_list('dt', 'dttm_work_start', 'dttm_work_end', 'work_hours', 'work_part', 'employee_id'))
+        columns = list(zip(*rows)) if rows else [()] * 6
+        day = self._dts2indexes(columns[0], dt_from=dt_from)
+        day_start = day * periods_in_day
+        # смены раскладываются по строкам дней длиной 2 * periods_in_day
+        starts = day * 2 * periods_in_day + np.clip(
+            self._dttms2indexes(columns[1], dt_from=dt_from) - day_start, 0, 2 * periods_in_day)
+        ends = day * 2 * periods_in_day + np.clip(
+            self._dttms2indexes(columns[2], dt_from=dt_from) - day_start, 0, 2 * periods_in_day)
+        work_hours = np.asarray(columns[3], dtype='timedelta64[us]').astype(np.int64) / 10 ** 6 / 3600
+        work_part = np.asarray(columns[4], dtype=float)
+        employees_mask = np.array([employee_id is not None for employee_id in columns[5]], dtype=bool)
+        wdays_mask = np.ones_like(employees_mask) if self.consider_vacancies else employees_mask
+
+        predict_needs = np.zeros(days * periods_in_day)
+        fill_points(predict_needs, *self._get_points_columns(
+            self._get_predict_needs_qs(
+                dt_from=dt_from, dt_to=dt_to + datetime.timedelta(days=1),
+            ).filter(type=PeriodClients.LONG_FORECASE_TYPE), 'need_workers', dt_from=dt_from))
+        wdays = np.zeros(days * 2 * periods_in_day)
+        fill_intervals(wdays, starts[wdays_mask], ends[wdays_mask], work_part[wdays_mask])
+        wdays_with_open_vacancies = np.zeros(days * 2 * periods_in_day)
+        fill_intervals(wdays_with_open_vacancies, starts, ends, work_part)
+        totals = np.zeros((days, 3))
+        fill_points(totals[:, 0], day[employees_mask], work_hours[employees_mask])
+        fill_points(totals[:, 1], day[employees_mask], np.ones(employees_mask.sum()))
+        fill_points(totals[:, 2], *self._get_points_columns(
+            self._get_income_qs(dt_from=dt_from, dt_to=dt_to + datetime.timedelta(days=1)),
+            'value', by_day=True, dt_from=dt_from))
+
+        days_arrays = np.hstack([
+            predict_needs.reshape(days, periods_in_day),
+            wdays.reshape(days, 2 * periods_in_day),
+            wdays_with_open_vacancies.reshape(days, 2 * periods_in_day),
+            totals,
+        ])
+        return {dt: days_arrays[(dt - dt_from).days].copy() for dt in dts}
+
+    def _init_arrays_from_cache(self):
+        periods_in_day = self.periods_in_day
+        size = len(self.dttms)
+        dts = [self.dt_from + datetime.timedelta(days=day) for day in range((self.dt_to - self.dt_from).days)]
+        params_hash = efficiency_cache.get_params_hash(
+            sorted(self.work_types.keys()), self.graph_type, self.consider_vacancies, self.consider_canceled,
+            periods_in_day, str(self.shop_times_q), self.income_code,
         )
+        generations = efficiency_cache.get_generations(self.shop_id, dts)
+        days_arrays = efficiency_cache.get_days_arrays(self.shop_id, params_hash, generations)
+        missing_dts = [dt for dt in dts if dt not in days_arrays]
+        if missing_dts:
+            calculated = self._calc_days_arrays(missing_dts)
+            efficiency_cache.set_days_arrays(
+                self.shop_id, params_hash, {dt: generations[dt] for dt in missing_dts}, calculated)
+            days_arrays.update(calculated)
+
+        self.predict_needs_array = np.zeros(size)
+        self.wdays_array = np.zeros(size)
+        self.wdays_with_open_vacancies_array = np.zeros(size)
+        self.work_hours_array = np.zeros(size)
+        self.work_days_array = np.zeros(size)
+        self.income_array = np.zeros(size)
+        for i, dt in enumerate(dts):
+            predict_needs, wdays, wdays_with_open_vacancies, totals = np.split(
+                days_arrays[dt], [periods_in_day, 3 * periods_in_day, 5 * periods_in_day])
+            start = i * periods_in_day
+            end = min(start + 2 * periods_in_day, size)
+            self.predict_needs_array[start:start + periods_in_day] = predict_needs
+            self.wdays_array[start:end] += wdays[:end - start]
+            self.wdays_with_open_vacancies_array[start:end] += wdays_with_open_vacancies[:end - start]
+            self.work_hours_array[i], self.work_days_array[i], self.income_array[i] = totals
+
+    def _init_arrays(self):
+        if self.use_cache and not self.add_schedule_tabs_day_stats:
+            # статистика по отделам зависит от всего периода (активные трудоустройства), поэтому не кэшируется
+            self._init_arrays_from_cache()
+            return
+
+        wdays = self._get_wdays_columns()
+        employees_mask = ~wdays['is_vacancy']
+        wdays_mask = np.ones_like(employees_mask) if self.consider_vacancies else employees_mask
+
+        def _fill_wdays_intervals(mask):
+            array = np.zeros(len(self.dttms))
+            fill_intervals(array, wdays['start'][mask], wdays['end'][mask], wdays['work_part'][mask])
+            return array
+
+        def _fill_wdays_work_hours(mask):
+            array = np.zeros(len(self.dttms))
+            fill_points(array, wdays['day'][mask], wdays['work_hours'][mask])
+            return array
+
+        self.predict_needs_array = np.zeros(len(self.dttms))
+        fill_points(self.predict_needs_array, *self._get_points_columns(
+            self._get_predict_needs_qs().filter(type=PeriodClients.LONG_FORECASE_TYPE), 'need_workers'))
+        self.wdays_array = _fill_wdays_intervals(wdays_mask)
+        self.wdays_with_open_vacancies_array = _fill_wdays_intervals(np.ones_like(employees_mask))
+        self.work_hours_array = _fill_wdays_work_hours(employees_mask)
         self.work_days_array = np.zeros(len(self.dttms))
-        self._fill_array(
-            self.work_days_array,
-            consider_vacancy_map_wdays.get(False),
-            self.lambda_index_work_days,
-            self.lambda_add_work_days,
-        )
+        fill_points(self.work_days_array, wdays['day'][employees_mask], np.ones(employees_mask.sum()))
         self.income_array = np.zeros(len(self.dttms))
-        self._fill_array(
-            self.income_array,
-            list(self._get_income_qs()),
-            self.lambda_index_income,
-            self.lambda_add_income,
-        )
+        fill_points(self.income_array, *self._get_points_columns(self._get_income_qs(), 'value', by_day=True))
         if self.add_schedule_tabs_day_stats:
-            self.wdays_with_only_open_vacancies_array = np.zeros(len(self.dttms))
-            self._fill_array(
-                self.wdays_with_only_open_vacancies_array,
-                self._get_wdays_qs(consider_vacancies=True, only_open_vacancies=True),
-                self.lambda_index_wdays,
-                self.lambda_add_wdays,
-            )
-            self.work_hours_other_departments_array = np.zeros(len(self.dttms))
-            self._fill_array(
-                self.work_hours_other_departments_array,
-                self._get_wdays_qs(other_departments=True),
-                self.lambda_index_work_hours,
-                self.lambda_add_work_hours,
-            )
-            self.work_hours_selected_department_array = np.zeros(len(self.dttms))
-            self._fill_array(
-                self.work_hours_selected_department_array,
-                self._get_wdays_qs(selected_department=True),
-                self.lambda_index_work_hours,
-                self.lambda_add_work_hours,
-            )
+            self.wdays_with_only_open_vacancies_array = _fill_wdays_intervals(wdays['is_vacancy'])
+            self.work_hours_other_departments_array = _fill_wdays_work_hours(
+                employees_mask & ~wdays['selected_department'])
+            self.work_hours_selected_department_array = _fill_wdays_work_hours(
+                employees_mask & wdays['selected_department'])
 
     def _calc_efficiency(self):
         day_stats = {}
@@ -383,3 +517,152 @@ class ShopEfficiencyGetter:
             self._calc_indicators()
 
         return self.response
+
+
+class BatchShopEfficiencyGetter:
+    """
+    Потребность и покрытие сразу по многим магазинам и типам работ несколькими запросами.
+
+    Результат -- плотные массивы (тип работ, период): строка -- позиция типа работ в work_type_ids,
+    столбец -- период с начала диапазона дат магазина с шагом прогноза магазина
+    (как в ShopEfficiencyGetter). Периоды за пределами диапазона магазина заполнены nan.
+    """
+
+    def __init__(self, shops_dates: dict, graph_type='plan_approved', consider_vacancies=False,
+                 consider_canceled=False):
+        """
+        :param shops_dates: {shop_id: (dt_from, dt_to)}, dt_to включительно
+        """
+        self.shops_dates = shops_dates
+        self.graph_type = graph_type
+        self.consider_vacancies = consider_vacancies
+        self.consider_canceled = consider_canceled
+
+    @cached_property
+    def shops(self):
+        return {shop.id: shop for shop in Shop.objects.filter(id__in=self.shops_dates.keys())}
+
+    @property
+    def dt_from(self):
+        return min(dt_from for dt_from, _dt_to in self.shops_dates.values())
+
+    @property
+    def dt_to(self):
+        return max(dt_to for _dt_from, dt_to in self.shops_dates.values()) + datetime.timedelta(days=1)
+
+    def _init_work_types(self):
+        work_types = list(WorkType.objects.filter(
+            shop_id__in=self.shops.keys(),
+        ).order_by('id').values_list('id', 'shop_id'))
+        self.work_type_ids = np.array([work_type_id for work_type_id, _shop_id in work_types], dtype=np.int64)
+        self.positions = {work_type_id: i for i, (work_type_id, _shop_id) in enumerate(work_types)}
+        row_shops = [self.shops[shop_id] for _work_type_id, shop_id in work_types]
+        self.dttm_from = np.array(
+            [np.datetime64(self.shops_dates[shop.id][0], 's') for shop in row_shops], dtype='datetime64[s]')
+        self.days = np.array(
+            [(self.shops_dates[shop.id][1] - self.shops_dates[shop.id][0]).days + 1 for shop in row_shops],
+            dtype=np.int64,
+        )
+        self.period_length_in_minutes = np.array(
+            [shop.system_step_in_minutes() for shop in row_shops], dtype=np.int64)
+        self.periods_in_day = MINUTES_IN_DAY // self.period_length_in_minutes
+        self.periods = self.days * self.periods_in_day
+        self.width = int(self.periods.max()) if self.periods.size else 0
+
+    def _rows(self, work_type_ids):
+        return np.searchsorted(self.work_type_ids, np.asarray(work_type_ids, dtype=np.int64))
+
+    def _dttms2indexes(self, rows, dttms):
+        minutes = (np.asarray(dttms, dtype='datetime64[s]') - self.dttm_from[rows]).astype(np.int64) // 60
+        return (minutes // MINUTES_IN_DAY) * self.periods_in_day[rows] + \
+            (minutes % MINUTES_IN_DAY) // self.period_length_in_minutes[rows]
+
+    def _get_predict_needs_qs(self):
+        shops_with_schedule_times = [shop.id for shop in self.shops.values() if shop.open_times.get('all', False)]
+        shops_times = PeriodClients.objects.get_shop_times(shops_with_schedule_times) \
+            if shops_with_schedule_times else {}
+        shops_q = Q()
+        for shop in self.shops.values():
+            shops_q |= Q(operation_type__work_type__shop_id=shop.id) & PeriodClients.objects.shop_times_q(
+                shop, weekday=True, shop_times=shops_times.get(shop.id, {}))
+
+        return PeriodClients.objects.filter(
+            shops_q,
+            type=PeriodClients.LONG_FORECASE_TYPE,
+            dttm_forecast__gte=self.dt_from,
+            dttm_forecast__lte=self.dt_to,
+            operation_type__work_type_id__in=self.work_type_ids.tolist(),
+            operation_type__dttm_deleted__isnull=True,
+        )
+
+    def _get_wdays_qs(self):
+        return get_efficiency_wdays_qs(
+            self.dt_from, self.dt_to, self.work_type_ids.tolist(), graph_type=self.graph_type,
+            consider_vacancies=self.consider_vacancies, consider_canceled=self.consider_canceled,
+        ).annotate(work_type_id=F('worker_day_details__work_type_id'))
+
+    def _init_arrays(self):
+        shape = (self.work_type_ids.size, self.width)
+
+        self.predict_needs_array = np.zeros(shape)
+        predict_needs = list(self._get_predict_needs_qs().values_list(
+            'operation_type__work_type_id', 'dttm_forecast', 'value'))
+        work_type_ids, dttms, values = zip(*predict_needs) if predict_needs else ((), (), ())
+        rows = self._rows(work_type_ids)
+        indexes = self._dttms2indexes(rows, dttms)
+        mask = (indexes >= 0) & (indexes < self.periods[rows])
+        fill_points(
+            self.predict_needs_array.ravel(),
+            rows[mask] * self.width + indexes[mask],
+            np.asarray(values, dtype=float)[mask],
+        )
+
+        self.wdays_array = np.zeros(shape)
+        wdays = list(self._get_wdays_qs().values_list(
+            'id', 'work_type_id', 'dt', 'dttm_work_start', 'dttm_work_end', 'work_part'))
+        _ids, work_type_ids, dts, starts, ends, work_parts = zip(*wdays) if wdays else ((), (), (), (), (), ())
+        rows = self._rows(work_type_ids)
+        days = (np.asarray(dts, dtype='datetime64[D]') -
+                self.dttm_from[rows].astype('datetime64[D]')).astype(np.int64)
+        # как в ShopEfficiencyGetter, берем дни [dt_from, dt_to + 1 день] каждого магазина
+        mask = (days >= 0) & (days <= self.days[rows])
+        rows = rows[mask]
+        starts = np.clip(
+            self._dttms2indexes(rows, np.asarray(starts, dtype='datetime64[s]')[mask]), 0, self.periods[rows])
+        ends = np.clip(
+            self._dttms2indexes(rows, np.asarray(ends, dtype='datetime64[s]')[mask]), 0, self.periods[rows])
+        fill_intervals(
+            self.wdays_array.ravel(),
+            rows * self.width + starts,
+            rows * self.width + ends,
+            np.asarray(work_parts, dtype=float)[mask],
+        )
+
+        padding = np.arange(self.width) >= self.periods[:, np.newaxis]
+        self.predict_needs_array[padding] = np.nan
+        self.wdays_array[padding] = np.nan
+        self.lack_array = self.predict_needs_array - self.wdays_array
+
+    def get_periods_slice(self, work_type_id, dttm_from, dttm_to):
+        """
+        Строка и срез периодов типа работ, начинающихся в [dttm_from, dttm_to)
+        :return: (row, slice) или None, если типа работ нет в выборке
+        """
+        row = self.positions.get(work_type_id)
+        if row is None:
+            return None
+
+        def _ceil_index(dttm):
+            seconds = int((np.datetime64(dttm, 's') - self.dttm_from[row]).astype(np.int64))
+            days, day_seconds = divmod(seconds, MINUTES_IN_DAY * 60)
+            period_seconds = int(self.period_length_in_minutes[row]) * 60
+            index = days * int(self.periods_in_day[row]) + min(
+                -(-day_seconds // period_seconds), int(self.periods_in_day[row]))
+            return min(max(index, 0), int(self.periods[row]))
+
+        return row, slice(_ceil_index(dttm_from), _ceil_index(dttm_to))
+
+    def get(self):
+        self._init_work_types()
+        self._init_arrays()
+        return self
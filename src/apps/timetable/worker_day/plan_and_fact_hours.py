@@ -0,0 +1,343 @@
+"""
+Материализованные плановые и фактические часы (представление timetable_plan_and_fact_hours).
+
+Агрегаты по подтвержденным рабочим дням в разрезе (сотрудник, дата, магазин, тип дня, тип работ)
+хранятся в таблице timetable_plan_and_fact_hours_data, представление timetable_plan_and_fact_hours
+добавляет к ним названия магазинов, ФИО и сети (колонки и типы прежние, зависимые представления не меняются).
+
+Таблица обновляется триггерами (на уровне оператора, по таблицам переходов) в той же транзакции:
+- timetable_workerday, timetable_workerdaycashboxdetails -- пересчет затронутых пар (сотрудник, дата);
+- base_employment -- пересчет сотрудников при изменении дат трудоустройства;
+- base_network -- пересчет магазинов сети при изменении допустимых интервалов опозданий/уходов.
+Изменение отметок (AttendanceRecords) попадает в таблицу через изменение фактических рабочих дней.
+Полное перестроение -- refresh_plan_and_fact_hours() без параметров (команда rebuild_plan_and_fact_hours).
+"""
+from django.db import connection
+
+TABLE = 'timetable_plan_and_fact_hours_data'
+
+SELECT_SQL = '''
+ SELECT string_agg(wd.id::text, '-'::text ORDER BY wd.is_fact) AS id,
+    wd.dt,
+    wd.shop_id,
+    wd.type_id AS wd_type_id,
+    COALESCE(sum(date_part('epoch'::text, GREATEST(wd.work_hours, '00:00:00'::interval)) / 3600::double precision) FILTER (WHERE wd.is_fact IS TRUE), 0::double precision) AS fact_work_hours,
+    COALESCE(sum(date_part('epoch'::text, GREATEST(wd.work_hours, '00:00:00'::interval)) / 3600::double precision) FILTER (WHERE wd.is_fact IS FALSE), 0::double precision) AS plan_work_hours,
+    COALESCE(sum(date_part('epoch'::text, GREATEST(wd.work_hours, '00:00:00'::interval)) / 3600::double precision) FILTER (WHERE wd.is_fact IS TRUE AND (wd.created_by_id IS NOT NULL OR wd.last_edited_by_id IS NOT NULL)), 0::double precision) AS fact_manual_work_hours,
+    sum(COALESCE(GREATEST(date_part('epoch'::text, wd_fact.dttm_work_start - (wd.dttm_work_start + shop_network.allowed_interval_for_late_arrival)) / 3600::double precision, 0::double precision), 0::double precision)) AS late_arrival_hours,
+    sum(COALESCE(GREATEST(date_part('epoch'::text, wd.dttm_work_end - shop_network.allowed_interval_for_early_departure - wd_fact.dttm_work_end) / 3600::double precision, 0::double precision), 0::double precision)) AS early_departure_hours,
+    count(*) FILTER (WHERE COALESCE(GREATEST(date_part('epoch'::text, wd_fact.dttm_work_start - (wd.dttm_work_start + shop_network.allowed_interval_for_late_arrival)) / 3600::double precision, 0::double precision), 0::double precision) > 0::double precision) AS late_arrival_count,
+    count(*) FILTER (WHERE COALESCE(GREATEST(date_part('epoch'::text, wd.dttm_work_end - shop_network.allowed_interval_for_early_departure - wd_fact.dttm_work_end) / 3600::double precision, 0::double precision), 0::double precision) > 0::double precision) AS early_departure_count,
+    sum(COALESCE(GREATEST(date_part('epoch'::text, wd.dttm_work_start - shop_network.allowed_interval_for_early_arrival - wd_fact.dttm_work_start) / 3600::double precision, 0::double precision), 0::double precision)) AS early_arrival_hours,
+    sum(COALESCE(GREATEST(date_part('epoch'::text, wd_fact.dttm_work_end - (wd.dttm_work_end + shop_network.allowed_interval_for_late_departure)) / 3600::double precision, 0::double precision), 0::double precision)) AS late_departure_hours,
+    count(*) FILTER (WHERE COALESCE(GREATEST(date_part('epoch'::text, wd.dttm_work_start - shop_network.allowed_interval_for_early_arrival - wd_fact.dttm_work_start) / 3600::double precision, 0::double precision), 0::double precision) > 0::double precision) AS early_arrival_count,
+    count(*) FILTER (WHERE COALESCE(GREATEST(date_part('epoch'::text, wd_fact.dttm_work_end - (wd.dttm_work_end + shop_network.allowed_interval_for_late_departure)) / 3600::double precision, 0::double precision), 0::double precision) > 0::double precision) AS late_departure_count,
+    COALESCE(sum(date_part('epoch'::text, GREATEST(wd.work_hours, '00:00:00'::interval)) / 3600::double precision) FILTER (WHERE wd.closest_plan_approved_id IS NULL AND wd.is_fact IS TRUE), 0::double precision) AS fact_without_plan_work_hours,
+    count(*) FILTER (WHERE wd.closest_plan_approved_id IS NULL AND wd.is_fact IS TRUE) AS fact_without_plan_count,
+    COALESCE(sum(COALESCE(GREATEST(date_part('epoch'::text, wd.work_hours - COALESCE(wd_fact.work_hours, '00:00:00'::interval)) / 3600::double precision, 0::double precision), 0::double precision)) FILTER (WHERE wd.is_fact IS FALSE), 0::double precision) AS lost_work_hours,
+    count(*) FILTER (WHERE COALESCE(GREATEST(date_part('epoch'::text, wd.work_hours - COALESCE(wd_fact.work_hours, '00:00:00'::interval)) / 3600::double precision, 0::double precision), 0::double precision) > 0::double precision AND wd.is_fact IS FALSE) AS lost_work_hours_count,
+        CASE
+            WHEN count(*) FILTER (WHERE wd.is_fact IS FALSE AND wd.is_vacancy IS TRUE) = 1 THEN true
+            ELSE false
+        END AS is_vacancy,
+    (count(*) FILTER (WHERE wd.is_fact IS TRUE AND wd.dttm_work_start IS NOT NULL) + count(*) FILTER (WHERE wd.is_fact IS TRUE AND wd.dttm_work_end IS NOT NULL))::integer AS ticks_fact_count,
+    (COALESCE(count(*) FILTER (WHERE wd.is_fact IS FALSE AND wd.type_id::text = 'W'::text), 0::bigint) * 2)::integer AS ticks_plan_count,
+    COALESCE(wd_details_wt_name.name, ''::character varying) AS work_type_name,
+    date_trunc('minute'::text, min(wd.dttm_work_start) FILTER (WHERE wd.is_fact IS FALSE)) AS dttm_work_start_plan,
+    date_trunc('minute'::text, max(wd.dttm_work_end) FILTER (WHERE wd.is_fact IS FALSE)) AS dttm_work_end_plan,
+    date_trunc('minute'::text, min(wd.dttm_work_start) FILTER (WHERE wd.is_fact IS TRUE)) AS dttm_work_start_fact,
+    date_trunc('minute'::text, max(wd.dttm_work_end) FILTER (WHERE wd.is_fact IS TRUE)) AS dttm_work_end_fact,
+    count(*) FILTER (WHERE wd.is_fact IS TRUE AND wd.dttm_work_start IS NOT NULL)::integer AS ticks_comming_fact_count,
+    count(*) FILTER (WHERE wd.is_fact IS TRUE AND wd.dttm_work_end IS NOT NULL)::integer AS ticks_leaving_fact_count,
+    count(*) FILTER (WHERE wd.is_fact IS FALSE AND wd.created_by_id IS NULL AND wd.last_edited_by_id IS NULL AND wd.work_hours IS NOT NULL AND wd.work_hours > '00:00:00'::interval) AS auto_created_plan,
+    count(*) FILTER (WHERE wd.is_fact IS TRUE AND wd.created_by_id IS NULL AND wd.last_edited_by_id IS NULL AND wd.work_hours IS NOT NULL AND wd.work_hours > '00:00:00'::interval) AS auto_created_fact,
+    wd.employee_id
+   FROM timetable_workerday wd
+     JOIN base_shop s ON wd.shop_id = s.id
+     JOIN base_network shop_network ON shop_network.id = s.network_id
+     LEFT JOIN timetable_workerdaycashboxdetails wd_details ON wd.id = wd_details.worker_day_id AND wd_details.id = (( SELECT max(wd_details2.id) AS max
+           FROM timetable_workerdaycashboxdetails wd_details2
+          WHERE wd.id = wd_details2.worker_day_id))
+     LEFT JOIN timetable_worktype wd_details_wt ON wd_details.work_type_id = wd_details_wt.id
+     LEFT JOIN timetable_worktypename wd_details_wt_name ON wd_details_wt.work_type_name_id = wd_details_wt_name.id
+     LEFT JOIN timetable_workerday wd_fact ON wd_fact.closest_plan_approved_id = wd.id AND wd_fact.is_approved IS TRUE
+  WHERE wd.is_approved IS TRUE AND NOT (wd.employment_id IS NULL AND wd.type_id::text = 'W'::text AND wd.employee_id IS NOT NULL) AND (wd.employee_id IN ( SELECT be.employee_id
+           FROM base_employment be
+          WHERE be.employee_id = wd.employee_id AND (be.dt_hired <= wd.dt OR be.dt_hired IS NULL) AND (be.dt_fired >= wd.dt OR be.dt_fired IS NULL))) AND {condition}
+  GROUP BY wd.dt, wd.type_id, wd.shop_id, (COALESCE(wd_details_wt_name.name, ''::character varying)), wd.employee_id
+'''
+
+CREATE_TABLE_SQL = f'''
+CREATE TABLE {TABLE} AS {SELECT_SQL.format(condition='FALSE')};
+CREATE INDEX {TABLE}_employee_dt ON {TABLE} (employee_id, dt);
+CREATE INDEX {TABLE}_shop_dt ON {TABLE} (shop_id, dt);
+CREATE INDEX {TABLE}_dt ON {TABLE} (dt);
+'''
+
+# представление поверх таблицы, колонки и типы совпадают с прежним представлением
+VIEW_SQL = f'''
+CREATE OR REPLACE VIEW timetable_plan_and_fact_hours AS
+ SELECT pfh.id,
+    pfh.dt,
+    pfh.shop_id,
+    s.name AS shop_name,
+    s.code AS shop_code,
+    employee.user_id AS worker_id,
+    pfh.wd_type_id,
+    concat(u.last_name, ' ', u.first_name, ' ', u.middle_name) AS worker_fio,
+    pfh.fact_work_hours,
+    pfh.plan_work_hours,
+    pfh.fact_manual_work_hours,
+    pfh.late_arrival_hours,
+    pfh.early_departure_hours,
+    pfh.late_arrival_count,
+    pfh.early_departure_count,
+    pfh.early_arrival_hours,
+    pfh.late_departure_hours,
+    pfh.early_arrival_count,
+    pfh.late_departure_count,
+    pfh.fact_without_plan_work_hours,
+    pfh.fact_without_plan_count,
+    pfh.lost_work_hours,
+    pfh.lost_work_hours_count,
+    pfh.is_vacancy,
+    pfh.ticks_fact_count,
+    pfh.ticks_plan_count,
+    u.username AS worker_username,
+    pfh.work_type_name,
+    pfh.dttm_work_start_plan,
+    pfh.dttm_work_end_plan,
+    pfh.dttm_work_start_fact,
+    pfh.dttm_work_end_fact,
+    pfh.ticks_comming_fact_count,
+    pfh.ticks_leaving_fact_count,
+    pfh.auto_created_plan,
+    pfh.auto_created_fact,
+    employee.tabel_code,
+    pfh.employee_id,
+    shop_network.name AS shop_network,
+    user_network.name AS user_network,
+    shop_network.id <> user_network.id AS is_outsource
+   FROM {TABLE} pfh
+     JOIN base_shop s ON pfh.shop_id = s.id
+     JOIN base_network shop_network ON shop_network.id = s.network_id
+     JOIN base_employee employee ON pfh.employee_id = employee.id
+     JOIN base_user u ON employee.user_id = u.id
+     JOIN base_network user_network ON user_network.id = u.network_id
+'''
+
+# пересчет по парам (сотрудник, дата), сотрудникам и сетям магазинов
+KEYS_CONDITION = '(wd.employee_id, wd.dt) IN (SELECT * FROM unnest(employee_ids, dts))'
+EMPLOYEES_CONDITION = 'wd.employee_id = ANY(employee_ids)'
+NETWORKS_CONDITION = 's.network_id = ANY(network_ids)'
+
+FUNCTIONS_SQL = f'''
+CREATE OR REPLACE FUNCTION plan_and_fact_hours_refresh_keys(employee_ids integer[], dts date[]) RETURNS void AS $$
+BEGIN
+    DELETE FROM {TABLE} pfh USING unnest(employee_ids, dts) AS k(employee_id, dt)
+    WHERE pfh.employee_id = k.employee_id AND pfh.dt = k.dt;
+    INSERT INTO {TABLE} {SELECT_SQL.format(condition=KEYS_CONDITION)};
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION plan_and_fact_hours_refresh_employees(employee_ids integer[]) RETURNS void AS $$
+BEGIN
+    DELETE FROM {TABLE} WHERE employee_id = ANY(employee_ids);
+    INSERT INTO {TABLE} {SELECT_SQL.format(condition=EMPLOYEES_CONDITION)};
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION plan_and_fact_hours_refresh_networks(network_ids integer[]) RETURNS void AS $$
+BEGIN
+    DELETE FROM {TABLE} WHERE shop_id IN (SELECT id FROM base_shop WHERE network_id = ANY(network_ids));
+    INSERT INTO {TABLE} {SELECT_SQL.format(condition=NETWORKS_CONDITION)};
+END;
+$$ LANGUAGE plpgsql;
+
+-- рабочие дни: пары (сотрудник, дата) измененных подтвержденных дней и планов, к которым привязан факт
+CREATE OR REPLACE FUNCTION plan_and_fact_hours_workerday_trigger() RETURNS trigger AS $$
+DECLARE
+    changed_employee_ids integer[];
+    changed_dts date[];
+    plan_ids integer[];
+    employee_ids integer[];
+    dts date[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(employee_id), array_agg(dt), array_agg(closest_plan_approved_id)
+        INTO changed_employee_ids, changed_dts, plan_ids
+        FROM new_rows WHERE is_approved;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(employee_id), array_agg(dt), array_agg(closest_plan_approved_id)
+        INTO changed_employee_ids, changed_dts, plan_ids
+        FROM old_rows WHERE is_approved;
+    ELSE
+        -- старые и новые значения строк, в которых изменились поля, влияющие на агрегаты
+        SELECT array_agg(c.employee_id), array_agg(c.dt), array_agg(c.closest_plan_approved_id)
+        INTO changed_employee_ids, changed_dts, plan_ids
+        FROM new_rows n
+        JOIN old_rows o ON o.id = n.id,
+        LATERAL (VALUES
+            (n.employee_id, n.dt, n.closest_plan_approved_id, n.is_approved),
+            (o.employee_id, o.dt, o.closest_plan_approved_id, o.is_approved)
+        ) c(employee_id, dt, closest_plan_approved_id, is_approved)
+        WHERE c.is_approved AND (
+            n.dt, n.employee_id, n.shop_id, n.type_id, n.work_hours, n.dttm_work_start, n.dttm_work_end,
+            n.is_fact, n.is_approved, n.is_vacancy, n.employment_id, n.closest_plan_approved_id,
+            n.created_by_id, n.last_edited_by_id
+        ) IS DISTINCT FROM (
+            o.dt, o.employee_id, o.shop_id, o.type_id, o.work_hours, o.dttm_work_start, o.dttm_work_end,
+            o.is_fact, o.is_approved, o.is_vacancy, o.employment_id, o.closest_plan_approved_id,
+            o.created_by_id, o.last_edited_by_id
+        );
+    END IF;
+    IF changed_employee_ids IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    SELECT array_agg(k.employee_id), array_agg(k.dt) INTO employee_ids, dts FROM (
+        SELECT c.employee_id, c.dt FROM unnest(changed_employee_ids, changed_dts) AS c(employee_id, dt)
+        WHERE c.employee_id IS NOT NULL
+        UNION
+        SELECT plan.employee_id, plan.dt FROM timetable_workerday plan
+        WHERE plan.id = ANY(plan_ids) AND plan.employee_id IS NOT NULL
+    ) k;
+    IF employee_ids IS NOT NULL THEN
+        PERFORM plan_and_fact_hours_refresh_keys(employee_ids, dts);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- тип работ рабочего дня
+CREATE OR REPLACE FUNCTION plan_and_fact_hours_details_trigger() RETURNS trigger AS $$
+DECLARE
+    employee_ids integer[];
+    dts date[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(k.employee_id), array_agg(k.dt) INTO employee_ids, dts FROM (
+            SELECT DISTINCT wd.employee_id, wd.dt FROM new_rows d JOIN timetable_workerday wd ON wd.id = d.worker_day_id
+            WHERE wd.is_approved AND wd.employee_id IS NOT NULL
+        ) k;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(k.employee_id), array_agg(k.dt) INTO employee_ids, dts FROM (
+            SELECT DISTINCT wd.employee_id, wd.dt FROM old_rows d JOIN timetable_workerday wd ON wd.id = d.worker_day_id
+            WHERE wd.is_approved AND wd.employee_id IS NOT NULL
+        ) k;
+    ELSE
+        SELECT array_agg(k.employee_id), array_agg(k.dt) INTO employee_ids, dts FROM (
+            SELECT DISTINCT wd.employee_id, wd.dt
+            FROM (SELECT * FROM new_rows UNION ALL SELECT * FROM old_rows) d
+            JOIN timetable_workerday wd ON wd.id = d.worker_day_id
+            WHERE wd.is_approved AND wd.employee_id IS NOT NULL
+        ) k;
+    END IF;
+    IF employee_ids IS NOT NULL THEN
+        PERFORM plan_and_fact_hours_refresh_keys(employee_ids, dts);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- трудоустройства: дни вне трудоустройств в представление не попадают
+CREATE OR REPLACE FUNCTION plan_and_fact_hours_employment_trigger() RETURNS trigger AS $$
+DECLARE
+    employee_ids integer[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(DISTINCT employee_id) INTO employee_ids FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(DISTINCT employee_id) INTO employee_ids FROM old_rows;
+    ELSE
+        SELECT array_agg(DISTINCT e.employee_id) INTO employee_ids FROM (
+            SELECT n.employee_id, o.employee_id AS old_employee_id FROM new_rows n JOIN old_rows o ON o.id = n.id
+            WHERE (n.employee_id, n.dt_hired, n.dt_fired) IS DISTINCT FROM (o.employee_id, o.dt_hired, o.dt_fired)
+        ) changed, LATERAL (VALUES (changed.employee_id), (changed.old_employee_id)) e(employee_id);
+    END IF;
+    IF employee_ids IS NOT NULL THEN
+        PERFORM plan_and_fact_hours_refresh_employees(employee_ids);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- сети: допустимые интервалы опозданий и ранних уходов
+CREATE OR REPLACE FUNCTION plan_and_fact_hours_network_trigger() RETURNS trigger AS $$
+DECLARE
+    network_ids integer[];
+BEGIN
+    SELECT array_agg(n.id) INTO network_ids FROM new_rows n JOIN old_rows o ON o.id = n.id
+    WHERE (n.allowed_interval_for_late_arrival, n.allowed_interval_for_early_departure,
+           n.allowed_interval_for_early_arrival, n.allowed_interval_for_late_departure)
+        IS DISTINCT FROM (o.allowed_interval_for_late_arrival, o.allowed_interval_for_early_departure,
+                          o.allowed_interval_for_early_arrival, o.allowed_interval_for_late_departure);
+    IF network_ids IS NOT NULL THEN
+        PERFORM plan_and_fact_hours_refresh_networks(network_ids);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+'''
+
+TRIGGERS = (
+    ('timetable_workerday', 'plan_and_fact_hours_workerday_trigger', ('INSERT', 'UPDATE', 'DELETE')),
+    ('timetable_workerdaycashboxdetails', 'plan_and_fact_hours_details_trigger', ('INSERT', 'UPDATE', 'DELETE')),
+    ('base_employment', 'plan_and_fact_hours_employment_trigger', ('INSERT', 'UPDATE', 'DELETE')),
+    ('base_network', 'plan_and_fact_hours_network_trigger', ('UPDATE',)),
+)
+
+
+def _get_trigger_name(table, event):
+    return f'{table}_plan_and_fact_hours_{event.lower()}'
+
+
+def get_create_triggers_sql():
+    sql = []
+    for table, function, events in TRIGGERS:
+        for event in events:
+            # таблицы переходов можно задать только для триггера на одно событие
+            referencing = {
+                'INSERT': 'NEW TABLE AS new_rows',
+                'UPDATE': 'NEW TABLE AS new_rows OLD TABLE AS old_rows',
+                'DELETE': 'OLD TABLE AS old_rows',
+            }[event]
+            sql.append(
+                f'CREATE TRIGGER {_get_trigger_name(table, event)} AFTER {event} ON {table} '
+                f'REFERENCING {referencing} FOR EACH STATEMENT EXECUTE FUNCTION {function}();'
+            )
+    return '\n'.join(sql)
+
+
+def get_drop_triggers_sql():
+    return '\n'.join(
+        f'DROP TRIGGER IF EXISTS {_get_trigger_name(table, event)} ON {table};'
+        for table, _function, events in TRIGGERS for event in events
+    )
+
+
+def refresh_plan_and_fact_hours(employee_ids=None, dt_from=None, dt_to=None):
+    """
+    Пересчет строк сотрудников employee_ids за период (без параметров -- вся таблица).
+    Выполняется в текущей транзакции.
+    """
+    delete_conditions = []
+    select_conditions = []
+    if employee_ids is not None:
+        delete_conditions.append('employee_id = ANY(%(employee_ids)s)')
+        select_conditions.append('wd.employee_id = ANY(%(employee_ids)s)')
+    if dt_from:
+        delete_conditions.append('dt >= %(dt_from)s')
+        select_conditions.append('wd.dt >= %(dt_from)s')
+    if dt_to:
+        delete_conditions.append('dt <= %(dt_to)s')
+        select_conditions.append('wd.dt <= %(dt_to)s')
+    params = {
+        'employee_ids': list(set(employee_ids)) if employee_ids is not None else None,
+        'dt_from': dt_from,
+        'dt_to': dt_to,
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE {" AND ".join(delete_conditions) or "TRUE"}', params)
+        cursor.execute(
+            f'INSERT INTO {TABLE} {SELECT_SQL.format(condition=" AND ".join(select_conditions) or "TRUE")}', params)
@@ -0,0 +1,123 @@
+"""
+Кэш производственного календаря сотрудников для WorkersStatsGetter.
+
+В ключ значения входят поколения: общее, сети и сотрудника.
+Инвалидация -- INCR нужного поколения (старые ключи больше не читаются и истекают по TTL),
+вместо delete_pattern, который в django-redis сканирует все ключи.
+
+Счетчики попаданий, промахов и инвалидаций -- get_prod_cal_cache_stats().
+"""
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+VALUE_KEY = 'prod_cal_{dt_from}_{dt_to}_{employee_id}_{generation}'
+GLOBAL_GENERATION_KEY = 'prod_cal_gen'
+NETWORK_GENERATION_KEY = 'prod_cal_gen_network_{network_id}'
+EMPLOYEE_GENERATION_KEY = 'prod_cal_gen_employee_{employee_id}'
+STATS_KEY = 'prod_cal_stats_{name}'
+STATS_NAMES = ('hits', 'misses', 'invalidations')
+
+
+def _new_generation():
+    # случайное начальное значение, чтобы после потери ключа поколения не прочитать значения старого поколения
+    return random.randint(1, 2 ** 31)
+
+
+def _incr(key, delta=1, default=None):
+    """INCR с созданием ключа без TTL, если его нет"""
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        value = delta if default is None else default
+        cache.set(key, value, timeout=None)
+        return value
+
+
+def _incr_stat(name, delta=1):
+    if delta:
+        _incr(STATS_KEY.format(name=name), delta)
+
+
+def get_keys(dt_from, dt_to, employee_ids, network_id=None):
+    """
+    Ключи значений с текущими поколениями (поколения читаются одним get_many)
+    :return: {employee_id: key}
+    """
+    generation_keys = {e: EMPLOYEE_GENERATION_KEY.format(employee_id=e) for e in employee_ids}
+    common_keys = [GLOBAL_GENERATION_KEY]
+    if network_id:
+        common_keys.append(NETWORK_GENERATION_KEY.format(network_id=network_id))
+    generations = cache.get_many(common_keys + list(generation_keys.values()))
+    missing = {key: _new_generation() for key in common_keys + list(generation_keys.values()) if key not in generations}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        generations.update(missing)
+
+    common_generation = '.'.join(str(generations[key]) for key in common_keys)
+    return {
+        e: VALUE_KEY.format(
+            dt_from=dt_from, dt_to=dt_to, employee_id=e,
+            generation=f'{common_generation}.{generations[generation_key]}',
+        )
+        for e, generation_key in generation_keys.items()
+    }
+
+
+def get_many(keys):
+    """
+    :param keys: {employee_id: key} из get_keys
+    :return: {employee_id: data} только для найденных
+    """
+    values = cache.get_many(keys.values())
+    found = {e: values[key] for e, key in keys.items() if values.get(key)}
+    _incr_stat('hits', len(found))
+    _incr_stat('misses', len(keys) - len(found))
+    return found
+
+
+def set_many(keys, data):
+    """
+    :param keys: {employee_id: key} из get_keys
+    :param data: {employee_id: data}
+    """
+    cache.set_many(
+        {keys[e]: employee_data for e, employee_data in data.items()},
+        timeout=settings.CACHE_TTL.get('prod_cal', 86400),
+    )
+
+
+def _invalidate(generation_keys):
+    for key in generation_keys:
+        _incr(key, default=_new_generation())
+    _incr_stat('invalidations', len(generation_keys))
+
+
+def invalidate_prod_cal_cache(employee_ids=None, network_id=None, on_commit=True):
+    """
+    Инвалидация кэша сотрудников employee_ids, сети network_id или всего кэша (если не переданы)
+    :param on_commit: инвалидировать после коммита текущей транзакции
+    """
+    if employee_ids is not None:
+        generation_keys = [EMPLOYEE_GENERATION_KEY.format(employee_id=e) for e in set(employee_ids) if e]
+    elif network_id:
+        generation_keys = [NETWORK_GENERATION_KEY.format(network_id=network_id)]
+    else:
+        generation_keys = [GLOBAL_GENERATION_KEY]
+    if not generation_keys:
+        return
+
+    if on_commit:
+        transaction.on_commit(lambda: _invalidate(generation_keys))
+    else:
+        _invalidate(generation_keys)
+
+
+def get_prod_cal_cache_stats():
+    values = cache.get_many([STATS_KEY.format(name=name) for name in STATS_NAMES])
+    stats = {name: values.get(STATS_KEY.format(name=name), 0) for name in STATS_NAMES}
+    requests_count = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / requests_count, 4) if requests_count else None
+    return stats
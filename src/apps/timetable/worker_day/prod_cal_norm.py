@@ -0,0 +1,125 @@
+"""
+Материализованная норма часов производственного календаря (ProdCalNorm).
+
+Раньше prod_cal был представлением, которое вычислялось заново при каждом запросе.
+Теперь нормы по (трудоустройство, день) хранятся в таблице timetable_prodcalnorm,
+а представление prod_cal только добавляет к ним username и код магазина.
+
+Таблица обновляется частично -- только строки затронутых сотрудников, магазинов, должностей
+или дней календаря (в тех же местах, где инвалидируется кэш prod_cal_cache).
+Полное перестроение -- refresh_prod_cal() без параметров (команда rebuild_prod_cal).
+"""
+from django.db import connection
+
+TABLE = 'timetable_prodcalnorm'
+
+# норма часов по трудоустройству и дню календаря (день региона магазина или родительского региона)
+SELECT_SQL = '''
+SELECT pd.id,
+    pd.dt,
+    employment.id,
+    employment.employee_id,
+    employment.shop_id,
+    pd.region_id,
+    sum(
+        CASE
+            WHEN pd.type::text = 'W'::text THEN 8::double precision * COALESCE(wp.hours_in_a_week::integer, 40)::double precision / 40::double precision * employment.norm_work_hours / 100::double precision
+            WHEN pd.type::text = 'S'::text THEN 8::double precision * COALESCE(wp.hours_in_a_week::integer, 40)::double precision / 40::double precision * employment.norm_work_hours / 100::double precision - 1::double precision
+            ELSE 0::double precision
+        END) AS norm_hours
+   FROM base_employment employment
+     JOIN base_shop s ON employment.shop_id = s.id
+     JOIN base_region r ON s.region_id = r.id
+     JOIN base_productionday pd ON (pd.dt >= employment.dt_hired OR employment.dt_hired IS NULL) AND (pd.dt <= employment.dt_fired OR employment.dt_fired IS NULL) AND (pd.region_id = r.id OR pd.region_id = r.parent_id) AND pd.id = (( SELECT pd2.id
+           FROM base_productionday pd2
+          WHERE (pd2.dt >= employment.dt_hired OR employment.dt_hired IS NULL) AND (pd2.dt <= employment.dt_fired OR employment.dt_fired IS NULL) AND (pd2.region_id = r.id OR pd2.region_id = r.parent_id) AND pd2.dt = pd.dt
+          ORDER BY (pd2.region_id = r.id) DESC, (pd2.region_id = r.parent_id) DESC
+         LIMIT 1))
+     LEFT JOIN base_workerposition wp ON employment.position_id = wp.id AND pd.dt >= '2020-01-01'::date
+  WHERE employment.dttm_deleted IS NULL AND {condition}
+  GROUP BY pd.id, pd.dt, employment.id, employment.employee_id, employment.shop_id, pd.region_id
+'''
+
+INSERT_SQL = f'''
+INSERT INTO {TABLE} (production_day_id, dt, employment_id, employee_id, shop_id, region_id, norm_hours)
+{SELECT_SQL}
+'''
+
+DELETE_SQL = f'DELETE FROM {TABLE} pc WHERE {{condition}}'
+
+# представление prod_cal поверх таблицы, колонки и типы совпадают с прежним представлением
+VIEW_SQL = f'''
+CREATE OR REPLACE VIEW prod_cal AS
+ SELECT pc.production_day_id::integer AS id,
+    pc.dt,
+    employee.user_id::bigint AS user_id,
+    pc.employment_id::bigint AS employment_id,
+    u.username,
+    pc.shop_id::bigint AS shop_id,
+    s.code,
+    pc.region_id::integer AS region_id,
+    pc.norm_hours,
+    pc.employee_id::integer AS employee_id
+   FROM {TABLE} pc
+     JOIN base_shop s ON pc.shop_id = s.id
+     JOIN base_employee employee ON pc.employee_id = employee.id
+     JOIN base_user u ON employee.user_id = u.id
+'''
+
+REGION_SHOPS_SQL = 'SELECT s.id FROM base_shop s JOIN base_region r ON s.region_id = r.id ' \
+                   'WHERE r.id = ANY(%(region_ids)s) OR r.parent_id = ANY(%(region_ids)s)'
+
+
+def _get_conditions(employee_ids=None, shop_ids=None, position_ids=None, region_ids=None, dt_from=None, dt_to=None):
+    """
+    :return: (условие удаления строк таблицы, условие выборки новых строк)
+    """
+    delete_conditions = []
+    select_conditions = []
+    if employee_ids is not None:
+        delete_conditions.append('pc.employee_id = ANY(%(employee_ids)s)')
+        select_conditions.append('employment.employee_id = ANY(%(employee_ids)s)')
+    if shop_ids is not None:
+        delete_conditions.append('pc.shop_id = ANY(%(shop_ids)s)')
+        select_conditions.append('employment.shop_id = ANY(%(shop_ids)s)')
+    if position_ids is not None:
+        delete_conditions.append(
+            'pc.employment_id IN (SELECT id FROM base_employment WHERE position_id = ANY(%(position_ids)s))')
+        select_conditions.append('employment.position_id = ANY(%(position_ids)s)')
+    if region_ids is not None:
+        delete_conditions.append(f'pc.shop_id IN ({REGION_SHOPS_SQL})')
+        select_conditions.append('(r.id = ANY(%(region_ids)s) OR r.parent_id = ANY(%(region_ids)s))')
+    if dt_from:
+        delete_conditions.append('pc.dt >= %(dt_from)s')
+        select_conditions.append('pd.dt >= %(dt_from)s')
+    if dt_to:
+        delete_conditions.append('pc.dt <= %(dt_to)s')
+        select_conditions.append('pd.dt <= %(dt_to)s')
+    return ' AND '.join(delete_conditions) or 'TRUE', ' AND '.join(select_conditions) or 'TRUE'
+
+
+def refresh_prod_cal(employee_ids=None, shop_ids=None, position_ids=None, region_ids=None, dt_from=None, dt_to=None):
+    """
+    Пересчет норм для строк, удовлетворяющих всем переданным условиям (без условий -- вся таблица).
+    Выполняется в текущей транзакции.
+    :param employee_ids: сотрудники (изменение/удаление трудоустройств)
+    :param shop_ids: магазины (смена региона)
+    :param position_ids: должности (смена кол-ва часов в неделю)
+    :param region_ids: регионы дней календаря, включая дочерние (изменение ProductionDay)
+    :param dt_from: дата начала
+    :param dt_to: дата окончания
+    """
+    params = {
+        'employee_ids': list(set(employee_ids)) if employee_ids is not None else None,
+        'shop_ids': list(set(shop_ids)) if shop_ids is not None else None,
+        'position_ids': list(set(position_ids)) if position_ids is not None else None,
+        'region_ids': list(set(region_ids)) if region_ids is not None else None,
+        'dt_from': dt_from,
+        'dt_to': dt_to,
+    }
+    if any(params[key] == [] for key in ('employee_ids', 'shop_ids', 'position_ids', 'region_ids')):
+        return
+    delete_condition, select_condition = _get_conditions(**params)
+    with connection.cursor() as cursor:
+        cursor.execute(DELETE_SQL.format(condition=delete_condition), params)
+        cursor.execute(INSERT_SQL.format(condition=select_condition), params)
@@ -1,14 +1,12 @@
-import json, itertools
-from typing import Union, Iterable, Iterator
+import collections, json, itertools, uuid
+from typing import Union, Iterable
 from datetime import date
 
-import pandas as pd
 from django.conf import settings
 from django.contrib.postgres.aggregates import StringAgg
-from django.core.cache import cache
 from django.core.serializers.json import DjangoJSONEncoder
 from django.db import transaction
-from django.db.models import OuterRef, Subquery, Q, F, Exists, Case, When, Value, CharField, QuerySet, Model
+from django.db.models import OuterRef, Subquery, Q, F, Exists, Case, When, Value, CharField, QuerySet
 from django.db.models.functions import Cast
 from django.utils import timezone
 from django.utils.functional import cached_property
@@ -29,12 +27,18 @@ from src.apps.timetable.models import (
     WorkerDayPermission,
     GroupWorkerDayPermission,
     WorkerDayType,
-    Restriction
+    WorkType,
+    Restriction,
+    PostApproveJob,
 )
 from src.apps.timetable.timesheet.tasks import recalc_timesheet_on_data_change
 from src.apps.timetable.vacancy.tasks import vacancies_create_and_cancel_for_shop
 from src.apps.timetable.vacancy.utils import notify_vacancy_created
-from src.apps.timetable.worker_day.tasks import recalc_work_hours, recalc_fact_from_records
+from src.apps.timetable.worker_day.tasks import recalc_work_hours, recalc_fact_from_records, run_post_approve_jobs
+from src.apps.timetable.work_type.efficiency_cache import invalidate_shop_efficiency_cache
+from src.apps.timetable.worker_day.prod_cal_cache import invalidate_prod_cal_cache
+from src.apps.timetable.worker_day.services.post_approve import PostApproveJobs
+from src.apps.timetable.worker_day.services.work_hours import WorkHoursCalculator
 from src.apps.timetable.worker_day_permissions.checkers import BaseWdPermissionChecker
 from src.apps.timetable.exceptions import ApprovalError, NothingToApprove
 from src.apps.timetable.worker_day.utils.utils import ERROR_MESSAGES
@@ -81,6 +85,8 @@ class WorkerDayApproveService(Service):
         self.approve_open_vacs = approve_open_vacs
         self.exclude_approve_q = exclude_approve_q
         self.batch = batch
+        # id to track deferred post approve actions (post_approve.get_status), set if any were enqueued
+        self.post_approve_id = None
 
     # Public interface
     def approve(self) -> int:
@@ -99,10 +105,9 @@ class WorkerDayApproveService(Service):
     # Main function
     @transaction.atomic
     def _run(self) -> int:
-        draft_wdays, approved_wdays = self._get_wdays()
-        self._parse_changes_in_wdays(draft_wdays, approved_wdays)
-        self._filter_wdays(draft_wdays, approved_wdays)
-        self._parse_for_approval(draft_wdays)
+        self._parse_changes_in_wdays()
+        self._filter_wdays()
+        self._parse_for_approval()
         self._parse_for_deletion()
 
         ###### Orteka custom logic =( ######
@@ -194,12 +199,6 @@ class WorkerDayApproveService(Service):
                 )
         return requested_wd_types
 
-    @cached_property
-    def changes_dict(self) -> Q:
-        return self.__get_employee_days_dict(
-            itertools.chain(self.changed_draft_wdays, self.changed_approved_wdays)
-        )
-
     @cached_property
     def changes_q(self) -> dict[int, set[date]]:
         return self.__get_employee_days_q(self.changes_dict)
@@ -229,19 +228,86 @@ class WorkerDayApproveService(Service):
 
 
     # Day parsing
-    def _get_wdays(self) -> tuple[tuple[WorkerDay], tuple[WorkerDay]]:
-        """Get draft and approved WorkerDays from DB"""
-        draft_wdays = tuple(
-            WorkerDay.objects.filter(
-                self.approve_condition,
-                is_approved=False,
-            ).annotate(
+    @cached_property
+    def approved_wdays_qs(self) -> QuerySet[WorkerDay]:
+        qs = WorkerDay.objects
+        if self.batch:
+            qs = WorkerDay.objects_with_excluded
+        return qs.filter(
+            self.approve_condition,
+            is_approved=True,
+        ).exclude(
+            is_vacancy=True, employee_id__isnull=True    # don't delete open vacs
+        )
+
+    @cached_property
+    def draft_wdays_qs(self) -> QuerySet[WorkerDay]:
+        return WorkerDay.objects.filter(
+            self.approve_condition,
+            is_approved=False,
+        )
+
+    def _get_wdays_values(self) -> tuple[list[tuple], list[tuple]]:
+        """
+        Get draft and approved WorkerDays from DB as tuples of `VALUES`.
+        Only compared fields are selected, without related objects.
+        """
+        values = [
+            qs.annotate(
                 work_type_ids=StringAgg(
                     Cast('work_types', CharField()),
                     distinct=True,
                     delimiter=',',
                     output_field=CharField(),
                 )
+            ).order_by().values_list(*self.VALUES)
+            for qs in (self.draft_wdays_qs, self.approved_wdays_qs)
+        ]
+        draft_values, approved_values = list(values[0]), list(values[1])
+        if not draft_values and not approved_values:
+            raise NothingToApprove
+        return draft_values, approved_values
+
+    def _parse_changes_in_wdays(self):
+        """
+        Compare draft and approved WorkerDays for `DIFFERENCE_FIELDS`, find actual changes:
+        `changed_draft_ids` (to approve), `changed_approved_ids` (to delete) and `changes_dict` (employee-dt).
+        Day is changed if there are no other days (draft or approved) with the same `DIFFERENCE_FIELDS`.
+        """
+        draft_values, approved_values = self._get_wdays_values()
+        diff_len = len(self.DIFFERENCE_FIELDS)
+        id_idx = self.VALUES.index('id')
+        employee_idx = self.VALUES.index('employee_id')
+        is_vacancy_idx = self.VALUES.index('is_vacancy')
+        dt_idx = self.VALUES.index('dt')
+
+        # TODO: think of another way of logical comparison. This does not allow full duplicates in draft.
+        counter = collections.Counter(row[:diff_len] for row in itertools.chain(draft_values, approved_values))
+
+        self.changed_draft_ids = set()
+        self.changed_approved_ids = set()
+        self.changes_dict = {}
+        for rows, changed_ids in ((draft_values, self.changed_draft_ids), (approved_values, self.changed_approved_ids)):
+            for row in rows:
+                # Similar open vacancies are considered equal. Forcefully add them.
+                if counter[row[:diff_len]] == 1 or \
+                        changed_ids is self.changed_draft_ids and row[employee_idx] is None and row[is_vacancy_idx]:
+                    changed_ids.add(row[id_idx])
+                    self.changes_dict.setdefault(row[employee_idx], set()).add(row[dt_idx])
+
+        if not self.changed_draft_ids and not self.changed_approved_ids:
+            raise NothingToApprove
+
+    def _filter_wdays(self):
+        """
+        Get changed WorkerDays from DB.
+        Draft: by changes_dict (employee-dt), with related objects needed for approval
+        Approved: by `changed_approved_ids`
+        """
+        # all draft days of changed employee-dt
+        self.draft_wdays = tuple(
+            self.draft_wdays_qs.filter(
+                self.changes_q,
             ).select_related(
                 'employment',
                 'employment__position',
@@ -261,90 +327,16 @@ class WorkerDayApproveService(Service):
                 'outsources'
             )
         )
-
-        qs = WorkerDay.objects
-        if self.batch:
-            qs = WorkerDay.objects_with_excluded
-
-        approved_wdays = tuple(
-            qs.filter(
-                self.approve_condition,
-                is_approved=True,
-            ).exclude(
-                is_vacancy=True, employee_id__isnull=True    # don't delete open vacs
-            ).annotate(
-                work_type_ids=StringAgg(
-                    Cast('work_types', CharField()),
-                    distinct=True,
-                    delimiter=',',
-                    output_field=CharField(),
-                )
-            )
+        self.changed_draft_wdays = tuple(filter(lambda wd: wd.id in self.changed_draft_ids, self.draft_wdays))
+        self.changed_approved_wdays = tuple(
+            self.approved_wdays_qs.filter(id__in=self.changed_approved_ids).select_related('employment')
         )
-        if not draft_wdays and not approved_wdays:
-            raise NothingToApprove
-        return draft_wdays, approved_wdays
-
-    def _parse_changes_in_wdays(
-            self, draft_wdays: tuple[WorkerDay], approved_wdays: tuple[WorkerDay]
-            ):
-        """Compare draft and approved WorkerDays for `DIFFERENCE_FIELDS`, find actual changes, return to_approve_ids and to_delete_ids"""
-        # Model to dict (only fields in VALUES)
-        draft_data = self.__models_to_dict(draft_wdays, self.VALUES)
-        approved_data = self.__models_to_dict(approved_wdays, self.VALUES)
-
-        # Combined DataFrame with all days
-        draft_df = pd.DataFrame(draft_data)
-        approved_df = pd.DataFrame(approved_data)
-        combined_dfs = pd.concat([draft_df, approved_df])
-
-        # Drop duplicates by specific field to find actual changes.
-        # TODO: think of another way of logical comparison. This does not allow full duplicates in draft.
-        symmetric_difference = combined_dfs.drop_duplicates(subset=self.DIFFERENCE_FIELDS, keep=False).astype(object)
-
-        # Similar open vacancies can be dropped as duplicates. Forcefully add them back in.
-        if not draft_df.empty:
-            open_vacancies = draft_df.loc[(draft_df['employee_id'].isnull()) & (draft_df['is_vacancy'] == True)]
-            symmetric_difference = pd.concat([symmetric_difference, open_vacancies]).astype(object)
-
-        # NaN to None
-        symmetric_difference.where(pd.notnull(symmetric_difference), None, inplace=True)
-
-        # Split by is_approved. False (draft) will be approved, True (currently approved) will be deleted.
-        grouped = symmetric_difference.groupby('is_approved')
-
-        # Draft - to approve
-        if False in grouped.groups:
-            self.changed_draft_ids = set(grouped.get_group(False)['id'])
-        else:
-            self.changed_draft_ids = set()
-
-        # Approved - to delete
-        if True in grouped.groups:
-            self.changed_approved_ids = set(grouped.get_group(True)['id'])
-        else:
-            self.changed_approved_ids = set()
-
-        if not self.changed_draft_ids and not self.changed_approved_ids:
-            raise NothingToApprove
 
-    def _filter_wdays(
-            self, draft_wdays: tuple[WorkerDay], approved_wdays: tuple[WorkerDay]
-            ):
+    def _parse_for_approval(self):
         """
-        Filter wdays.
-        Draft: by changes_dict (employee-dt)
-        Approved: by `changed_draft_ids` and `changed_approved_ids`
+        Prepares tuples of days and ids for approval. Draft days filtered by employee-dt
         """
-        self.changed_draft_wdays = tuple(filter(lambda wd: wd.id in self.changed_draft_ids, draft_wdays))
-        self.changed_approved_wdays = tuple(filter(lambda wd: wd.id in self.changed_approved_ids, approved_wdays))
-
-    def _parse_for_approval(self, draft_wdays: Iterable[WorkerDay]):
-        """
-        Prepares tuples of days and ids for approval. `draft_wdays` filtered by employee-dt
-        """
-        filter_func = lambda wd: wd.dt in self.changes_dict.get(wd.employee_id, set())
-        self.to_approve_wdays = tuple(filter(filter_func, draft_wdays))
+        self.to_approve_wdays = self.draft_wdays
         self.to_approve_ids = {wd.id for wd in self.to_approve_wdays}
 
     def _parse_for_deletion(self):
@@ -367,7 +359,7 @@ class WorkerDayApproveService(Service):
             is_fact=self.is_fact
         ).exclude(
             is_vacancy=True, employee_id__isnull=True                # don't delete open vacancies
-        )
+        ).select_related('employment')
         if self.shop:
             wdays = wdays.filter(Q(shop=self.shop) | Q(shop__isnull=True))  # don't delete days in other shops
         self.to_delete_wdays = self.changed_approved_wdays + tuple(filter(lambda wd: wd.id not in self.changed_approved_ids, wdays))
@@ -829,21 +821,59 @@ class WorkerDayApproveService(Service):
     # Actions
     def _post_approve_actions(self):
         """Various things to be done after approval"""
-        if not self.is_fact:
-            if self.shop:
-                self._update_shop_stat()
-                self._create_and_cancel_vacancies()
+        if not self.is_fact and self.shop:
+            self._update_shop_stat()
         if self.to_approve_wdays:
             self._set_closest_plan_approved()
+            self._create_draft()
+            self._delete_cache()
+        self._invalidate_efficiency_cache()
+        if settings.WORKER_DAY_APPROVE_DEFERRED_ACTIONS:
+            self._enqueue_recalc_actions()
+        else:
+            self._recalc_actions()
+
+    def _recalc_actions(self):
+        """Recalculations that don't change the approved version. Run in request if deferred actions are disabled."""
         if not self.is_fact:
+            if self.shop:
+                self._create_and_cancel_vacancies()
             self._recalc_work_hours()
-        if self.to_approve_wdays:
-            if not self.is_fact:
+            if self.to_approve_wdays:
                 self._recalc_fact_from_records()    # after _set_closest_plan_approved
-            self._create_draft()
-            self._delete_cache()
         self._recalc_timesheet()
 
+    def _enqueue_recalc_actions(self):
+        """
+        Same recalculations as `_recalc_actions`, deferred as `PostApproveJob`s by (employee, month)
+        and (shop, work type, month). Pending jobs with the same key are coalesced, jobs run after commit.
+        """
+        approve_id = uuid.uuid4()
+        jobs = PostApproveJobs(approve_id)
+        # open vacancies (without employee) have nothing to recalculate
+        for employee_id, dates in self.changes_dict.items():
+            if employee_id is None:
+                continue
+            if not self.is_fact:
+                jobs.add_employee_action(PostApproveJob.ACTION_RECALC_WORK_HOURS, employee_id, dates)
+            jobs.add_employee_action(PostApproveJob.ACTION_RECALC_TIMESHEET, employee_id, dates)
+        if not self.is_fact:
+            if self.to_approve_wdays:
+                for employee_id, dates in self.employee_days_dict.items():
+                    if employee_id is not None:
+                        jobs.add_employee_action(PostApproveJob.ACTION_RECALC_FACT_FROM_RECORDS, employee_id, dates)
+            if self.shop:
+                today = date.today()
+                for work_type_id in WorkType.objects.qos_filter_active(
+                        today, today, shop_id=self.shop_id).values_list('id', flat=True):
+                    jobs.add_shop_work_type_action(
+                        PostApproveJob.ACTION_CREATE_AND_CANCEL_VACANCIES, self.shop_id, work_type_id, self.dt_from)
+        if not jobs.jobs:
+            return
+        jobs.enqueue()
+        self.post_approve_id = str(approve_id)
+        transaction.on_commit(lambda: run_post_approve_jobs.delay())
+
     def _recalc_work_hours(self):
         recalc_work_hours(
             self.changes_q,
@@ -893,7 +923,7 @@ class WorkerDayApproveService(Service):
         Create corresponding draft WorkerDay, WorkerDayOutsourceNetwork, WorkerDayCashboxDetails.
         Doesn't copy open vacancies.
         """
-        new_draft_wdays = WorkerDay.objects.bulk_create(
+        new_draft_wdays = WorkHoursCalculator(
             (
                 WorkerDay(
                     shop=wd.shop,
@@ -912,7 +942,6 @@ class WorkerDayApproveService(Service):
                     is_outsource=wd.is_outsource,
                     comment=wd.comment,
                     canceled=wd.canceled,
-                    need_count_wh=True,
                     is_blocked=wd.is_blocked,
                     closest_plan_approved_id=wd.closest_plan_approved_id,
                     parent_worker_day_id=wd.id,
@@ -921,7 +950,8 @@ class WorkerDayApproveService(Service):
                 )
                 for wd in self.to_approve_wdays if not wd.is_open_vacancy
             )
-        )
+        ).run()
+        WorkerDay.objects.bulk_create(new_draft_wdays)
         search_wds = {wd.parent_worker_day_id: wd for wd in new_draft_wdays}
         WorkerDayOutsourceNetwork.objects.bulk_create(
             (
@@ -950,13 +980,14 @@ class WorkerDayApproveService(Service):
         recalc_timesheet_on_data_change(self.changes_dict)
 
     def _delete_cache(self):
-        # TODO: research how this works
-        transaction.on_commit(
-            lambda: [
-                cache.delete_pattern(f"prod_cal_*_*_{employee_id}")
-                for employee_id in self.employee_ids_for_approval
-            ]
-        )
+        invalidate_prod_cal_cache(employee_ids=self.employee_ids_for_approval)
+
+    def _invalidate_efficiency_cache(self):
+        """Approved and replaced days change shop efficiency (coverage) of their shops"""
+        shop_dts = {}
+        for wd in self.all_days:
+            shop_dts.setdefault(wd.shop_id, set()).add(wd.dt)
+        invalidate_shop_efficiency_cache(shop_dts=shop_dts)
 
 
     # Events
@@ -1010,16 +1041,6 @@ class WorkerDayApproveService(Service):
             q |= Q(employee_id=employee_id, dt__in=dates)
         return q
 
-    @staticmethod
-    def __models_to_dict(
-            models: Iterable[Model],
-            values: Iterable[str]
-            ) -> Iterator[dict]:
-        return (
-            {key: getattr(model, key) for key in values}
-            for model in models
-        )
-
     def __day_key(self, worker_day: WorkerDay) -> tuple:
         """Dict key for comparing same employee days (e.g. between draft and approved)"""
         return tuple(getattr(worker_day, field) for field in self.COMPARISON_FIELDS)
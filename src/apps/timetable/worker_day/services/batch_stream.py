@@ -0,0 +1,206 @@
+"""
+Потоковая загрузка дней сотрудников (WorkerDay.batch_update_or_create) большими объемами.
+
+Строки NDJSON читаются по одной и собираются в пачки по сотрудникам:
+пачка закрывается, когда в ней не меньше chunk_size строк и начинается следующий сотрудник,
+поэтому все дни сотрудника (и область удаления, построенная по ним) попадают в одну транзакцию.
+Каждая пачка валидируется и сохраняется отдельным вызовом batch_update_or_create (своя транзакция),
+после чего вызывающему отдается прогресс: статистика пачки и ошибки по строкам.
+Память и время блокировок ограничены размером пачки, а не всего запроса.
+
+Строки сотрудника должны идти подряд (как при выгрузке, отсортированной по сотруднику):
+строки сотрудника, пачка которого уже обработана, отклоняются.
+"""
+import codecs
+import json
+import logging
+
+from django.conf import settings
+from rest_framework.exceptions import APIException
+
+from src.apps.timetable.models import WorkerDay
+from src.common.mixins.bulk_update_or_create import BatchUpdateOrCreateException
+
+logger = logging.getLogger('worker_day_batch_stream')
+
+MAX_ERRORS = 100
+
+# поля, по которым определяется сотрудник строки (см. WorkerDaySerializer)
+EMPLOYEE_KEY_FIELDS = ('employee_id', 'tabel_code', 'username')
+
+
+def _iter_records(lines):
+    """
+    :param lines: итератор строк тела запроса (bytes)
+    :return: итератор (номер строки, запись, ошибка)
+    """
+    for line_num, line in enumerate(codecs.iterdecode(lines, 'utf-8-sig'), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_num, None, f'invalid json: {e}'
+            continue
+        if not isinstance(record, dict):
+            yield line_num, None, 'record should be an object'
+            continue
+        yield line_num, record, None
+
+
+def _sum_stats(total, stats):
+    for model_name, model_stats in stats.items():
+        total_model_stats = total.setdefault(model_name, {})
+        for k, v in model_stats.items():
+            total_model_stats[k] = total_model_stats.get(k, 0) + v
+
+
+class _Chunk:
+    def __init__(self, num):
+        self.num = num
+        self.rows = []  # (номер строки, запись)
+        self.rows_count = 0  # включая отклоненные при чтении строки
+        self.errors = []
+        self.line_from = None
+        self.line_to = None
+        self.employee_keys = set()
+
+    def add_line(self, line_num):
+        if self.line_from is None:
+            self.line_from = line_num
+        self.line_to = line_num
+        self.rows_count += 1
+
+    def add_error(self, line_num, error):
+        self.errors.append({'line': line_num, 'error': error})
+
+
+class WorkerDayBatchStreamService:
+    """
+    Потоковое создание/обновление дней сотрудников пачками.
+
+    run() -- генератор прогресса: после каждой пачки
+        {"chunk": номер, "lines": [первая, последняя], "rows": кол-во, "stats": {...}, "errors": [...]},
+    в конце
+        {"total": {"chunks": ..., "rows": ..., "rejected": ..., "failed_chunks": ..., "stats": {...}}}.
+    Ошибка пачки (проверки batch_update_or_create) откатывает только эту пачку.
+    """
+
+    def __init__(self, lines, get_serializer, user=None, options=None, chunk_size=None):
+        """
+        :param lines: итератор строк (bytes) в формате NDJSON, один день сотрудника в строке
+        :param get_serializer: функция, возвращающая сериализатор для валидации одной строки
+        :param options: опции batch_update_or_create (BatchUpdateOrCreateStreamOptionsSerializer)
+        :param chunk_size: примерное кол-во строк в пачке (settings.WORKER_DAY_BATCH_STREAM_CHUNK_SIZE)
+        """
+        self.lines = lines
+        self.get_serializer = get_serializer
+        self.user = user
+        self.options = options or {}
+        self.chunk_size = chunk_size or settings.WORKER_DAY_BATCH_STREAM_CHUNK_SIZE
+        self.total = {
+            'chunks': 0,
+            'rows': 0,
+            'rejected': 0,
+            'failed_chunks': 0,
+            'stats': {},
+        }
+        self._errors_count = 0
+
+    @staticmethod
+    def _get_employee_key(record):
+        return tuple(record.get(field) for field in EMPLOYEE_KEY_FIELDS)
+
+    def _get_batch_kwargs(self):
+        options = self.options
+        model_options = dict(options.get('model_options', {}))
+        delete_scope_filters = dict(options.get('delete_scope_filters', {}))
+        if options.get('by_code'):
+            delete_scope_filters.update({'code__isnull': False})
+        return dict(
+            update_key_field=options.get('update_key_field') or ('code' if options.get('by_code') else 'id'),
+            delete_scope_fields_list=options.get('delete_scope_fields_list'),
+            delete_scope_filters=delete_scope_filters,
+            rel_objs_delete_scope_filters=dict(options.get('rel_objs_delete_scope_filters', {})),
+            user=self.user,
+            dry_run=options.get('dry_run', False),
+            check_perms_extra_kwargs=dict(
+                grouped_checks=model_options.pop('grouped_checks', False),
+                check_active_empl=model_options.pop('check_active_empl', True),
+            ),
+            model_options=model_options,
+        )
+
+    def _get_errors(self, chunk):
+        # в ответ попадает не более MAX_ERRORS ошибок на весь запрос
+        errors = chunk.errors[:max(MAX_ERRORS - self._errors_count, 0)]
+        self._errors_count += len(errors)
+        return errors
+
+    def _process_chunk(self, chunk):
+        data = []
+        for line_num, record in chunk.rows:
+            serializer = self.get_serializer(record)
+            if serializer.is_valid():
+                data.append(serializer.validated_data)
+            else:
+                chunk.add_error(line_num, serializer.errors)
+        chunk.errors.sort(key=lambda e: e['line'])
+        rejected = len(chunk.errors)
+
+        stats = {}
+        if data:
+            try:
+                WorkerDay.batch_update_or_create(data=data, stats=stats, **self._get_batch_kwargs())
+            except (APIException, BatchUpdateOrCreateException) as e:
+                stats = {}
+                rejected += len(data)
+                self.total['failed_chunks'] += 1
+                chunk.errors.append({
+                    'lines': [chunk.line_from, chunk.line_to],
+                    'error': e.detail if isinstance(e, APIException) else str(e),
+                })
+                logger.info(f'batch stream chunk {chunk.num} (lines {chunk.line_from}-{chunk.line_to}) failed: {e}')
+
+        self.total['chunks'] += 1
+        self.total['rows'] += chunk.rows_count
+        self.total['rejected'] += rejected
+        _sum_stats(self.total['stats'], stats)
+        return {
+            'chunk': chunk.num,
+            'lines': [chunk.line_from, chunk.line_to],
+            'rows': chunk.rows_count,
+            'stats': stats,
+            'errors': self._get_errors(chunk),
+        }
+
+    def run(self):
+        chunk = _Chunk(1)
+        done_employee_keys = set()
+        current_key = None
+        for line_num, record, error in _iter_records(self.lines):
+            if error is not None:
+                chunk.add_line(line_num)
+                chunk.add_error(line_num, error)
+                continue
+
+            key = self._get_employee_key(record)
+            if key != current_key and key not in chunk.employee_keys:
+                if key in done_employee_keys:
+                    chunk.add_line(line_num)
+                    chunk.add_error(line_num, 'rows of the employee should go one after another, '
+                                              'the employee has already been processed in the previous chunk')
+                    continue
+                if len(chunk.rows) >= self.chunk_size:
+                    done_employee_keys.update(chunk.employee_keys)
+                    yield self._process_chunk(chunk)
+                    chunk = _Chunk(chunk.num + 1)
+                chunk.employee_keys.add(key)
+            current_key = key
+            chunk.add_line(line_num)
+            chunk.rows.append((line_num, record))
+
+        if chunk.rows_count:
+            yield self._process_chunk(chunk)
+        yield {'total': self.total}
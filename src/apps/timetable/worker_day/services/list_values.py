@@ -0,0 +1,400 @@
+"""
+Выдача списка рабочих дней (WorkerDayViewSet.list) без WorkerDayListSerializer.
+
+Дни читаются через values() порциями по chunk_size, детали, аутсорс сети и пользователи (last_edited_by)
+подгружаются одним запросом на порцию, поэтому время выдачи определяется запросами к БД,
+а не созданием объектов моделей и сериализаторов. Формат строк совпадает с WorkerDayListSerializer.
+
+Разбивка часов на дневные и ночные (hours_details) зависит только от типа дня, часов, времени начала/окончания
+(без даты), перерывов, сети и длительности ближайшего плана, поэтому считается тем же
+WorkerDay.calc_day_and_night_work_hours один раз на уникальный набор этих значений.
+"""
+import datetime
+import json
+from itertools import islice
+
+import pandas as pd
+from django.utils import timezone
+
+from src.apps.base.models import Employee, Employment, Shop, User
+from src.apps.timetable.models import (
+    WorkerDay,
+    WorkerDayCashboxDetails,
+    WorkerDayOutsourceNetwork,
+    WorkerDayType,
+)
+from src.common.models_converter import Converter
+
+CHUNK_SIZE = 2000
+# дата, к которой приводятся начало и окончание дня при расчете дневных и ночных часов
+DAY_NIGHT_CALC_DT = datetime.date(2000, 1, 3)
+
+
+def _date_to_str(value):
+    return value.isoformat() if value else None
+
+
+class WorkerDayListValues:
+    VALUES_FIELDS = (
+        'id',
+        'employee_id',
+        'shop_id',
+        'code',
+        'employment_id',
+        'type_id',
+        'dt',
+        'dttm_work_start',
+        'dttm_work_end',
+        'dttm_work_start_tabel',
+        'dttm_work_end_tabel',
+        'dt_not_actual',
+        'comment',
+        'is_approved',
+        'is_vacancy',
+        'is_fact',
+        'is_outsource',
+        'work_hours',
+        'created_by_id',
+        'last_edited_by_id',
+        'dttm_modified',
+        'is_blocked',
+        'closest_plan_approved_id',
+        'cost_per_hour',
+    )
+    BY_CODE_FIELDS = ('shop_code', 'user_login', 'employment_tabel_code')
+    HOURS_DETAILS_FIELDS = (
+        'closest_plan_approved__work_hours',
+        'closest_plan_approved__dttm_work_start',
+        'closest_plan_approved__dttm_work_end',
+    )
+
+    def __init__(self, queryset, hours_details=False, extra_fields=None, chunk_size=CHUNK_SIZE):
+        """
+        :param queryset: отфильтрованный queryset WorkerDay
+        :param hours_details: добавить разбивку часов на дневные и ночные (work_hours_details)
+        :param extra_fields: доп. поля, как в BaseSerializer (не аннотируются в queryset, поэтому всегда None)
+        :param chunk_size: кол-во дней в порции
+        """
+        self.queryset = queryset
+        self.hours_details = hours_details
+        self.extra_fields = extra_fields or []
+        self.chunk_size = chunk_size
+        self.by_code_fields = [f for f in self.BY_CODE_FIELDS if f in queryset.query.annotations]
+        self._users = {}
+        self._types = {}
+        self._shops = {}
+        self._employments = {}
+        self._breaks = {}
+        self._day_night_hours = {}
+
+    def _get_values_qs(self):
+        fields = self.VALUES_FIELDS + tuple(self.by_code_fields)
+        if self.hours_details:
+            fields += self.HOURS_DETAILS_FIELDS
+        return self.queryset.prefetch_related(None).values(*fields)
+
+    @staticmethod
+    def _get_details(wd_ids):
+        details = {}
+        for wd_id, detail_id, work_type_id, work_part in WorkerDayCashboxDetails.objects.filter(
+                worker_day_id__in=wd_ids,
+        ).order_by('id').values_list('worker_day_id', 'id', 'work_type_id', 'work_part'):
+            details.setdefault(wd_id, []).append({
+                'id': detail_id,
+                'work_type_id': work_type_id,
+                'work_part': work_part,
+            })
+        return details
+
+    @staticmethod
+    def _get_outsources(wd_ids):
+        outsources = {}
+        for wd_id, network_id, network_name in WorkerDayOutsourceNetwork.objects.filter(
+                workerday_id__in=wd_ids,
+        ).order_by('id').values_list('workerday_id', 'network_id', 'network__name'):
+            outsources.setdefault(wd_id, []).append({
+                'id': network_id,
+                'name': network_name,
+            })
+        return outsources
+
+    def _load_users(self, user_ids):
+        user_ids = user_ids.difference(self._users)
+        if not user_ids:
+            return
+        avatar_storage = User._meta.get_field('avatar').storage
+        for user_id, first_name, last_name, middle_name, avatar in User._base_manager.filter(
+                id__in=user_ids,
+        ).values_list('id', 'first_name', 'last_name', 'middle_name', 'avatar'):
+            self._users[user_id] = {
+                'id': user_id,
+                'first_name': first_name,
+                'last_name': last_name,
+                'middle_name': middle_name,
+                'avatar': avatar_storage.url(avatar) if avatar else None,
+            }
+
+    @staticmethod
+    def _load_related(cache, manager, ids):
+        ids = ids.difference(cache)
+        if ids:
+            cache.update(manager.in_bulk(ids))
+
+    def _load_day_night_related(self, rows):
+        self._load_related(self._types, WorkerDayType._base_manager, {row['type_id'] for row in rows})
+        self._load_related(
+            self._shops,
+            Shop._base_manager.select_related('network__breaks', 'settings__breaks'),
+            {row['shop_id'] for row in rows if row['shop_id']},
+        )
+        self._load_related(
+            self._employments,
+            Employment._base_manager.select_related('position__breaks'),
+            {row['employment_id'] for row in rows if row['employment_id']},
+        )
+
+    def _get_breaks(self, shop_id, employment_id):
+        key = (shop_id, employment_id)
+        if key not in self._breaks:
+            breaks = WorkerDay(
+                shop=self._shops.get(shop_id),
+                employment=self._employments.get(employment_id),
+            )._get_breaks()
+            self._breaks[key] = (json.dumps(breaks), breaks)
+        return self._breaks[key]
+
+    def _calc_day_and_night_work_hours(self, row):
+        """
+        :return: (work_hours, work_hours_day, work_hours_night), как WorkerDay.calc_day_and_night_work_hours
+        """
+        wd_type = self._types[row['type_id']]
+        work_hours = row['work_hours']
+        work_start = row['dttm_work_start_tabel'] or row['dttm_work_start']
+        work_end = row['dttm_work_end_tabel'] or row['dttm_work_end']
+        if wd_type.is_dayoff or not work_hours or work_hours <= datetime.timedelta(0) \
+                or not (work_start and work_end):
+            return 0.0, 0.0, 0.0
+
+        shop = self._shops.get(row['shop_id'])
+        breaks_key, breaks = None, None
+        plan_key = None
+        if wd_type.subtract_breaks:
+            breaks_key, breaks = self._get_breaks(row['shop_id'], row['employment_id'])
+            if breaks and row['closest_plan_approved_id']:
+                plan_start = row['closest_plan_approved__dttm_work_start']
+                plan_end = row['closest_plan_approved__dttm_work_end']
+                plan_key = (
+                    row['closest_plan_approved__work_hours'],
+                    plan_end - plan_start if plan_start and plan_end else None,
+                )
+        key = (
+            wd_type.code, work_hours, work_start.time(), work_end - work_start,
+            shop.network_id if shop else None, breaks_key, plan_key,
+        )
+        if key not in self._day_night_hours:
+            dttm_work_start = datetime.datetime.combine(DAY_NIGHT_CALC_DT, work_start.time())
+            closest_plan_approved = None
+            if plan_key:
+                plan_work_hours, plan_duration = plan_key
+                closest_plan_approved = WorkerDay(
+                    work_hours=plan_work_hours,
+                    dttm_work_start=dttm_work_start if plan_duration is not None else None,
+                    dttm_work_end=dttm_work_start + plan_duration if plan_duration is not None else None,
+                )
+            self._day_night_hours[key] = WorkerDay(
+                type=wd_type,
+                work_hours=work_hours,
+                dttm_work_start=dttm_work_start,
+                dttm_work_end=dttm_work_start + (work_end - work_start),
+                shop=shop,
+                employment=self._employments.get(row['employment_id']),
+                closest_plan_approved=closest_plan_approved,
+            ).calc_day_and_night_work_hours()
+        return self._day_night_hours[key]
+
+    def _to_dict(self, row, details, outsources):
+        work_hours = row['work_hours']
+        if isinstance(work_hours, datetime.timedelta):
+            work_hours = round(work_hours.total_seconds() / 3600, 2)
+        unaccounted_overtime = 0
+        if row['dttm_work_start'] and row['dttm_work_end'] and \
+                row['dttm_work_start_tabel'] and row['dttm_work_end_tabel']:
+            unaccounted_overtime = max(
+                (row['dttm_work_end'] - row['dttm_work_end_tabel']).total_seconds(),
+                0,
+            ) + max(
+                (row['dttm_work_start_tabel'] - row['dttm_work_start']).total_seconds(),
+                0,
+            )
+        cost_per_hour = row['cost_per_hour']
+        total_cost = None
+        if cost_per_hour and work_hours is not None:
+            total_cost = work_hours * float(cost_per_hour)
+
+        wd_dict = {
+            'id': row['id'],
+            'employee_id': row['employee_id'],
+            'shop_id': row['shop_id'],
+            'code': row['code'],
+            'employment_id': row['employment_id'],
+            'type': row['type_id'],
+            'dt': _date_to_str(row['dt']),
+            'dttm_work_start': _date_to_str(row['dttm_work_start']),
+            'dttm_work_end': _date_to_str(row['dttm_work_end']),
+            'dttm_work_start_tabel': _date_to_str(row['dttm_work_start_tabel']),
+            'dttm_work_end_tabel': _date_to_str(row['dttm_work_end_tabel']),
+            'dt_not_actual': _date_to_str(row['dt_not_actual']),
+            'comment': row['comment'],
+            'is_approved': row['is_approved'],
+            'is_vacancy': row['is_vacancy'],
+            'worker_day_details': details.get(row['id'], []),
+            'outsources': outsources.get(row['id'], []),
+            'is_fact': row['is_fact'],
+            'is_outsource': row['is_outsource'],
+            'work_hours': work_hours,
+        }
+        for field in self.by_code_fields:
+            wd_dict[field] = row[field]
+        wd_dict.update({
+            'created_by_id': row['created_by_id'],
+            'last_edited_by': self._users.get(row['last_edited_by_id']),
+            'dttm_modified': _date_to_str(row['dttm_modified']),
+            'is_blocked': row['is_blocked'],
+            'unaccounted_overtime': unaccounted_overtime / 60,
+            'closest_plan_approved_id': row['closest_plan_approved_id'],
+            'cost_per_hour': '{:f}'.format(cost_per_hour) if cost_per_hour is not None else None,
+            'total_cost': total_cost,
+        })
+        for field in self.extra_fields:
+            wd_dict[field] = None
+        if self.hours_details:
+            wd_dict['work_hours'], work_hours_day, work_hours_night = self._calc_day_and_night_work_hours(row)
+            wd_dict['work_hours_details'] = {
+                'D': work_hours_day,
+                'N': work_hours_night,
+            }
+        return wd_dict
+
+    def _process_chunk(self, rows):
+        wd_ids = [row['id'] for row in rows]
+        details = self._get_details(wd_ids)
+        outsources = self._get_outsources(wd_ids)
+        self._load_users({row['last_edited_by_id'] for row in rows if row['last_edited_by_id']})
+        if self.hours_details:
+            self._load_day_night_related(rows)
+        return [self._to_dict(row, details, outsources) for row in rows]
+
+    def __iter__(self):
+        rows_iter = self._get_values_qs().iterator(chunk_size=self.chunk_size)
+        while True:
+            rows = list(islice(rows_iter, self.chunk_size))
+            if not rows:
+                return
+            yield from self._process_chunk(rows)
+
+
+def get_empty_days(dt_from, dt_to, existing_days, employee_id__in=None, tabel_code__in=None, by_code=False):
+    """
+    Дни без записей в ответе (fill_empty_days): выходной (H), если нет подтвержденного плана,
+    иначе для рабочего дня плана -- прогул (A) в прошлом или рабочий день (W) с нулевыми часами.
+
+    :param existing_days: множество (employee_id, dt в iso формате) дней, которые уже есть в ответе
+    :return: список дней в формате ответа WorkerDayViewSet.list
+    """
+    employees = Employee.objects
+    if employee_id__in:
+        employees = employees.filter(id__in=employee_id__in)
+    elif tabel_code__in:
+        employees = employees.filter(tabel_code__in=tabel_code__in)
+
+    plan_wdays_dict = {
+        (wd['employee_id'], wd['dt']): wd for wd in WorkerDay.objects.filter(
+            employee__in=employees,
+            dt__gte=dt_from,
+            dt__lte=dt_to,
+            is_approved=True,
+            is_fact=False,
+        ).exclude(
+            type_id=WorkerDay.TYPE_EMPTY,
+        ).values('employee_id', 'dt', 'shop_id', 'employment_id', 'type__is_dayoff', 'shop__code')
+    }
+    dates = [(dt, Converter.convert_date(dt)) for dt in pd.date_range(dt_from, dt_to).date]
+    dt_now = timezone.now().date()
+
+    data = []
+    for employee in employees.values('id', 'user_id', 'tabel_code', 'user__username'):
+        for dt, dt_str in dates:
+            if (employee['id'], dt_str) in existing_days:
+                continue
+
+            plan_wd = plan_wdays_dict.get((employee['id'], dt))
+
+            # Если нет ни плана ни факта, то добавляем выходной
+            if not plan_wd:
+                d = {
+                    'id': None,
+                    'worker_id': employee['user_id'],
+                    'employee_id': employee['id'],
+                    'shop_id': None,
+                    'employment_id': None,  # нужен?
+                    'type': "H",
+                    'dt': dt_str,
+                    'dttm_work_start': None,
+                    'dttm_work_end': None,
+                    'dttm_work_start_tabel': None,
+                    'dttm_work_end_tabel': None,
+                    'comment': None,
+                    'is_approved': None,
+                    'worker_day_details': [],
+                    'outsources': [],
+                    'is_fact': None,
+                    'work_hours': 0,
+                    'parent_worker_day_id': None,
+                    'created_by_id': None,
+                    'last_edited_by': None,
+                    'dttm_modified': None,
+                    'is_blocked': None
+                }
+                if by_code:
+                    d['shop_code'] = None
+                    d['user_login'] = employee['user__username']
+                    d['employment_tabel_code'] = employee['tabel_code']
+                data.append(d)
+                continue
+
+            if not plan_wd['type__is_dayoff']:
+                day_in_past = dt < dt_now
+                d = {
+                    'id': None,
+                    'worker_id': employee['user_id'],
+                    'employee_id': employee['id'],
+                    'shop_id': plan_wd['shop_id'],
+                    'employment_id': plan_wd['employment_id'],
+                    'type': WorkerDay.TYPE_ABSENSE if day_in_past else WorkerDay.TYPE_WORKDAY,
+                    'dt': dt_str,
+                    'dttm_work_start': None,
+                    'dttm_work_end': None,
+                    'dttm_work_start_tabel': None,
+                    'dttm_work_end_tabel': None,
+                    'comment': None,
+                    'is_approved': None,
+                    'worker_day_details': None,
+                    'outsources': None,
+                    'is_fact': None,
+                    'work_hours': 0,
+                    'parent_worker_day_id': None,
+                    'created_by_id': None,
+                    'last_edited_by': None,
+                    'dttm_modified': None,
+                    'is_blocked': None,
+                }
+                if not day_in_past:
+                    d["work_hours_details"] = {
+                        "D": 0
+                    }
+                if by_code:
+                    d['shop_code'] = plan_wd['shop__code']
+                    d['user_login'] = employee['user__username']
+                    d['employment_tabel_code'] = employee['tabel_code']
+                data.append(d)
+    return data
@@ -0,0 +1,195 @@
+"""
+Отложенные действия после подтверждения графика (WorkerDayApproveService).
+
+Пересчеты, от которых не зависит сама подтвержденная версия (часы факта, факт по отметкам, табель, вакансии),
+не выполняются в запросе подтверждения: в его транзакции создаются задания PostApproveJob,
+после коммита их выполняет задача run_post_approve_jobs.
+
+Задания группируются по ключу: сотрудник + месяц (часы факта, факт по отметкам, табель)
+и магазин + тип работ + месяц (вакансии). Если задание с тем же ключом еще ожидает выполнения,
+новое не создается, а в ожидающее добавляются даты и идентификатор подтверждения,
+поэтому при одновременном подтверждении соседних магазинов общие сотрудники пересчитываются один раз.
+Статус по идентификатору подтверждения -- get_status (worker_day/post_approve_status/).
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from src.apps.timetable.models import PostApproveJob
+from src.apps.timetable.timesheet.tasks import calc_timesheets
+from src.apps.timetable.vacancy.utils import cancel_vacancies, create_vacancies_and_notify
+from src.apps.timetable.worker_day.stat import get_month_range
+from src.apps.timetable.worker_day.tasks import recalc_work_hours, recalc_fact_from_records
+from src.common.models_converter import Converter
+
+logger = logging.getLogger('post_approve_jobs')
+
+# задание могут забрать на выполнение между вставкой и блокировкой, тогда вставка повторяется
+ENQUEUE_ATTEMPTS = 3
+MAX_ERRORS = 20
+
+
+class PostApproveJobs:
+    """
+    Набор заданий одного подтверждения, по одному на ключ
+    """
+
+    def __init__(self, approve_id):
+        self.approve_id = str(approve_id)
+        self.jobs = {}
+
+    def _get_job(self, kind, dt, **kwargs):
+        key = PostApproveJob.get_key(kind, dt, **kwargs)
+        job = self.jobs.get(key)
+        if job is None:
+            job = self.jobs[key] = PostApproveJob(
+                key=key, kind=kind, dt=dt.replace(day=1), approve_ids=[self.approve_id], **kwargs)
+        return job
+
+    def add_employee_action(self, action, employee_id, dates):
+        for dt in dates:
+            self._get_job(PostApproveJob.KIND_EMPLOYEE_MONTH, dt, employee_id=employee_id).add_dates(action, [dt])
+
+    def add_shop_work_type_action(self, action, shop_id, work_type_id, dt):
+        self._get_job(
+            PostApproveJob.KIND_SHOP_WORK_TYPE_MONTH, dt, shop_id=shop_id, work_type_id=work_type_id,
+        ).add_dates(action, [])
+
+    def enqueue(self):
+        """
+        Сохранение заданий в текущей транзакции с объединением с ожидающими заданиями тех же ключей.
+        Вставка ждет коммита параллельной транзакции, вставившей тот же ключ, и пропускает его,
+        ожидающие задания блокируются в порядке ключей.
+        """
+        keys = sorted(self.jobs)
+        for _attempt in range(ENQUEUE_ATTEMPTS):
+            if not keys:
+                return
+            PostApproveJob.objects.bulk_create([self.jobs[key] for key in keys], ignore_conflicts=True)
+            pending_jobs = list(PostApproveJob.objects.select_for_update().filter(
+                key__in=keys,
+                status=PostApproveJob.STATUS_PENDING,
+            ).order_by('key'))
+            changed_jobs = [job for job in pending_jobs if job.merge(self.jobs[job.key])]
+            PostApproveJob.objects.bulk_update(changed_jobs, fields=['actions', 'approve_ids'])
+            pending_keys = {job.key for job in pending_jobs}
+            keys = [key for key in keys if key not in pending_keys]
+        if keys:
+            raise RuntimeError(f'could not enqueue post approve jobs: {keys}')
+
+
+def _run_employee_month_job(job):
+    actions = job.actions
+    # порядок важен: табель считается по пересчитанному факту
+    if PostApproveJob.ACTION_RECALC_WORK_HOURS in actions:
+        recalc_work_hours(
+            Q(employee_id=job.employee_id, dt__in=actions[PostApproveJob.ACTION_RECALC_WORK_HOURS]),
+            is_fact=True,
+            dttm_work_start__isnull=False,
+            dttm_work_end__isnull=False,
+        )
+    if PostApproveJob.ACTION_RECALC_FACT_FROM_RECORDS in actions:
+        dates = [Converter.parse_date(dt) for dt in actions[PostApproveJob.ACTION_RECALC_FACT_FROM_RECORDS]]
+        recalc_fact_from_records(employee_days_list=[(job.employee_id, dates)])
+    if PostApproveJob.ACTION_RECALC_TIMESHEET in actions:
+        dt_from, dt_to = get_month_range(year=job.dt.year, month_num=job.dt.month)
+        calc_timesheets(employee_id__in=[job.employee_id], dt_from=dt_from, dt_to=dt_to, reraise_exc=True)
+
+
+def _run_shop_work_type_month_job(job):
+    if PostApproveJob.ACTION_CREATE_AND_CANCEL_VACANCIES in job.actions:
+        cancel_vacancies(job.shop_id, job.work_type_id, approved=True)
+        create_vacancies_and_notify(job.shop_id, job.work_type_id)
+
+
+JOB_RUNNERS = {
+    PostApproveJob.KIND_EMPLOYEE_MONTH: _run_employee_month_job,
+    PostApproveJob.KIND_SHOP_WORK_TYPE_MONTH: _run_shop_work_type_month_job,
+}
+
+
+def _claim_job():
+    with transaction.atomic():
+        job = PostApproveJob.objects.select_for_update(skip_locked=True).filter(
+            status=PostApproveJob.STATUS_PENDING,
+        ).order_by('id').first()
+        if job is not None:
+            job.status = PostApproveJob.STATUS_RUNNING
+            job.dttm_started = timezone.now()
+            job.save(update_fields=['status', 'dttm_started'])
+    return job
+
+
+def _run_job(job):
+    try:
+        with transaction.atomic():
+            JOB_RUNNERS[job.kind](job)
+    except Exception as e:
+        logger.exception(f'post approve job {job.key} (id={job.id}) failed')
+        job.status = PostApproveJob.STATUS_FAILED
+        job.error = str(e)
+    else:
+        job.status = PostApproveJob.STATUS_DONE
+    job.dttm_finished = timezone.now()
+    job.save(update_fields=['status', 'error', 'dttm_finished'])
+
+
+def run_pending_jobs():
+    """
+    Выполнение ожидающих заданий по одному. Задание забирается со статусом running (skip locked),
+    поэтому несколько воркеров могут работать параллельно, не выполняя задание дважды.
+    Пока задание ожидает, в него объединяются новые подтверждения.
+    :return: кол-во выполненных заданий
+    """
+    processed = 0
+    while True:
+        job = _claim_job()
+        if job is None:
+            return processed
+        _run_job(job)
+        processed += 1
+
+
+def clean_jobs():
+    """
+    Удаление завершенных заданий старше settings.POST_APPROVE_JOBS_KEEP_DAYS
+    """
+    return PostApproveJob.objects.filter(
+        status__in=[PostApproveJob.STATUS_DONE, PostApproveJob.STATUS_FAILED],
+        dttm_finished__lt=timezone.now() - timedelta(days=settings.POST_APPROVE_JOBS_KEEP_DAYS),
+    ).delete()[0]
+
+
+def get_status(approve_id):
+    """
+    Статус отложенных действий подтверждения
+    :return: {"status": pending|running|done|failed, "jobs": {статус: кол-во}, "errors": [...]}
+        или None, если заданий подтверждения нет
+    """
+    jobs_qs = PostApproveJob.objects.filter(approve_ids__contains=[str(approve_id)])
+    jobs = {
+        row['status']: row['count']
+        for row in jobs_qs.values('status').annotate(count=Count('id')).order_by()
+    }
+    if not jobs:
+        return None
+
+    for status in (PostApproveJob.STATUS_RUNNING, PostApproveJob.STATUS_PENDING, PostApproveJob.STATUS_FAILED):
+        if jobs.get(status):
+            break
+    else:
+        status = PostApproveJob.STATUS_DONE
+    errors = []
+    if jobs.get(PostApproveJob.STATUS_FAILED):
+        errors = list(jobs_qs.filter(
+            status=PostApproveJob.STATUS_FAILED,
+        ).order_by('id').values('key', 'error')[:MAX_ERRORS])
+    return {
+        'status': status,
+        'jobs': jobs,
+        'errors': errors,
+    }
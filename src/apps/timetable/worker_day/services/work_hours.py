@@ -0,0 +1,137 @@
+from src.apps.base.models import Employee, Employment, Shop
+from src.apps.base.shop.schedule import ShopScheduleIndex
+from src.apps.timetable.models import ProdCal, WorkerDay, WorkerDayType
+from src.common.models_converter import Converter
+
+
+class WorkHoursCalculator:
+    """
+    Пакетный расчет рабочих часов (dttm_work_start_tabel, dttm_work_end_tabel, work_hours)
+    для списка рабочих дней без сохранения.
+
+    WorkerDay.save считает часы по одному дню: тип, магазин, сеть, перерывы, трудоустройство, штрафы должности,
+    ближайший план и расписание магазина запрашиваются для каждого дня.
+    Здесь связанные объекты загружаются одним запросом на модель для всех дней,
+    расписания магазинов -- одним запросом на период (ShopScheduleIndex),
+    нормы и среднемесячные часы -- одним запросом на набор дней.
+    Сам расчет выполняется теми же методами WorkerDay._calc_wh/_round_wh, поэтому результат совпадает с save.
+    """
+    SAWH_HOURS_METHODS = (
+        WorkerDayType.GET_WORK_HOURS_METHOD_TYPE_MONTH_AVERAGE_SAWH_HOURS,
+        WorkerDayType.GET_WORK_HOURS_METHOD_TYPE_MANUAL_OR_MONTH_AVERAGE_SAWH_HOURS,
+    )
+
+    def __init__(self, worker_days):
+        self.worker_days = list(worker_days)
+        self._shop_schedule_index = None
+        self._norm_hours = None
+        self._stats_employees = {}
+        self._employee_stats = {}
+
+    @staticmethod
+    def _set_related(worker_days, field_name, objs_by_id):
+        field = WorkerDay._meta.get_field(field_name)
+        for wd in worker_days:
+            if not field.is_cached(wd):
+                obj = objs_by_id.get(getattr(wd, field.attname))
+                if obj is not None:
+                    field.set_cached_value(wd, obj)
+
+    @staticmethod
+    def _get_not_cached_ids(worker_days, field_name):
+        field = WorkerDay._meta.get_field(field_name)
+        return {
+            getattr(wd, field.attname) for wd in worker_days
+            if getattr(wd, field.attname) is not None and not field.is_cached(wd)
+        }
+
+    def _prefetch_related(self):
+        wdays = self.worker_days
+        self._set_related(wdays, 'type', WorkerDayType._base_manager.in_bulk(
+            self._get_not_cached_ids(wdays, 'type')))
+        self._set_related(wdays, 'shop', Shop._base_manager.select_related(
+            'network__breaks', 'settings__breaks').in_bulk(self._get_not_cached_ids(wdays, 'shop')))
+        self._set_related(wdays, 'employment', Employment._base_manager.select_related(
+            'position__breaks', 'position__network').in_bulk(self._get_not_cached_ids(wdays, 'employment')))
+        # сеть сотрудника нужна для округления только дням без магазина
+        without_shop = [wd for wd in wdays if not wd.shop_id]
+        self._set_related(without_shop, 'employee', Employee._base_manager.select_related(
+            'user__network').in_bulk(self._get_not_cached_ids(without_shop, 'employee')))
+        facts = [wd for wd in wdays if wd.is_fact]
+        self._set_related(facts, 'closest_plan_approved', WorkerDay._base_manager.in_bulk(
+            self._get_not_cached_ids(facts, 'closest_plan_approved')))
+
+    def _prefetch_shop_schedules(self):
+        shops = {}
+        dts = []
+        for wd in self.worker_days:
+            if wd.shop_id and wd.shop.network.crop_work_hours_by_shop_schedule and not wd.type.is_dayoff:
+                shops[wd.shop_id] = wd.shop
+                dts.append(wd.dt)
+        if shops:
+            self._shop_schedule_index = ShopScheduleIndex(shops.values(), min(dts), max(dts))
+
+    def _prepare_stats(self):
+        for wd in self.worker_days:
+            if wd.type.is_dayoff and wd.type.is_work_hours and wd.employment_id:
+                if wd.type.get_work_hours_method in self.SAWH_HOURS_METHODS:
+                    self._stats_employees.setdefault((wd.employment.shop_id, wd.dt), set()).add(wd.employee_id)
+
+    def get_shop_schedule(self, shop_id, dt):
+        """
+        Расписание магазина на дату, как Shop.get_schedule
+        """
+        return self._shop_schedule_index.get_schedule(shop_id, dt)
+
+    def get_norm_hours(self, employee_id, dt, shop_id):
+        """
+        Норма часов из производственного календаря (0, если нет)
+        """
+        if self._norm_hours is None:
+            keys = [
+                (wd.employee_id, wd.dt, wd.employment.shop_id) for wd in self.worker_days
+                if wd.type.get_work_hours_method == WorkerDayType.GET_WORK_HOURS_METHOD_TYPE_NORM_HOURS
+                and wd.employment_id
+            ]
+            self._norm_hours = {}
+            prod_cal = ProdCal.objects.filter(
+                employee_id__in={k[0] for k in keys},
+                dt__in={k[1] for k in keys},
+                shop_id__in={k[2] for k in keys},
+            ).order_by('id').values_list('employee_id', 'dt', 'shop_id', 'norm_hours')
+            for pc_employee_id, pc_dt, pc_shop_id, norm_hours in prod_cal:
+                self._norm_hours.setdefault((pc_employee_id, pc_dt, pc_shop_id), norm_hours)
+        return self._norm_hours.get((employee_id, dt, shop_id), 0)
+
+    def get_employee_stats(self, employee_id, shop_id, dt):
+        """
+        Статистика WorkersStatsGetter за день, одна на всех сотрудников набора с тем же магазином и датой
+        """
+        key = (shop_id, dt)
+        if key not in self._employee_stats:
+            from src.apps.timetable.worker_day.stat import WorkersStatsGetter
+            employee_ids = self._stats_employees.get(key) or {employee_id}
+            self._employee_stats[key] = WorkersStatsGetter(
+                employee_id__in=list(employee_ids),
+                dt_from=dt,
+                dt_to=dt,
+                shop_id=shop_id,
+            ).run()
+        return self._employee_stats[key]
+
+    def run(self):
+        """
+        :return: рабочие дни с рассчитанными часами
+        """
+        if not self.worker_days:
+            return self.worker_days
+        for wd in self.worker_days:
+            if isinstance(wd.dt, str):
+                wd.dt = Converter.parse_date(wd.dt)
+        self._prefetch_related()
+        self._prefetch_shop_schedules()
+        self._prepare_stats()
+        for wd in self.worker_days:
+            wd.dttm_work_start_tabel, wd.dttm_work_end_tabel, wd.work_hours = wd._calc_wh(calc_cache=self)
+            wd.work_hours = wd._round_wh()
+        return self.worker_days
@@ -5,9 +5,7 @@ from functools import lru_cache
 
 import pandas as pd
 from dateutil.relativedelta import relativedelta
-from django.conf import settings
 from django.contrib.postgres.aggregates import ArrayAgg
-from django.core.cache import cache
 from django.db.models import (
     Case, When, BooleanField, )
 from django.db.models import (
@@ -26,6 +24,7 @@ from src.apps.base.models import Employment, Shop, ProductionDay, SAWHSettings,
 from src.apps.base.shift_schedule.utils import get_shift_schedule
 from src.apps.forecast.models import PeriodClients
 from src.apps.timetable.models import WorkerDay, ProdCal, TimesheetItem, WorkerDayType
+from src.apps.timetable.worker_day import prod_cal_cache
 from src.common.models_converter import Converter
 
 
@@ -505,23 +504,27 @@ class WorkersStatsGetter:
             dts=ArrayAgg('dt'),
         )
 
-    def _get_prod_cal_for_employee(self, employee_id):
-        return list(self.prod_cal_qs.filter(employee_id=employee_id))
+    def _get_prod_cal_for_employees(self, employee_ids):
+        return list(self.prod_cal_qs.filter(employee_id__in=employee_ids))
 
     def _get_prod_cal_cached(self):
-        cached_data = []
-
-        if self.use_cache:
-            for e in self.employees_dict.keys():
-                key = f'prod_cal_{self.dt_from}_{self.dt_to}_{e}'
-                cached = cache.get(key)
-                if not cached:
-                    cached = self._get_prod_cal_for_employee(e)
-                    cache.set(key, cached, timeout=settings.CACHE_TTL.get('prod_cal', 86400))
-                cached_data.extend(cached)
-        else:
-            cached_data = list(self.prod_cal_qs.filter(employee_id__in=self.employees_dict.keys()))
+        if not self.use_cache:
+            return self._get_prod_cal_for_employees(self.employees_dict.keys())
+
+        # один get_many на всех сотрудников, промахи считаются одним запросом и сохраняются одним set_many
+        keys = prod_cal_cache.get_keys(self.dt_from, self.dt_to, self.employees_dict.keys(), network_id=self.network.id)
+        cached = prod_cal_cache.get_many(keys)
+        missed_employee_ids = [e for e in keys.keys() if e not in cached]
+        if missed_employee_ids:
+            missed = {e: [] for e in missed_employee_ids}
+            for prod_cal in self._get_prod_cal_for_employees(missed_employee_ids):
+                missed[prod_cal['employee_id']].append(prod_cal)
+            prod_cal_cache.set_many(keys, missed)
+            cached.update(missed)
 
+        cached_data = []
+        for e in keys.keys():
+            cached_data.extend(cached[e])
         return cached_data
 
     def run(self):
@@ -15,8 +15,11 @@ from src.adapters.celery.celery import app
 from src.apps.forecast.models import OperationType, PeriodClients
 from src.apps.forecast.period_clients.utils import create_demand
 from src.apps.timetable.models import WorkerDay
+from src.apps.timetable.work_type.efficiency_cache import invalidate_shop_efficiency_cache
 from src.apps.timetable.work_type.utils import ShopEfficiencyGetter
+from src.apps.timetable.worker_day.prod_cal_cache import invalidate_prod_cal_cache
 from src.apps.timetable.worker_day.services.fix import FixWdaysService
+from src.apps.timetable.worker_day.services.work_hours import WorkHoursCalculator
 from src.apps.timetable.worker_day.utils.utils import create_fact_from_attendance_records
 from src.common.jsons import process_single_quote_json
 from src.common.time import DateProducerFactory, DateTimeHelper
@@ -32,8 +35,7 @@ from src.common.time_series import TIME_FEATURES_ORDERED, produce_dt_feature
 @transaction.atomic
 def recalc_work_hours(*q_objects, **filters) -> int:
     """Recalculate `work_hours` and `dttm_work_start/end_tabel` of `WorkerDays`. `kwargs` - arguments for `filter()`"""
-    # TODO: rewrite to in-memory work_hours calculation, save once in bulk_update.
-    wdays = WorkerDay.objects.filter(
+    wdays = list(WorkerDay.objects.filter(
         *q_objects,
         Q(type__is_dayoff=False) | Q(type__is_dayoff=True, type__is_work_hours=True),
         **filters
@@ -47,17 +49,20 @@ def recalc_work_hours(*q_objects, **filters) -> int:
         'employment__position__network',
         'employee__user__network',
         'closest_plan_approved'
-    )
-    wd: WorkerDay
-    for wd in wdays:
-        wd.save(
-            recalc_fact=False,
-            update_fields=[
-                'work_hours',
-                'dttm_work_start_tabel',
-                'dttm_work_end_tabel',
-            ]
-        )
+    ))
+    update_fields = ['work_hours', 'dttm_work_start_tabel', 'dttm_work_end_tabel']
+    prev_values = {wd.id: tuple(getattr(wd, f) for f in update_fields) for wd in wdays}
+    WorkHoursCalculator(wdays).run()
+    changed_wdays = [wd for wd in wdays if tuple(getattr(wd, f) for f in update_fields) != prev_values[wd.id]]
+    WorkerDay.objects.bulk_update(changed_wdays, update_fields, batch_size=1000)
+
+    shop_dts = {}
+    for wd in changed_wdays:
+        shop_dts.setdefault(wd.shop_id, set()).add(wd.dt)
+    invalidate_shop_efficiency_cache(shop_dts=shop_dts)
+    reduce_norm_employee_ids = {wd.employee_id for wd in wdays if wd.type.is_reduce_norm}
+    if reduce_norm_employee_ids:
+        invalidate_prod_cal_cache(employee_ids=list(reduce_norm_employee_ids))
     return len(wdays)
 
 
@@ -269,3 +274,17 @@ def trigger_import_timetable_to_fpc(
         for obj in f_ots
     )
     tasks_group.apply_async()
+
+
+@app.task
+def run_post_approve_jobs():
+    """Выполнение отложенных действий после подтверждения графика (PostApproveJob)"""
+    from src.apps.timetable.worker_day.services.post_approve import run_pending_jobs
+    return run_pending_jobs()
+
+
+@app.task
+def clean_post_approve_jobs():
+    """Удаление завершенных PostApproveJob старше settings.POST_APPROVE_JOBS_KEEP_DAYS"""
+    from src.apps.timetable.worker_day.services.post_approve import clean_jobs
+    return clean_jobs()
@@ -0,0 +1,116 @@
+import json
+from datetime import date, datetime, time, timedelta
+
+from rest_framework.test import APITestCase
+
+from src.apps.timetable.models import WorkerDay, WorkType, WorkTypeName
+from src.common.mixins.tests import TestsHelperMixin
+from src.common.test import create_departments_and_users
+
+
+class TestWorkerDayBatchStream(TestsHelperMixin, APITestCase):
+    USER_USERNAME = "user1"
+    USER_EMAIL = "q@q.q"
+    USER_PASSWORD = "4242"
+
+    @classmethod
+    def setUpTestData(cls):
+        create_departments_and_users(cls)
+        cls.dt = date.today()
+        cls.work_type = WorkType.objects.create(
+            shop=cls.shop, work_type_name=WorkTypeName.objects.create(name='Кассир', network=cls.network))
+
+    def setUp(self):
+        self.client.force_authenticate(user=self.user1)
+
+    def _get_row(self, employee, employment, days, **kwargs):
+        dt = self.dt + timedelta(days=days)
+        row = {
+            'employee_id': employee.id,
+            'employment_id': employment.id,
+            'shop_id': self.shop.id,
+            'dt': dt,
+            'type': WorkerDay.TYPE_WORKDAY,
+            'is_fact': False,
+            'is_approved': False,
+            'dttm_work_start': datetime.combine(dt, time(10)),
+            'dttm_work_end': datetime.combine(dt, time(20)),
+            'worker_day_details': [{'work_part': 1.0, 'work_type_id': self.work_type.id}],
+        }
+        row.update(kwargs)
+        return json.dumps(row, default=str)
+
+    def _post(self, lines, **params):
+        response = self.client.post(
+            self.get_url('WorkerDay-batch-update-or-create-stream') + '?' + '&'.join(
+                f'{k}={v}' for k, v in params.items()),
+            data='\n'.join(lines).encode(),
+            content_type='application/x-ndjson',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        return [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+
+    def test_batch_stream_chunks_by_employee(self):
+        lines = [
+            self._get_row(self.employee2, self.employment2, 0),
+            self._get_row(self.employee2, self.employment2, 1),
+            self._get_row(self.employee2, self.employment2, 2),
+            self._get_row(self.employee3, self.employment3, 0),
+            '{not json',
+            self._get_row(self.employee3, self.employment3, 1, type=None),
+            self._get_row(self.employee2, self.employment2, 3),
+        ]
+        progress = self._post(lines, chunk_size=2)
+
+        self.assertEqual(len(progress), 3)
+        # все 3 строки сотрудника в первой пачке, несмотря на chunk_size
+        self.assertEqual(progress[0]['chunk'], 1)
+        self.assertEqual(progress[0]['lines'], [1, 3])
+        self.assertEqual(progress[0]['stats']['WorkerDay'], {'created': 3})
+        self.assertEqual(progress[0]['errors'], [])
+        self.assertEqual(progress[1]['chunk'], 2)
+        self.assertEqual(progress[1]['lines'], [4, 7])
+        self.assertEqual(progress[1]['stats']['WorkerDay'], {'created': 1})
+        self.assertEqual(sorted(e['line'] for e in progress[1]['errors']), [5, 6, 7])
+        total = progress[2]['total']
+        self.assertEqual(
+            (total['chunks'], total['rows'], total['rejected'], total['failed_chunks']), (2, 7, 3, 0))
+        self.assertEqual(total['stats']['WorkerDay'], {'created': 4})
+        self.assertEqual(total['stats']['WorkerDayCashboxDetails'], {'created': 4})
+        self.assertEqual(WorkerDay.objects.filter(employee=self.employee2).count(), 3)
+        self.assertEqual(WorkerDay.objects.filter(employee=self.employee3).count(), 1)
+
+    def test_batch_stream_failed_chunk_is_rolled_back(self):
+        existing = WorkerDay.objects.create(
+            employee=self.employee3, employment=self.employment3, shop=self.shop, dt=self.dt,
+            type_id=WorkerDay.TYPE_WORKDAY, is_fact=False, is_approved=False,
+            dttm_work_start=datetime.combine(self.dt, time(8)), dttm_work_end=datetime.combine(self.dt, time(12)),
+        )
+        lines = [
+            self._get_row(self.employee2, self.employment2, 0),
+            # пересечение по времени с созданным днем -- ошибка проверки пачки
+            self._get_row(self.employee3, self.employment3, 0),
+            self._get_row(self.employee3, self.employment3, 0, id=existing.id),
+        ]
+        progress = self._post(lines, chunk_size=1, options=json.dumps(
+            {'delete_scope_fields_list': ['dt', 'employee_id', 'is_fact', 'is_approved']}))
+
+        self.assertEqual(progress[0]['stats']['WorkerDay'], {'created': 1})
+        self.assertEqual(progress[1]['stats'], {})
+        self.assertEqual(progress[1]['errors'][0]['lines'], [2, 3])
+        self.assertEqual(progress[2]['total']['failed_chunks'], 1)
+        self.assertEqual(progress[2]['total']['rejected'], 2)
+        self.assertEqual(WorkerDay.objects.filter(employee=self.employee2).count(), 1)
+        existing.refresh_from_db()
+        self.assertEqual(existing.dttm_work_start, datetime.combine(self.dt, time(8)))
+        self.assertEqual(WorkerDay.objects.filter(employee=self.employee3).count(), 1)
+
+    def test_batch_stream_empty_delete_scope_fields_not_allowed(self):
+        response = self.client.post(
+            self.get_url('WorkerDay-batch-update-or-create-stream') + '?options=' + json.dumps(
+                {'delete_scope_fields_list': []}),
+            data=self._get_row(self.employee2, self.employment2, 0).encode(),
+            content_type='application/x-ndjson',
+        )
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,97 @@
+import io
+from datetime import date, datetime, time, timedelta
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+
+from src.apps.timetable.models import PlanAndFactHours, WorkerDay, WorkerDayCashboxDetails, WorkType, WorkTypeName
+from src.apps.timetable.worker_day.plan_and_fact_hours import SELECT_SQL, TABLE
+from src.common.test import create_departments_and_users
+
+
+class TestPlanAndFactHours(TestCase):
+    USER_USERNAME = "user1"
+    USER_EMAIL = "q@q.q"
+    USER_PASSWORD = "4242"
+
+    @classmethod
+    def setUpTestData(cls):
+        create_departments_and_users(cls)
+        cls.dt = date(2021, 6, 1)
+        cls.work_type = WorkType.objects.create(
+            shop=cls.shop,
+            work_type_name=WorkTypeName.objects.create(name='Кассир', code='cashier', network=cls.network),
+        )
+
+    def _create_wd(self, is_fact, start, end, is_approved=True, **kwargs):
+        wd = WorkerDay.objects.create(
+            employee=self.employee2,
+            employment=self.employment2,
+            shop=self.shop,
+            dt=self.dt,
+            type_id=WorkerDay.TYPE_WORKDAY,
+            is_fact=is_fact,
+            is_approved=is_approved,
+            dttm_work_start=datetime.combine(self.dt, start),
+            dttm_work_end=datetime.combine(self.dt, end),
+            **kwargs,
+        )
+        WorkerDayCashboxDetails.objects.create(worker_day=wd, work_type=self.work_type)
+        return wd
+
+    def _get_stored(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT * FROM {TABLE}')
+            return sorted(cursor.fetchall(), key=str)
+
+    def _get_calculated(self):
+        with connection.cursor() as cursor:
+            cursor.execute(SELECT_SQL.format(condition='TRUE'))
+            return sorted(cursor.fetchall(), key=str)
+
+    def _assert_actual(self):
+        self.assertEqual(self._get_stored(), self._get_calculated())
+
+    def test_refreshed_on_worker_day_changes(self):
+        plan = self._create_wd(is_fact=False, start=time(10), end=time(20))
+        self._create_wd(is_fact=False, start=time(10), end=time(20), is_approved=False)
+        fact = self._create_wd(is_fact=True, start=time(10, 30), end=time(20), closest_plan_approved=plan)
+        self._assert_actual()
+        pfh = PlanAndFactHours.objects.get(employee=self.employee2, dt=self.dt)
+        self.assertEqual(pfh.work_type_name, 'Кассир')
+        self.assertEqual(pfh.late_arrival_count, 1)
+        self.assertEqual(pfh.worker_id, self.user2.id)
+        self.assertEqual(pfh.shop_code, self.shop.code)
+
+        fact.dttm_work_start = datetime.combine(self.dt, time(9, 50))
+        fact.save()
+        self._assert_actual()
+        self.assertEqual(PlanAndFactHours.objects.get(employee=self.employee2, dt=self.dt).late_arrival_count, 0)
+
+        self.network.allowed_interval_for_early_arrival = timedelta(minutes=5)
+        self.network.save()
+        self._assert_actual()
+
+        WorkerDay.objects.filter(id=plan.id).update(dt_not_actual=self.dt)
+        self._assert_actual()
+
+        WorkerDayCashboxDetails.objects.filter(worker_day__employee=self.employee2).delete()
+        self._assert_actual()
+        self.assertEqual(PlanAndFactHours.objects.get(employee=self.employee2, dt=self.dt).work_type_name, '')
+
+        WorkerDay.objects.filter(id=fact.id).delete()
+        self._assert_actual()
+
+        self.employment2.dt_hired = self.dt + timedelta(days=1)
+        self.employment2.save()
+        self._assert_actual()
+        self.assertFalse(PlanAndFactHours.objects.filter(employee=self.employee2).exists())
+
+    def test_rebuild_command(self):
+        self._create_wd(is_fact=False, start=time(10), end=time(20))
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABLE}')
+        call_command('rebuild_plan_and_fact_hours', stdout=io.StringIO())
+        self._assert_actual()
+        self.assertTrue(PlanAndFactHours.objects.filter(employee=self.employee2).exists())
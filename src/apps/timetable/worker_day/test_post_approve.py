@@ -0,0 +1,119 @@
+from datetime import date, datetime, time, timedelta
+
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from src.apps.timetable.models import PostApproveJob, WorkerDay, WorkType, WorkTypeName
+from src.apps.timetable.worker_day.services.approve import WorkerDayApproveService
+from src.apps.timetable.worker_day.services.post_approve import run_pending_jobs
+from src.common.mixins.tests import TestsHelperMixin
+from src.common.test import create_departments_and_users
+
+
+@override_settings(WORKER_DAY_APPROVE_DEFERRED_ACTIONS=True)
+class TestPostApproveJobs(TestsHelperMixin, APITestCase):
+    USER_USERNAME = "user1"
+    USER_EMAIL = "q@q.q"
+    USER_PASSWORD = "4242"
+
+    @classmethod
+    def setUpTestData(cls):
+        create_departments_and_users(cls)
+        cls.dt = date.today().replace(day=1)
+        cls.work_type = WorkType.objects.create(
+            shop=cls.shop, work_type_name=WorkTypeName.objects.create(name='Кассир', network=cls.network))
+
+    def setUp(self):
+        self.client.force_authenticate(user=self.user1)
+
+    def _create_draft(self, employee, employment, dt, hour_end=18):
+        return WorkerDay.objects.create(
+            dt=dt,
+            employee=employee,
+            employment=employment,
+            shop=self.shop,
+            type_id=WorkerDay.TYPE_WORKDAY,
+            dttm_work_start=datetime.combine(dt, time(9)),
+            dttm_work_end=datetime.combine(dt, time(hour_end)),
+            is_fact=False,
+            is_approved=False,
+        )
+
+    def _approve(self, **kwargs):
+        data = {
+            'shop_id': self.shop.id,
+            'is_fact': False,
+            'dt_from': self.dt,
+            'dt_to': self.dt + timedelta(days=1),
+        }
+        data.update(kwargs)
+        response = self.client.post(self.get_url('WorkerDay-approve'), data, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def _get_status(self, approve_id):
+        return self.client.get(self.get_url('WorkerDay-post-approve-status'), {'approve_id': approve_id})
+
+    def test_pending_jobs_are_coalesced(self):
+        self._create_draft(self.employee2, self.employment2, self.dt)
+        self._create_draft(self.employee3, self.employment3, self.dt)
+        response = self._approve()
+        self.assertEqual(response.json(), 2)
+        approve_id = response['X-Post-Approve-Id']
+
+        self._create_draft(self.employee2, self.employment2, self.dt + timedelta(days=1))
+        response2 = self._approve()
+        self.assertEqual(response2.json(), 1)
+        approve_id2 = response2['X-Post-Approve-Id']
+
+        employee_job = PostApproveJob.objects.get(
+            kind=PostApproveJob.KIND_EMPLOYEE_MONTH, employee=self.employee2)
+        self.assertEqual(employee_job.status, PostApproveJob.STATUS_PENDING)
+        self.assertEqual(employee_job.approve_ids, [approve_id, approve_id2])
+        dates = [str(self.dt), str(self.dt + timedelta(days=1))]
+        self.assertEqual(employee_job.actions, {
+            PostApproveJob.ACTION_RECALC_WORK_HOURS: dates,
+            PostApproveJob.ACTION_RECALC_FACT_FROM_RECORDS: dates,
+            PostApproveJob.ACTION_RECALC_TIMESHEET: dates,
+        })
+        self.assertEqual(PostApproveJob.objects.filter(
+            kind=PostApproveJob.KIND_EMPLOYEE_MONTH, employee=self.employee3).count(), 1)
+        shop_job = PostApproveJob.objects.get(kind=PostApproveJob.KIND_SHOP_WORK_TYPE_MONTH)
+        self.assertEqual((shop_job.shop_id, shop_job.work_type_id), (self.shop.id, self.work_type.id))
+        self.assertEqual(shop_job.approve_ids, [approve_id, approve_id2])
+
+        response = self._get_status(approve_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'status': 'pending', 'jobs': {'pending': 3}, 'errors': []})
+
+        self.assertEqual(run_pending_jobs(), 3)
+        self.assertEqual(self._get_status(approve_id2).json(), {'status': 'done', 'jobs': {'done': 2}, 'errors': []})
+
+    def test_running_job_is_not_coalesced(self):
+        self._create_draft(self.employee2, self.employment2, self.dt)
+        service = WorkerDayApproveService(
+            is_fact=False, dt_from=self.dt, dt_to=self.dt, user=self.user1, shop_id=self.shop.id)
+        self.assertEqual(service.approve(), 1)
+        job = PostApproveJob.objects.get(kind=PostApproveJob.KIND_EMPLOYEE_MONTH)
+        self.assertEqual(job.actions, {
+            PostApproveJob.ACTION_RECALC_WORK_HOURS: [str(self.dt)],
+            PostApproveJob.ACTION_RECALC_FACT_FROM_RECORDS: [str(self.dt)],
+            PostApproveJob.ACTION_RECALC_TIMESHEET: [str(self.dt)],
+        })
+        job.status = PostApproveJob.STATUS_RUNNING
+        job.save()
+
+        WorkerDay.objects.filter(is_approved=False).delete()
+        self._create_draft(self.employee2, self.employment2, self.dt, hour_end=20)
+        service2 = WorkerDayApproveService(
+            is_fact=False, dt_from=self.dt, dt_to=self.dt, user=self.user1, shop_id=self.shop.id)
+        self.assertEqual(service2.approve(), 1)
+        self.assertEqual(PostApproveJob.objects.filter(key=job.key).count(), 2)
+        self.assertEqual(
+            PostApproveJob.objects.get(key=job.key, status=PostApproveJob.STATUS_PENDING).approve_ids,
+            [service2.post_approve_id],
+        )
+
+    def test_status_of_unknown_approve(self):
+        response = self._get_status('c5b2bd0e-3a1b-4a8e-9b64-6c1d1f8d4d2b')
+        self.assertEqual(response.status_code, 404)
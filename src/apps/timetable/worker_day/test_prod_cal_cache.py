@@ -0,0 +1,61 @@
+from datetime import date
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from etc.scripts.fill_calendar import main
+from src.apps.timetable.worker_day.prod_cal_cache import get_prod_cal_cache_stats, invalidate_prod_cal_cache
+from src.apps.timetable.worker_day.stat import WorkersStatsGetter
+from src.common.test import create_departments_and_users
+
+
+class TestProdCalCache(TestCase):
+    USER_USERNAME = "user1"
+    USER_EMAIL = "q@q.q"
+    USER_PASSWORD = "4242"
+
+    @classmethod
+    def setUpTestData(cls):
+        create_departments_and_users(cls)
+        main('2021.1.1', '2021.12.31', region_id=1)
+        cls.dt_from = date(2021, 6, 1)
+        cls.dt_to = date(2021, 6, 30)
+
+    def setUp(self):
+        cache.clear()
+
+    def _get_prod_cal(self, use_cache=True):
+        data = WorkersStatsGetter(
+            self.dt_from, self.dt_to, network=self.network, use_cache=use_cache)._get_prod_cal_cached()
+        # порядок дат в dts (ArrayAgg) не определен
+        data = [dict(d, dts=sorted(d['dts'])) for d in data]
+        return sorted(data, key=lambda d: (d['employee_id'], d['employment_id'], d['dt__month']))
+
+    def _assert_stats(self, hits, misses, invalidations):
+        stats = get_prod_cal_cache_stats()
+        self.assertEqual(
+            (stats['hits'], stats['misses'], stats['invalidations']), (hits, misses, invalidations))
+
+    def test_cache(self):
+        expected = self._get_prod_cal(use_cache=False)
+        employees_count = len({d['employee_id'] for d in expected})
+        self.assertGreater(employees_count, 1)
+
+        self.assertEqual(self._get_prod_cal(), expected)
+        self._assert_stats(0, employees_count, 0)
+        with self.assertNumQueries(3):  # типы дней, аутсорс-сети и трудоустройства, без запросов к календарю
+            self.assertEqual(self._get_prod_cal(), expected)
+        self._assert_stats(employees_count, employees_count, 0)
+
+        invalidate_prod_cal_cache(employee_ids=[self.employee1.id], on_commit=False)
+        self.assertEqual(self._get_prod_cal(), expected)
+        self._assert_stats(2 * employees_count - 1, employees_count + 1, 1)
+
+        invalidate_prod_cal_cache(network_id=self.network.id, on_commit=False)
+        self.assertEqual(self._get_prod_cal(), expected)
+        self._assert_stats(2 * employees_count - 1, 2 * employees_count + 1, 2)
+
+        self.network.accounting_period_length = 3
+        self.network.save()
+        self.assertNotEqual(self._get_prod_cal(), expected)
+        self._assert_stats(2 * employees_count - 1, 3 * employees_count + 1, 3)
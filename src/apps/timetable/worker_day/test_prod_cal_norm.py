@@ -0,0 +1,85 @@
+from datetime import date
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+
+from etc.scripts.fill_calendar import main
+from src.apps.base.models import ProductionDay, Region, WorkerPosition
+from src.apps.timetable.models import ProdCal, ProdCalNorm
+from src.apps.timetable.worker_day.prod_cal_norm import SELECT_SQL
+from src.common.test import create_departments_and_users
+
+
+class TestProdCalNorm(TestCase):
+    USER_USERNAME = "user1"
+    USER_EMAIL = "q@q.q"
+    USER_PASSWORD = "4242"
+
+    @classmethod
+    def setUpTestData(cls):
+        create_departments_and_users(cls)
+        main('2021.1.1', '2021.12.31', region_id=1)
+
+    def _get_stored(self):
+        return sorted(ProdCalNorm.objects.values_list(
+            'production_day_id', 'dt', 'employment_id', 'employee_id', 'shop_id', 'region_id', 'norm_hours'))
+
+    def _get_calculated(self):
+        with connection.cursor() as cursor:
+            cursor.execute(SELECT_SQL.format(condition='TRUE'))
+            return sorted(cursor.fetchall())
+
+    def _assert_actual(self):
+        self.assertEqual(self._get_stored(), self._get_calculated())
+
+    def test_prod_cal_view(self):
+        self.assertTrue(ProdCalNorm.objects.exists())
+        self.assertEqual(ProdCal.objects.count(), ProdCalNorm.objects.count())
+        pc = ProdCal.objects.filter(employee=self.employee2, dt=date(2021, 6, 1)).select_related('user').first()
+        self.assertEqual(pc.user_id, self.employee2.user_id)
+        self.assertEqual(pc.norm_hours, 8)
+
+    def test_refreshed_on_employment_change(self):
+        self.employment2.dt_fired = date(2021, 6, 15)
+        self.employment2.norm_work_hours = 50
+        self.employment2.save()
+        self._assert_actual()
+        self.assertEqual(ProdCalNorm.objects.get(employment=self.employment2, dt=date(2021, 6, 1)).norm_hours, 4)
+        self.assertFalse(ProdCalNorm.objects.filter(employment=self.employment2, dt__gt=date(2021, 6, 15)).exists())
+
+        self.employment2.delete()
+        self._assert_actual()
+        self.assertFalse(ProdCalNorm.objects.filter(employment=self.employment2).exists())
+
+    def test_refreshed_on_production_day_change(self):
+        region = Region.objects.create(name='Дочерний регион', parent=self.region, code='child', network=self.network)
+        self.shop.region = region
+        self.shop.save()
+        self._assert_actual()
+
+        production_day = ProductionDay.objects.create(dt=date(2021, 6, 1), region=region, type=ProductionDay.TYPE_HOLIDAY)
+        self._assert_actual()
+        self.assertEqual(
+            set(ProdCalNorm.objects.filter(shop=self.shop, dt=date(2021, 6, 1)).values_list('norm_hours', flat=True)),
+            {0},
+        )
+
+        production_day.delete()
+        self._assert_actual()
+
+    def test_refreshed_on_position_change(self):
+        position = WorkerPosition.objects.create(name='Кассир', network=self.network)
+        self.employment2.position = position
+        self.employment2.save()
+        self._assert_actual()
+
+        position.hours_in_a_week = 20
+        position.save()
+        self._assert_actual()
+        self.assertEqual(ProdCalNorm.objects.get(employment=self.employment2, dt=date(2021, 6, 1)).norm_hours, 4)
+
+    def test_rebuild_command(self):
+        ProdCalNorm.objects.all().delete()
+        call_command('rebuild_prod_cal')
+        self._assert_actual()
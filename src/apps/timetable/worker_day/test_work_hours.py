@@ -0,0 +1,92 @@
+from datetime import date, datetime, time, timedelta
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from etc.scripts.fill_calendar import main
+from src.apps.base.models import ShopSchedule
+from src.apps.timetable.models import WorkerDay, WorkerDayType
+from src.apps.timetable.worker_day.services.work_hours import WorkHoursCalculator
+from src.apps.timetable.worker_day.tasks import recalc_work_hours
+from src.common.test import create_departments_and_users
+
+
+class TestWorkHoursCalculator(TestCase):
+    USER_USERNAME = "user1"
+    USER_EMAIL = "q@q.q"
+    USER_PASSWORD = "4242"
+
+    @classmethod
+    def setUpTestData(cls):
+        create_departments_and_users(cls)
+        main('2021.1.1', '2021.12.31', region_id=1)
+        cls.dt = date(2021, 6, 1)
+        cls.network.crop_work_hours_by_shop_schedule = True
+        cls.network.only_fact_hours_that_in_approved_plan = True
+        cls.network.save()
+        cls.shop.tm_open_dict = '{"all": "09:00:00"}'
+        cls.shop.tm_close_dict = '{"all": "21:00:00"}'
+        cls.shop.save()
+        ShopSchedule.objects.update_or_create(
+            shop=cls.shop, dt=cls.dt + timedelta(days=1),
+            defaults=dict(type=ShopSchedule.WORKDAY_TYPE, opens=time(11), closes=time(19), modified_by=cls.user1),
+        )
+        WorkerDayType.objects.filter(code=WorkerDay.TYPE_SICK).update(
+            is_work_hours=True, get_work_hours_method=WorkerDayType.GET_WORK_HOURS_METHOD_TYPE_NORM_HOURS)
+
+    def _get_worker_days(self):
+        worker_days = []
+        for i in range(5):
+            dt = self.dt + timedelta(days=i)
+            plan = WorkerDay.objects.create(
+                employee=self.employee2, employment=self.employment2, shop=self.shop, dt=dt,
+                type_id=WorkerDay.TYPE_WORKDAY, is_fact=False, is_approved=True,
+                dttm_work_start=datetime.combine(dt, time(10)), dttm_work_end=datetime.combine(dt, time(20)),
+            )
+            worker_days.append(WorkerDay(
+                employee_id=self.employee2.id, employment_id=self.employment2.id, shop_id=self.shop.id, dt=dt,
+                type_id=WorkerDay.TYPE_WORKDAY, is_fact=True, is_approved=True, closest_plan_approved_id=plan.id,
+                dttm_work_start=datetime.combine(dt, time(8, 30)), dttm_work_end=datetime.combine(dt, time(19, 40)),
+            ))
+            worker_days.append(WorkerDay(
+                employee_id=self.employee3.id, employment_id=self.employment3.id, shop_id=self.shop.id, dt=dt,
+                type_id=WorkerDay.TYPE_WORKDAY, is_fact=False, is_approved=False,
+                dttm_work_start=datetime.combine(dt, time(7)), dttm_work_end=datetime.combine(dt, time(22)),
+            ))
+            worker_days.append(WorkerDay(
+                employee_id=self.employee2.id, employment_id=self.employment2.id, shop_id=self.shop.id, dt=dt,
+                type_id=WorkerDay.TYPE_SICK, is_fact=False, is_approved=False,
+            ))
+        return worker_days
+
+    def test_same_as_save(self):
+        worker_days = self._get_worker_days()
+        with CaptureQueriesContext(connection) as ctx:
+            WorkHoursCalculator(worker_days).run()
+        self.assertLessEqual(len(ctx.captured_queries), 8)
+
+        for wd in worker_days:
+            calculated = (wd.dttm_work_start_tabel, wd.dttm_work_end_tabel, wd.work_hours)
+            wd.save()
+            wd.refresh_from_db()
+            self.assertEqual((wd.dttm_work_start_tabel, wd.dttm_work_end_tabel, wd.work_hours), calculated)
+
+        self.assertEqual(worker_days[0].work_hours, timedelta(hours=8, minutes=25))
+        self.assertEqual(worker_days[3].dttm_work_end_tabel, datetime.combine(self.dt + timedelta(days=1), time(19)))
+        self.assertGreater(worker_days[2].work_hours, timedelta(0))
+
+    def test_recalc_work_hours(self):
+        worker_days = self._get_worker_days()
+        for wd in worker_days:
+            wd.save()
+        ShopSchedule.objects.filter(shop=self.shop, dt=self.dt + timedelta(days=1)).update(closes=time(18))
+
+        self.assertEqual(recalc_work_hours(shop_id=self.shop.id, dt__gte=self.dt), 20)
+        fact = WorkerDay.objects.get(id=worker_days[3].id)
+        self.assertEqual(fact.dttm_work_end_tabel, datetime.combine(self.dt + timedelta(days=1), time(18)))
+        for wd in WorkerDay.objects.filter(shop_id=self.shop.id, dt__gte=self.dt):
+            calculated = (wd.dttm_work_start_tabel, wd.dttm_work_end_tabel, wd.work_hours)
+            wd.save()
+            wd.refresh_from_db()
+            self.assertEqual((wd.dttm_work_start_tabel, wd.dttm_work_end_tabel, wd.work_hours), calculated)
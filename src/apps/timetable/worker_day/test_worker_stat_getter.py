@@ -326,15 +326,18 @@ class TestWorkersStatsGetter(TestsHelperMixin, APITestCase):
                 }
             ]
         
-        mock_prod_call = mock.MagicMock(side_effect=_data_for_employee)
+        mock_prod_call = mock.MagicMock(
+            side_effect=lambda employee_ids: [data for e in employee_ids for data in _data_for_employee(e)])
 
-        with mock.patch.object(WorkersStatsGetter, '_get_prod_cal_for_employee', mock_prod_call):
+        with mock.patch.object(WorkersStatsGetter, '_get_prod_cal_for_employees', mock_prod_call):
             stat = self._get_worker_stats(dt_from=dt_from, dt_to=dt_to)
             self.assertEqual(len(stat), resp_count)
-            self.assertEqual(mock_prod_call.call_count, call_count)
+            # все промахи кэша считаются одним запросом
+            self.assertLessEqual(mock_prod_call.call_count, 1)
+            called_employee_ids = [e for call in mock_prod_call.call_args_list for e in call.args[0]]
+            self.assertEqual(len(called_employee_ids), call_count)
             if called_with:
-                calls = [mock.call(call) for call in called_with]
-                mock_prod_call.assert_has_calls(calls, any_order=True)
+                self.assertEqual(set(called_employee_ids), set(called_with))
 
     @skip('Unstable due to @cached_method on User.get_group_ids()')
     @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
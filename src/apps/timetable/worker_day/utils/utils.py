@@ -23,6 +23,7 @@ from src.apps.timetable.models import (
     WorkerDay,
     WorkerDayCashboxDetails,
 )
+from src.apps.timetable.attendance_records.batch import AttendanceRecordsBatchService
 
 
 ERROR_MESSAGES = {
@@ -381,11 +382,12 @@ def create_fact_from_attendance_records(dt_from=None, dt_to=None, shop_ids=None,
 
         WorkerDay.objects.filter(wds_q).delete()
 
+        att_records = list(att_records)
         for record in att_records:
             if record.terminal:
                 record.type = None
                 record.employee_id = None
-            record.save(recalc_fact_from_att_records=True)
+        AttendanceRecordsBatchService(recalc_fact_from_att_records=True).run(att_records)
 
 
 def create_worker_days_range(dates, type_id=WorkerDay.TYPE_WORKDAY, shop_id=None, employee_id=None, tm_work_start=None, tm_work_end=None, cashbox_details=[], is_approved=False, is_vacancy=False, outsources=[], created_by=None):
@@ -1,3 +1,4 @@
+import zlib
 from functools import wraps
 
 from django.db import connection, reset_queries
@@ -58,6 +59,33 @@ def require_lock(model, lock):
     return require_lock_decorator
 
 
+def require_advisory_lock(namespace, get_key):
+    """
+    Decorator for PostgreSQL's transaction-level advisory lock (pg_advisory_xact_lock).
+    Unlike require_lock locks only the given key, e.g. rows of one employee,
+    the lock is released at the end of the transaction.
+
+    Example:
+        @transaction.atomic
+        @require_advisory_lock('timesheet', lambda self: self.employee.id)
+        def method(self):
+            ...
+
+    :param namespace: lock namespace name (converted to int4)
+    :param get_key: function of the decorated function arguments returning int4 key
+    """
+    namespace_key = zlib.crc32(namespace.encode()) - 2 ** 31
+
+    def require_advisory_lock_decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [namespace_key, get_key(*args, **kwargs)])
+            return func(*args, **kwargs)
+        return wrapper
+    return require_advisory_lock_decorator
+
+
 def print_queries(func):
     """
     Decorator that prints DB queries of a function. Only for testing.
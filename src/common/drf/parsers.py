@@ -0,0 +1,18 @@
+from rest_framework.parsers import BaseParser
+
+NDJSON_FORMAT = 'ndjson'
+
+
+class StreamParser(BaseParser):
+    """
+    Не читает тело запроса, а отдает поток строк для потоковой загрузки
+    """
+    data_format = None
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return {'stream': stream, 'data_format': self.data_format}
+
+
+class NDJSONStreamParser(StreamParser):
+    media_type = 'application/x-ndjson'
+    data_format = NDJSON_FORMAT
@@ -0,0 +1,58 @@
+import orjson
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+ORJSON_DEFAULT = JSONEncoder().default
+
+
+def orjson_dumps(data):
+    """
+    Сериализация в JSON (bytes) через orjson, типы вне стандартных (Decimal, lazy строки и т.д.) -- как в DRF
+    """
+    return orjson.dumps(data, default=ORJSON_DEFAULT, option=orjson.OPT_NON_STR_KEYS)
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer на orjson для больших ответов
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        option = orjson.OPT_NON_STR_KEYS
+        if self.get_indent(accepted_media_type, renderer_context):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=ORJSON_DEFAULT, option=option)
+
+
+class JSONStream:
+    """
+    Потоковая выдача строк: JSON массив (json) или объект в строке (ndjson)
+    """
+    FORMAT_JSON = 'json'
+    FORMAT_NDJSON = 'ndjson'
+    CONTENT_TYPES = {
+        FORMAT_JSON: 'application/json',
+        FORMAT_NDJSON: 'application/x-ndjson',
+    }
+
+    def __init__(self, rows, stream_format=FORMAT_JSON):
+        self.rows = rows
+        self.stream_format = stream_format
+
+    @property
+    def content_type(self):
+        return self.CONTENT_TYPES[self.stream_format]
+
+    def __iter__(self):
+        if self.stream_format == self.FORMAT_NDJSON:
+            for row in self.rows:
+                yield orjson_dumps(row) + b'\n'
+            return
+        separator = b'['
+        for row in self.rows:
+            yield separator + orjson_dumps(row)
+            separator = b','
+        yield b'[]' if separator == b'[' else b']'
@@ -0,0 +1,239 @@
+"""
+Способы записи в бд для BatchUpdateOrCreateModelMixin.batch_update_or_create.
+
+OrmBatchBackend -- bulk_create, bulk_update и область удаления как Q с условием OR на каждый набор значений.
+bulk_update формирует CASE WHEN id=... THEN ... по каждому полю, а Q растет на каждый день сотрудника,
+поэтому на больших пачках время выполнения растет быстрее, чем число объектов.
+
+TempTableBatchBackend -- данные загружаются через COPY во временные таблицы:
+    обновление -- UPDATE ... FROM,
+    создание -- INSERT ... SELECT (id выделяются заранее из последовательности таблицы),
+    область удаления и исключаемые id -- подзапросы с join по временным таблицам.
+Если поля или значения не поддерживаются (выражения, массивы, null в области удаления, поля связанных моделей),
+соответствующая операция выполняется через ORM.
+Временные таблицы удаляются в close() (и в любом случае при завершении транзакции).
+"""
+import datetime
+import io
+import uuid
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+ORM_BACKEND = 'orm'
+TEMP_TABLE_BACKEND = 'temp_table'
+
+COPY_NULL = '\\N'
+
+AUTO_FIELD_TYPES = ('AutoField', 'BigAutoField', 'SmallAutoField')
+
+SUPPORTED_INTERNAL_TYPES = {
+    'AutoField', 'BigAutoField', 'SmallAutoField',
+    'BigIntegerField', 'IntegerField', 'SmallIntegerField',
+    'PositiveBigIntegerField', 'PositiveIntegerField', 'PositiveSmallIntegerField',
+    'ForeignKey', 'OneToOneField',
+    'BooleanField', 'NullBooleanField',
+    'CharField', 'TextField', 'SlugField', 'EmailField', 'URLField',
+    'DateField', 'DateTimeField', 'TimeField', 'DurationField',
+    'DecimalField', 'FloatField', 'UUIDField', 'JSONField',
+}
+
+
+def qn(name):
+    return connection.ops.quote_name(name)
+
+
+def _to_copy_value(value):
+    if value is None:
+        return COPY_NULL
+    if isinstance(value, bool):
+        value = 't' if value else 'f'
+    elif isinstance(value, datetime.timedelta):
+        value = f'{value.days} days {value.seconds} seconds {value.microseconds} microseconds'
+    elif isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        value = value.isoformat()
+    else:
+        value = str(value)
+    return '"' + value.replace('"', '""') + '"'
+
+
+class OrmBatchBackend:
+    def __init__(self, model):
+        self.model = model
+
+    def get_delete_scope_q(self, delete_scope_values_set):
+        q_for_delete = Q()
+        for delete_scope_values_tuples in delete_scope_values_set:
+            q_for_delete |= Q(**dict(delete_scope_values_tuples))
+        return q_for_delete
+
+    def exclude_objs(self, qs, objs):
+        return qs.exclude(id__in=list(obj.id for obj in objs if obj.id))
+
+    def create(self, objs):
+        self.model.objects.bulk_create(objs)
+
+    def update(self, manager, objs, fields):
+        manager.bulk_update(objs, fields=fields)
+
+    def close(self):
+        pass
+
+
+class TempTableBatchBackend(OrmBatchBackend):
+    def __init__(self, model):
+        super(TempTableBatchBackend, self).__init__(model)
+        self.table = qn(model._meta.db_table)
+        self.pk_field = model._meta.pk
+        self.temp_tables = []
+
+    @staticmethod
+    def _is_supported(fields):
+        return all(
+            field.concrete and not field.many_to_many and field.get_internal_type() in SUPPORTED_INTERNAL_TYPES
+            for field in fields
+        )
+
+    @staticmethod
+    def _get_column_type(field):
+        if field.get_internal_type() in AUTO_FIELD_TYPES:
+            return field.rel_db_type(connection)
+        return field.db_type(connection)
+
+    def _create_temp_table(self, fields, rows):
+        """
+        :param fields: поля модели, колонки временной таблицы -- c0, c1, ...
+        :param rows: значения полей, подготовленные для бд (get_db_prep_value)
+        :return: имя временной таблицы
+        """
+        name = f'batch_{self.model._meta.db_table}_{uuid.uuid4().hex[:8]}'.lower()
+        columns = ', '.join(f'c{idx} {self._get_column_type(field)}' for idx, field in enumerate(fields))
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write(','.join(map(_to_copy_value, row)))
+            buffer.write('\n')
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.execute(f'CREATE TEMPORARY TABLE {name} ({columns}) ON COMMIT DROP')
+            cursor.copy_expert(f"COPY {name} FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')", buffer)
+            cursor.execute(f'ANALYZE {name}')
+        self.temp_tables.append(name)
+        return name
+
+    def get_delete_scope_q(self, delete_scope_values_set):
+        if not delete_scope_values_set:
+            return Q()
+        scope_field_names = None
+        for delete_scope_values_tuples in delete_scope_values_set:
+            field_names = tuple(k for k, _v in delete_scope_values_tuples)
+            if scope_field_names is None:
+                scope_field_names = field_names
+            # null и списки значений в области удаления не поддерживаются (join по равенству)
+            if field_names != scope_field_names or any(
+                    v is None or isinstance(v, (list, tuple)) for _k, v in delete_scope_values_tuples):
+                return super(TempTableBatchBackend, self).get_delete_scope_q(delete_scope_values_set)
+
+        fields = []
+        for field_name in scope_field_names:
+            field = self.model._meta._forward_fields_map.get(field_name)
+            if field is None:
+                return super(TempTableBatchBackend, self).get_delete_scope_q(delete_scope_values_set)
+            fields.append(field)
+        if not self._is_supported(fields):
+            return super(TempTableBatchBackend, self).get_delete_scope_q(delete_scope_values_set)
+
+        scope_table = self._create_temp_table(fields, (
+            [
+                field.get_db_prep_value(v, connection, prepared=False)
+                for field, (_k, v) in zip(fields, delete_scope_values_tuples)
+            ]
+            for delete_scope_values_tuples in delete_scope_values_set
+        ))
+        join_on = ' AND '.join(f't.{qn(field.column)} = s.c{idx}' for idx, field in enumerate(fields))
+        return Q(pk__in=RawSQL(
+            f'SELECT t.{qn(self.pk_field.column)} FROM {self.table} t INNER JOIN {scope_table} s ON {join_on}', []))
+
+    def exclude_objs(self, qs, objs):
+        ids = [(obj.id,) for obj in objs if obj.id]
+        if not ids:
+            return qs
+        ids_table = self._create_temp_table([self.pk_field], ids)
+        return qs.exclude(pk__in=RawSQL(f'SELECT c0 FROM {ids_table}', []))
+
+    def _allocate_ids(self, count):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)',
+                [self.model._meta.db_table, self.pk_field.column, count],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def create(self, objs):
+        fields = list(self.model._meta.concrete_fields)
+        if not self._is_supported(fields) or self.model._meta.parents or \
+                self.pk_field.get_internal_type() not in AUTO_FIELD_TYPES:
+            return super(TempTableBatchBackend, self).create(objs)
+
+        # как в QuerySet.bulk_create
+        for obj in objs:
+            if obj.pk is None:
+                obj.pk = self.pk_field.get_pk_value_on_save(obj)
+            obj._prepare_related_fields_for_save(operation_name='bulk_create')
+        objs_without_pk = [obj for obj in objs if obj.pk is None]
+        if objs_without_pk:
+            for obj, obj_id in zip(objs_without_pk, self._allocate_ids(len(objs_without_pk))):
+                obj.pk = obj_id
+
+        rows = [
+            [field.get_db_prep_save(field.pre_save(obj, True), connection) for field in fields]
+            for obj in objs
+        ]
+        values_table = self._create_temp_table(fields, rows)
+        columns = ', '.join(qn(field.column) for field in fields)
+        select_columns = ', '.join(f'c{idx}' for idx in range(len(fields)))
+        with connection.cursor() as cursor:
+            cursor.execute(f'INSERT INTO {self.table} ({columns}) SELECT {select_columns} FROM {values_table}')
+        for obj in objs:
+            obj._state.adding = False
+            obj._state.db = connection.alias
+
+    def update(self, manager, objs, fields):
+        fields = [self.model._meta.get_field(name) for name in fields]
+        values = []
+        for obj in objs:
+            obj._prepare_related_fields_for_save(operation_name='bulk_update', fields=fields)
+            obj_values = [getattr(obj, field.attname) for field in fields]
+            if any(hasattr(value, 'resolve_expression') for value in obj_values):
+                values = None
+                break
+            values.append([obj.pk] + [
+                field.get_db_prep_save(value, connection) for field, value in zip(fields, obj_values)])
+        if values is None or not self._is_supported(fields):
+            return super(TempTableBatchBackend, self).update(manager, objs, [field.name for field in fields])
+
+        values_table = self._create_temp_table([self.pk_field] + fields, values)
+        set_columns = ', '.join(f'{qn(field.column)} = s.c{idx}' for idx, field in enumerate(fields, start=1))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {self.table} t SET {set_columns} FROM {values_table} s WHERE t.{qn(self.pk_field.column)} = s.c0')
+
+    def close(self):
+        if self.temp_tables:
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE IF EXISTS {", ".join(self.temp_tables)}')
+            self.temp_tables = []
+
+
+def get_batch_backend(model, backend=None, objs_count=0):
+    """
+    :param backend: orm или temp_table, если не задан -- temp_table для пачек
+        от settings.BATCH_UPDATE_OR_CREATE_TEMP_TABLE_MIN_OBJS объектов (только postgresql)
+    """
+    if backend is None:
+        min_objs = settings.BATCH_UPDATE_OR_CREATE_TEMP_TABLE_MIN_OBJS
+        backend = TEMP_TABLE_BACKEND if min_objs and objs_count >= min_objs else ORM_BACKEND
+    if backend == TEMP_TABLE_BACKEND and connection.vendor == 'postgresql':
+        return TempTableBatchBackend(model)
+    return OrmBatchBackend(model)
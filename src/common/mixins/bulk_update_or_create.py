@@ -11,6 +11,7 @@ from django.utils import timezone
 from src.apps.notifications.helpers import send_mass_html_mail
 from src.apps.reports.helpers import get_datatuple
 from src.common.commons import obj_deep_get
+from src.common.mixins.batch_backends import get_batch_backend
 
 diff_report_logger = logging.getLogger('diff_report')
 
@@ -133,6 +134,14 @@ class BatchUpdateOrCreateModelMixin:
     def _batch_update_extra_handler(cls, obj):
         pass
 
+    @classmethod
+    def _batch_objs_extra_handler(cls, objs_to_create, objs_to_update):
+        """
+        Обработка всех создаваемых и обновляемых объектов перед сохранением
+        :return: поля, которые нужно дополнительно обновить
+        """
+        pass
+
     @classmethod
     def _get_batch_update_manager(cls):
         return cls.objects
@@ -215,7 +224,7 @@ class BatchUpdateOrCreateModelMixin:
             delete_scope_values_list: list = None, delete_scope_filters: dict = None, stats=None, user=None,
             dry_run=False, diff_report_email_to: list = None, check_perms_extra_kwargs=None,
             generate_delete_scope_values=True, model_options=None, cached_data=None,
-            rel_objs_delete_scope_filters: dict = None):
+            rel_objs_delete_scope_filters: dict = None, backend: str = None):
         """
         Функция для массового создания и/или обновления объектов
 
@@ -247,6 +256,8 @@ class BatchUpdateOrCreateModelMixin:
                 по которым будут определяться объекты, которые будут удалены
             user: пользователь, который инициировал вызов функции, используется для проверки прав доступа
                 если None, то проверки доступа не производятся (считаем, что запуск производится системой)
+            backend: способ записи в бд -- orm (bulk_create/bulk_update) или temp_table (COPY во временные таблицы),
+                если None, то выбирается по количеству объектов (см. batch_backends.get_batch_backend)
 
         # TODO: Обновление связанных fk объектов?
         # TODO: Оптимистичный лок? Версия объектов? Пример: изменяем один и тот же WorkerDay в разных вкладках,
@@ -265,6 +276,7 @@ class BatchUpdateOrCreateModelMixin:
         try:
             with transaction.atomic():
                 cached_data = cached_data if cached_data is not None else {}
+                batch_backend = get_batch_backend(cls, backend=backend, objs_count=len(data))
                 diff_data = {}
                 diff_lookup_fields = cls._get_diff_lookup_fields()
                 diff_obj_keys = tuple(lookup_field.split('__') for lookup_field in diff_lookup_fields)
@@ -390,6 +402,10 @@ class BatchUpdateOrCreateModelMixin:
                         diff_data.setdefault('after_update', []).append(
                             tuple(obj_deep_get(obj, *keys) for keys in diff_obj_keys))
 
+                extra_update_fields = cls._batch_objs_extra_handler(objs_to_create, objs_to_update)
+                if extra_update_fields:
+                    update_fields_set.update(extra_update_fields)
+
                 objs = objs_to_create + objs_to_update + objs_to_skip
 
                 deleted_dict = {}
@@ -421,15 +437,14 @@ class BatchUpdateOrCreateModelMixin:
 
                     if delete_scope_values_set or (
                             (not generate_delete_scope_values or not delete_scope_fields_list) and delete_scope_filters):
-                        for delete_scope_values_tuples in delete_scope_values_set:
-                            q_for_delete |= Q(**dict(delete_scope_values_tuples))
+                        q_for_delete = batch_backend.get_delete_scope_q(delete_scope_values_set)
 
                         delete_manager = cls._get_batch_delete_manager()
                         delete_filter_kwargs = {}
                         if delete_scope_filters:
                             delete_filter_kwargs.update(delete_scope_filters)
-                        delete_qs = delete_manager.filter(
-                            q_for_delete, **delete_filter_kwargs).exclude(id__in=list(obj.id for obj in objs if obj.id))
+                        delete_qs = batch_backend.exclude_objs(
+                            delete_manager.filter(q_for_delete, **delete_filter_kwargs), objs)
                         if user and not check_perms_extra_kwargs.get('grouped_checks'):
                             cls._check_delete_qs_perm(user, delete_qs, **check_perms_extra_kwargs)
                         objs_to_delete = list(delete_qs)
@@ -455,7 +470,7 @@ class BatchUpdateOrCreateModelMixin:
                         rel_objs_delete_scope_filters=rel_objs_delete_scope_filters)
 
                 if objs_to_create:
-                    cls.objects.bulk_create(objs_to_create)  # в объектах будут проставлены id (только в postgres)
+                    batch_backend.create(objs_to_create)  # в объектах будут проставлены id (только в postgres)
                     cls._batch_update_or_create_rel_objs(
                         rel_objs_data=create_rel_objs_data, objs=objs_to_create, rel_objs_mapping=rel_objs_mapping,
                         stats=stats, update_key_field=update_key_field,
@@ -463,7 +478,7 @@ class BatchUpdateOrCreateModelMixin:
 
                 if objs_to_update:
                     update_fields_set.discard(cls._meta.pk.name)
-                    update_manager.bulk_update(objs_to_update, fields=update_fields_set)
+                    batch_backend.update(update_manager, objs_to_update, fields=update_fields_set)
                     cls._batch_update_or_create_rel_objs(
                         rel_objs_data=update_rel_objs_data, objs=objs_to_update, rel_objs_mapping=rel_objs_mapping,
                         stats=stats, update_key_field=update_key_field,
@@ -497,6 +512,7 @@ class BatchUpdateOrCreateModelMixin:
                 transaction_checks_kwargs = cls._get_batch_update_or_create_transaction_checks_kwargs(
                     data=data, q_for_delete=q_for_delete, user=user)
                 cls._run_batch_update_or_create_transaction_checks(**transaction_checks_kwargs)
+                batch_backend.close()
 
                 if dry_run:
                     raise DryRunRevertException()
@@ -5,6 +5,7 @@ from unittest import mock
 
 from dateutil.relativedelta import relativedelta
 from django.conf import settings
+from django.core.cache import cache
 from django.db import connection
 from django.db.models import Value, F, CharField
 from django.db.models.functions import Concat
@@ -53,6 +54,7 @@ class TestRunner(DiscoverRunner):
     def run_tests(self, test_labels, extra_tests=None, **kwargs):
         logging.disable(settings.TEST_LOG_LEVEL)   # Don't show logging messages
         warnings.filterwarnings("ignore")          # Don't show warnings
+        cache.clear()                              # Don't use cache left from previous runs
         return super().run_tests(test_labels, extra_tests, **kwargs)
 
 
@@ -0,0 +1,104 @@
+from datetime import date, datetime, time, timedelta
+
+from django.db import transaction
+from django.test import TestCase, override_settings
+
+from src.apps.timetable.models import WorkerDay
+from src.common.mixins.batch_backends import (
+    ORM_BACKEND,
+    TEMP_TABLE_BACKEND,
+    OrmBatchBackend,
+    TempTableBatchBackend,
+    get_batch_backend,
+)
+from src.common.mixins.tests import TestsHelperMixin
+from src.common.test import create_departments_and_users
+
+
+class TestBatchBackends(TestsHelperMixin, TestCase):
+    USER_USERNAME = "user1"
+    USER_EMAIL = "q@q.q"
+    USER_PASSWORD = "4242"
+
+    @classmethod
+    def setUpTestData(cls):
+        create_departments_and_users(cls)
+        cls.dt = date(2021, 6, 1)
+
+    def _get_data(self, days, type_id=WorkerDay.TYPE_WORKDAY, hour_start=10):
+        data = []
+        for employee, employment in ((self.employee2, self.employment2), (self.employee3, self.employment3)):
+            for i in range(days):
+                dt = self.dt + timedelta(days=i)
+                data.append({
+                    'dt': dt,
+                    'employee_id': employee.id,
+                    'employment_id': employment.id,
+                    'shop_id': self.shop.id,
+                    'type_id': type_id,
+                    'is_fact': False,
+                    'is_approved': False,
+                    'dttm_work_start': datetime.combine(dt, time(hour_start)),
+                    'dttm_work_end': datetime.combine(dt, time(20)),
+                })
+        return data
+
+    @staticmethod
+    def _get_wdays():
+        return sorted(WorkerDay.objects.values_list(
+            'employee_id', 'dt', 'is_fact', 'is_approved', 'type_id', 'shop_id',
+            'dttm_work_start', 'dttm_work_end', 'work_hours', 'source',
+        ))
+
+    def _run(self, backend):
+        results = []
+        with transaction.atomic():
+            created, stats = WorkerDay.batch_update_or_create(self._get_data(5), backend=backend)
+            results.append((stats, self._get_wdays()))
+            ids = [wd.id for wd in created]
+            self.assertEqual(len(set(ids)), 10)
+            self.assertTrue(all(ids))
+
+            # обновление 7 дней, удаление 3 дней по области удаления, создание 1 дня
+            data = self._get_data(4, hour_start=11)
+            for item, obj_id in zip(data, ids[:4] + ids[5:9]):
+                item['id'] = obj_id
+            data = data[:3] + data[4:]
+            data.append({**self._get_data(6)[5], 'type_id': WorkerDay.TYPE_HOLIDAY,
+                         'dttm_work_start': None, 'dttm_work_end': None})
+            _objs, stats = WorkerDay.batch_update_or_create(
+                data,
+                delete_scope_fields_list=['dt', 'employee_id', 'is_fact', 'is_approved'],
+                delete_scope_values_list=self._get_data(5),
+                backend=backend,
+            )
+            results.append((stats, self._get_wdays()))
+            transaction.set_rollback(True)
+        return results
+
+    def test_temp_table_same_as_orm(self):
+        orm_results = self._run(ORM_BACKEND)
+        temp_table_results = self._run(TEMP_TABLE_BACKEND)
+        self.assertEqual(orm_results[0][0], {'WorkerDay': {'created': 10}})
+        self.assertEqual(orm_results[1][0]['WorkerDay'], {'created': 1, 'updated': 7, 'deleted': 3})
+        self.assertEqual(temp_table_results, orm_results)
+
+    def test_temp_table_create_uses_table_sequence(self):
+        with transaction.atomic():
+            WorkerDay.batch_update_or_create(self._get_data(1), backend=TEMP_TABLE_BACKEND)
+            wd = WorkerDay.objects.create(
+                employee=self.employee2, employment=self.employment2, shop=self.shop, dt=self.dt + timedelta(days=10),
+                type_id=WorkerDay.TYPE_HOLIDAY, is_fact=False, is_approved=False,
+            )
+            self.assertGreater(wd.id, WorkerDay.objects.exclude(id=wd.id).order_by('-id').first().id)
+            transaction.set_rollback(True)
+
+    def test_get_batch_backend(self):
+        with override_settings(BATCH_UPDATE_OR_CREATE_TEMP_TABLE_MIN_OBJS=100):
+            self.assertIsInstance(get_batch_backend(WorkerDay, objs_count=99), OrmBatchBackend)
+            self.assertNotIsInstance(get_batch_backend(WorkerDay, objs_count=99), TempTableBatchBackend)
+            self.assertIsInstance(get_batch_backend(WorkerDay, objs_count=100), TempTableBatchBackend)
+            self.assertNotIsInstance(
+                get_batch_backend(WorkerDay, backend=ORM_BACKEND, objs_count=100), TempTableBatchBackend)
+        with override_settings(BATCH_UPDATE_OR_CREATE_TEMP_TABLE_MIN_OBJS=0):
+            self.assertNotIsInstance(get_batch_backend(WorkerDay, objs_count=100000), TempTableBatchBackend)
@@ -6,7 +6,7 @@ from django.conf import settings
 
 from src.apps.base.models import Shop
 from src.common.mixins.tests import TestsHelperMixin
-from src.common.decorators import cached_method, require_lock
+from src.common.decorators import cached_method, require_lock, require_advisory_lock
 
 
 class TestDecorators(TestsHelperMixin, TestCase):
@@ -46,6 +46,14 @@ class TestDecorators(TestsHelperMixin, TestCase):
         self.assertEqual(len(connection.queries), 1)
         self.assertEqual(connection.queries[0]['sql'], f'LOCK TABLE {Shop._meta.db_table} IN EXCLUSIVE MODE')
 
+    def test_require_advisory_lock(self):
+        """PostgreSQL advisory locking decorator"""
+        mock = LockMock()
+        self.assertEqual(mock.needs_advisory_lock(5), 5)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT objid FROM pg_locks WHERE locktype = 'advisory' AND pid = pg_backend_pid()")
+            self.assertEqual(cursor.fetchall(), [(5,)])
+
 
 # Mock classes
 
@@ -54,6 +62,10 @@ class LockMock(Mock):
     def needs_lock(self):
         pass
 
+    @require_advisory_lock('test', lambda self, key: key)
+    def needs_advisory_lock(self, key):
+        return key
+
 class CacheMock:
     expensive_method = Mock(return_value='result')
 
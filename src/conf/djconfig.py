@@ -325,6 +325,8 @@ add_logger('recognition')
 add_logger('forecast_loadtemplate')
 add_logger('forecast_period_clients')
 add_logger('attendance_records')
+add_logger('worker_day_batch_stream', extra_handlers=['mail_admins'])
+add_logger('post_approve_jobs', extra_handlers=['mail_admins'])
 
 # LOGGING USAGE:
 # import logging
@@ -506,6 +508,7 @@ CALCULATE_LOAD_TEMPLATE = False  # параметр отключающий ав
 
 CACHE_TTL = {
     'prod_cal': 604800, # время жизни кэша в статистике, по умолчанию 7 дней == 604800 сек.
+    'shop_efficiency': 3600, # время жизни кэша массивов эффективности магазина по дням
 }
 
 CLIENT_TIMEZONE = 3
@@ -537,11 +540,32 @@ ENV_LVL_LOCAL = 'local'
 ENV_LVL = env.str('ENV_LVL', default='')
 
 API_LOG_DELETE_GAP = 90
+# лог API пишется в буфер в Redis и сохраняется задачей flush_api_log пачками по {API_LOG_FLUSH_BATCH_SIZE}
+API_LOG_BUFFER_ENABLED = env.bool('API_LOG_BUFFER_ENABLED', default=True)
+API_LOG_FLUSH_BATCH_SIZE = env.int('API_LOG_FLUSH_BATCH_SIZE', default=500)
 
 # если текущий день месяца > {CALC_TIMESHEET_PREV_MONTH_THRESHOLD_DAYS},
 # то за прошлый месяца автоматически пересчет не запускается
 CALC_TIMESHEET_PREV_MONTH_THRESHOLD_DAYS = 4
 
+# если сотрудников больше, расчет табеля разбивается на параллельные задачи по {CALC_TIMESHEETS_CHUNK_SIZE} сотрудников
+# 0 -- расчет всех сотрудников в одной задаче
+CALC_TIMESHEETS_CHUNK_SIZE = env.int('CALC_TIMESHEETS_CHUNK_SIZE', default=0)
+
+# batch_update_or_create от {BATCH_UPDATE_OR_CREATE_TEMP_TABLE_MIN_OBJS} объектов пишет в бд через временные таблицы
+# (COPY + UPDATE ... FROM / INSERT ... SELECT), 0 -- всегда через bulk_create/bulk_update
+BATCH_UPDATE_OR_CREATE_TEMP_TABLE_MIN_OBJS = env.int('BATCH_UPDATE_OR_CREATE_TEMP_TABLE_MIN_OBJS', default=1000)
+
+# потоковая загрузка дней сотрудников (worker_day/batch_update_or_create_stream/):
+# примерное кол-во строк в транзакции, пачка закрывается только на границе сотрудника
+WORKER_DAY_BATCH_STREAM_CHUNK_SIZE = env.int('WORKER_DAY_BATCH_STREAM_CHUNK_SIZE', default=2000)
+
+# пересчеты после подтверждения графика (часы факта, факт по отметкам, табель, вакансии) выполняются
+# после коммита заданиями PostApproveJob (задача run_post_approve_jobs), объединенными по сотруднику/магазину и месяцу
+WORKER_DAY_APPROVE_DEFERRED_ACTIONS = env.bool('WORKER_DAY_APPROVE_DEFERRED_ACTIONS', default=True)
+# завершенные задания хранятся {POST_APPROVE_JOBS_KEEP_DAYS} дней для проверки статуса (worker_day/post_approve_status/)
+POST_APPROVE_JOBS_KEEP_DAYS = env.int('POST_APPROVE_JOBS_KEEP_DAYS', default=7)
+
 DOWNLOAD_TIMETABLE_GET_CODE_FUNC = lambda e: e.employee.tabel_code or ''
 
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
@@ -674,6 +698,21 @@ BEAT_SCHEDULE = {
         'schedule': crontab(hour=3, minute=15),
         'options': {'queue': BACKEND_QUEUE}
     },
+    'task-flush-api-log': {
+        'task': 'src.apps.base.tasks.flush_api_log',
+        'schedule': crontab(),
+        'options': {'queue': BACKEND_QUEUE}
+    },
+    'task-run-post-approve-jobs': {
+        'task': 'src.apps.timetable.worker_day.tasks.run_post_approve_jobs',
+        'schedule': crontab(minute='*/5'),
+        'options': {'queue': BACKEND_QUEUE}
+    },
+    'task-clean-post-approve-jobs': {
+        'task': 'src.apps.timetable.worker_day.tasks.clean_post_approve_jobs',
+        'schedule': crontab(hour=4, minute=12),
+        'options': {'queue': BACKEND_QUEUE}
+    },
     'task-clean-tevian-log': {
         'task': 'src.apps.base.tasks.clean_api_log',
         'schedule': crontab(hour=3, minute=46),
@@ -754,6 +793,8 @@ if 'test' in sys.argv:
 
 
     MIGRATION_MODULES = MigrationDisabler()
+    API_LOG_BUFFER_ENABLED = False
+    WORKER_DAY_APPROVE_DEFERRED_ACTIONS = False
 
 if DEBUG:
     REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append('rest_framework.renderers.BrowsableAPIRenderer')
@@ -1,3 +1,5 @@
+from rest_framework import serializers
+
 from src.interfaces.api.serializers.base import BaseModelSerializer
 
 from src.apps.timetable.models import AttendanceRecords
@@ -7,3 +9,17 @@ class AttendanceRecordsSerializer(BaseModelSerializer):
     class Meta:
         model = AttendanceRecords
         fields = ['id', 'dt', 'dttm', 'type', 'user_id', 'employee_id', 'verified', 'terminal', 'shop_id']
+
+
+class AttendanceRecordsBatchItemSerializer(serializers.Serializer):
+    dttm = serializers.DateTimeField()
+    type = serializers.ChoiceField(choices=AttendanceRecords.RECORD_TYPES, required=False, allow_null=True)
+    user_id = serializers.IntegerField()
+    employee_id = serializers.IntegerField(required=False, allow_null=True)
+    shop_id = serializers.IntegerField()
+    verified = serializers.BooleanField(default=True)
+    terminal = serializers.BooleanField(default=False)
+
+
+class AttendanceRecordsBatchSerializer(serializers.Serializer):
+    data = AttendanceRecordsBatchItemSerializer(many=True, allow_empty=False)
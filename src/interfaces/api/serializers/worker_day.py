@@ -71,6 +71,10 @@ class WorkerDayApproveSerializer(serializers.Serializer):
     approve_open_vacs = serializers.BooleanField(required=False)
 
 
+class PostApproveStatusSerializer(serializers.Serializer):
+    approve_id = serializers.UUIDField(help_text='Значение заголовка X-Post-Approve-Id ответа worker_day/approve/')
+
+
 class WorkerDayCashboxDetailsSerializer(BaseModelSerializer):
     work_type_id = serializers.IntegerField(required=True)
 
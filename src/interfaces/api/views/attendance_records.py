@@ -5,15 +5,22 @@ from django.db.models import Case, When, Value, CharField
 from django.http import HttpResponse
 from django.utils.encoding import escape_uri_path
 from django.utils.translation import gettext as _
+from drf_yasg.utils import swagger_auto_schema
 from rest_framework.decorators import action
+from rest_framework.response import Response
 
+from src.apps.base.models import Shop, User
 from src.apps.base.permissions import Permission
 from src.apps.base.views_abstract import (
     BaseModelViewSet,
 )
 from src.apps.timetable.models import AttendanceRecords
+from src.apps.timetable.attendance_records.batch import AttendanceRecordsBatchService
 from src.apps.timetable.attendance_records.filters import AttendanceRecordsFilter
-from src.interfaces.api.serializers.attendance_records import AttendanceRecordsSerializer
+from src.interfaces.api.serializers.attendance_records import (
+    AttendanceRecordsSerializer,
+    AttendanceRecordsBatchSerializer,
+)
 
 
 class AttendanceRecordsViewSet(BaseModelViewSet):
@@ -65,3 +72,44 @@ class AttendanceRecordsViewSet(BaseModelViewSet):
         )
         response['Content-Disposition'] = 'attachment; filename="{}.xlsx"'.format(escape_uri_path(self.action))
         return response
+
+    @swagger_auto_schema(
+        request_body=AttendanceRecordsBatchSerializer,
+        operation_description='''
+        Пакетная загрузка отметок (терминалы, распознавание).\n
+        Отметки сохраняются так же, как по одной, неподтвержденный факт пересоздается один раз на день сотрудника,
+        пересчет табеля ставится один раз на месяц сотрудника.
+        Отметки с ошибками (нет трудоустройства, пользователя или магазина) пропускаются и возвращаются в errors.
+        ''',
+    )
+    @action(detail=False, methods=['post'], permission_classes=[Permission])
+    def batch(self, request):
+        serializer = AttendanceRecordsBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data['data']
+        network_id = request.user.network_id
+        user_ids = set(User.objects.filter(
+            id__in={item['user_id'] for item in items}, network_id=network_id,
+        ).values_list('id', flat=True))
+        shop_ids = set(Shop.objects.filter(
+            id__in={item['shop_id'] for item in items}, network_id=network_id,
+        ).values_list('id', flat=True))
+
+        records = []
+        errors = []
+        for idx, item in enumerate(items):
+            if item['user_id'] not in user_ids or item['shop_id'] not in shop_ids:
+                errors.append({'index': idx, 'error': _('User or department does not exist')})
+                continue
+            record = AttendanceRecords(dt=item['dttm'].date(), **item)
+            record.batch_index = idx
+            records.append(record)
+
+        service = AttendanceRecordsBatchService(skip_errors=True)
+        saved = service.run(records)
+        for record, e in service.errors:
+            errors.append({'index': record.batch_index, 'error': e.detail})
+        return Response({
+            'created': len(saved),
+            'errors': sorted(errors, key=lambda e: e['index']),
+        })
@@ -15,6 +15,7 @@ from rest_framework.decorators import action
 from src.apps.base.models import Shop
 from src.apps.forecast.load_template.utils import apply_reverse_formula # чтобы тесты не падали
 from src.apps.forecast.period_clients.utils import upload_demand, download_demand_xlsx_util, create_demand, upload_demand_util_v3
+from src.apps.timetable.work_type.efficiency_cache import invalidate_shop_efficiency_cache
 from src.common.upload import get_uploaded_file
 from src.apps.base.views_abstract import BaseModelViewSet
 from drf_yasg.utils import swagger_auto_schema
@@ -319,6 +320,7 @@ class PeriodClientsViewSet(BaseModelViewSet):
                         )
         PeriodClients.objects.bulk_create(models)
         period_clients.update(value=set_value if set_value else F('value')*multiply_coef)
+        invalidate_shop_efficiency_cache(shop_id=shop_id, dt_from=dttm_from.date(), dt_to=dttm_to.date())
         changed_operation_type_ids = set(period_clients.values_list('operation_type_id', flat=True))
         if Shop.objects.filter(pk=shop_id, load_template__isnull=False).exists():
             for o_type in OperationType.objects.select_related('shop').filter(id__in=operation_type_ids):
@@ -360,6 +362,7 @@ class PeriodClientsViewSet(BaseModelViewSet):
             dttm_forecast__time__lte=dttm_to.time(),
             operation_type_id__in=operation_type_ids,
         ).delete()
+        invalidate_shop_efficiency_cache(shop_id=shop_id, dt_from=dttm_from.date(), dt_to=dttm_to.date())
         return Response(status=204)
 
     def list(self, requset):
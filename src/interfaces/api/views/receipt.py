@@ -1,16 +1,18 @@
-import json
 
 from django.http.response import Http404
 from django.utils.dateparse import parse_datetime
 from django.utils.translation import gettext as _
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import serializers, status
+from rest_framework.decorators import action
 from rest_framework.response import Response
 
 from src.apps.base.models import Shop
 from src.apps.base.permissions import FilteredListPermission
 from src.apps.base.views_abstract import GetObjectByCodeMixin, BaseModelViewSet
 from src.apps.forecast.models import Receipt
+from src.apps.forecast.receipt.ingestion import CSV_FORMAT, ingest_receipts
+from src.common.drf.parsers import NDJSONStreamParser, StreamParser
 
 
 class PeriodClientsCreateSerializer(serializers.Serializer):
@@ -19,6 +21,24 @@ class PeriodClientsCreateSerializer(serializers.Serializer):
     version = serializers.IntegerField(required=False)
 
 
+class ReceiptBulkSerializer(serializers.Serializer):
+    data_type = serializers.CharField(max_length=128)
+    version = serializers.IntegerField(required=False, default=0)
+
+
+class ReceiptBulkResultSerializer(serializers.Serializer):
+    created = serializers.IntegerField()
+    updated = serializers.IntegerField()
+    skipped = serializers.IntegerField(help_text='Повторы кода в пачке и записи с не меньшей версией')
+    rejected = serializers.IntegerField()
+    errors = serializers.ListField(child=serializers.DictField())
+
+
+class CSVReceiptStreamParser(StreamParser):
+    media_type = 'text/csv'
+    data_format = CSV_FORMAT
+
+
 # TODO: documentation
 class ReceiptViewSet(GetObjectByCodeMixin, BaseModelViewSet):
     """
@@ -31,11 +51,11 @@ class ReceiptViewSet(GetObjectByCodeMixin, BaseModelViewSet):
         return self.filter_queryset(Receipt.objects.all())
 
     @staticmethod
-    def _get_receive_data_info(data_type, settings_values):
-        for receive_data_info in settings_values['receive_data_info']:
-            if receive_data_info['data_type'] == data_type:
-                return receive_data_info
-        raise serializers.ValidationError(_('Settings for data processing not found.'))
+    def _get_receive_data_info(data_type, network):
+        receive_data_info = network.parsed_settings.receive_data_info_by_type.get(data_type)
+        if receive_data_info is None:
+            raise serializers.ValidationError(_('Settings for data processing not found.'))
+        return receive_data_info
     
     @swagger_auto_schema(responses={201:'empty_response'})
     def create(self, request, *args, **kwargs):
@@ -43,8 +63,7 @@ class ReceiptViewSet(GetObjectByCodeMixin, BaseModelViewSet):
         serializer.is_valid(raise_exception=True)
         data = serializer.validated_data['data']
         data_type = serializer.validated_data['data_type']
-        settings_values = json.loads(self.request.user.network.settings_values)
-        receive_data_info = self._get_receive_data_info(data_type, settings_values)
+        receive_data_info = self._get_receive_data_info(data_type, self.request.user.network)
 
         for receipt in data:
             receipt[receive_data_info['shop_code_field_name']] = \
@@ -72,7 +91,7 @@ class ReceiptViewSet(GetObjectByCodeMixin, BaseModelViewSet):
                 code=receipt[receive_data_info['receipt_code_field_name']],
                 dttm=dttm,
                 dt=parse_datetime(dttm).date(),
-                info=json.dumps(receipt),
+                info=receipt,
                 data_type=data_type,
             )
             if 'version' in serializer.validated_data:
@@ -87,8 +106,7 @@ class ReceiptViewSet(GetObjectByCodeMixin, BaseModelViewSet):
         serializer.is_valid(raise_exception=True)
         data = serializer.validated_data['data']
         data_type = serializer.validated_data['data_type']
-        settings_values = json.loads(self.request.user.network.settings_values)
-        receive_data_info = self._get_receive_data_info(data_type, settings_values)
+        receive_data_info = self._get_receive_data_info(data_type, self.request.user.network)
 
         data[receive_data_info['shop_code_field_name']] = data[receive_data_info['shop_code_field_name']].strip()
         shop = Shop.objects.filter(code=data[receive_data_info['shop_code_field_name']]).first()
@@ -110,7 +128,7 @@ class ReceiptViewSet(GetObjectByCodeMixin, BaseModelViewSet):
         instance.code = data[receive_data_info['receipt_code_field_name']]
         instance.dttm = dttm
         instance.dt = parse_datetime(dttm).date()
-        instance.info = json.dumps(data)
+        instance.info = data
         instance.data_type = data_type
         if 'version' in serializer.validated_data:
             instance.version = serializer.validated_data['version']
@@ -118,6 +136,35 @@ class ReceiptViewSet(GetObjectByCodeMixin, BaseModelViewSet):
 
         return Response(data, status=status.HTTP_201_CREATED if is_new else status.HTTP_200_OK)
 
+    @swagger_auto_schema(
+        query_serializer=ReceiptBulkSerializer,
+        operation_description='''
+        Потоковая загрузка событийных данных.\n
+        Тело запроса -- NDJSON (Content-Type: application/x-ndjson, один объект в строке)
+        или CSV с заголовком (Content-Type: text/csv).\n
+        Существующие записи (по коду) обновляются, если их версия меньше version, иначе пропускаются.
+        ''',
+        responses={200: ReceiptBulkResultSerializer},
+    )
+    @action(detail=False, methods=['post'], parser_classes=(NDJSONStreamParser, CSVReceiptStreamParser))
+    def bulk(self, request, *args, **kwargs):
+        serializer = ReceiptBulkSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        data_type = serializer.validated_data['data_type']
+        receive_data_info = self._get_receive_data_info(data_type, self.request.user.network)
+        if 'stream' not in request.data:
+            raise serializers.ValidationError(_('Request body is empty.'))
+
+        result = ingest_receipts(
+            request.data['stream'],
+            request.data['data_format'],
+            data_type=data_type,
+            receive_data_info=receive_data_info,
+            network_id=self.request.user.network_id,
+            version=serializer.validated_data['version'],
+        )
+        return Response(result)
+
 # {
 # "Ссылка": "954a22a1-cd84-11ea-8edf-00155d012a03",
 # "Дата": "2020-07-24T11:06:32",
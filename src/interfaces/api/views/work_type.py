@@ -207,4 +207,5 @@ class WorkTypeViewSet(BaseModelViewSet):
 
         return Response(ShopEfficiencyGetter(
             **data.validated_data,
+            use_cache=True,
         ).get(), status=200)
@@ -1,4 +1,5 @@
 import datetime
+import json
 
 import pandas as pd
 from dateutil.relativedelta import relativedelta
@@ -6,13 +7,16 @@ from django.conf import settings
 from django.db import transaction
 from django.db.models import OuterRef, Q, F, Exists
 from django.db.models.query import Prefetch
-from django.http import HttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, StreamingHttpResponse
 from django.utils import timezone
 from django.utils.encoding import escape_uri_path
 from django.utils.translation import gettext_lazy as _
 from django_filters import utils
 from drf_yasg.utils import swagger_auto_schema
+from rest_framework import serializers
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.serializers import ValidationError
@@ -21,7 +25,7 @@ from src.apps.base.pagination import LimitOffsetPaginationWithOptionalCount
 from src.apps.base.exceptions import FieldError
 from src.apps.base.models import Employment, Shop, Employee
 from src.apps.base.permissions import WdPermission
-from src.apps.base.views_abstract import BaseActiveNamedModelViewSet
+from src.apps.base.views_abstract import BaseActiveNamedModelViewSet, BatchUpdateOrCreateOptionsSerializer
 from src.apps.events.signals import event_signal
 from src.adapters.mda.tasks import sync_mda_user_to_shop_relation
 from src.apps.reports.utils.overtimes_undertimes import overtimes_undertimes_xlsx
@@ -43,6 +47,7 @@ from src.interfaces.api.serializers.worker_day import (
     ChangeListSerializer,
     WorkerDaySerializer,
     WorkerDayApproveSerializer,
+    PostApproveStatusSerializer,
     WorkerDayWithParentSerializer,
     DuplicateSrializer,
     DeleteWorkerDaysSerializer,
@@ -64,9 +69,13 @@ from src.apps.timetable.worker_day.stat import count_daily_stat
 from src.apps.timetable.worker_day.tasks import recalc_work_hours, batch_block_or_unblock
 from src.apps.timetable.worker_day.services.timetable import get_timetable_generator_cls
 from src.apps.timetable.worker_day.services.approve import WorkerDayApproveService
+from src.apps.timetable.worker_day.services.batch_stream import WorkerDayBatchStreamService
+from src.apps.timetable.worker_day.services import post_approve
+from src.apps.timetable.worker_day.services.work_hours import WorkHoursCalculator
 from src.apps.timetable.worker_day.utils.utils import create_worker_days_range, exchange, \
     copy_as_excel_cells, ERROR_MESSAGES
 from src.common.dg.timesheet import get_tabel_generator_cls
+from src.common.drf.parsers import NDJSONStreamParser
 from src.common.models_converter import Converter
 from src.common.openapi.responses import (
     worker_stat_response_schema_dictionary,
@@ -79,6 +88,27 @@ from src.common.time import DateTimeHelper
 from src.apps.timetable.worker_day.stat import WorkersStatsGetter
 
 
+class BatchUpdateOrCreateStreamOptionsSerializer(BatchUpdateOrCreateOptionsSerializer):
+    # область удаления строится только по строкам пачки
+    delete_scope_fields_list = serializers.ListField(
+        child=serializers.CharField(), required=False, allow_empty=False, allow_null=False)
+    delete_scope_values_list = None
+    return_response = None
+    diff_report_email_to = None
+
+
+class WorkerDayBatchStreamSerializer(serializers.Serializer):
+    chunk_size = serializers.IntegerField(
+        required=False, min_value=1, help_text='Approximate number of rows per transaction')
+    options = serializers.JSONField(
+        required=False, binary=True, help_text='JSON-encoded batch_update_or_create options')
+
+    def validate_options(self, value):
+        serializer = BatchUpdateOrCreateStreamOptionsSerializer(data=value)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data
+
+
 class WorkerDayViewSet(BaseActiveNamedModelViewSet):
 
     error_messages = {  # вынести из вьюсета
@@ -333,7 +363,11 @@ class WorkerDayViewSet(BaseActiveNamedModelViewSet):
     @swagger_auto_schema(
         request_body=WorkerDayApproveSerializer,
         responses={200: 'empty response'},
-        operation_description="Метод для подтверждения графика",
+        operation_description='''
+        Метод для подтверждения графика.\n
+        Возвращает кол-во подтвержденных дней. Пересчеты после подтверждения (часы факта, табель, вакансии)
+        выполняются отложенно, их статус -- worker_day/post_approve_status/?approve_id=<заголовок X-Post-Approve-Id>.
+        ''',
     )
     @action(detail=False, methods=['post'])
     def approve(self, request):
@@ -345,7 +379,26 @@ class WorkerDayViewSet(BaseActiveNamedModelViewSet):
         if settings.MDA_SYNC_USER_TO_SHOP_DAILY and not request.data['is_fact']:
             filter_kwargs = {'shop_id': request.data['shop_id']}
             sync_mda_user_to_shop_relation.delay(**filter_kwargs)  # чтобы отправлять в МДА срочные выходы на работу сегодняшнего дня
-        return Response(approved_count)
+        response = Response(approved_count)
+        if wd_approve_helper.post_approve_id:
+            response['X-Post-Approve-Id'] = wd_approve_helper.post_approve_id
+        return response
+
+    @swagger_auto_schema(
+        query_serializer=PostApproveStatusSerializer,
+        operation_description='''
+        Статус отложенных действий после подтверждения графика.\n
+        status: pending, running, done или failed; jobs -- кол-во заданий по статусам; errors -- ошибки заданий.
+        ''',
+    )
+    @action(detail=False, methods=['get'], filterset_class=None)
+    def post_approve_status(self, request):
+        serializer = PostApproveStatusSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        status = post_approve.get_status(serializer.validated_data['approve_id'])
+        if status is None:
+            raise NotFound()
+        return Response(status)
 
     @swagger_auto_schema(
         operation_description='Возвращает статистику по сотрудникам',
@@ -608,12 +661,11 @@ class WorkerDayViewSet(BaseActiveNamedModelViewSet):
                             is_fact=is_fact,
                             type=wd_type,
                             created_by=self.request.user,
-                            need_count_wh=True,
                             source=WorkerDay.SOURCE_CHANGE_RANGE,
                         )
                     )
                     employee_dates.setdefault(employment.employee_id, []).append(dt)
-        WorkerDay.objects.bulk_create(wdays_to_create)
+        WorkerDay.objects.bulk_create(WorkHoursCalculator(wdays_to_create).run())
 
         if is_approved:
             recalc_timesheet_on_data_change(employee_dates)
@@ -1111,6 +1163,55 @@ class WorkerDayViewSet(BaseActiveNamedModelViewSet):
         updated = batch_block_or_unblock(network_id=request.user.network.id, **serializer.validated_data)
         return Response({'updated': updated})
 
+    def _get_batch_stream_obj_serializer_getter(self, update_key_field):
+        obj_serializer_cls = self.batch_update_or_create_serializer_cls or self.serializer_class
+        context = self.get_serializer_context()
+        context['batch'] = True
+
+        def _get_obj_serializer(data):
+            obj_serializer = obj_serializer_cls(data=data, context=context)
+            update_key = obj_serializer.fields[update_key_field]
+            update_key.read_only = False
+            update_key.required = False
+            update_key.allow_null = True
+            return obj_serializer
+
+        return _get_obj_serializer
+
+    @swagger_auto_schema(
+        query_serializer=WorkerDayBatchStreamSerializer,
+        operation_description='''
+        Потоковое создание/обновление дней сотрудников.\n
+        Тело запроса -- NDJSON (Content-Type: application/x-ndjson), один день сотрудника в строке
+        (формат как у data в batch_update_or_create), строки одного сотрудника должны идти подряд.\n
+        Строки сохраняются пачками примерно по chunk_size строк, в пачку попадают все строки сотрудника,
+        каждая пачка -- отдельная транзакция.\n
+        Ответ -- NDJSON с прогрессом: строка на каждую пачку (статистика и ошибки по строкам)
+        и итоговая строка {"total": {...}}.
+        ''',
+        responses={200: 'NDJSON'},
+    )
+    @action(detail=False, methods=['post'], filterset_class=None, parser_classes=(NDJSONStreamParser,))
+    def batch_update_or_create_stream(self, request: Request):
+        serializer = WorkerDayBatchStreamSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        if 'stream' not in request.data:
+            raise ValidationError(_('Request body is empty.'))
+
+        options = serializer.validated_data.get('options', {})
+        service = WorkerDayBatchStreamService(
+            request.data['stream'],
+            get_serializer=self._get_batch_stream_obj_serializer_getter(
+                update_key_field=options.get('update_key_field') or ('code' if options.get('by_code') else 'id')),
+            user=request.user,
+            options=options,
+            chunk_size=serializer.validated_data.get('chunk_size'),
+        )
+        return StreamingHttpResponse(
+            (json.dumps(progress, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n' for progress in service.run()),
+            content_type='application/x-ndjson',
+        )
+
     @swagger_auto_schema(
         request_body=RecalcWdaysSerializer,
         operation_description='Пересчет часов'
@@ -0,0 +1,18 @@
+from django.core.management import BaseCommand
+
+from src.apps.forecast.receipt.indexes import create_receipt_info_indexes
+
+
+class Command(BaseCommand):
+    help = "Creates indexes on Receipt.info fields used by timeserie_filters in networks' receive_data_info settings"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--no_concurrently', help='Create indexes without CONCURRENTLY (locks writes)', action='store_true')
+
+    def handle(self, *args, **options):
+        index_names = create_receipt_info_indexes(concurrently=not options['no_concurrently'])
+        for index_name in index_names:
+            self.stdout.write(index_name)
+
+        self.stdout.write(self.style.SUCCESS(f'SUCCESS'))
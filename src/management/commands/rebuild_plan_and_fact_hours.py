@@ -0,0 +1,20 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from src.apps.timetable.worker_day.plan_and_fact_hours import refresh_plan_and_fact_hours
+from src.common.models_converter import Converter
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds materialized plan and fact hours (timetable_plan_and_fact_hours), optionally for a period only'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dt_from', type=str, help='Date from (YYYY-MM-DD)')
+        parser.add_argument('--dt_to', type=str, help='Date to (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        dt_from = Converter.parse_date(options['dt_from']) if options.get('dt_from') else None
+        dt_to = Converter.parse_date(options['dt_to']) if options.get('dt_to') else None
+        with transaction.atomic():
+            refresh_plan_and_fact_hours(dt_from=dt_from, dt_to=dt_to)
+        self.stdout.write(self.style.SUCCESS('plan and fact hours rebuilt'))
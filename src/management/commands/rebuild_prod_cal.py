@@ -0,0 +1,22 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from src.apps.timetable.worker_day.prod_cal_cache import invalidate_prod_cal_cache
+from src.apps.timetable.worker_day.prod_cal_norm import refresh_prod_cal
+from src.common.models_converter import Converter
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds production calendar norm hours (prod_cal) for all employees, optionally for a period only'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dt_from', type=str, help='Date from (YYYY-MM-DD)')
+        parser.add_argument('--dt_to', type=str, help='Date to (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        dt_from = Converter.parse_date(options['dt_from']) if options.get('dt_from') else None
+        dt_to = Converter.parse_date(options['dt_to']) if options.get('dt_to') else None
+        with transaction.atomic():
+            refresh_prod_cal(dt_from=dt_from, dt_to=dt_to)
+            invalidate_prod_cal_cache()
+        self.stdout.write(self.style.SUCCESS('prod_cal rebuilt'))